@@ -0,0 +1,3 @@
+"""
+Dispatch benchmark / simülasyon araçları (sahte Supabase). `python -m benchmarks.dispatch_bench --help`
+"""
@@ -0,0 +1,366 @@
+"""
+Dispatch yük benchmark'ı — rolling dispatch sıcak yolu sahte Supabase + sahte rota/push ile.
+
+server.py'deki gerçek fonksiyonlar çalışır (rolling_dispatch_start → find_eligible_drivers →
+rolling_dispatch_batch → handle_dispatch_accept); yalnızca dış bağımlılıklar değiştirilir:
+- server.supabase → FakeSupabase (bellek içi PostgREST; db çağrıları thread havuzundan geçer, latency_ms)
+- get_route_matrix_to_point → düz çizgi × yol katsayısı (çağrı başına route_latency_ms)
+- push_outbox → aynı depo (notifications_log, sahte DB) + push_latency_ms bekleyen teslimat; worker'lar
+  başlatılmaz: sıcak yolda ölçülen yalnızca kuyruklama maliyetidir
+- ExpoPushService.send → push_latency_ms bekleyip başarı döner
+- sio.emit → kayıt (new_passenger_offer zamanları); driver_geo_index → boş yeni indeks
+
+Rapor: ilk teklife kadar süre (p50/p95/max), teklif/sn, event loop gecikmesi (p50/p95/p99/max),
+tag başına DB çağrısı (tablo/işlem kırılımıyla).
+
+Çalıştırma (backend/ içinden):
+    python -m benchmarks.dispatch_bench --drivers 5000 --tags 500
+    python -m benchmarks.dispatch_bench --drivers 5000 --tags 500 --no-geo-index --json
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import math
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from benchmarks.fake_supabase import FakeSupabase
+from services.driver_geo_index import DriverGeoIndex
+from services.push_outbox import OUTCOME_SENT, PushOutbox
+
+# Sakarya / Adapazarı çevresi
+DEFAULT_CENTER = (40.7569, 30.3783)
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    vals = sorted(values)
+    idx = min(len(vals) - 1, max(0, int(round(pct / 100.0 * (len(vals) - 1)))))
+    return vals[idx]
+
+
+def _offset(lat: float, lng: float, max_km: float, rng: random.Random) -> tuple:
+    r = max_km * math.sqrt(rng.random())
+    th = rng.random() * 2 * math.pi
+    dlat = (r * math.cos(th)) / 111.32
+    dlng = (r * math.sin(th)) / (111.32 * math.cos(math.radians(lat)))
+    return lat + dlat, lng + dlng
+
+
+def _straight_km(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    x = math.radians(lng2 - lng1) * math.cos(math.radians((lat1 + lat2) / 2.0))
+    y = math.radians(lat2 - lat1)
+    return 6371.0 * math.hypot(x, y)
+
+
+class LoopLagMonitor:
+    """interval_sec aralıkla uyuyup gecikmeyi (ms) örnekler."""
+
+    def __init__(self, interval_sec: float = 0.01) -> None:
+        self.interval_sec = interval_sec
+        self.samples_ms: List[float] = []
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self) -> None:
+        while True:
+            t = time.perf_counter()
+            await asyncio.sleep(self.interval_sec)
+            self.samples_ms.append(max(0.0, (time.perf_counter() - t - self.interval_sec) * 1000.0))
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+
+class OfferRecorder:
+    """sio.emit yerine: new_passenger_offer'ların tag başına ilk zamanı ve toplam sayısı."""
+
+    def __init__(self) -> None:
+        self.first_offer: Dict[str, float] = {}
+        self.offered_drivers: Dict[str, List[str]] = {}
+        self.offers = 0
+        self.events = 0
+
+    async def emit(self, event: str, data: Any = None, to: Any = None, room: Any = None, **_: Any) -> None:
+        self.events += 1
+        if event != "new_passenger_offer" or not isinstance(data, dict):
+            return
+        tag_id = str(data.get("tag_id"))
+        self.offers += 1
+        self.first_offer.setdefault(tag_id, time.perf_counter())
+        target = str(room or to or "")
+        self.offered_drivers.setdefault(tag_id, []).append(target.replace("user_", "", 1))
+
+
+def seed_fake_db(
+    fake: FakeSupabase,
+    *,
+    drivers: int,
+    tags: int,
+    center: tuple = DEFAULT_CENTER,
+    driver_spread_km: float = 15.0,
+    pickup_spread_km: float = 6.0,
+    rng: Optional[random.Random] = None,
+) -> List[str]:
+    """Çevrimiçi sürücüler + yolcular + waiting tag'ler. Dönüş: tag id listesi."""
+    rng = rng or random.Random(42)
+    now = datetime.utcnow()
+    until = (now + timedelta(days=1)).isoformat()
+    users = fake.tables.setdefault("users", [])
+    for i in range(drivers):
+        lat, lng = _offset(center[0], center[1], driver_spread_km, rng)
+        users.append(
+            {
+                "id": str(uuid.uuid4()),
+                "name": f"Sürücü {i}",
+                "rating": round(rng.uniform(3.5, 5.0), 1),
+                "latitude": lat,
+                "longitude": lng,
+                "driver_online": True,
+                "driver_active_until": until,
+                "driver_details": {"vehicle_kind": "motorcycle" if rng.random() < 0.1 else "car"},
+                "push_token": f"ExponentPushToken[bench-{i}]",
+                "last_location_update": now.isoformat(),
+            }
+        )
+    tag_rows = fake.tables.setdefault("tags", [])
+    tag_ids: List[str] = []
+    for i in range(tags):
+        pid = str(uuid.uuid4())
+        users.append({"id": pid, "name": f"Yolcu {i}", "driver_details": None})
+        plat, plng = _offset(center[0], center[1], pickup_spread_km, rng)
+        dlat, dlng = _offset(plat, plng, 8.0, rng)
+        tid = str(uuid.uuid4())
+        tag_ids.append(tid)
+        tag_rows.append(
+            {
+                "id": tid,
+                "status": "waiting",
+                "passenger_id": pid,
+                "passenger_name": f"Yolcu {i}",
+                "pickup_lat": plat,
+                "pickup_lng": plng,
+                "pickup_location": "Bench pickup",
+                "dropoff_lat": dlat,
+                "dropoff_lng": dlng,
+                "dropoff_location": "Bench dropoff",
+                "final_price": 150,
+                "distance_km": round(_straight_km(plat, plng, dlat, dlng) * 1.3, 1),
+                "estimated_minutes": 15,
+                "passenger_preferred_vehicle": "car",
+                "created_at": now.isoformat(),
+            }
+        )
+    return tag_ids
+
+
+def install_fakes(server: Any, fake: FakeSupabase, *, route_latency_ms: float, push_latency_ms: float):
+    """server modülüne sahte bağımlılıkları tak. Dönüş: (OfferRecorder, geri_al())."""
+    recorder = OfferRecorder()
+    saved = {
+        "supabase": server.supabase,
+        "get_route_matrix_to_point": server.get_route_matrix_to_point,
+        "push_outbox": server.push_outbox,
+        "expo_send": server.ExpoPushService.__dict__["send"],
+        "emit": server.sio.emit,
+        "driver_geo_index": server.driver_geo_index,
+    }
+    route_calls = {"n": 0}
+
+    async def fake_route_matrix(origins: list, dest_lat: float, dest_lng: float, *, reverse: bool = False) -> list:
+        route_calls["n"] += 1
+        if route_latency_ms:
+            await asyncio.sleep(route_latency_ms / 1000.0)
+        out = []
+        for la, lo in origins:
+            km = _straight_km(float(la), float(lo), float(dest_lat), float(dest_lng)) * 1.3
+            out.append({"distance_km": km, "duration_min": km / 40.0 * 60.0})
+        return out
+
+    async def fake_expo_send(tokens: list, title: str, body: str, data: dict = None) -> dict:
+        if push_latency_ms:
+            await asyncio.sleep(push_latency_ms / 1000.0)
+        return {"sent": len(tokens or []), "failed": 0}
+
+    async def fake_deliver(item: dict) -> tuple:
+        if push_latency_ms:
+            await asyncio.sleep(push_latency_ms / 1000.0)
+        return OUTCOME_SENT, None
+
+    server.supabase = fake
+    server.get_route_matrix_to_point = fake_route_matrix
+    server.push_outbox = PushOutbox(server._create_push_outbox_store(), fake_deliver, rate_per_sec=0)
+    server.ExpoPushService.send = staticmethod(fake_expo_send)
+    server.sio.emit = recorder.emit
+    server.driver_geo_index = DriverGeoIndex()
+    recorder.route_calls = route_calls
+
+    def restore() -> None:
+        server.supabase = saved["supabase"]
+        server.get_route_matrix_to_point = saved["get_route_matrix_to_point"]
+        server.push_outbox = saved["push_outbox"]
+        server.ExpoPushService.send = saved["expo_send"]
+        server.sio.emit = saved["emit"]
+        server.driver_geo_index = saved["driver_geo_index"]
+
+    return recorder, restore
+
+
+async def run_benchmark(
+    *,
+    drivers: int = 5000,
+    tags: int = 500,
+    concurrency: int = 500,
+    db_latency_ms: float = 2.0,
+    route_latency_ms: float = 20.0,
+    push_latency_ms: float = 30.0,
+    use_geo_index: bool = True,
+    accept: bool = True,
+    seed: int = 42,
+) -> Dict[str, Any]:
+    import server
+
+    fake = FakeSupabase(latency_ms=db_latency_ms)
+    tag_ids = seed_fake_db(fake, drivers=drivers, tags=tags, rng=random.Random(seed))
+    recorder, restore = install_fakes(
+        server, fake, route_latency_ms=route_latency_ms, push_latency_ms=push_latency_ms
+    )
+    try:
+        await server.clear_dispatch_in_memory_state()
+        server.driver_state_cache.clear()
+        if use_geo_index:
+            await server.driver_geo_index_reconcile()
+        fake.reset_stats()
+
+        lag = LoopLagMonitor()
+        lag.start()
+        sem = asyncio.Semaphore(max(1, concurrency))
+        started: Dict[str, float] = {}
+        eligible: Dict[str, int] = {}
+
+        async def _one(tid: str) -> None:
+            async with sem:
+                started[tid] = time.perf_counter()
+                eligible[tid] = await server.rolling_dispatch_start(tid)
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*(_one(t) for t in tag_ids))
+        dispatch_sec = time.perf_counter() - t0
+
+        accepted = 0
+        if accept:
+            for tid in tag_ids:
+                offered = recorder.offered_drivers.get(tid)
+                if not offered:
+                    continue
+                did = offered[0]
+                for row in fake.tables.get("tags", []):
+                    if row["id"] == tid:
+                        row.update({"status": "matched", "driver_id": did})
+                await server.rolling_dispatch_stop(tid, revoke_offers=True, except_driver_id=did)
+                await server.handle_dispatch_accept(tid, did)
+                accepted += 1
+        wall_sec = time.perf_counter() - t0
+        await lag.stop()
+    finally:
+        for tid in tag_ids:
+            try:
+                await server.dispatch_scheduler.cancel(server._rolling_job_id(tid))
+            except Exception:
+                pass
+        await server.clear_dispatch_in_memory_state()
+        restore()
+
+    ttfo_ms = [
+        (recorder.first_offer[t] - started[t]) * 1000.0 for t in tag_ids if t in recorder.first_offer and t in started
+    ]
+    db_calls = fake.total_calls()
+    return {
+        "drivers": drivers,
+        "tags": tags,
+        "geo_index": use_geo_index,
+        "tags_offered": len(ttfo_ms),
+        "avg_eligible": round(sum(eligible.values()) / max(1, len(eligible)), 1),
+        "offers": recorder.offers,
+        "accepted": accepted,
+        "dispatch_sec": round(dispatch_sec, 3),
+        "wall_sec": round(wall_sec, 3),
+        "offers_per_sec": round(recorder.offers / dispatch_sec, 1) if dispatch_sec else 0.0,
+        "ttfo_ms_p50": round(_percentile(ttfo_ms, 50), 1),
+        "ttfo_ms_p95": round(_percentile(ttfo_ms, 95), 1),
+        "ttfo_ms_max": round(max(ttfo_ms), 1) if ttfo_ms else 0.0,
+        "loop_lag_ms_p50": round(_percentile(lag.samples_ms, 50), 2),
+        "loop_lag_ms_p95": round(_percentile(lag.samples_ms, 95), 2),
+        "loop_lag_ms_p99": round(_percentile(lag.samples_ms, 99), 2),
+        "loop_lag_ms_max": round(max(lag.samples_ms), 2) if lag.samples_ms else 0.0,
+        "db_calls": db_calls,
+        "db_calls_per_tag": round(db_calls / max(1, tags), 2),
+        "route_calls": recorder.route_calls["n"],
+        "db_calls_by_table": fake.stats(),
+    }
+
+
+def _print_report(report: Dict[str, Any]) -> None:
+    by_table = report.pop("db_calls_by_table", {})
+    width = max(len(k) for k in report)
+    for k, v in report.items():
+        print(f"{k.ljust(width)}  {v}")
+    print("\nDB çağrıları (tablo.işlem):")
+    for k, v in sorted(by_table.items(), key=lambda kv: -kv[1]):
+        print(f"  {k.ljust(36)} {v}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Rolling dispatch yük benchmark'ı (sahte Supabase)")
+    ap.add_argument("--drivers", type=int, default=5000)
+    ap.add_argument("--tags", type=int, default=500)
+    ap.add_argument("--concurrency", type=int, default=500, help="aynı anda başlatılan tag")
+    ap.add_argument("--db-latency-ms", type=float, default=2.0)
+    ap.add_argument("--route-latency-ms", type=float, default=20.0)
+    ap.add_argument("--push-latency-ms", type=float, default=30.0)
+    ap.add_argument("--no-geo-index", action="store_true", help="find_eligible_drivers DB taraması yolu")
+    ap.add_argument("--no-accept", action="store_true")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--json", action="store_true")
+    ap.add_argument("--verbose", action="store_true", help="server loglarını göster")
+    args = ap.parse_args(argv)
+
+    if not args.verbose:
+        logging.disable(logging.WARNING)
+    report = asyncio.run(
+        run_benchmark(
+            drivers=args.drivers,
+            tags=args.tags,
+            concurrency=args.concurrency,
+            db_latency_ms=args.db_latency_ms,
+            route_latency_ms=args.route_latency_ms,
+            push_latency_ms=args.push_latency_ms,
+            use_geo_index=not args.no_geo_index,
+            accept=not args.no_accept,
+            seed=args.seed,
+        )
+    )
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        _print_report(report)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,329 @@
+"""
+Bellek içi PostgREST benzeri Supabase istemcisi — benchmark / simülasyon için.
+
+supabase-py zincir API'sinin server.py'de kullanılan alt kümesi:
+table(...).select(cols, count=) / insert / upsert / update / delete
+  .eq .neq .in_ .gt .gte .lt .lte .is_ .like .ilike .not_.is_ .order .limit .range .single .maybe_single
+  .execute() → .data / .count
+rpc(name, params).execute() — register_rpc() ile tanımlanan fonksiyonlar
+
+Her execute() gerçek istemcideki gibi senkrondur (async cephe onu thread havuzunda çalıştırır);
+latency_ms ile ağ gecikmesi taklit edilir. Çağrı sayaçları tablo/işlem bazında tutulur (stats()).
+"""
+from __future__ import annotations
+
+import copy
+import fnmatch
+import threading
+import time
+import uuid
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional
+
+
+class FakeResponse:
+    def __init__(self, data: Any, count: Optional[int] = None) -> None:
+        self.data = data
+        self.count = count
+
+
+def _as_comparable(a: Any, b: Any):
+    if isinstance(a, bool) or isinstance(b, bool):
+        return a, b
+    if isinstance(a, (int, float)) and isinstance(b, str):
+        try:
+            return a, float(b)
+        except ValueError:
+            return str(a), b
+    if isinstance(a, str) and isinstance(b, (int, float)):
+        try:
+            return float(a), b
+        except ValueError:
+            return a, str(b)
+    return a, b
+
+
+def _eq(a: Any, b: Any) -> bool:
+    """uuid / bool kolonları PostgREST'te metinle de eşleşir (büyük/küçük harf duyarsız)."""
+    if a == b:
+        return True
+    if a is None or b is None:
+        return False
+    return str(a).lower() == str(b).lower()
+
+
+def _order_key(v: Any):
+    return (v is None, v if not isinstance(v, bool) else int(v))
+
+
+class _Not:
+    def __init__(self, query: "FakeQuery") -> None:
+        self._q = query
+
+    def is_(self, col: str, value: Any) -> "FakeQuery":
+        return self._q._filter(lambda r: not _is(r.get(col), value))
+
+    def in_(self, col: str, values: List[Any]) -> "FakeQuery":
+        return self._q._filter(lambda r: not any(_eq(r.get(col), v) for v in values))
+
+    def eq(self, col: str, value: Any) -> "FakeQuery":
+        return self._q._filter(lambda r: not _eq(r.get(col), value))
+
+
+def _is(v: Any, value: Any) -> bool:
+    if value is None or str(value).lower() == "null":
+        return v is None
+    return _eq(v, value)
+
+
+class FakeQuery:
+    def __init__(self, client: "FakeSupabase", table: str) -> None:
+        self._c = client
+        self._table = table
+        self._op = "select"
+        self._cols = "*"
+        self._count: Optional[str] = None
+        self._payload: Any = None
+        self._filters: List[Callable[[dict], bool]] = []
+        self._order: List[tuple] = []
+        self._limit: Optional[int] = None
+        self._offset = 0
+        self._single = False
+        self._maybe_single = False
+        self._on_conflict = "id"
+        # id üzerinde eq / in_ → birincil anahtar araması (tam tarama yok)
+        self._id_keys: Optional[set] = None
+
+    # ---------- işlem ----------
+
+    def select(self, cols: str = "*", count: Optional[str] = None) -> "FakeQuery":
+        if self._op == "select":
+            self._cols = cols
+        self._count = count
+        return self
+
+    def insert(self, payload: Any, **_: Any) -> "FakeQuery":
+        self._op, self._payload = "insert", payload
+        return self
+
+    def upsert(self, payload: Any, on_conflict: str = "id", **_: Any) -> "FakeQuery":
+        self._op, self._payload, self._on_conflict = "upsert", payload, on_conflict or "id"
+        return self
+
+    def update(self, payload: dict, **_: Any) -> "FakeQuery":
+        self._op, self._payload = "update", payload
+        return self
+
+    def delete(self, **_: Any) -> "FakeQuery":
+        self._op = "delete"
+        return self
+
+    # ---------- filtre ----------
+
+    def _filter(self, fn: Callable[[dict], bool]) -> "FakeQuery":
+        self._filters.append(fn)
+        return self
+
+    def _narrow_ids(self, values: List[Any]) -> None:
+        keys = {str(v).lower() for v in values if v is not None}
+        self._id_keys = keys if self._id_keys is None else self._id_keys & keys
+
+    def eq(self, col: str, value: Any) -> "FakeQuery":
+        if col == "id":
+            self._narrow_ids([value])
+        return self._filter(lambda r: _eq(r.get(col), value))
+
+    def neq(self, col: str, value: Any) -> "FakeQuery":
+        return self._filter(lambda r: not _eq(r.get(col), value))
+
+    def in_(self, col: str, values: List[Any]) -> "FakeQuery":
+        vals = list(values)
+        if col == "id":
+            self._narrow_ids(vals)
+        return self._filter(lambda r: any(_eq(r.get(col), v) for v in vals))
+
+    def _cmp(self, col: str, value: Any, op: Callable[[Any, Any], bool]) -> "FakeQuery":
+        def fn(r: dict) -> bool:
+            v = r.get(col)
+            if v is None:
+                return False
+            a, b = _as_comparable(v, value)
+            try:
+                return op(a, b)
+            except TypeError:
+                return op(str(a), str(b))
+
+        return self._filter(fn)
+
+    def gt(self, col: str, value: Any) -> "FakeQuery":
+        return self._cmp(col, value, lambda a, b: a > b)
+
+    def gte(self, col: str, value: Any) -> "FakeQuery":
+        return self._cmp(col, value, lambda a, b: a >= b)
+
+    def lt(self, col: str, value: Any) -> "FakeQuery":
+        return self._cmp(col, value, lambda a, b: a < b)
+
+    def lte(self, col: str, value: Any) -> "FakeQuery":
+        return self._cmp(col, value, lambda a, b: a <= b)
+
+    def is_(self, col: str, value: Any) -> "FakeQuery":
+        return self._filter(lambda r: _is(r.get(col), value))
+
+    def like(self, col: str, pattern: str) -> "FakeQuery":
+        pat = pattern.replace("%", "*")
+        return self._filter(lambda r: r.get(col) is not None and fnmatch.fnmatchcase(str(r.get(col)), pat))
+
+    def ilike(self, col: str, pattern: str) -> "FakeQuery":
+        pat = pattern.replace("%", "*").lower()
+        return self._filter(lambda r: r.get(col) is not None and fnmatch.fnmatchcase(str(r.get(col)).lower(), pat))
+
+    @property
+    def not_(self) -> _Not:
+        return _Not(self)
+
+    def order(self, col: str, desc: bool = False, **_: Any) -> "FakeQuery":
+        self._order.append((col, bool(desc)))
+        return self
+
+    def limit(self, n: int) -> "FakeQuery":
+        self._limit = int(n)
+        return self
+
+    def range(self, start: int, end: int) -> "FakeQuery":
+        self._offset, self._limit = int(start), int(end) - int(start) + 1
+        return self
+
+    def single(self) -> "FakeQuery":
+        self._single = True
+        return self
+
+    def maybe_single(self) -> "FakeQuery":
+        self._maybe_single = True
+        return self
+
+    # ---------- çalıştır ----------
+
+    def _project(self, row: dict) -> dict:
+        cols = (self._cols or "*").strip()
+        if cols == "*" or "(" in cols:
+            return copy.deepcopy(row)
+        out = {}
+        for c in cols.split(","):
+            c = c.strip()
+            if c:
+                out[c] = copy.deepcopy(row.get(c))
+        return out
+
+    def _match(self, row: dict) -> bool:
+        return all(f(row) for f in self._filters)
+
+    def execute(self) -> FakeResponse:
+        self._c._record(self._table, self._op)
+        with self._c._lock:
+            rows = self._c.tables.setdefault(self._table, [])
+            if self._op == "insert":
+                new = [self._c._with_id(r) for r in (self._payload if isinstance(self._payload, list) else [self._payload])]
+                rows.extend(new)
+                return FakeResponse(copy.deepcopy(new))
+            if self._op == "upsert":
+                out = []
+                key = self._on_conflict.split(",")[0].strip()
+                for r in self._payload if isinstance(self._payload, list) else [self._payload]:
+                    hit = next((x for x in rows if key in r and _eq(x.get(key), r[key])), None)
+                    if hit is None:
+                        hit = self._c._with_id(r)
+                        rows.append(hit)
+                    else:
+                        hit.update(copy.deepcopy(r))
+                    out.append(copy.deepcopy(hit))
+                return FakeResponse(out)
+            if self._id_keys is not None:
+                index = self._c._index(self._table)
+                candidates = [index[k] for k in self._id_keys if k in index]
+            else:
+                candidates = rows
+            matched = [r for r in candidates if self._match(r)]
+            if self._op == "update":
+                for r in matched:
+                    r.update(copy.deepcopy(self._payload))
+                return FakeResponse(copy.deepcopy(matched))
+            if self._op == "delete":
+                ids = {id(r) for r in matched}
+                if ids:
+                    self._c.tables[self._table] = [r for r in rows if id(r) not in ids]
+                return FakeResponse(copy.deepcopy(matched))
+            for col, desc in reversed(self._order):
+                matched.sort(key=lambda r: _order_key(r.get(col)), reverse=desc)
+            total = len(matched)
+            end = None if self._limit is None else self._offset + self._limit
+            data = [self._project(r) for r in matched[self._offset : end]]
+        if self._single or self._maybe_single:
+            return FakeResponse(data[0] if data else None, total if self._count else None)
+        return FakeResponse(data, total if self._count else None)
+
+
+class _FakeRpc:
+    def __init__(self, client: "FakeSupabase", name: str, params: Optional[dict]) -> None:
+        self._c, self._name, self._params = client, name, params or {}
+
+    def execute(self) -> FakeResponse:
+        self._c._record("rpc:" + self._name, "rpc")
+        fn = self._c._rpcs.get(self._name)
+        if fn is None:
+            raise RuntimeError(f"PGRST202: function {self._name} not found")
+        with self._c._lock:
+            return FakeResponse(fn(self._c, self._params))
+
+
+class FakeSupabase:
+    """tables: {tablo: [satır, ...]} — satırlar doğrudan düzenlenebilir (tohumlama)."""
+
+    def __init__(self, *, latency_ms: float = 0.0) -> None:
+        self.tables: Dict[str, List[dict]] = {}
+        self.latency_ms = float(latency_ms)
+        self._rpcs: Dict[str, Callable[["FakeSupabase", dict], Any]] = {}
+        self._calls: Counter = Counter()
+        self._lock = threading.RLock()
+        self._indexes: Dict[str, tuple] = {}
+
+    def table(self, name: str) -> FakeQuery:
+        return FakeQuery(self, name)
+
+    from_ = table
+
+    def rpc(self, name: str, params: Optional[dict] = None) -> _FakeRpc:
+        return _FakeRpc(self, name, params)
+
+    def register_rpc(self, name: str, fn: Callable[["FakeSupabase", dict], Any]) -> None:
+        self._rpcs[name] = fn
+
+    def _index(self, table: str) -> Dict[str, dict]:
+        """id → satır (tablo listesi dışarıdan değişmiş olabileceği için boyut farkında yeniden kurulur)."""
+        rows = self.tables.get(table, [])
+        idx = self._indexes.get(table)
+        if idx is None or idx[0] is not rows or idx[1] != len(rows):
+            idx = (rows, len(rows), {str(r.get("id")).lower(): r for r in rows if r.get("id") is not None})
+            self._indexes[table] = idx
+        return idx[2]
+
+    def _with_id(self, row: dict) -> dict:
+        r = copy.deepcopy(row)
+        r.setdefault("id", str(uuid.uuid4()))
+        return r
+
+    def _record(self, table: str, op: str) -> None:
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000.0)
+        with self._lock:
+            self._calls[(table, op)] += 1
+
+    def total_calls(self) -> int:
+        return sum(self._calls.values())
+
+    def stats(self) -> Dict[str, int]:
+        return {f"{t}.{op}": n for (t, op), n in sorted(self._calls.items())}
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self._calls.clear()
@@ -0,0 +1,153 @@
+"""
+Kuş uçuşu yarıçap filtresi mikro-benchmark'ı — satır satır haversine_distance döngüsü vs GeoPoints (NumPy).
+
+/drivers/nearby biçiminde sentetik online sürücü satırları (merkez etrafında 0–60 km, bir kısmı konumsuz)
+üzerinde her sorgu için:
+- python: eski uç nokta döngüsü (`if d_lat and d_lng` + haversine_distance, çağrı içinde `import math`)
+- numpy: GeoPoints.from_rows + within (satır listesinden dizilere çevirme dahil)
+- numpy_query: hazır GeoPoints üzerinde yalnızca within (diziler tutulursa)
+- k_nearest: hazır GeoPoints üzerinde en yakın k
+
+Rapor: sorgu başına ms (median), hızlanma oranı; iki yolun sonuç kümesi aynı olmalı (matches).
+
+Çalıştırma (backend/ içinden):
+    python -m benchmarks.geo_bench --drivers 10000
+    python -m benchmarks.geo_bench --drivers 10000 --queries 200 --json
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import random
+import statistics
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+from services.geo_arrays import GeoPoints
+
+# Sakarya / Adapazarı çevresi
+DEFAULT_CENTER = (40.7569, 30.3783)
+
+
+def _haversine_distance_legacy(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """server.haversine_distance'ın önceki hâli (çağrı başına import dahil) — karşılaştırma tabanı."""
+    import math
+
+    R = 6371
+    dlat = math.radians(lat2 - lat1)
+    dlng = math.radians(lng2 - lng1)
+    a = math.sin(dlat / 2) ** 2 + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlng / 2) ** 2
+    return R * 2 * math.asin(math.sqrt(a))
+
+
+def _offset(lat: float, lng: float, max_km: float, rng: random.Random) -> tuple:
+    r = max_km * math.sqrt(rng.random())
+    th = rng.random() * 2 * math.pi
+    dlat = (r * math.cos(th)) / 111.32
+    dlng = (r * math.sin(th)) / (111.32 * math.cos(math.radians(lat)))
+    return lat + dlat, lng + dlng
+
+
+def _make_rows(n: int, rng: random.Random) -> List[dict]:
+    rows = []
+    for i in range(n):
+        if rng.random() < 0.03:
+            la, lo = None, None
+        else:
+            la, lo = _offset(DEFAULT_CENTER[0], DEFAULT_CENTER[1], 60.0, rng)
+        rows.append({"id": f"d{i}", "latitude": la, "longitude": lo})
+    return rows
+
+
+def _python_within(rows: List[dict], lat: float, lng: float, radius_km: float) -> List[str]:
+    out = []
+    for d in rows:
+        d_lat, d_lng = d.get("latitude"), d.get("longitude")
+        if d_lat and d_lng:
+            if _haversine_distance_legacy(lat, lng, d_lat, d_lng) <= radius_km:
+                out.append(d["id"])
+    return out
+
+
+def _median_ms(samples: List[float]) -> float:
+    return round(statistics.median(samples) * 1000.0, 3) if samples else 0.0
+
+
+def run_benchmark(
+    *, drivers: int = 10000, queries: int = 50, radius_km: float = 20.0, k: int = 10, seed: int = 42
+) -> Dict[str, Any]:
+    rng = random.Random(seed)
+    rows = _make_rows(drivers, rng)
+    points = [_offset(DEFAULT_CENTER[0], DEFAULT_CENTER[1], 30.0, rng) for _ in range(queries)]
+
+    py_t: List[float] = []
+    np_t: List[float] = []
+    q_t: List[float] = []
+    k_t: List[float] = []
+    matches = True
+    hits = 0
+    prebuilt = GeoPoints.from_rows(rows)
+    for lat, lng in points:
+        t = time.perf_counter()
+        py_ids = _python_within(rows, lat, lng, radius_km)
+        py_t.append(time.perf_counter() - t)
+
+        t = time.perf_counter()
+        pts = GeoPoints.from_rows(rows)
+        idx, _d = pts.within(lat, lng, radius_km, sort=False)
+        np_t.append(time.perf_counter() - t)
+
+        t = time.perf_counter()
+        prebuilt.within(lat, lng, radius_km, sort=False)
+        q_t.append(time.perf_counter() - t)
+
+        t = time.perf_counter()
+        prebuilt.k_nearest(lat, lng, k, radius_km=radius_km)
+        k_t.append(time.perf_counter() - t)
+
+        np_ids = [r["id"] for r in pts.take(idx)]
+        matches = matches and np_ids == py_ids
+        hits += len(py_ids)
+
+    py_ms, np_ms, q_ms = _median_ms(py_t), _median_ms(np_t), _median_ms(q_t)
+    return {
+        "drivers": drivers,
+        "queries": queries,
+        "radius_km": radius_km,
+        "avg_hits": round(hits / max(1, queries), 1),
+        "matches": matches,
+        "python_ms": py_ms,
+        "numpy_ms": np_ms,
+        "numpy_query_ms": q_ms,
+        "k_nearest_ms": _median_ms(k_t),
+        "speedup": round(py_ms / np_ms, 1) if np_ms else 0.0,
+        "speedup_query": round(py_ms / q_ms, 1) if q_ms else 0.0,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Kuş uçuşu yarıçap filtresi mikro-benchmark'ı (Python vs NumPy)")
+    ap.add_argument("--drivers", type=int, default=10000)
+    ap.add_argument("--queries", type=int, default=50)
+    ap.add_argument("--radius-km", type=float, default=20.0)
+    ap.add_argument("--k", type=int, default=10)
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--json", action="store_true")
+    args = ap.parse_args(argv)
+
+    report = run_benchmark(
+        drivers=args.drivers, queries=args.queries, radius_km=args.radius_km, k=args.k, seed=args.seed
+    )
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        width = max(len(k) for k in report)
+        for key, v in report.items():
+            print(f"{key.ljust(width)}  {v}")
+    return 0 if report["matches"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -9,9 +9,8 @@ import logging
 import os
 from typing import Any, Literal
 
-import httpx
-
 from controllers.ai_controller import LeylekZekaError
+from services.http_clients import get_http_client
 
 logger = logging.getLogger("server")
 
@@ -179,8 +178,8 @@ async def _call_anthropic_admin_json(user_text: str) -> str:
         "anthropic-version": "2023-06-01",
         "content-type": "application/json",
     }
-    async with httpx.AsyncClient(timeout=ac.REQUEST_TIMEOUT_SEC) as client:
-        resp = await client.post(ac.ANTHROPIC_URL, json=payload, headers=headers)
+    client = get_http_client("anthropic")
+    resp = await client.post(ac.ANTHROPIC_URL, json=payload, headers=headers, timeout=ac.REQUEST_TIMEOUT_SEC)
     if resp.status_code != 200:
         raise LeylekZekaError("bad_status")
     data = resp.json()
@@ -14,6 +14,7 @@ from typing import Any, Literal, Optional, TypedDict
 import httpx
 
 from services.answer_engine import try_resolve
+from services.http_clients import get_http_client
 from services.answer_engine.telemetry import emit_answer_engine_resolution
 from services.leylek_zeka_live_training import (
     is_admin_teaching_statement,
@@ -465,8 +466,8 @@ async def _call_openai(
     }
 
     try:
-        async with httpx.AsyncClient(timeout=REQUEST_TIMEOUT_SEC) as client:
-            resp = await client.post(OPENAI_URL, json=payload, headers=headers)
+        client = get_http_client("openai")
+        resp = await client.post(OPENAI_URL, json=payload, headers=headers, timeout=REQUEST_TIMEOUT_SEC)
     except httpx.TimeoutException:
         logger.warning("Leylek Zeka: OpenAI timeout (%ss)", REQUEST_TIMEOUT_SEC)
         raise LeylekZekaError("timeout")
@@ -5,11 +5,12 @@ OSRM API ile rota hesaplama, Redis benzeri in-memory cache
 
 import asyncio
 import math
-import httpx
 from datetime import datetime, timedelta
 from typing import Optional, Dict, Tuple
 import logging
 
+from services.http_clients import get_http_client
+
 logger = logging.getLogger(__name__)
 
 # ==================== ROUTE CACHE ====================
@@ -98,9 +99,9 @@ async def get_route_cached(
     try:
         url = f"https://router.project-osrm.org/route/v1/driving/{start_lng},{start_lat};{end_lng},{end_lat}?overview=full&geometries=polyline"
         
-        async with httpx.AsyncClient(http2=False, timeout=5.0) as client:
-            response = await client.get(url)
-            data = response.json()
+        client = get_http_client("osrm")
+        response = await client.get(url, timeout=5.0)
+        data = response.json()
         
         if data.get('code') == 'Ok' and data.get('routes'):
             route = data['routes'][0]
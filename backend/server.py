@@ -7,7 +7,7 @@ from fastapi.responses import JSONResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, ValidationError, field_validator
-from typing import Annotated, Optional
+from typing import Annotated, Dict, Optional, Tuple
 import os
 import logging
 import uuid
@@ -20,6 +20,7 @@ import httpx
 import json
 import time
 import math
+import re
 import asyncio
 import sys
 import jwt
@@ -60,6 +61,55 @@ except ModuleNotFoundError as e:
 from expo_push_channels import expo_android_channel_id_for_data, expo_android_channel_id_for_type
 from route_service import get_route_cached
 import trust_service as _trust_service
+from services.driver_geo_index import DriverGeoIndex, _coerce_latlng, haversine_km
+from services.dispatch_ranking import known_positions, merge_candidates, pending_driver_ids
+from services.waiting_tag_index import WAITING_TAGS_CHANNEL, WaitingTagIndex
+from services.route_cache import RouteCache
+from services.location_ingest import SUBMIT_THROTTLED, LocationIngestor
+from services.trip_location_stream import ACTIVE_TRIP_STATUSES, TripLocationStream, trip_room
+from services.shared_state import create_state_backend, socketio_client_manager
+from services.presence_registry import PresenceRegistry
+from services.driver_state_cache import DRIVER_STATE_COLUMNS, DriverStateCache
+from services.offer_fanout import OfferAckTracker, bounded_gather
+from services.push_dispatcher import PushDispatcher
+from services.push_token_cache import PushTokenCache
+from services.tag_expiry import TagExpirySweeper
+from services.block_cache import BlockCache
+from services.heatmap_tiles import KIND_APP_USER, KIND_SEEKING, HeatmapTiles
+from services.geo_arrays import GeoPoints
+from services.match_events import (
+    FLOW_ACCEPT_OFFER,
+    FLOW_ACCEPT_RIDE,
+    FLOW_DRIVER_ACCEPT_HTTP,
+    FLOW_DRIVER_ACCEPT_SOCKET,
+    MATCH_PUSH_TYPE,
+    ROLE_DRIVER,
+    ROLE_PASSENGER,
+    build_match_payload,
+    match_event_names,
+    match_push_messages,
+)
+from services.push_outbox import (
+    OUTCOME_DROP as OUTBOX_DROP,
+    OUTCOME_RETRY as OUTBOX_RETRY,
+    OUTCOME_SENT as OUTBOX_SENT,
+    MemoryOutboxStore,
+    PushOutbox,
+    SupabaseOutboxStore,
+)
+from services.dispatch_config import DispatchConfig
+from services.dispatch_scheduler import (
+    DispatchScheduler,
+    MemoryJobJournal,
+    RedisJobJournal,
+    SupabaseJobJournal,
+)
+from services.http_clients import (
+    close_http_clients,
+    get_http_client,
+    http_pool_stats,
+    start_http_clients,
+)
 from routes.admin_ai import router as admin_ai_router
 from routes.admin_answer_engine import router as admin_answer_engine_router
 from routes.admin_leylek_zeka_train import router as admin_leylek_zeka_train_router
@@ -256,33 +306,111 @@ CORS_ALLOW_ORIGINS = _build_cors_allow_origins()
 logger.info("🌐 CORS allow_origins (%d): %s", len(CORS_ALLOW_ORIGINS), ", ".join(CORS_ALLOW_ORIGINS))
 
 # ==================== SOCKET.IO SERVER ====================
+# Çoklu worker/node: REDIS_URL doluysa emit'ler AsyncRedisManager ile tüm süreçlere yayılır,
+# aşağıdaki paylaşılan map'ler Redis'te tutulur (services/shared_state.py). Boşsa tek süreç / bellek.
+_sio_client_manager = socketio_client_manager()
 sio = socketio.AsyncServer(
     async_mode="asgi",
     cors_allowed_origins=CORS_ALLOW_ORIGINS,
     logger=True,
     engineio_logger=True,
+    **({"client_manager": _sio_client_manager} if _sio_client_manager is not None else {}),
 )
+shared_state = create_state_backend()
+
+# Bu süreçteki soketler: kullanıcı ↔ sid çift yönlü indeks (çoklu cihaz, O(1) disconnect)
+presence = PresenceRegistry()
+# Süreçler arası: {user_id (küçük harf): birincil socket_id} — sid Redis manager ile diğer worker'dan da emit edilebilir
+connected_users = shared_state.map("connected_users")
+# Çökmüş worker'ın disconnect'i gelmezse kayıt kendiliğinden düşsün
+CONNECTED_USER_TTL_SEC = 24 * 3600
+# Worker başına çevrimiçi sayaç özeti (yalnızca paylaşılan arka uçta; online_count tüm worker'ları toplar)
+presence_counts = shared_state.map("presence_counts")
+PRESENCE_PUBLISH_SEC = 15.0
+_presence_worker_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+_presence_publish_task: Optional[asyncio.Task] = None
+
+
+async def get_user_sid(user_id) -> Optional[str]:
+    """Kullanıcının birincil sid'i: önce bu süreç (O(1)), yoksa paylaşılan kayıt (diğer worker)."""
+    if user_id is None:
+        return None
+    local = presence.get_sid(user_id)
+    if local:
+        return local
+    key = str(user_id).strip().lower()
+    if not key:
+        return None
+    return await connected_users.get(key)
+
+
+async def online_user_count(city: Optional[str] = None) -> int:
+    """Çevrimiçi (socket kayıtlı) kullanıcı sayısı; city verilirse o şehir."""
+    if shared_state.kind == "memory":
+        return presence.online_count(city)
+    total = presence.online_count(city)
+    for worker_id, snap in await presence_counts.items():
+        if worker_id == _presence_worker_id or not isinstance(snap, dict):
+            continue
+        if city is None:
+            total += int(snap.get("total") or 0)
+        else:
+            total += int((snap.get("cities") or {}).get(city.strip(), 0))
+    return total
+
+
+async def _presence_publish_loop() -> None:
+    while True:
+        try:
+            await presence_counts.set(
+                _presence_worker_id,
+                {"total": presence.online_count(), "cities": presence.city_counts()},
+                ttl_sec=PRESENCE_PUBLISH_SEC * 4,
+            )
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning("Presence sayaç yayını başarısız: %s", e)
+        await asyncio.sleep(PRESENCE_PUBLISH_SEC)
+
+
+async def _presence_load_city(user_id: str) -> None:
+    """Şehir sayacı için kullanıcının şehrini bir kez oku (register'ı bekletmez)."""
+    try:
+        res = await db.table("users").select("city").eq("id", user_id).limit(1).execute()
+        if res.data:
+            presence.set_city(user_id, res.data[0].get("city"))
+    except Exception as e:
+        logger.debug("Presence şehir okunamadı %s: %s", user_id, e)
 
-# Aktif kullanıcılar: {user_id: socket_id}
-connected_users = {}
 
 @sio.event
 async def connect(sid, environ):
     print("🔥 SOCKET CLIENT CONNECTED:", sid)
     logger.info(f"🔌 Socket bağlandı: {sid}")
-    logger.info(f"🔌 Toplam bağlı: {len(connected_users) + 1}")
+    logger.info(f"🔌 Bu süreçte bağlı soket: {presence.stats()['sockets'] + 1}")
 
 @sio.event
 async def disconnect(sid):
     print("❌ SOCKET CLIENT DISCONNECTED:", sid)
-    # Aynı sid'e kayıtlı tüm key'leri kaldır (orijinal + normalized user_id)
-    to_remove = [uid for uid, s in connected_users.items() if s == sid]
-    for uid in to_remove:
-        del connected_users[uid]
-    if to_remove:
-        logger.info(f"🔌 Socket ayrıldı: {sid} (user: {to_remove})")
-    else:
+    uid = presence.remove_sid(sid)
+    if not uid:
         logger.info(f"🔌 Socket ayrıldı: {sid}")
+        return
+    # Kullanıcının başka cihazı varsa paylaşılan kayıt ona geçer; yoksa (hâlâ bu sid ise) silinir
+    remaining = presence.get_sid(uid)
+    try:
+        if remaining:
+            await connected_users.set(uid, remaining, ttl_sec=CONNECTED_USER_TTL_SEC)
+        elif await connected_users.get(uid) == sid:
+            await connected_users.pop(uid)
+    except Exception as e:
+        logger.warning("connected_users disconnect güncellemesi başarısız %s: %s", uid, e)
+    logger.info(f"🔌 Socket ayrıldı: {sid} (user: {uid}, kalan cihaz: {len(presence.sids(uid))})")
+
+
+DRIVERS_ROOM = "drivers"
+
 
 def _normalize_user_room(user_id: str) -> str:
     """UUID/user_id için tutarlı room adı (büyük/küçük harf uyumsuzluğunu önler)."""
@@ -333,11 +461,22 @@ async def register(sid, data):
     resolved_uid = str(resolved_uid).strip()
     resolved_lower = resolved_uid.lower()
 
-    connected_users[resolved_uid] = sid
-    connected_users[resolved_lower] = sid
+    was_online = presence.is_online(resolved_lower)
+    presence.add(resolved_lower, sid, role=role)
+    await connected_users.set(resolved_lower, sid, ttl_sec=CONNECTED_USER_TTL_SEC)
+    if not was_online:
+        asyncio.create_task(_presence_load_city(resolved_lower))
+        asyncio.create_task(block_cache.prefetch([resolved_lower]))
+    # location_update / driver_location_update kimliği payload'dan değil oturumdan alır
+    await sio.save_session(sid, {"user_id": resolved_lower, "role": role})
 
     room_name = _normalize_user_room(resolved_uid)
     await sio.enter_room(sid, room_name)
+    # Tüm sürücülere yayın (tag iptal / süre dolumu: tag_cancelled, remove_offer) bu odaya gider
+    if role == "driver":
+        await sio.enter_room(sid, DRIVERS_ROOM)
+    else:
+        await sio.leave_room(sid, DRIVERS_ROOM)
 
     _ru_short = (resolved_uid[:12] + "…") if len(resolved_uid) > 12 else resolved_uid
     logger.info(
@@ -363,6 +502,187 @@ async def register(sid, data):
         except Exception:
             pass
 
+async def _socket_location_ping(sid, data) -> None:
+    """GPS ping'i (socket): kayıtlı oturumun kullanıcısı için location_ingestor'a verir."""
+    if not isinstance(data, dict):
+        return
+    try:
+        session = await sio.get_session(sid)
+    except KeyError:
+        session = None
+    uid = (session or {}).get("user_id")
+    if not uid:
+        return
+    lat = data.get("latitude", data.get("lat"))
+    lng = data.get("longitude", data.get("lng"))
+    try:
+        lat_f, lng_f = float(lat), float(lng)
+    except (TypeError, ValueError):
+        return
+    if not (-90.0 <= lat_f <= 90.0 and -180.0 <= lng_f <= 180.0):
+        return
+    presence.touch(uid)
+    if _UUID_RE.match(uid):
+        location_ingestor.submit(uid, lat_f, lng_f)
+    driver_geo_index.update_location(uid, lat_f, lng_f)
+    heatmap_presence_move(uid, lat_f, lng_f)
+    await _trip_location_fanout(uid, lat_f, lng_f, skip_sid=sid)
+
+
+async def _fetch_active_trip_row(tag_id: str) -> Optional[dict]:
+    res = (
+        await db.table("tags")
+        .select("id, passenger_id, driver_id, status")
+        .eq("id", tag_id)
+        .limit(1)
+        .execute()
+    )
+    row = res.data[0] if res.data else None
+    if not row or row.get("status") not in ACTIVE_TRIP_STATUSES:
+        return None
+    return row
+
+
+def _trip_member_entry(trip: dict) -> dict:
+    return {k: trip[k] for k in ("tag_id", "passenger_id", "driver_id")}
+
+
+async def _trip_members_forget(trip: dict) -> None:
+    for uid in (trip.get("passenger_id"), trip.get("driver_id")):
+        if not uid:
+            continue
+        try:
+            current = await trip_members.get(uid)
+            if current and current.get("tag_id") == trip["tag_id"]:
+                await trip_members.pop(uid)
+        except Exception as e:
+            logger.warning("trip_members temizliği uid=%s: %s", uid, e)
+
+
+async def _trip_for_user(uid: str) -> Optional[dict]:
+    """Yerel yolculuk kaydı; yoksa (join_trip başka worker'da işlendi) paylaşılan üyelikten yükler."""
+    trip = trip_location_stream.trip_for_user(uid)
+    if trip is not None or trip_location_stream.recently_missed(uid):
+        return trip
+    try:
+        entry = await trip_members.get(uid)
+    except Exception as e:
+        logger.warning("trip_members okuma uid=%s: %s", uid, e)
+        entry = None
+    if not entry or not entry.get("tag_id"):
+        trip_location_stream.mark_miss(uid)
+        return None
+    return trip_location_stream.register(
+        entry["tag_id"], entry.get("passenger_id"), entry.get("driver_id"), verified=False
+    )
+
+
+async def _trip_location_fanout(uid: str, lat: float, lng: float, skip_sid: Optional[str] = None) -> None:
+    """Aktif yolculuktaki kullanıcının konumunu trip odasına yay (süzgeçli; yolculuk yoksa no-op)."""
+    trip = await _trip_for_user(uid)
+    if trip is None or not trip_location_stream.should_emit(uid, lat, lng):
+        return
+    try:
+        if trip_location_stream.needs_revalidate(trip):
+            if await _fetch_active_trip_row(trip["tag_id"]) is None:
+                trip_location_stream.unregister(trip["tag_id"])
+                await _trip_members_forget(trip)
+                await sio.emit("trip_tracking_ended", {"tag_id": trip["tag_id"]}, room=trip_room(trip["tag_id"]))
+                return
+            trip_location_stream.mark_verified(trip)
+        await sio.emit(
+            "trip_location",
+            {
+                "tag_id": trip["tag_id"],
+                "user_id": uid,
+                "role": trip_location_stream.role_of(trip, uid),
+                "latitude": lat,
+                "longitude": lng,
+                "updated_at": datetime.utcnow().isoformat(),
+            },
+            room=trip_room(trip["tag_id"]),
+            skip_sid=skip_sid,
+        )
+    except Exception as e:
+        logger.warning("trip_location yayını tag=%s: %s", trip.get("tag_id"), e)
+
+
+@sio.event
+async def join_trip(sid, data):
+    """Eşleşmiş yolculuğun canlı konum odasına katıl ({tag_id}); yalnızca yolcu veya sürücü."""
+    tag_id = str((data or {}).get("tag_id") or "").strip().lower() if isinstance(data, dict) else ""
+    try:
+        session = await sio.get_session(sid)
+    except KeyError:
+        session = None
+    uid = (session or {}).get("user_id")
+    if not uid or not tag_id:
+        await sio.emit("trip_joined", {"success": False, "error": "auth_required"}, room=sid)
+        return
+    try:
+        row = await _fetch_active_trip_row(tag_id)
+    except Exception as e:
+        logger.warning("join_trip tag=%s: %s", tag_id, e)
+        row = None
+    participants = {str(row.get(k) or "").strip().lower() for k in ("passenger_id", "driver_id")} if row else set()
+    if uid not in participants:
+        await sio.emit("trip_joined", {"success": False, "tag_id": tag_id, "error": "not_active"}, room=sid)
+        return
+    trip = trip_location_stream.register(tag_id, row.get("passenger_id"), row.get("driver_id"))
+    # Üyelik tüm worker'lara: karşı tarafın ping'i başka worker'a düşse de yayın yapılır
+    entry = _trip_member_entry(trip)
+    for member_id in (trip["passenger_id"], trip["driver_id"]):
+        if member_id:
+            try:
+                await trip_members.set(member_id, entry, ttl_sec=TRIP_MEMBER_TTL_SEC)
+            except Exception as e:
+                logger.warning("trip_members yazımı uid=%s: %s", member_id, e)
+    await sio.enter_room(sid, trip_room(tag_id))
+    # Karşı tarafın bilinen son konumu (bellekten) — ilk ping'i beklemeden haritayı doldurur
+    other_id = trip["driver_id"] if uid == trip["passenger_id"] else trip["passenger_id"]
+    live = location_ingestor.get(other_id)
+    await sio.emit(
+        "trip_joined",
+        {
+            "success": True,
+            "tag_id": tag_id,
+            "room": trip_room(tag_id),
+            "other_location": (
+                {
+                    "user_id": other_id,
+                    "role": trip_location_stream.role_of(trip, other_id),
+                    "latitude": live["latitude"],
+                    "longitude": live["longitude"],
+                    "updated_at": live["last_location_update"],
+                }
+                if live
+                else None
+            ),
+        },
+        room=sid,
+    )
+
+
+@sio.event
+async def leave_trip(sid, data):
+    """Yolculuk odasından ayrıl ({tag_id})."""
+    tag_id = str((data or {}).get("tag_id") or "").strip().lower() if isinstance(data, dict) else ""
+    if tag_id:
+        await sio.leave_room(sid, trip_room(tag_id))
+
+
+@sio.event
+async def location_update(sid, data):
+    """Canlı konum (yolcu/sürücü) — HTTP update-location ile aynı boru hattı, istek başına DB yazımı yok."""
+    await _socket_location_ping(sid, data)
+
+
+@sio.event
+async def driver_location_update(sid, data):
+    """Sürücü canlı konumu ({driver_id, lat, lng}); driver_id yok sayılır, oturum kullanıcısı esas."""
+    await _socket_location_ping(sid, data)
+
+
 @sio.event
 async def call_user(sid, data):
     """Arama başlat - karşı tarafa bildir"""
@@ -375,10 +695,10 @@ async def call_user(sid, data):
     caller_name = data.get('caller_name', 'Bilinmeyen')
     
     logger.info(f"📞 Arama isteği: {caller_id} -> {receiver_id} (call_id: {call_id})")
-    logger.info(f"📱 Bağlı kullanıcılar: {list(connected_users.keys())}")
+    logger.info(f"📱 Bağlı kullanıcı kaydı: {presence.online_count()}")
     
     # Karşı tarafın socket_id'sini bul
-    receiver_sid = connected_users.get(receiver_id)
+    receiver_sid = await get_user_sid(receiver_id)
     
     if receiver_sid:
         # Karşı tarafa gelen arama bildirimi gönder
@@ -394,7 +714,7 @@ async def call_user(sid, data):
         await sio.emit('call_ringing', {'success': True, 'receiver_online': True}, room=sid)
     else:
         logger.warning(f"⚠️ Alıcı çevrimdışı veya kayıtlı değil: {receiver_id}")
-        logger.warning(f"⚠️ Kayıtlı kullanıcılar: {connected_users}")
+        logger.warning(f"⚠️ Kayıtlı kullanıcı sayısı: {presence.online_count()}")
         try:
             asyncio.create_task(send_push_notification(
                 receiver_id,
@@ -424,7 +744,7 @@ async def accept_call(sid, data):
     logger.info(f"✅ Arama kabul edildi: {call_id}")
     
     # Arayana bildir
-    caller_sid = connected_users.get(caller_id)
+    caller_sid = await get_user_sid(caller_id)
     if caller_sid:
         await sio.emit('call_accepted', {
             'call_id': call_id,
@@ -441,7 +761,7 @@ async def reject_call(sid, data):
     logger.info(f"❌ Arama reddedildi: {call_id}")
     
     # Arayana bildir
-    caller_sid = connected_users.get(caller_id)
+    caller_sid = await get_user_sid(caller_id)
     if caller_sid:
         await sio.emit('call_rejected', {
             'call_id': call_id,
@@ -461,7 +781,7 @@ async def end_call(sid, data):
     # Her iki tarafa da bildir
     for user_id in [caller_id, receiver_id]:
         if user_id and user_id != ended_by:
-            user_sid = connected_users.get(user_id)
+            user_sid = await get_user_sid(user_id)
             if user_sid:
                 await sio.emit('call_ended', {
                     'call_id': call_id,
@@ -487,14 +807,14 @@ async def deduct_points(user_id: str, points: int, reason: str):
     """Kullanıcıdan puan düş"""
     try:
         # Mevcut puanı al
-        result = supabase.table("users").select("points, rating").eq("id", user_id).execute()
+        result = await db.table("users").select("points, rating").eq("id", user_id).execute()
         if result.data:
             current_points = result.data[0].get("points", 75)
             new_points = max(0, current_points - points)
             new_rating = points_to_rating(new_points)
             
             # Güncelle
-            supabase.table("users").update({
+            await db.table("users").update({
                 "points": new_points,
                 "rating": new_rating,
                 "updated_at": datetime.utcnow().isoformat()
@@ -553,7 +873,7 @@ async def request_trip_end_socket(sid, data):
     
     # Supabase'e kaydet
     try:
-        supabase.table("tags").update({
+        await db.table("tags").update({
             "end_request": {
                 "requester_id": requester_id,
                 "user_type": requester_type,
@@ -565,7 +885,7 @@ async def request_trip_end_socket(sid, data):
         logger.error(f"Trip end request save error: {e}")
     
     # Karşı tarafa ANINDA bildirim gönder
-    target_sid = connected_users.get(target_user_id)
+    target_sid = await get_user_sid(target_user_id)
     if target_sid:
         await sio.emit('trip_end_request', {
             'tag_id': tag_id,
@@ -591,7 +911,7 @@ async def respond_trip_end_socket(sid, data):
     try:
         if approved:
             # Trip'i tamamla
-            supabase.table("tags").update({
+            await db.table("tags").update({
                 "status": "completed",
                 "completed_at": datetime.utcnow().isoformat(),
                 "end_request": None,
@@ -600,7 +920,7 @@ async def respond_trip_end_socket(sid, data):
             
             # Her iki tarafa da bildir
             for user_id in [responder_id, requester_id]:
-                user_sid = connected_users.get(user_id)
+                user_sid = await get_user_sid(user_id)
                 if user_sid:
                     await sio.emit('trip_completed', {
                         'tag_id': tag_id,
@@ -611,14 +931,14 @@ async def respond_trip_end_socket(sid, data):
             logger.info(f"✅ Trip completed via socket (mutual): {tag_id}")
         else:
             # İsteği reddet
-            result = supabase.table("tags").select("end_request").eq("id", tag_id).execute()
+            result = await db.table("tags").select("end_request").eq("id", tag_id).execute()
             if result.data and result.data[0].get("end_request"):
                 end_request = result.data[0]["end_request"]
                 end_request["status"] = "rejected"
-                supabase.table("tags").update({"end_request": end_request}).eq("id", tag_id).execute()
+                await db.table("tags").update({"end_request": end_request}).eq("id", tag_id).execute()
             
             # İsteği yapana reddi bildir
-            requester_sid = connected_users.get(requester_id)
+            requester_sid = await get_user_sid(requester_id)
             if requester_sid:
                 await sio.emit('trip_end_rejected', {
                     'tag_id': tag_id,
@@ -668,10 +988,112 @@ def _has_active_package_for_dispatch(driver_active_until, now_iso: str) -> bool:
     return bool(driver_active_until and driver_active_until > now_iso)
 
 
+async def _load_driver_state_rows(driver_ids: list) -> list:
+    """driver_state_cache yükleyicisi: tek users.in_() sorgusu; bellekteki daha yeni konum bindirilir."""
+    if not supabase:
+        return []
+    res = await db.table("users").select(DRIVER_STATE_COLUMNS).in_("id", driver_ids).execute()
+    return [location_ingestor.overlay(r.get("id"), r) for r in res.data or []]
+
+
+# Teklif uygunluğu + push token için kısa TTL'li sürücü satırı (batch başına tek sorgu)
+driver_state_cache = DriverStateCache.from_env(_load_driver_state_rows)
+# Push alıcı çözümleme (id / telefon → token); token kayıt / silme uçlarında düşürülür
+push_token_cache = PushTokenCache.from_env()
+PUSH_TOKEN_INVALIDATE_CHANNEL = "push_token_invalidate"
+
+
+async def invalidate_push_user(user_id) -> None:
+    """users.push_token değişti: sürücü satırı + push token önbellekleri (diğer worker'lar dahil)."""
+    if not user_id:
+        return
+    driver_state_cache.invalidate(user_id)
+    push_token_cache.invalidate(user_id)
+    if shared_state.kind == "memory":
+        return
+    try:
+        await shared_state.publish(PUSH_TOKEN_INVALIDATE_CHANNEL, {"user_id": str(user_id).strip()})
+    except Exception as e:
+        logger.warning("push_token_invalidate yayını başarısız: %s", e)
+
+
+DRIVER_STATE_INVALIDATE_CHANNEL = "driver_state_invalidate"
+
+
+async def invalidate_driver_state(user_id) -> None:
+    """users.driver_online / driver_active_until değişti: dispatch satır önbelleği (diğer worker'lar dahil)."""
+    if not user_id:
+        return
+    driver_state_cache.invalidate(user_id)
+    if shared_state.kind == "memory":
+        return
+    try:
+        await shared_state.publish(DRIVER_STATE_INVALIDATE_CHANNEL, {"user_id": str(user_id).strip()})
+    except Exception as e:
+        logger.warning("driver_state_invalidate yayını başarısız: %s", e)
+
+
+async def _on_driver_state_invalidate(message) -> None:
+    if isinstance(message, dict) and message.get("user_id"):
+        driver_state_cache.invalidate(message["user_id"])
+
+
+async def _on_push_token_invalidate(message) -> None:
+    if isinstance(message, dict) and message.get("user_id"):
+        driver_state_cache.invalidate(message["user_id"])
+        push_token_cache.invalidate(message["user_id"])
+
+
+async def _load_block_rows(user_ids: list) -> list:
+    """block_cache yükleyicisi: kullanıcıların engellediği ve onları engelleyen satırlar (iki in_ sorgusu)."""
+    mine = await db.table("blocked_users").select("user_id, blocked_user_id").in_("user_id", user_ids).execute()
+    theirs = await db.table("blocked_users").select("user_id, blocked_user_id").in_("blocked_user_id", user_ids).execute()
+    return (mine.data or []) + (theirs.data or [])
+
+
+# Sürücü / yolcu akış filtreleri için engelleme kümeleri (block / unblock'ta düşürülür)
+block_cache = BlockCache.from_env(_load_block_rows)
+BLOCK_INVALIDATE_CHANNEL = "block_invalidate"
+
+
+async def invalidate_block_pair(user_id, other_id) -> None:
+    """Engelleme değişti: iki tarafın kümesi (diğer worker'lar dahil)."""
+    block_cache.invalidate(user_id, other_id)
+    if shared_state.kind == "memory":
+        return
+    try:
+        await shared_state.publish(
+            BLOCK_INVALIDATE_CHANNEL, {"user_ids": [str(user_id or "").strip(), str(other_id or "").strip()]}
+        )
+    except Exception as e:
+        logger.warning("block_invalidate yayını başarısız: %s", e)
+
+
+async def _on_block_invalidate(message) -> None:
+    if isinstance(message, dict):
+        block_cache.invalidate(*(message.get("user_ids") or []))
+
+
+def _driver_row_eligible_for_dispatch(row: Optional[dict], now_iso: str) -> bool:
+    if not row:
+        return False
+    if row.get("driver_online") is not True:
+        return False
+    if not _has_active_package_for_dispatch(row.get("driver_active_until"), now_iso):
+        return False
+    lat, lng = row.get("latitude"), row.get("longitude")
+    if lat is None or lng is None:
+        return False
+    if str(lat).strip() == "" or str(lng).strip() == "":
+        return False
+    return True
+
+
 async def is_driver_eligible_for_dispatch_offer(driver_id) -> bool:
     """
     Teklif / push gönderilebilir mi: çevrimiçi, geçerli paket süresi (ücretsiz dönemde yalnızca online),
     konum satırı dolu. Kuyruk/eski liste gecikmeli kalsa bile pasif sürücüye emit edilmez.
+    Satır driver_state_cache'ten okunur (DRIVER_STATE_TTL_SEC; durum değişikliklerinde invalidate).
     """
     try:
         uid = str(driver_id).strip() if driver_id is not None else ""
@@ -683,27 +1105,8 @@ async def is_driver_eligible_for_dispatch_offer(driver_id) -> bool:
                 uid = str(resolved).strip()
         except Exception:
             pass
-        now_iso = datetime.utcnow().isoformat()
-        r = (
-            supabase.table("users")
-            .select("id, driver_online, driver_active_until, latitude, longitude")
-            .eq("id", uid)
-            .limit(1)
-            .execute()
-        )
-        if not r.data:
-            return False
-        row = r.data[0]
-        if row.get("driver_online") is not True:
-            return False
-        if not _has_active_package_for_dispatch(row.get("driver_active_until"), now_iso):
-            return False
-        lat, lng = row.get("latitude"), row.get("longitude")
-        if lat is None or lng is None:
-            return False
-        if str(lat).strip() == "" or str(lng).strip() == "":
-            return False
-        return True
+        row = await driver_state_cache.get(uid)
+        return _driver_row_eligible_for_dispatch(row, datetime.utcnow().isoformat())
     except Exception as e:
         logger.warning("is_driver_eligible_for_dispatch_offer: %s", e)
         return False
@@ -822,20 +1225,35 @@ DRIVER_ACTIVATION_CONFIG = {
 # Aktif dispatch task'ları (tag_id -> asyncio.Task)
 active_dispatch_tasks: dict = {}
 
-# Dispatch Queue In-Memory State (Supabase'e de yazılacak)
-dispatch_queues: dict = {}  # tag_id -> list of driver entries
+# Dispatch Queue paylaşılan durum (Supabase'e de yazılır): tag_id -> list of driver entries.
+# Okunan liste kopyadır; değişiklik _dispatch_queue_update_entry / set ile geri yazılır.
+dispatch_queues = shared_state.map("dispatch_queues")
+DISPATCH_STATE_TTL_SEC = 3600
+
+
+async def _dispatch_queue_update_entry(tag_id: str, entry: dict) -> None:
+    """Paylaşılan kuyruktaki kaydı (id ile) güncelle."""
+    queue = await dispatch_queues.get(tag_id)
+    if not queue:
+        return
+    for i, e in enumerate(queue):
+        if e.get("id") == entry.get("id"):
+            queue[i] = {**e, **entry}
+            break
+    await dispatch_queues.set(tag_id, queue, ttl_sec=DISPATCH_STATE_TTL_SEC)
 
 # Sıralı dispatch: tag bazında tam teklif bağlamı (DB tag satırında olmayan alanlar)
 dispatch_tag_context: dict = {}
 
 
-def clear_dispatch_in_memory_state():
+async def clear_dispatch_in_memory_state():
     """
     Bellekteki sürücü/dispatch listeleri: kuyruk, tag bağlamı, timeout task'ları.
     Process restart zaten sıfırlar; startup'ta da çağrılır (deploy sonrası kalıntı olmaması için).
+    Redis'teki paylaşılan kuyruk/rolling durumu silinmez (diğer worker'lar kullanıyor olabilir).
     """
     global dispatch_queues, dispatch_tag_context, active_dispatch_tasks
-    global rolling_dispatch_tasks, rolling_dispatch_index
+    global rolling_dispatch_index
     for _key, task in list(active_dispatch_tasks.items()):
         try:
             if task is not None and not task.done():
@@ -843,17 +1261,12 @@ def clear_dispatch_in_memory_state():
         except Exception:
             pass
     active_dispatch_tasks.clear()
-    dispatch_queues.clear()
+    if shared_state.kind == "memory":
+        await dispatch_queues.clear()
+        await rolling_dispatch_index.clear()
     dispatch_tag_context.clear()
-    for _tid, task in list(rolling_dispatch_tasks.items()):
-        try:
-            if task is not None and not task.done():
-                task.cancel()
-        except Exception:
-            pass
-    rolling_dispatch_tasks.clear()
-    rolling_dispatch_index.clear()
-    logger.info("🧹 Dispatch bellek durumu temizlendi (queues, tag_context, active_dispatch_tasks, rolling_dispatch)")
+    # Rolling batch zamanlayıcıları dispatch_scheduler journal'ında — restart sonrası devam eder, silinmez
+    logger.info("🧹 Dispatch bellek durumu temizlendi (queues, tag_context, active_dispatch_tasks)")
 
 
 # Araç tipi eşleşmesi her zaman açık: yolcu car → yalnız car sürücü; yolcu motorcycle → yalnız motorcycle.
@@ -874,10 +1287,59 @@ except (TypeError, ValueError):
 SEQUENTIAL_DISPATCH_RADIUS_KM = DISPATCH_RADIUS_KM
 BROADCAST_RADIUS_KM = DISPATCH_RADIUS_KM
 
-# tag_id -> asyncio.Task (20s zamanlayıcı)
-rolling_dispatch_tasks: dict = {}
-# tag_id -> {"cursor": int, "drivers": list, "full_tag": dict, "current_batch": list[str]}
-rolling_dispatch_index: dict = {}
+# tag_id -> {"cursor": int, "drivers": list, "full_tag": dict, "current_batch": list[str], "gen": int}
+rolling_dispatch_index = shared_state.map("rolling_dispatch")
+
+
+def _create_dispatch_journal():
+    """DISPATCH_JOURNAL=auto|redis|supabase|memory — auto: Redis varsa sorted set, yoksa dispatch_timers tablosu."""
+    mode = (os.getenv("DISPATCH_JOURNAL") or "auto").strip().lower()
+    if mode in ("auto", "redis") and shared_state.kind == "redis":
+        return RedisJobJournal(shared_state.client, prefix=shared_state.prefix)
+    if mode == "memory":
+        return MemoryJobJournal()
+    # `db` bu noktada henüz tanımlı değil; aynı tembel cephe
+    return SupabaseJobJournal(_supabase_core.AsyncSupabase(lambda: supabase))
+
+
+# Rolling batch zamanlayıcıları (20 sn): timing wheel + kalıcı journal; iş kimliği "rolling:{tag_id}".
+# Hangi batch'in tetikleneceğini paylaşılan durumdaki "gen" belirler (eski iş boşa düşer).
+dispatch_scheduler = DispatchScheduler.from_env(_create_dispatch_journal())
+ROLLING_JOB_KIND = "rolling_batch"
+# Açılışta zamanlayıcısı olmayan waiting tag'ler için geriye bakış (dakika)
+try:
+    DISPATCH_RESUME_LOOKBACK_MIN = max(1, int(os.getenv("DISPATCH_RESUME_LOOKBACK_MIN", "10")))
+except (TypeError, ValueError):
+    DISPATCH_RESUME_LOOKBACK_MIN = 10
+
+
+def _rolling_job_id(tag_id: str) -> str:
+    return f"rolling:{tag_id}"
+
+# Çevrimiçi sürücü grid indeksi: find_eligible_drivers adayları (konum ping + online/offline + periyodik uzlaştırma)
+driver_geo_index = DriverGeoIndex()
+try:
+    DRIVER_GEO_INDEX_RECONCILE_SEC = max(10.0, float(os.getenv("DRIVER_GEO_INDEX_RECONCILE_SEC", "60")))
+except (TypeError, ValueError):
+    DRIVER_GEO_INDEX_RECONCILE_SEC = 60.0
+# Uzlaştırma bu süreden eskiyse indeks kullanılmaz (DB taraması)
+DRIVER_GEO_INDEX_MAX_AGE_SEC = DRIVER_GEO_INDEX_RECONCILE_SEC * 3
+_DRIVER_GEO_INDEX_COLUMNS = (
+    "id, name, rating, latitude, longitude, driver_active_until, driver_online, driver_details, last_location_update"
+)
+
+# Bekleyen tag indeksi: online olan sürücüye catch-up teklifleri (ride/create + kabul/iptal/süre dolumu + uzlaştırma)
+waiting_tag_index = WaitingTagIndex()
+try:
+    WAITING_TAG_INDEX_RECONCILE_SEC = max(10.0, float(os.getenv("WAITING_TAG_INDEX_RECONCILE_SEC", "30")))
+except (TypeError, ValueError):
+    WAITING_TAG_INDEX_RECONCILE_SEC = 30.0
+WAITING_TAG_INDEX_MAX_AGE_SEC = WAITING_TAG_INDEX_RECONCILE_SEC * 3
+_WAITING_TAG_COLUMNS = (
+    "id, passenger_id, passenger_name, pickup_lat, pickup_lng, pickup_location, "
+    "dropoff_lat, dropoff_lng, dropoff_location, final_price, distance_km, estimated_minutes, "
+    "passenger_preferred_vehicle, passenger_payment_method"
+)
 
 # dispatch_queue tablosu (sql_migrations/schema_updates.sql) — bilinmeyen kolonla insert tüm kaydı düşürürdü
 DISPATCH_QUEUE_DB_KEYS = frozenset(
@@ -902,21 +1364,377 @@ def generate_promo_code(length: int = 8) -> str:
     chars = string.ascii_uppercase + string.digits
     return ''.join(random.choice(chars) for _ in range(length))
 
-async def get_dispatch_config() -> dict:
-    """Config tablosundan dispatch ayarlarını oku, yoksa default kullan"""
-    try:
-        result = supabase.table("config").select("*").eq("key", "dispatch_config").execute()
-        if result.data:
-            import json
-            return json.loads(result.data[0].get("value", "{}"))
-    except:
-        pass
-    return DISPATCH_CONFIG
+async def _load_dispatch_config_value() -> Optional[str]:
+    if not supabase:
+        return None
+    result = await db.table("config").select("value").eq("key", "dispatch_config").limit(1).execute()
+    return result.data[0].get("value") if result.data else None
+
+
+async def _save_dispatch_config_value(value: str) -> None:
+    existing = await db.table("config").select("key").eq("key", "dispatch_config").limit(1).execute()
+    if existing.data:
+        await db.table("config").update({"value": value}).eq("key", "dispatch_config").execute()
+    else:
+        await db.table("config").insert({"key": "dispatch_config", "value": value}).execute()
+
+
+# Dispatch ayarları: config tablosunun dondurulmuş kopyası (okuma G/Ç'siz; POST sürüm artırıp tüm worker'lara yayar)
+dispatch_config = DispatchConfig.from_env(
+    DISPATCH_CONFIG,
+    loader=_load_dispatch_config_value,
+    saver=_save_dispatch_config_value,
+    backend=shared_state,
+)
 
 def _dispatch_env_flag(name: str) -> bool:
     return os.getenv(name, "").strip().lower() in ("1", "true", "yes", "on")
 
 
+async def driver_geo_index_reconcile() -> int:
+    """Supabase'deki online + paketi geçerli sürücülerle indeksi baştan kur. Dönüş: konumlu sürücü sayısı."""
+    if not supabase:
+        return 0
+    now = datetime.utcnow().isoformat()
+
+    def _fetch():
+        query = supabase.table("users").select(_DRIVER_GEO_INDEX_COLUMNS).eq("driver_online", True)
+        return _apply_driver_active_until_filter(query, now).execute()
+
+    res = await asyncio.to_thread(_fetch)
+    # Toplu yazım aralığında DB konumu bayat olabilir: bellekteki son ping öncelikli
+    rows = [location_ingestor.overlay(r.get("id"), r) for r in (res.data or [])]
+    n = driver_geo_index.replace_all(
+        (row, _effective_driver_vehicle_kind(row)) for row in rows
+    )
+    logger.info("driver_geo_index reconcile: online_rows=%s indexed=%s", len(rows), n)
+    return n
+
+
+async def driver_geo_index_reconcile_loop() -> None:
+    """Startup'ta başlar; DRIVER_GEO_INDEX_RECONCILE_SEC aralıkla tam uzlaştırma."""
+    while True:
+        try:
+            await driver_geo_index_reconcile()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning("driver_geo_index reconcile hatası: %s", e)
+        await asyncio.sleep(DRIVER_GEO_INDEX_RECONCILE_SEC)
+
+
+async def driver_geo_index_refresh_driver(user_id) -> None:
+    """Tek sürücü satırını DB'den okuyup indekse yaz (online/offline geçişi sonrası)."""
+    try:
+        uid = str(user_id).strip() if user_id is not None else ""
+        if not uid or not supabase:
+            return
+        res = (
+            await db.table("users")
+            .select(_DRIVER_GEO_INDEX_COLUMNS)
+            .eq("id", uid)
+            .limit(1)
+            .execute()
+        )
+        row = location_ingestor.overlay(uid, res.data[0]) if res.data else None
+        now_iso = datetime.utcnow().isoformat()
+        if (
+            row
+            and row.get("driver_online") is True
+            and _has_active_package_for_dispatch(row.get("driver_active_until"), now_iso)
+        ):
+            driver_geo_index.upsert(row, _effective_driver_vehicle_kind(row))
+        else:
+            driver_geo_index.remove(uid)
+    except Exception as e:
+        logger.warning("driver_geo_index refresh driver=%s: %s", user_id, e)
+
+
+async def waiting_tag_index_reconcile() -> int:
+    """Supabase'deki tüm waiting tag'lerle indeksi baştan kur. Dönüş: konumlu tag sayısı."""
+    if not supabase:
+        return 0
+    res = await db.table("tags").select(_WAITING_TAG_COLUMNS).eq("status", "waiting").execute()
+    rows = res.data or []
+    n = waiting_tag_index.replace_all(
+        (row, _canonical_vehicle_kind(row.get("passenger_preferred_vehicle")) or "car") for row in rows
+    )
+    logger.info("waiting_tag_index reconcile: waiting_rows=%s indexed=%s", len(rows), n)
+    return n
+
+
+async def waiting_tag_index_reconcile_loop() -> None:
+    """Startup'ta başlar; WAITING_TAG_INDEX_RECONCILE_SEC aralıkla tam uzlaştırma (kaçan olaylar için)."""
+    while True:
+        try:
+            await waiting_tag_index_reconcile()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning("waiting_tag_index reconcile hatası: %s", e)
+        await asyncio.sleep(WAITING_TAG_INDEX_RECONCILE_SEC)
+
+
+async def _publish_waiting_tag_event(message: dict) -> None:
+    """Diğer worker'ların indeksine yay (bellek backend'de tek süreç: yayın gereksiz)."""
+    if shared_state.kind == "memory":
+        return
+    try:
+        await shared_state.publish(WAITING_TAGS_CHANNEL, message)
+    except Exception as e:
+        logger.warning("waiting_tags yayını başarısız: %s", e)
+
+
+async def waiting_tag_index_add(tag: dict) -> None:
+    """Yeni waiting tag (ride/create) — yerel indeks + harita karoları + diğer worker'lar."""
+    kind = _canonical_vehicle_kind((tag or {}).get("passenger_preferred_vehicle")) or "car"
+    heatmap_tag_upsert(tag)
+    if waiting_tag_index.upsert(tag, kind):
+        await _publish_waiting_tag_event({"op": "upsert", "tag": tag, "vehicle_kind": kind})
+
+
+async def waiting_tag_index_drop(tag_id, *, closed: bool = True) -> None:
+    """
+    Tag waiting'den çıktı (kabul / iptal / süre dolumu) — yerel indeks + diğer worker'lar.
+    closed=False: tag hâlâ açık (pending / offers_received) — bekleme haritasında kalır.
+    """
+    if not tag_id:
+        return
+    waiting_tag_index.remove(tag_id)
+    if closed:
+        heatmap_tiles.remove("tag:" + str(tag_id).strip())
+    await _publish_waiting_tag_event({"op": "remove", "tag_id": str(tag_id).strip(), "closed": closed})
+
+
+async def _on_waiting_tag_event(message) -> None:
+    waiting_tag_index.apply_event(message)
+    if not isinstance(message, dict):
+        return
+    if message.get("op") == "upsert" and isinstance(message.get("tag"), dict):
+        heatmap_tag_upsert(message["tag"])
+    elif message.get("op") == "remove" and message.get("closed", True) and message.get("tag_id"):
+        heatmap_tiles.remove("tag:" + str(message["tag_id"]).strip())
+
+
+# ==================== BEKLEME HARİTASI KAROLARI ====================
+# Açık tag'ler + uygulamadaki yolcular için şehir başına yoğunluk hücreleri ve yakın işaret indeksi
+# (services/heatmap_tiles.py). Tam yenileme HEATMAP_REFRESH_SEC aralıkla — yalnızca harita isteği alan
+# worker'da: döngü ilk istekte başlar, HEATMAP_IDLE_STOP_SEC istek gelmezse durur. Arada tag oluşturma /
+# kapanma ve konum ping'leri noktaları yerinde günceller.
+try:
+    HEATMAP_REFRESH_SEC = max(5.0, float(os.getenv("HEATMAP_REFRESH_SEC", "15")))
+except (TypeError, ValueError):
+    HEATMAP_REFRESH_SEC = 15.0
+try:
+    HEATMAP_IDLE_STOP_SEC = max(HEATMAP_REFRESH_SEC, float(os.getenv("HEATMAP_IDLE_STOP_SEC", "300")))
+except (TypeError, ValueError):
+    HEATMAP_IDLE_STOP_SEC = 300.0
+HEATMAP_MAX_AGE_SEC = HEATMAP_REFRESH_SEC * 3
+try:
+    HEATMAP_REFRESH_ROWS = max(100, int(os.getenv("HEATMAP_REFRESH_ROWS", "1000")))
+except (TypeError, ValueError):
+    HEATMAP_REFRESH_ROWS = 1000
+HEATMAP_OPEN_TAG_STATUSES = ["waiting", "pending", "offers_received"]
+HEATMAP_TAG_COLUMNS = (
+    "id, passenger_id, pickup_lat, pickup_lng, pickup_location, status, final_price, created_at, "
+    "passenger_preferred_vehicle, "
+    "users!tags_passenger_id_fkey(name, city, driver_details, gender)"
+)
+
+heatmap_tiles = HeatmapTiles()
+_heatmap_refresh_task: Optional[asyncio.Task] = None
+_heatmap_loop_task: Optional[asyncio.Task] = None
+_heatmap_last_request_mono = 0.0
+
+
+def _heatmap_seeking_point(tag: dict) -> dict:
+    passenger_info = tag.get("users") or {}
+    pname = passenger_info.get("name") or "Yolcu"
+    pg = passenger_info.get("gender")
+    return {
+        "key": "tag:" + str(tag.get("id") or "").strip(),
+        "kind": KIND_SEEKING,
+        "owner": tag.get("passenger_id"),
+        "city": passenger_info.get("city"),
+        "lat": tag.get("pickup_lat"),
+        "lng": tag.get("pickup_lng"),
+        "data": {
+            "tag_id": tag.get("id"),
+            "passenger_id": tag.get("passenger_id"),
+            "pickup_location": (tag.get("pickup_location") or "")[:80],
+            "status": tag.get("status"),
+            "offered_price": tag.get("final_price") or tag.get("offered_price"),
+            "label": (pname.split() or ["Yolcu"])[0][:20],
+            "passenger_gender": pg if pg in ("female", "male") else None,
+            "vehicle_pref": _trip_passenger_vehicle_pref(tag, passenger_info),
+            "created_at": tag.get("created_at"),
+        },
+    }
+
+
+def _heatmap_app_user_point(row: dict) -> dict:
+    nm = row.get("name") or "Yolcu"
+    g = row.get("gender")
+    return {
+        "key": "user:" + str(row.get("id") or "").strip().lower(),
+        "kind": KIND_APP_USER,
+        "owner": row.get("id"),
+        "city": row.get("city"),
+        "lat": row.get("latitude"),
+        "lng": row.get("longitude"),
+        "data": {
+            "user_id": row.get("id"),
+            "label": (nm.split() or ["Yakında"])[0][:12],
+            "passenger_gender": g if g in ("female", "male") else None,
+        },
+    }
+
+
+def heatmap_tag_upsert(tag: dict) -> None:
+    """Yeni / güncellenen açık tag (ride/create satırında users join'i yoksa şehir sonraki yenilemede gelir)."""
+    if not tag or not tag.get("id"):
+        return
+    pt = _heatmap_seeking_point(tag)
+    heatmap_tiles.upsert(pt["key"], kind=pt["kind"], owner=pt["owner"], city=pt["city"], lat=pt["lat"], lng=pt["lng"], data=pt["data"])
+
+
+def heatmap_presence_move(user_id, latitude: float, longitude: float) -> None:
+    """Konum ping'i: haritada görünen (talebi olmayan) kullanıcının noktası taşınır."""
+    if user_id:
+        heatmap_tiles.move("user:" + str(user_id).strip().lower(), latitude, longitude)
+
+
+async def heatmap_tiles_refresh() -> int:
+    """Açık tag'ler (son 10 dk) + son 45 dk konumu güncel, çevrimdışı kullanıcılar → tam yenileme."""
+    ten_min_ago = (datetime.utcnow() - timedelta(minutes=10)).isoformat()
+    forty_five_min_ago = (datetime.utcnow() - timedelta(minutes=45)).isoformat()
+    tag_res = (
+        await db.table("tags")
+        .select(HEATMAP_TAG_COLUMNS)
+        .in_("status", HEATMAP_OPEN_TAG_STATUSES)
+        .gte("created_at", ten_min_ago)
+        .order("created_at", desc=True)
+        .limit(HEATMAP_REFRESH_ROWS)
+        .execute()
+    )
+    try:
+        pu = (
+            await db.table("users")
+            .select("id, name, latitude, longitude, driver_online, updated_at, city, gender")
+            .not_.is_("latitude", "null")
+            .not_.is_("longitude", "null")
+            .or_("driver_online.is.null,driver_online.eq.false")
+            .gte("updated_at", forty_five_min_ago)
+            .limit(HEATMAP_REFRESH_ROWS)
+            .execute()
+        )
+    except Exception as ex:
+        logger.warning(f"heatmap users query fallback: {ex}")
+        pu = (
+            await db.table("users")
+            .select("id, name, latitude, longitude, driver_online, city, gender")
+            .not_.is_("latitude", "null")
+            .not_.is_("longitude", "null")
+            .or_("driver_online.is.null,driver_online.eq.false")
+            .limit(HEATMAP_REFRESH_ROWS)
+            .execute()
+        )
+    points = [_heatmap_seeking_point(t) for t in tag_res.data or [] if t.get("id")]
+    points += [_heatmap_app_user_point(r) for r in pu.data or [] if r.get("id")]
+    return heatmap_tiles.replace_all(points)
+
+
+async def _heatmap_refresh_once() -> None:
+    """Tek yenileme görevi (döngü ve istekler aynı görevi paylaşır)."""
+    global _heatmap_refresh_task
+    if _heatmap_refresh_task is None or _heatmap_refresh_task.done():
+        _heatmap_refresh_task = asyncio.create_task(heatmap_tiles_refresh())
+    await asyncio.shield(_heatmap_refresh_task)
+
+
+async def heatmap_tiles_ensure_fresh() -> None:
+    """
+    Harita isteği: yenileme döngüsü çalışmıyorsa başlatılır; karolar hiç kurulmamış / çok bayatsa bu istek
+    tek yenilemeyi bekler (eşzamanlı istekler aynı görevi bekler).
+    """
+    global _heatmap_loop_task, _heatmap_last_request_mono
+    _heatmap_last_request_mono = time.monotonic()
+    if _heatmap_loop_task is None or _heatmap_loop_task.done():
+        _heatmap_loop_task = asyncio.create_task(heatmap_tiles_refresh_loop())
+    if heatmap_tiles.is_ready(HEATMAP_MAX_AGE_SEC):
+        return
+    await _heatmap_refresh_once()
+
+
+async def heatmap_tiles_refresh_loop() -> None:
+    """İlk harita isteğinde başlar; HEATMAP_REFRESH_SEC aralıkla tam yenileme, HEATMAP_IDLE_STOP_SEC boşta kalınca durur."""
+    while time.monotonic() - _heatmap_last_request_mono < HEATMAP_IDLE_STOP_SEC:
+        try:
+            await _heatmap_refresh_once()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning("heatmap_tiles yenileme hatası: %s", e)
+        await asyncio.sleep(HEATMAP_REFRESH_SEC)
+    logger.info("heatmap_tiles: %.0f sn harita isteği yok, periyodik yenileme durdu", HEATMAP_IDLE_STOP_SEC)
+
+
+def _find_eligible_candidate_rows(
+    plat_f: float, plng_f: float, r_km: float, pref: str, vehicle_filter: bool
+) -> Optional[list]:
+    """
+    Grid indeksinden aday satırlar (bbox ön filtre yarıçapı ile). İndeks hazır değilse None → DB taraması.
+    Paket süresi sorgu anında kontrol edilir (indeks satırı uzlaştırmalar arasında bayatlayabilir).
+    """
+    if not driver_geo_index.is_ready(DRIVER_GEO_INDEX_MAX_AGE_SEC):
+        return None
+    now_iso = datetime.utcnow().isoformat()
+    hits = driver_geo_index.query_radius(
+        plat_f,
+        plng_f,
+        max(1.0, r_km) * 1.4,
+        vehicle_kinds=[pref] if vehicle_filter else None,
+    )
+    return [
+        row
+        for _km, row in hits
+        if _has_active_package_for_dispatch(row.get("driver_active_until"), now_iso)
+    ]
+
+
+async def _route_rank_candidates(candidates: list, plat_f: float, plng_f: float, r_km: float) -> list:
+    """
+    Aday satırlar → pickup tek matris çağrısı (cache + parçalı Distance Matrix / OSRM table).
+    Yol mesafesi r_km içindekiler eligible girdisi olarak (sırasız); lat/lng rota anındaki konum.
+    """
+    if not candidates:
+        return []
+    route_rows = await get_route_matrix_to_point(
+        [(float(d["latitude"]), float(d["longitude"])) for d in candidates],
+        plat_f,
+        plng_f,
+    )
+    out = []
+    for drv, ri in zip(candidates, route_rows):
+        if not ri:
+            continue
+        road_km = float(ri["distance_km"])
+        if road_km > r_km:
+            continue
+        out.append(
+            {
+                "driver_id": str(drv["id"]).strip().lower(),
+                "driver_name": drv.get("name", "Sürücü"),
+                "distance_km": round(road_km, 2),
+                "duration_min": int(max(1, round(float(ri["duration_min"])))),
+                "rating": drv.get("rating", 4.0) or 4.0,
+                "lat": float(drv["latitude"]),
+                "lng": float(drv["longitude"]),
+            }
+        )
+    return out
+
+
 async def find_eligible_drivers(
     pickup_lat: float,
     pickup_lng: float,
@@ -937,16 +1755,19 @@ async def find_eligible_drivers(
         r_km = float(radius_km) if radius_km is not None else float(SEQUENTIAL_DISPATCH_RADIUS_KM)
         pref = _canonical_vehicle_kind(passenger_vehicle_kind) or "car"
 
-        # Online ve aktif paketi olan sürücüleri getir
-        now = datetime.utcnow().isoformat()
-        query = supabase.table("users").select(
-            "id, name, rating, latitude, longitude, driver_active_until, driver_online, driver_details"
-        ).eq("driver_online", True)
-        query = _apply_driver_active_until_filter(query, now)
-
-        result = query.execute()
+        plat_f, plng_f = float(pickup_lat), float(pickup_lng)
 
-        if not result.data:
+        # Önce grid indeksi (yakın hücreler); hazır değilse online ve aktif paketi olan tüm sürücüler
+        driver_rows = _find_eligible_candidate_rows(plat_f, plng_f, r_km, pref, vehicle_filter)
+        source = "geo_index"
+        if driver_rows is None:
+            source = "db_scan"
+            now = datetime.utcnow().isoformat()
+            query = db.table("users").select(_DRIVER_GEO_INDEX_COLUMNS).eq("driver_online", True)
+            query = _apply_driver_active_until_filter(query, now)
+            driver_rows = (await query.execute()).data or []
+
+        if not driver_rows and source == "db_scan":
             logger.warning(
                 "find_eligible_drivers: driver_online=true kayıt yok — sürücü uygulamasında çevrimiçi ve konum açık mı?"
             )
@@ -954,9 +1775,10 @@ async def find_eligible_drivers(
 
         eligible_drivers = []
         exclude_set = {str(x).strip().lower() for x in (exclude_ids or []) if x is not None}
-        online_count = len(result.data)
+        online_count = len(driver_rows)
         logger.info(
-            "find_eligible_drivers debug: online_rows=%s pickup=(%.5f,%.5f) r_km=%s pref=%s vehicle_filter=%s",
+            "find_eligible_drivers debug: source=%s online_rows=%s pickup=(%.5f,%.5f) r_km=%s pref=%s vehicle_filter=%s",
+            source,
             online_count,
             float(pickup_lat),
             float(pickup_lng),
@@ -966,9 +1788,8 @@ async def find_eligible_drivers(
         )
         no_loc = excluded = vehicle_mismatch = too_far = 0
 
-        plat_f, plng_f = float(pickup_lat), float(pickup_lng)
         candidates: list = []
-        for driver in result.data:
+        for driver in driver_rows:
             if str(driver["id"]).strip().lower() in exclude_set:
                 excluded += 1
                 continue
@@ -1004,31 +1825,7 @@ async def find_eligible_drivers(
 
             candidates.append(driver)
 
-        sem = asyncio.Semaphore(12)
-
-        async def _road_row(drv: dict):
-            async with sem:
-                try:
-                    d_la = float(drv["latitude"])
-                    d_lo = float(drv["longitude"])
-                except (TypeError, ValueError):
-                    return None
-                ri = await get_route_info(d_la, d_lo, plat_f, plng_f)
-                if not ri:
-                    return None
-                road_km = float(ri["distance_km"])
-                if road_km > r_km:
-                    return None
-                return {
-                    "driver_id": str(drv["id"]).strip().lower(),
-                    "driver_name": drv.get("name", "Sürücü"),
-                    "distance_km": round(road_km, 2),
-                    "duration_min": int(max(1, round(float(ri["duration_min"])))),
-                    "rating": drv.get("rating", 4.0) or 4.0,
-                }
-
-        rows = await asyncio.gather(*[_road_row(d) for d in candidates])
-        eligible_drivers = [x for x in rows if x is not None]
+        eligible_drivers = await _route_rank_candidates(candidates, plat_f, plng_f, r_km)
         eligible_drivers.sort(key=lambda x: (x["distance_km"], -x["rating"]))
 
         if not eligible_drivers:
@@ -1067,14 +1864,13 @@ async def create_dispatch_queue(tag_id: str, tag_data: dict) -> bool:
     Uygun sürücüleri bul, sırala ve queue'ya ekle
     """
     try:
-        config = await get_dispatch_config()
-        max_drivers = config.get("max_driver_dispatch", 5)
+        max_drivers = dispatch_config.max_driver_dispatch
         
         pref = _canonical_vehicle_kind(tag_data.get("passenger_preferred_vehicle"))
         if pref is None and tag_data.get("passenger_id"):
             try:
                 pr = (
-                    supabase.table("users")
+                    await db.table("users")
                     .select("driver_details")
                     .eq("id", tag_data["passenger_id"])
                     .limit(1)
@@ -1128,15 +1924,15 @@ async def create_dispatch_queue(tag_id: str, tag_data: dict) -> bool:
         try:
             for entry in queue_entries:
                 db_row = {k: entry[k] for k in DISPATCH_QUEUE_DB_KEYS if k in entry}
-                supabase.table("dispatch_queue").insert(db_row).execute()
+                await db.table("dispatch_queue").insert(db_row).execute()
         except Exception as db_err:
             logger.error(
                 f"Dispatch queue DB kayıt hatası — teklif socket ile gidebilir ama "
                 f"dispatch-pending-offer (polling) çalışmaz; tablo/FK kontrol edin: {db_err}"
             )
         
-        # In-memory'de tut
-        dispatch_queues[tag_id] = queue_entries
+        # Paylaşılan durumda tut (tüm worker'lar)
+        await dispatch_queues.set(tag_id, queue_entries, ttl_sec=DISPATCH_STATE_TTL_SEC)
         
         logger.info(f"✅ Dispatch queue oluşturuldu: tag={tag_id}, {len(queue_entries)} sürücü")
         return True
@@ -1148,7 +1944,7 @@ async def create_dispatch_queue(tag_id: str, tag_data: dict) -> bool:
 
 async def emit_new_passenger_offer_to_driver(driver_id, offer_data: dict) -> bool:
     """
-    Teklif socket event'i: önce doğrudan sid (connected_users), yoksa user room.
+    Teklif socket event'i: önce doğrudan sid (get_user_sid), yoksa user room.
     Pasif / çevrimdışı / paketsiz / konumsuz sürücüye gönderilmez (True=socket gönderildi).
     """
     try:
@@ -1170,9 +1966,16 @@ async def emit_new_passenger_offer_to_driver(driver_id, offer_data: dict) -> boo
             )
             return False
         room = _normalize_user_room(raw)
-        sid = connected_users.get(raw) or connected_users.get(str(driver_id).strip())
+        sid = await get_user_sid(raw)
         if sid:
-            await sio.emit("new_passenger_offer", offer_data, to=sid)
+            offer_tag = offer_data.get("tag_id")
+            offer_ack_tracker.sent(offer_tag, raw)
+            await sio.emit(
+                "new_passenger_offer",
+                offer_data,
+                to=sid,
+                callback=lambda *_: offer_ack_tracker.acked(offer_tag, raw),
+            )
             logger.info(
                 f"📤 new_passenger_offer to=sid driver={raw[:13]}… tag={offer_data.get('tag_id')}"
             )
@@ -1192,18 +1995,9 @@ async def emit_new_passenger_offer_to_driver(driver_id, offer_data: dict) -> boo
             try:
                 if not supabase:
                     return
-                # Supabase client sync çalışabildiği için event-loop'u bloke etmemek adına thread'e al.
-                def _fetch_user_push_token():
-                    return (
-                        supabase.table("users")
-                        .select("push_token")
-                        .eq("id", resolved_driver_id)
-                        .limit(1)
-                        .execute()
-                    )
-
-                ures = await asyncio.to_thread(_fetch_user_push_token)
-                token = (ures.data or [None])[0].get("push_token") if ures.data else None
+                # Uygunluk kontrolünde yüklenen satır (ek SELECT yok)
+                drow = await driver_state_cache.get(resolved_driver_id)
+                token = (drow or {}).get("push_token")
                 if not token:
                     logger.warning(
                         f"Push failed: no push_token driver={resolved_driver_id[:13]} tag={offer_tag_id}"
@@ -1214,6 +2008,8 @@ async def emit_new_passenger_offer_to_driver(driver_id, offer_data: dict) -> boo
                     token=token,
                     title="Yeni Yolculuk",
                     body="Yakınınızda yeni bir yolculuk var",
+                    user_id=resolved_driver_id,
+                    data={"type": "new_offer", "tag_id": str(offer_tag_id)},
                 )
                 if ok:
                     logger.info(
@@ -1249,56 +2045,48 @@ async def emit_existing_waiting_offers_to_driver(driver_id: str) -> None:
         if not supabase:
             return
 
-        cfg = await get_dispatch_config()
-        matching_radius_km = float(cfg.get("matching_radius_km", DISPATCH_CONFIG.get("matching_radius_km", 20)))
-        timeout_sec = int(cfg.get("driver_offer_timeout", DISPATCH_CONFIG.get("driver_offer_timeout", 10)))
+        matching_radius_km = dispatch_config.matching_radius_km
+        timeout_sec = dispatch_config.driver_offer_timeout
 
         resolved_driver_id = await resolve_user_id(driver_id)
         if not await is_driver_eligible_for_dispatch_offer(resolved_driver_id):
             return
-        drv_res = (
-            supabase.table("users")
-            .select("id, latitude, longitude, driver_details")
-            .eq("id", resolved_driver_id)
-            .limit(1)
-            .execute()
-        )
-        if not drv_res.data:
-            return
-        drv = drv_res.data[0]
+        # Online sürücü genelde grid indeksinde (konum ping'iyle güncel); yoksa tek satır okunur
+        drv = driver_geo_index.get(resolved_driver_id)
+        if drv is None:
+            drv_res = (
+                await db.table("users")
+                .select("id, latitude, longitude, driver_details")
+                .eq("id", resolved_driver_id)
+                .limit(1)
+                .execute()
+            )
+            if not drv_res.data:
+                return
+            drv = drv_res.data[0]
         driver_lat = drv.get("latitude")
         driver_lng = drv.get("longitude")
         if driver_lat is None or driver_lng is None:
             return
 
-        driver_eff = _effective_driver_vehicle_kind(drv) or "car"
-
-        waiting_tags = (
-            supabase.table("tags")
-            .select(
-                "id, passenger_id, passenger_name, pickup_lat, pickup_lng, pickup_location, "
-                "dropoff_lat, dropoff_lng, dropoff_location, final_price, distance_km, estimated_minutes, "
-                "passenger_preferred_vehicle, passenger_payment_method"
-            )
-            .eq("status", "waiting")
-            .execute()
+        driver_eff = _canonical_vehicle_kind(_effective_driver_vehicle_kind(drv)) or "car"
+        waiting_tags = await _waiting_tags_near(
+            float(driver_lat), float(driver_lng), matching_radius_km, driver_eff
         )
-        if not waiting_tags.data:
+        if not waiting_tags:
             return
 
-        for tag in waiting_tags.data:
-            tag_lat = tag.get("pickup_lat")
-            tag_lng = tag.get("pickup_lng")
-            if tag_lat is None or tag_lng is None:
-                continue
+        # Yol mesafesi road_route_cache üzerinden (aynı bölgedeki sürücüler aynı hücre anahtarını paylaşır)
+        routes = await bounded_gather(
+            waiting_tags,
+            lambda t: get_route_info(
+                float(driver_lat), float(driver_lng), float(t["pickup_lat"]), float(t["pickup_lng"])
+            ),
+            limit=DISPATCH_FANOUT_CONCURRENCY,
+        )
 
+        for tag, ri_pk in zip(waiting_tags, routes):
             passenger_pref = _canonical_vehicle_kind(tag.get("passenger_preferred_vehicle")) or "car"
-            if not _driver_matches_passenger_vehicle_pref(driver_eff, passenger_pref):
-                continue
-
-            ri_pk = await get_route_info(
-                float(driver_lat), float(driver_lng), float(tag_lat), float(tag_lng)
-            )
             if not ri_pk or float(ri_pk["distance_km"]) > matching_radius_km:
                 continue
             pu_km = round(float(ri_pk["distance_km"]), 1)
@@ -1334,11 +2122,38 @@ async def emit_existing_waiting_offers_to_driver(driver_id: str) -> None:
         logger.warning(f"emit_existing_waiting_offers_to_driver error: {e}")
 
 
+async def _waiting_tags_near(
+    driver_lat: float, driver_lng: float, radius_km: float, driver_kind: str
+) -> list:
+    """
+    Sürücünün araç tipine uyan, pickup'ı kuş uçuşu radius_km içindeki waiting tag'ler (yakından uzağa).
+    İndeks hazırsa yerel arama; değilse tek DB taraması (yol mesafesi kuş uçuşundan kısa olamaz).
+    """
+    if waiting_tag_index.is_ready(WAITING_TAG_INDEX_MAX_AGE_SEC):
+        return [
+            row
+            for _d, row in waiting_tag_index.query_radius(
+                driver_lat, driver_lng, radius_km, vehicle_kinds=[driver_kind]
+            )
+        ]
+    res = await db.table("tags").select(_WAITING_TAG_COLUMNS).eq("status", "waiting").execute()
+    matching = [
+        tag
+        for tag in res.data or []
+        if _driver_matches_passenger_vehicle_pref(
+            driver_kind, _canonical_vehicle_kind(tag.get("passenger_preferred_vehicle")) or "car"
+        )
+    ]
+    pts = GeoPoints.from_rows(matching, "pickup_lat", "pickup_lng")
+    idx, _dist = pts.within(driver_lat, driver_lng, radius_km)
+    return pts.take(idx)
+
+
 async def emit_passenger_offer_revoked(driver_id: str, tag_id: str):
     """Önceki sürücü teklifi artık göremesin (sıralı dispatch)."""
     try:
         raw = str(driver_id).strip().lower() if driver_id else ""
-        sid = connected_users.get(raw) or connected_users.get(str(driver_id).strip()) if driver_id else None
+        sid = await get_user_sid(raw) if raw else None
         payload = {"tag_id": tag_id}
         if sid:
             await sio.emit("passenger_offer_revoked", payload, to=sid)
@@ -1349,7 +2164,7 @@ async def emit_passenger_offer_revoked(driver_id: str, tag_id: str):
 
 
 async def emit_socket_event_to_user(user_id, event_name: str, payload: dict) -> None:
-    """Tek kullanıcıya socket event: önce connected_users sid, yoksa user_<uuid> room."""
+    """Tek kullanıcıya socket event: önce get_user_sid, yoksa user_<uuid> room."""
     try:
         if user_id is None:
             return
@@ -1363,7 +2178,7 @@ async def emit_socket_event_to_user(user_id, event_name: str, payload: dict) ->
         except Exception:
             pass
         room = _normalize_user_room(raw)
-        sid = connected_users.get(raw) or connected_users.get(str(user_id).strip())
+        sid = await get_user_sid(raw)
         if sid:
             await sio.emit(event_name, payload, to=sid)
             logger.info(f"📤 {event_name} to=sid user={raw[:13]}…")
@@ -1396,7 +2211,7 @@ async def apply_force_end_trip_and_notify(
         resolved_ender = str(ender_id).strip()
 
     try:
-        tr = supabase.table("tags").select("*").eq("id", tid).limit(1).execute()
+        tr = await db.table("tags").select("*").eq("id", tid).limit(1).execute()
     except Exception as e:
         logger.error(f"apply_force_end_trip: tag okunamadı: {e}")
         return {"success": False, "error": "TAG okunamadı"}
@@ -1453,7 +2268,7 @@ async def apply_force_end_trip_and_notify(
 
     now_iso = datetime.utcnow().isoformat()
     try:
-        supabase.table("tags").update(
+        await db.table("tags").update(
             {
                 "status": "completed",
                 "completed_at": now_iso,
@@ -1468,13 +2283,13 @@ async def apply_force_end_trip_and_notify(
     new_points, new_rating = await deduct_points(resolved_ender, 3, "Tek taraflı yolculuk bitirme")
 
     try:
-        supabase.table("chat_messages").delete().eq("tag_id", tid).execute()
+        await db.table("chat_messages").delete().eq("tag_id", tid).execute()
     except Exception as chat_err:
         logger.warning(f"apply_force_end_trip: chat silinemedi: {chat_err}")
 
     ender_name = ""
     try:
-        _en = supabase.table("users").select("name").eq("id", resolved_ender).limit(1).execute()
+        _en = await db.table("users").select("name").eq("id", resolved_ender).limit(1).execute()
         if _en.data:
             ender_name = (str(_en.data[0].get("name") or "")).strip()
     except Exception:
@@ -1541,10 +2356,12 @@ async def _expo_push_dispatch_new_offer(
     body: str,
     *,
     notifications_log_type: str = "new_offer",
+    offer_gen: Optional[str] = None,
 ) -> dict:
     """
-    Dispatch (sıralı kuyruk) ve rolling batch: sürücüye Expo push.
-    data.type=new_offer → Android channelId=offers (ExpoPushService).
+    Dispatch (sıralı kuyruk) ve rolling batch: sürücüye Expo push (push_outbox üzerinden).
+    data.type=new_offer → Android channelId=offers. offer_gen: teklif turu (outbox tekilleştirme anahtarına girer;
+    aynı sürücüye sonraki turdaki teklif push'u bastırılmaz).
     """
     uid = str(driver_id).strip() if driver_id else ""
     if not uid:
@@ -1556,46 +2373,31 @@ async def _expo_push_dispatch_new_offer(
             uid = str(resolved).strip()
     except Exception:
         pass
-    try:
-        supabase.table("notifications_log").insert({
-            "type": notifications_log_type,
-            "user_id": uid,
-            "title": title,
-            "body": body,
-            "created_at": datetime.utcnow().isoformat(),
-        }).execute()
-    except Exception:
-        pass
-
     push_data = {"type": "new_offer", "tag_id": str(tag_id)}
+    if offer_gen is not None:
+        push_data["offer_gen"] = str(offer_gen)
     try:
-        ur = supabase.table("users").select("push_token").eq("id", uid).limit(1).execute()
-        if not ur.data and "-" in uid:
-            ur = supabase.table("users").select("push_token").eq("id", uid.lower()).limit(1).execute()
-        token = (ur.data[0].get("push_token") if ur.data else None) or ""
-        if not token:
-            logger.warning(f"⚠️ Dispatch offer push: push_token yok user={uid[:8]}...")
-            return {"sent": 0, "failed": 1}
-        if not ExpoPushService.is_valid_token(token):
+        drow = await driver_state_cache.get(uid)
+        token = (drow or {}).get("push_token") or ""
+        if token and not ExpoPushService.is_valid_token(token):
             logger.warning(f"⚠️ Dispatch offer push: geçersiz token user={uid[:8]}...")
-            return {"sent": 0, "failed": 1}
+            token = ""
     except Exception as e:
         logger.warning(f"⚠️ Dispatch offer push_token okunamadı: {e}")
-        return {"sent": 0, "failed": 1}
-
-    try:
-        result = await ExpoPushService.send(
-            [token],
-            title,
-            body,
-            push_data,
-        )
-        if result.get("sent", 0) < 1:
-            logger.warning(f"⚠️ Expo dispatch new_offer başarısız: user={uid[:8]}... result={result}")
-        return result
-    except Exception as e:
-        logger.warning(f"⚠️ Dispatch offer Expo push hatası: {e}")
-        return {"sent": 0, "failed": 1}
+        token = ""
+    if not token:
+        logger.warning(f"⚠️ Dispatch offer push: push_token yok user={uid[:8]}...")
+
+    # Token önbellekte yoksa da satır yazılır: teslimatta users'tan tekrar okunur, yine yoksa failed
+    ok = await push_outbox.enqueue(
+        user_id=uid,
+        notification_type=notifications_log_type,
+        title=title,
+        body=body,
+        data=push_data,
+        push_token=token or None,
+    )
+    return {"queued": int(ok), "failed": int(not ok)}
 
 
 async def dispatch_offer_to_next_driver(tag_id: str, tag_data: dict):
@@ -1604,12 +2406,11 @@ async def dispatch_offer_to_next_driver(tag_id: str, tag_data: dict):
     Timeout sonrası otomatik olarak sonrakine geç
     """
     try:
-        config = await get_dispatch_config()
-        timeout = config.get("driver_offer_timeout", 10)
+        timeout = dispatch_config.driver_offer_timeout
         merged = {**(dispatch_tag_context.get(tag_id) or {}), **(tag_data or {})}
         dispatch_tag_context[tag_id] = merged
 
-        queue = dispatch_queues.get(tag_id, [])
+        queue = await dispatch_queues.get(tag_id, [])
         
         # Bekleyen sürücü bul
         next_entry = None
@@ -1621,7 +2422,7 @@ async def dispatch_offer_to_next_driver(tag_id: str, tag_data: dict):
         if not next_entry:
             logger.info(f"📭 Dispatch: Tag {tag_id} - Kuyruk bitti, yayın yok (sıralı mod)")
             dispatch_tag_context.pop(tag_id, None)
-            dispatch_queues.pop(tag_id, None)
+            await dispatch_queues.pop(tag_id)
             passenger_id = merged.get("passenger_id")
             if passenger_id:
                 try:
@@ -1669,8 +2470,9 @@ async def dispatch_offer_to_next_driver(tag_id: str, tag_data: dict):
                 f"📭 Dispatch sıradaki sürücü atlandı (aktif değil): tag={tag_id} driver={driver_name}"
             )
             next_entry["status"] = "expired"
+            await _dispatch_queue_update_entry(tag_id, next_entry)
             try:
-                supabase.table("dispatch_queue").update({
+                await db.table("dispatch_queue").update({
                     "status": "expired",
                     "responded_at": datetime.utcnow().isoformat(),
                 }).eq("id", next_entry["id"]).execute()
@@ -1683,8 +2485,9 @@ async def dispatch_offer_to_next_driver(tag_id: str, tag_data: dict):
 
         next_entry["status"] = "sent"
         next_entry["sent_at"] = datetime.utcnow().isoformat()
+        await _dispatch_queue_update_entry(tag_id, next_entry)
         try:
-            supabase.table("dispatch_queue").update({
+            await db.table("dispatch_queue").update({
                 "status": "sent",
                 "sent_at": next_entry["sent_at"],
             }).eq("id", next_entry["id"]).execute()
@@ -1699,6 +2502,7 @@ async def dispatch_offer_to_next_driver(tag_id: str, tag_data: dict):
                 tag_id,
                 "Yeni Teklif",
                 body,
+                offer_gen=f"queue:{next_entry.get('id') or next_entry.get('priority')}",
             )
         except Exception as push_err:
             logger.warning(f"⚠️ Dispatch push gönderilemedi: {driver_id} - {push_err}")
@@ -1710,12 +2514,13 @@ async def dispatch_offer_to_next_driver(tag_id: str, tag_data: dict):
             await asyncio.sleep(timeout)
             
             # Tag hala waiting durumunda mı?
-            tag_result = supabase.table("tags").select("status").eq("id", tag_id).execute()
+            tag_result = await db.table("tags").select("status").eq("id", tag_id).execute()
             if tag_result.data and tag_result.data[0].get("status") == "waiting":
                 # Bu sürücü yanıt vermedi, expired yap
                 next_entry["status"] = "expired"
+                await _dispatch_queue_update_entry(tag_id, next_entry)
                 try:
-                    supabase.table("dispatch_queue").update({"status": "expired"}).eq("id", next_entry["id"]).execute()
+                    await db.table("dispatch_queue").update({"status": "expired"}).eq("id", next_entry["id"]).execute()
                 except Exception:
                     pass
                 
@@ -1752,7 +2557,7 @@ async def broadcast_offer_to_all(tag_id: str, tag_data: dict) -> int:
         if pref is None and tag_data.get("passenger_id"):
             try:
                 pr = (
-                    supabase.table("users")
+                    await db.table("users")
                     .select("driver_details")
                     .eq("id", tag_data["passenger_id"])
                     .limit(1)
@@ -1765,10 +2570,10 @@ async def broadcast_offer_to_all(tag_id: str, tag_data: dict) -> int:
         pref = pref or "car"
         
         now = datetime.utcnow().isoformat()
-        q = supabase.table("users").select(
+        q = db.table("users").select(
             "id, latitude, longitude, driver_details"
         ).eq("driver_online", True)
-        drivers_result = _apply_driver_active_until_filter(q, now).execute()
+        drivers_result = await _apply_driver_active_until_filter(q, now).execute()
         
         if not drivers_result.data:
             logger.info(f"📢 Broadcast: Uygun sürücü yok")
@@ -1888,13 +2693,49 @@ async def _expire_dispatch_queue_rows_for_tag(tag_id: str) -> None:
     """Aynı tag için eski waiting/sent satırlarını kapat (polling ile uyum)."""
     try:
         now = datetime.utcnow().isoformat()
-        supabase.table("dispatch_queue").update(
+        await db.table("dispatch_queue").update(
             {"status": "expired", "responded_at": now}
         ).eq("tag_id", tag_id).in_("status", ["waiting", "sent"]).execute()
     except Exception as e:
         logger.warning("dispatch_queue expire tag=%s: %s", tag_id, e)
 
 
+def _dispatch_queue_sent_row(tag_id: str, did: str, priority: int, now: str) -> dict:
+    row = {
+        "id": str(uuid.uuid4()),
+        "tag_id": tag_id,
+        "driver_id": did,
+        "priority": int(priority),
+        "status": "sent",
+        "created_at": now,
+        "sent_at": now,
+    }
+    return {k: row[k] for k in DISPATCH_QUEUE_DB_KEYS if k in row}
+
+
+async def _dispatch_queue_insert_batch_after_emit(tag_id: str, sent: list) -> int:
+    """
+    Batch emit sonrası tüm sürücü satırları tek insert ile (sent: [(driver_id, priority), ...]).
+    Toplu insert başarısızsa satır satır denenir. Dönüş: yazılan satır.
+    """
+    sent = [(str(d).strip().lower(), p) for d, p in sent if d]
+    if not sent:
+        return 0
+    now = datetime.utcnow().isoformat()
+    rows = [_dispatch_queue_sent_row(tag_id, did, p, now) for did, p in sent]
+    try:
+        await db.table("dispatch_queue").insert(rows).execute()
+        logger.info("dispatch_queue rolling sync tag=%s drivers=%s ok=%s (bulk)", tag_id, len(rows), len(rows))
+        return len(rows)
+    except Exception as e:
+        logger.warning("dispatch_queue rolling sync tag=%s bulk insert başarısız, tek tek: %s", tag_id, e)
+    n_ok = 0
+    for did, p in sent:
+        if await _dispatch_queue_insert_after_emit(tag_id, did, p):
+            n_ok += 1
+    return n_ok
+
+
 async def _dispatch_queue_insert_after_emit(
     tag_id: str,
     driver_id: str,
@@ -1908,19 +2749,9 @@ async def _dispatch_queue_insert_after_emit(
     if not did:
         logger.warning("dispatch_queue rolling sync tag=%s driver=(boş) ok=0", tag_id)
         return False
-    now = datetime.utcnow().isoformat()
-    row = {
-        "id": str(uuid.uuid4()),
-        "tag_id": tag_id,
-        "driver_id": did,
-        "priority": int(priority),
-        "status": "sent",
-        "created_at": now,
-        "sent_at": now,
-    }
-    ins = {k: row[k] for k in DISPATCH_QUEUE_DB_KEYS if k in row}
+    ins = _dispatch_queue_sent_row(tag_id, did, priority, datetime.utcnow().isoformat())
     try:
-        supabase.table("dispatch_queue").insert(ins).execute()
+        await db.table("dispatch_queue").insert(ins).execute()
         logger.info(
             "dispatch_queue rolling sync tag=%s driver=%s priority=%s ok=1",
             tag_id,
@@ -1944,15 +2775,10 @@ async def rolling_dispatch_stop(
     *,
     revoke_offers: bool = True,
     except_driver_id: Optional[str] = None,
-) -> None:
-    """Zamanlayıcıyı durdur, rolling state'i sil; isteğe bağlı batch'e remove_offer."""
-    old = rolling_dispatch_tasks.pop(tag_id, None)
-    if old is not None and not old.done():
-        try:
-            old.cancel()
-        except Exception:
-            pass
-    st = rolling_dispatch_index.pop(tag_id, None)
+) -> Optional[dict]:
+    """Zamanlayıcıyı durdur, rolling state'i sil; isteğe bağlı batch'e remove_offer. Dönüş: silinen state."""
+    await dispatch_scheduler.cancel(_rolling_job_id(tag_id))
+    st = await rolling_dispatch_index.pop(tag_id)
     if revoke_offers and st:
         ex = str(except_driver_id).strip().lower() if except_driver_id else None
         for did in st.get("current_batch") or []:
@@ -1963,20 +2789,103 @@ async def rolling_dispatch_stop(
             except Exception:
                 pass
     await _expire_dispatch_queue_rows_for_tag(tag_id)
+    return st
+
+
+def _rolling_candidate_entry(state: Optional[dict], driver_id) -> Optional[dict]:
+    """Rolling state'teki sürücü girdisi (teklifteki pickup mesafe / süre) veya None."""
+    did = str(driver_id or "").strip().lower()
+    for entry in (state or {}).get("drivers") or []:
+        if str(entry.get("driver_id") or "").strip().lower() == did:
+            return entry
+    return None
+
+
+# Bir batch'te aynı anda teklif gönderilen sürücü sayısı üst sınırı
+try:
+    DISPATCH_FANOUT_CONCURRENCY = max(1, int(os.getenv("DISPATCH_FANOUT_CONCURRENCY", "10")))
+except (TypeError, ValueError):
+    DISPATCH_FANOUT_CONCURRENCY = 10
+# new_passenger_offer emit → istemci ack gecikmesi (admin/outbound-stats)
+offer_ack_tracker = OfferAckTracker.from_env()
+
+
+# Rolling sırasında rotası yeniden hesaplanacak yer değiştirme eşiği (metre)
+try:
+    ROLLING_RERANK_MOVE_M = max(50.0, float(os.getenv("ROLLING_RERANK_MOVE_M", "500")))
+except (TypeError, ValueError):
+    ROLLING_RERANK_MOVE_M = 500.0
+
+
+async def _rolling_rerank_candidates(tag_id: str, state: dict) -> None:
+    """
+    Batch öncesi artımlı sıralama (geo indeks üzerinden; indeks hazır değilse dokunmaz):
+    listede olmayan (sonradan online olan) ya da ROLLING_RERANK_MOVE_M'den fazla yer değiştirmiş sürücülerin
+    yalnızca kendi rotaları hesaplanıp bekleyen sıraya eklenir; indekste/yarıçapta olmayan bekleyenler çıkarılır.
+    """
+    tag = state.get("full_tag") or {}
+    try:
+        plat_f, plng_f = float(tag["pickup_lat"]), float(tag["pickup_lng"])
+    except (KeyError, TypeError, ValueError):
+        return
+    pref = _canonical_vehicle_kind(tag.get("passenger_preferred_vehicle")) or "car"
+    # Açılış taraması araç tipi filtresiz (DISPATCH_RELAX_VEHICLE_ON_EMPTY) yapıldıysa rerank da filtresiz
+    vehicle_filter = bool(state.get("vehicle_filter", True))
+    rows = _find_eligible_candidate_rows(plat_f, plng_f, DISPATCH_RADIUS_KM, pref, vehicle_filter)
+    if rows is None:
+        return
+    drivers = state.get("drivers") or []
+    cursor = int(state.get("cursor", 0))
+    known = known_positions(drivers)
+    passenger = str(tag.get("passenger_id") or "").strip().lower()
+    in_range = set()
+    to_route = []
+    for row in rows:
+        did = str(row.get("id") or "").strip().lower()
+        if not did or did == passenger:
+            continue
+        try:
+            la, lo = float(row["latitude"]), float(row["longitude"])
+        except (KeyError, TypeError, ValueError):
+            continue
+        if not _bbox_road_prefilter_ok(la, lo, plat_f, plng_f, DISPATCH_RADIUS_KM):
+            continue
+        in_range.add(did)
+        if did not in known:
+            to_route.append(row)
+            continue
+        k_la, k_lo = known[did]
+        if k_la is not None and k_lo is not None and haversine_km(k_la, k_lo, la, lo) * 1000.0 > ROLLING_RERANK_MOVE_M:
+            to_route.append(row)
+    drop = [d for d in pending_driver_ids(drivers, cursor) if d not in in_range]
+    if not to_route and not drop:
+        return
+    updates = await _route_rank_candidates(to_route, plat_f, plng_f, DISPATCH_RADIUS_KM)
+    routed = {u["driver_id"] for u in updates}
+    # Yer değiştirip yol mesafesi yarıçap dışına çıkanlar
+    drop.extend(d for d in (str(r["id"]).strip().lower() for r in to_route) if d in known and d not in routed)
+    merged, cursor, counts = merge_candidates(drivers, cursor, updates, drop)
+    state["drivers"] = merged
+    state["cursor"] = cursor
+    logger.info(
+        "rolling rerank tag=%s added=%s moved=%s dropped=%s routed=%s total=%s cursor=%s",
+        tag_id,
+        counts["added"],
+        counts["moved"],
+        counts["dropped"],
+        len(to_route),
+        len(merged),
+        cursor,
+    )
 
 
 async def rolling_dispatch_batch(tag_id: str) -> None:
     """Önceki batch'e remove_offer; sonraki 5'e new_passenger_offer; 20s sonra waiting ise tekrar."""
-    state = rolling_dispatch_index.get(tag_id)
+    state = await rolling_dispatch_index.get(tag_id)
     if not state:
         return
 
-    old = rolling_dispatch_tasks.pop(tag_id, None)
-    if old is not None and not old.done():
-        try:
-            old.cancel()
-        except Exception:
-            pass
+    await dispatch_scheduler.cancel(_rolling_job_id(tag_id))
 
     for did in state.get("current_batch") or []:
         try:
@@ -1985,6 +2894,18 @@ async def rolling_dispatch_batch(tag_id: str) -> None:
             pass
     state["current_batch"] = []
 
+    # İlk batch'ten sonra: yeni online / yer değiştirmiş sürücüleri sıraya kat (mevcut rotalar korunur)
+    if int(state.get("gen", 0)) > 0:
+        try:
+            await _rolling_rerank_candidates(tag_id, state)
+        except Exception as e:
+            logger.warning("rolling rerank tag=%s: %s", tag_id, e)
+        # Rota hesabı sürerken kabul / iptal (state silinir) ya da başka batch (gen ilerler) olduysa yazma
+        cur = await rolling_dispatch_index.get(tag_id)
+        if not cur or int(cur.get("gen", 0)) != int(state.get("gen", 0)):
+            logger.info("rolling batch tag=%s: rerank sırasında state değişti, batch atlandı", tag_id)
+            return
+
     drivers = state.get("drivers") or []
     tag_data = state.get("full_tag") or {}
     n = len(drivers)
@@ -2003,15 +2924,19 @@ async def rolling_dispatch_batch(tag_id: str) -> None:
     state["cursor"] = next_idx
 
     if not batch_entries:
+        await rolling_dispatch_index.set(tag_id, state, ttl_sec=DISPATCH_STATE_TTL_SEC)
         return
 
     state["current_batch"] = [e["driver_id"] for e in batch_entries]
+    gen = int(state.get("gen", 0)) + 1
+    state["gen"] = gen
+    await rolling_dispatch_index.set(tag_id, state, ttl_sec=DISPATCH_STATE_TTL_SEC)
 
     pref = _canonical_vehicle_kind(tag_data.get("passenger_preferred_vehicle")) or "car"
     if tag_data.get("passenger_id"):
         try:
             pr = (
-                supabase.table("users")
+                await db.table("users")
                 .select("driver_details")
                 .eq("id", tag_data["passenger_id"])
                 .limit(1)
@@ -2052,15 +2977,17 @@ async def rolling_dispatch_batch(tag_id: str) -> None:
         "passenger_payment_method": tag_data.get("passenger_payment_method"),
     }
 
-    # Bu batch için eski waiting/sent satırlarını kapat; insert her sürücüde emit SONRASI
+    # Bu batch için eski waiting/sent satırlarını kapat; yeni satırlar emit'lerden SONRA toplu insert
     await _expire_dispatch_queue_rows_for_tag(tag_id)
+    # Uygunluk + push token: batch'in tüm sürücüleri tek sorguda
+    await driver_state_cache.prefetch(e["driver_id"] for e in batch_entries)
 
-    n_queue_ok = 0
-    for idx, entry in enumerate(batch_entries, start=1):
+    async def _offer_one(item) -> Optional[tuple]:
+        idx, entry = item
         d_id = entry["driver_id"]
         if not await is_driver_eligible_for_dispatch_offer(d_id):
             logger.info("rolling batch atlandı (aktif değil) tag=%s driver=%s", tag_id, d_id)
-            continue
+            return None
         pk_km = entry.get("distance_km", 0)
         pk_min = entry.get("duration_min")
         offer_data = {
@@ -2071,7 +2998,7 @@ async def rolling_dispatch_batch(tag_id: str) -> None:
             "time_to_passenger_min": int(pk_min) if pk_min is not None else None,
         }
         if not await emit_new_passenger_offer_to_driver(d_id, offer_data):
-            continue
+            return None
         logger.info(
             "new_passenger_offer emitted tag=%s driver=%s (socket veya room)",
             tag_id,
@@ -2084,11 +3011,19 @@ async def rolling_dispatch_batch(tag_id: str) -> None:
                 tag_id,
                 "Yeni Teklif",
                 body,
+                offer_gen=f"rolling:{gen}",
             )
         except Exception as push_err:
             logger.warning(f"⚠️ Rolling batch push: {d_id} - {push_err}")
-        if await _dispatch_queue_insert_after_emit(tag_id, d_id, idx):
-            n_queue_ok += 1
+        return (d_id, idx)
+
+    # Batch'teki sürücülere eşzamanlı (emit'ler aynı tur içinde); kuyruk satırları sonra tek insert
+    sent = await bounded_gather(
+        list(enumerate(batch_entries, start=1)),
+        _offer_one,
+        limit=DISPATCH_FANOUT_CONCURRENCY,
+    )
+    n_queue_ok = await _dispatch_queue_insert_batch_after_emit(tag_id, [x for x in sent if x])
 
     logger.info(
         "dispatch_queue rolling sync tag=%s batch_summary drivers=%s queue_ok=%s idx=%s-%s/%s next_cursor=%s",
@@ -2105,28 +3040,78 @@ async def rolling_dispatch_batch(tag_id: str) -> None:
         f"idx {start}-{end - 1}/{n} next_cursor={next_idx}"
     )
 
-    async def _timeout_tick():
-        try:
-            await asyncio.sleep(DISPATCH_TIMEOUT)
-            if tag_id not in rolling_dispatch_index:
-                return
-            tr = supabase.table("tags").select("status").eq("id", tag_id).limit(1).execute()
-            if not tr.data or tr.data[0].get("status") != "waiting":
-                await rolling_dispatch_stop(tag_id, revoke_offers=False)
-                return
-            await rolling_dispatch_batch(tag_id)
-        except asyncio.CancelledError:
-            raise
-        except Exception as ex:
-            logger.warning(f"rolling_dispatch_batch timer tag={tag_id}: {ex}")
+    await dispatch_scheduler.schedule(
+        _rolling_job_id(tag_id),
+        time.time() + DISPATCH_TIMEOUT,
+        ROLLING_JOB_KIND,
+        {"tag_id": tag_id, "gen": gen},
+    )
 
-    rolling_dispatch_tasks[tag_id] = asyncio.create_task(_timeout_tick())
+
+async def _rolling_dispatch_timer_fired(payload: dict) -> None:
+    """
+    Batch süresi doldu: tag hâlâ waiting ise sonraki batch. Rolling state yoksa (bellek backend'li restart)
+    sürücüler yeniden sıralanıp dispatch baştan başlatılır.
+    """
+    tag_id = str(payload.get("tag_id") or "").strip()
+    if not tag_id:
+        return
+    try:
+        tr = await db.table("tags").select("status").eq("id", tag_id).limit(1).execute()
+        if not tr.data or tr.data[0].get("status") != "waiting":
+            await rolling_dispatch_stop(tag_id, revoke_offers=False)
+            still_open = bool(tr.data) and tr.data[0].get("status") in HEATMAP_OPEN_TAG_STATUSES
+            await waiting_tag_index_drop(tag_id, closed=not still_open)
+            return
+        cur = await rolling_dispatch_index.get(tag_id)
+        if not cur:
+            logger.info("rolling dispatch devam (state yok → yeniden başlat) tag=%s", tag_id)
+            await rolling_dispatch_start(tag_id)
+            return
+        # gen'siz iş = açılış devam taraması; state varsa dispatch başka süreçte zaten sürüyor
+        if payload.get("gen") is None or int(cur.get("gen", 0)) != int(payload["gen"]):
+            return
+        await rolling_dispatch_batch(tag_id)
+    except Exception as ex:
+        logger.warning(f"rolling_dispatch_batch timer tag={tag_id}: {ex}")
+
+
+dispatch_scheduler.register_handler(ROLLING_JOB_KIND, _rolling_dispatch_timer_fired)
+
+
+async def resume_orphaned_waiting_tags() -> int:
+    """
+    Açılış: son DISPATCH_RESUME_LOOKBACK_MIN dakikada oluşmuş waiting tag'lerden zamanlayıcısı olmayanlara
+    (ör. journal'sız eski sürümden kalan) hemen devam işi planla. Dönüş: planlanan tag sayısı.
+    """
+    if not supabase:
+        return 0
+    since = (datetime.utcnow() - timedelta(minutes=DISPATCH_RESUME_LOOKBACK_MIN)).isoformat()
+    res = (
+        await db.table("tags")
+        .select("id")
+        .eq("status", "waiting")
+        .gte("created_at", since)
+        .limit(500)
+        .execute()
+    )
+    scheduled = {j["id"] for j in await dispatch_scheduler.journal.load_all()}
+    n = 0
+    for row in res.data or []:
+        tid = str(row.get("id") or "").strip()
+        if not tid or _rolling_job_id(tid) in scheduled:
+            continue
+        await dispatch_scheduler.schedule(_rolling_job_id(tid), time.time(), ROLLING_JOB_KIND, {"tag_id": tid})
+        n += 1
+    if n:
+        logger.info("♻️ Zamanlayıcısız %s waiting tag için rolling dispatch devam ettiriliyor", n)
+    return n
 
 
 async def rolling_dispatch_start(tag_id: str) -> int:
     """DB'den tag; 20 km + vehicle_kind + mesafe sırası; ilk batch + timer. Dönüş: eligible sayısı."""
     await rolling_dispatch_stop(tag_id, revoke_offers=False)
-    tr = supabase.table("tags").select("*").eq("id", tag_id).limit(1).execute()
+    tr = await db.table("tags").select("*").eq("id", tag_id).limit(1).execute()
     if not tr.data:
         logger.warning(f"rolling_dispatch_start: tag yok veya okunamadı tag_id={tag_id}")
         return 0
@@ -2145,7 +3130,7 @@ async def rolling_dispatch_start(tag_id: str) -> int:
     if passenger_id:
         try:
             prow = (
-                supabase.table("users")
+                await db.table("users")
                 .select("name, driver_details")
                 .eq("id", passenger_id)
                 .limit(1)
@@ -2214,7 +3199,9 @@ async def rolling_dispatch_start(tag_id: str) -> int:
         passenger_vehicle_kind=passenger_pref,
         radius_km=DISPATCH_RADIUS_KM,
     )
+    vehicle_filter = True
     if not eligible and _dispatch_env_flag("DISPATCH_RELAX_VEHICLE_ON_EMPTY"):
+        vehicle_filter = False
         logger.warning(
             "rolling_dispatch_start: DISPATCH_RELAX_VEHICLE_ON_EMPTY=1 — araç tipi filtresiz ikinci tarama tag_id=%s",
             tag_id,
@@ -2233,16 +3220,22 @@ async def rolling_dispatch_start(tag_id: str) -> int:
             f"radius={DISPATCH_RADIUS_KM}km pref={passenger_pref!r} pickup=({pickup_lat_f},{pickup_lng_f}). "
             f"Kontrol: users.driver_online=true, lat/lng dolu, mesafe≤{DISPATCH_RADIUS_KM}km, "
             f"araç tipi eşleşmesi (yolcu {passenger_pref!r}); isteğe bağlı DISPATCH_RELAX_VEHICLE_ON_EMPTY=1 veya DISPATCH_RADIUS_KM artırın. "
-            f"Teklifler ayrıca dispatch_queue + socket ile gider; uvicorn server:socket_app ve mümkünse --workers 1 önerilir."
+            f"Teklifler ayrıca dispatch_queue + socket ile gider; çoklu worker için REDIS_URL (paylaşılan durum + Socket.IO Redis manager) gerekir."
         )
         return 0
 
-    rolling_dispatch_index[tag_id] = {
-        "cursor": 0,
-        "drivers": eligible,
-        "full_tag": full_tag_data,
-        "current_batch": [],
-    }
+    await rolling_dispatch_index.set(
+        tag_id,
+        {
+            "cursor": 0,
+            "drivers": eligible,
+            "full_tag": full_tag_data,
+            "current_batch": [],
+            "gen": 0,
+            "vehicle_filter": vehicle_filter,
+        },
+        ttl_sec=DISPATCH_STATE_TTL_SEC,
+    )
     logger.info(
         f"rolling_dispatch_start tag={tag_id} eligible={len(eligible)} "
         f"batch={BATCH_SIZE} timeout={DISPATCH_TIMEOUT}s radius={DISPATCH_RADIUS_KM}km"
@@ -2257,7 +3250,7 @@ async def handle_dispatch_accept(tag_id: str, driver_id: str):
     Queue'daki diğer kayıtları expire yap ve task'ları iptal et
     """
     try:
-        queue = dispatch_queues.get(tag_id, [])
+        queue = await dispatch_queues.get(tag_id, [])
         did_norm = str(driver_id).strip().lower()
 
         for entry in queue:
@@ -2269,8 +3262,8 @@ async def handle_dispatch_accept(tag_id: str, driver_id: str):
         
         # Supabase güncelle
         try:
-            supabase.table("dispatch_queue").update({"status": "accepted", "responded_at": datetime.utcnow().isoformat()}).eq("tag_id", tag_id).eq("driver_id", driver_id).execute()
-            supabase.table("dispatch_queue").update({"status": "expired"}).eq("tag_id", tag_id).neq("driver_id", driver_id).in_("status", ["waiting", "sent"]).execute()
+            await db.table("dispatch_queue").update({"status": "accepted", "responded_at": datetime.utcnow().isoformat()}).eq("tag_id", tag_id).eq("driver_id", driver_id).execute()
+            await db.table("dispatch_queue").update({"status": "expired"}).eq("tag_id", tag_id).neq("driver_id", driver_id).in_("status", ["waiting", "sent"]).execute()
         except:
             pass
         
@@ -2282,7 +3275,7 @@ async def handle_dispatch_accept(tag_id: str, driver_id: str):
                     task.cancel()
         
         # Queue'yu temizle
-        dispatch_queues.pop(tag_id, None)
+        await dispatch_queues.pop(tag_id)
         dispatch_tag_context.pop(tag_id, None)
         
         logger.info(f"✅ Dispatch accept: tag={tag_id}, sürücü={driver_id}")
@@ -2293,17 +3286,18 @@ async def handle_dispatch_accept(tag_id: str, driver_id: str):
 async def handle_dispatch_reject(tag_id: str, driver_id: str):
     """Sürücü dispatch teklifini reddetti, sonrakine geç"""
     try:
-        queue = dispatch_queues.get(tag_id, [])
+        queue = await dispatch_queues.get(tag_id, [])
         
         for entry in queue:
             if entry["driver_id"] == driver_id:
                 entry["status"] = "rejected"
                 entry["responded_at"] = datetime.utcnow().isoformat()
+                await _dispatch_queue_update_entry(tag_id, entry)
                 break
         
         # Supabase güncelle
         try:
-            supabase.table("dispatch_queue").update({
+            await db.table("dispatch_queue").update({
                 "status": "rejected",
                 "responded_at": datetime.utcnow().isoformat()
             }).eq("tag_id", tag_id).eq("driver_id", driver_id).execute()
@@ -2317,7 +3311,7 @@ async def handle_dispatch_reject(tag_id: str, driver_id: str):
             task.cancel()
         
         # Tag durumunu kontrol et
-        tag_result = supabase.table("tags").select("status, passenger_id, passenger_name, pickup_lat, pickup_lng, pickup_location, dropoff_lat, dropoff_lng, dropoff_location, final_price").eq("id", tag_id).execute()
+        tag_result = await db.table("tags").select("status, passenger_id, passenger_name, pickup_lat, pickup_lng, pickup_location, dropoff_lat, dropoff_lng, dropoff_location, final_price").eq("id", tag_id).execute()
         
         if tag_result.data and tag_result.data[0].get("status") == "waiting":
             # Sonraki sürücüye teklif gönder
@@ -2394,6 +3388,8 @@ def validate_turkish_phone(phone: str) -> tuple[bool, str]:
 
 # Initialize Supabase (global `supabase` = _supabase_core.get_supabase(), service role only)
 supabase: Client = None
+# Async handler'larda sorgular: `await db.table(...)...execute()` — senkron client sınırlı thread havuzunda
+db = _supabase_core.AsyncSupabase(lambda: supabase)
 
 
 def init_supabase():
@@ -2479,13 +3475,33 @@ last_cleanup_time = None
 
 @app.on_event("startup")
 async def startup():
-    global last_cleanup_time
-    clear_dispatch_in_memory_state()
+    global last_cleanup_time, _presence_publish_task
+    await clear_dispatch_in_memory_state()
     _warn_security_env_on_startup()
     _warn_admin_auth_style_inconsistency()
     init_supabase()
+    await shared_state.start()
+    await dispatch_config.start()
+    await dispatch_scheduler.start()
+    try:
+        await resume_orphaned_waiting_tags()
+    except Exception as e:
+        logger.warning("Waiting tag devam taraması: %s", e)
     _warn_duplicate_api_routes()
     last_cleanup_time = datetime.utcnow()
+    await start_http_clients()
+    asyncio.create_task(driver_geo_index_reconcile_loop())
+    await shared_state.subscribe(WAITING_TAGS_CHANNEL, _on_waiting_tag_event)
+    await shared_state.subscribe(PUSH_TOKEN_INVALIDATE_CHANNEL, _on_push_token_invalidate)
+    await shared_state.subscribe(DRIVER_STATE_INVALIDATE_CHANNEL, _on_driver_state_invalidate)
+    await shared_state.subscribe(BLOCK_INVALIDATE_CHANNEL, _on_block_invalidate)
+    asyncio.create_task(waiting_tag_index_reconcile_loop())
+    location_ingestor.start()
+    push_dispatcher.start()
+    push_outbox.start()
+    tag_expiry_sweeper.start()
+    if shared_state.kind != "memory":
+        _presence_publish_task = asyncio.create_task(_presence_publish_loop())
     print("🚀 SOCKET SERVER RUNNING ON PORT:", SOCKET_SERVER_PORT)
     logger.info("✅ Server started with Supabase + Socket.IO (path: /socket.io)")
     # Deploy doğrulama: bu satır yoksa ride/create hâlâ eski imza ile çalışıyordur (422, logda Pydantic uyarısı yok)
@@ -2496,6 +3512,47 @@ async def startup():
         DISPATCH_RADIUS_KM,
     )
 
+@app.on_event("shutdown")
+async def shutdown():
+    await dispatch_scheduler.stop()
+    dispatch_config.stop()
+    push_dispatcher.stop()
+    push_outbox.stop()
+    tag_expiry_sweeper.stop()
+    if _presence_publish_task is not None:
+        _presence_publish_task.cancel()
+        try:
+            await presence_counts.pop(_presence_worker_id)
+        except Exception:
+            pass
+    try:
+        n = await location_ingestor.stop()
+        logger.info("🛑 Bekleyen konumlar yazıldı: %s", n)
+    except Exception as e:
+        logger.warning("Kapanışta konum flush hatası: %s", e)
+    await close_http_clients()
+    await shared_state.close()
+    _supabase_core.shutdown_db_executor()
+    logger.info("🛑 Server kapanıyor: HTTP client ve Supabase sorgu havuzu kapatıldı")
+
+async def _on_tags_expired(rows: list) -> None:
+    """Süresi dolan (pending / offers_received) tag'ler: sürücü listelerinden düşür."""
+    for row in rows:
+        tid = str(row.get("id") or "").strip()
+        if not tid:
+            continue
+        heatmap_tiles.remove("tag:" + tid)
+        try:
+            await sio.emit("tag_cancelled", {"tag_id": tid, "reason": "expired"}, room=DRIVERS_ROOM)
+            await sio.emit("remove_offer", {"tag_id": tid}, room=DRIVERS_ROOM)
+        except Exception as e:
+            logger.warning(f"Süresi dolan tag socket emit hatası ({tid}): {e}")
+
+
+# Açık tag'lerin 10 dk süre dolumu — arka plan süpürücüsü (driver/requests yalnızca okur)
+tag_expiry_sweeper = TagExpirySweeper.from_env(db, _on_tags_expired)
+
+
 # Otomatik temizlik - her 10 dakikada bir inaktif TAG'leri temizle
 async def auto_cleanup_inactive_tags():
     """30 dakikadan fazla inaktif TAG'leri otomatik bitir"""
@@ -2510,7 +3567,7 @@ async def auto_cleanup_inactive_tags():
         cutoff_time = (datetime.utcnow() - timedelta(minutes=max_inactive_minutes)).isoformat()
         
         # Aktif TAG'leri bul (matched veya in_progress)
-        result = supabase.table("tags").select("id, passenger_id, driver_id, status, last_activity, matched_at, created_at").in_("status", ["matched", "in_progress"]).execute()
+        result = await db.table("tags").select("id, passenger_id, driver_id, status, last_activity, matched_at, created_at").in_("status", ["matched", "in_progress"]).execute()
         
         cleaned_count = 0
         for tag in result.data:
@@ -2523,7 +3580,7 @@ async def auto_cleanup_inactive_tags():
                     
                     if (now - activity_time).total_seconds() > max_inactive_minutes * 60:
                         # TAG'i iptal et
-                        supabase.table("tags").update({
+                        await db.table("tags").update({
                             "status": "cancelled",
                             "cancelled_at": datetime.utcnow().isoformat(),
                             "cancel_reason": "inactivity_timeout"
@@ -2637,7 +3694,7 @@ async def resolve_user_id(user_id: str) -> str:
     
     # MongoDB ID olabilir, mongo_id ile ara
     try:
-        result = supabase.table("users").select("id").eq("mongo_id", user_id).execute()
+        result = await db.table("users").select("id").eq("mongo_id", user_id).execute()
         if result.data:
             return str(result.data[0]["id"]).strip().lower()
     except Exception as e:
@@ -2646,6 +3703,95 @@ async def resolve_user_id(user_id: str) -> str:
     # Bulunamadıysa orijinal değeri döndür
     return user_id
 
+_UUID_RE = re.compile(r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$", re.I)
+
+# Toplu konum yazımı: sql_migrations/bulk_update_user_locations.sql yoksa satır satır update (bir kez tespit edilir)
+_location_bulk_rpc_available = True
+try:
+    LOCATION_FALLBACK_CONCURRENCY = max(1, int(os.getenv("LOCATION_FALLBACK_CONCURRENCY", "8")))
+except (TypeError, ValueError):
+    LOCATION_FALLBACK_CONCURRENCY = 8
+
+
+async def _persist_location_batch(rows: list) -> None:
+    """location_ingestor yazıcısı: tek RPC ile toplu users konum güncellemesi."""
+    global _location_bulk_rpc_available
+    if not supabase:
+        raise RuntimeError("Supabase hazır değil")
+    if _location_bulk_rpc_available:
+        try:
+            await db.rpc("bulk_update_user_locations", {"p_rows": rows}).execute()
+            return
+        except Exception as e:
+            msg = str(e)
+            if "PGRST202" not in msg and "bulk_update_user_locations" not in msg:
+                raise
+            _location_bulk_rpc_available = False
+            logger.warning("bulk_update_user_locations RPC yok — satır satır yazıma geçildi: %s", e)
+
+    sem = asyncio.Semaphore(LOCATION_FALLBACK_CONCURRENCY)
+
+    async def _one(row: dict) -> None:
+        async with sem:
+            await db.table("users").update({
+                "latitude": row["latitude"],
+                "longitude": row["longitude"],
+                "last_location_update": row["last_location_update"],
+            }).eq("id", row["id"]).execute()
+
+    results = await asyncio.gather(*(_one(r) for r in rows), return_exceptions=True)
+    errors = [r for r in results if isinstance(r, Exception)]
+    if errors:
+        logger.warning("Konum satır yazımı: %s/%s hata (ilk: %s)", len(errors), len(rows), errors[0])
+        if len(errors) == len(rows):
+            raise errors[0]
+
+
+# GPS ping'leri: son konum bellekte, DB'ye toplu yazım (LOCATION_* env)
+location_ingestor = LocationIngestor.from_env(_persist_location_batch)
+# Eşleşmiş yolculuklarda karşı tarafa canlı konum (trip_{tag_id} odası; TRIP_LOCATION_* env)
+trip_location_stream = TripLocationStream.from_env()
+# uid -> {tag_id, passenger_id, driver_id}: join_trip üyeliği tüm worker'larda (yerel kayıt yalnızca süzgeç/cache)
+trip_members = shared_state.map("trip_members")
+try:
+    TRIP_MEMBER_TTL_SEC = max(600.0, float(os.getenv("TRIP_MEMBER_TTL_SEC", "14400")))
+except ValueError:
+    TRIP_MEMBER_TTL_SEC = 14400.0
+
+
+async def _user_location_rows(user_id) -> list:
+    """
+    Tek kullanıcının konumu [{latitude, longitude}] (users select biçimi). Bellekteki canlı konum varsa
+    DB'ye gitmez — toplu yazım aralığında DB satırı bayat olabilir.
+    """
+    live = location_ingestor.get(user_id)
+    if live is not None:
+        return [live]
+    res = await db.table("users").select("latitude, longitude").eq("id", user_id).limit(1).execute()
+    return res.data or []
+
+
+# Google Directions / OSRM sonuç cache'i (bellek LRU + isteğe bağlı SQLite; ROUTE_CACHE_* env)
+road_route_cache = RouteCache.from_env()
+
+# Matris istek parça boyları: Google Distance Matrix en fazla 25 origin / istek; public OSRM table ~100 koordinat
+try:
+    ROUTE_MATRIX_GOOGLE_CHUNK = max(1, min(25, int(os.getenv("ROUTE_MATRIX_GOOGLE_CHUNK", "25"))))
+    ROUTE_MATRIX_OSRM_CHUNK = max(1, min(99, int(os.getenv("ROUTE_MATRIX_OSRM_CHUNK", "99"))))
+except (TypeError, ValueError):
+    ROUTE_MATRIX_GOOGLE_CHUNK, ROUTE_MATRIX_OSRM_CHUNK = 25, 99
+
+
+def _route_info_from_road(road_info: dict) -> dict:
+    """get_road_distance çıktısı → get_route_info yanıt biçimi."""
+    return {
+        "distance_km": road_info["distance_km"],
+        "duration_min": road_info["duration_min"],
+        "distance_text": f"{road_info['distance_km']} km",
+        "duration_text": f"{road_info['duration_min']} dk"
+    }
+
+
 async def get_route_info(origin_lat, origin_lng, dest_lat, dest_lng):
     """Rota bilgisi al: Google Directions tek kaynak, OSRM sadece backend fallback."""
     try:
@@ -2655,37 +3801,199 @@ async def get_route_info(origin_lat, origin_lng, dest_lat, dest_lng):
             float(dest_lat), float(dest_lng)
         )
         if road_info:
-            return {
-                "distance_km": road_info["distance_km"],
-                "duration_min": road_info["duration_min"],
-                "distance_text": f"{road_info['distance_km']} km",
-                "duration_text": f"{road_info['duration_min']} dk"
-            }
+            return _route_info_from_road(road_info)
 
         # 2) Fallback: OSRM (yalnızca backend içinde)
+        coords = (float(origin_lat), float(origin_lng), float(dest_lat), float(dest_lng))
+        cached = await road_route_cache.lookup("osrm", *coords)
+        if cached:
+            return cached
         url = f"https://router.project-osrm.org/route/v1/driving/{origin_lng},{origin_lat};{dest_lng},{dest_lat}?overview=false"
-        async with httpx.AsyncClient(http2=False, timeout=5.0) as client:
-            response = await client.get(url)
-            data = response.json()
-            if data.get("code") == "Ok" and data.get("routes"):
-                route = data["routes"][0]
-                distance_m = route.get("distance", 0)
-                duration_s = route.get("duration", 0)
-                distance_km = distance_m / 1000
-                duration_min = duration_s / 60
-                logger.warning(f"⚠️ Google başarısız, OSRM fallback kullanıldı: {distance_km:.1f} km, {duration_min:.0f} dk")
-                return {
-                    "distance_km": round(distance_km, 1),
-                    "duration_min": round(duration_min, 0),
-                    "distance_text": f"{round(distance_km, 1)} km",
-                    "duration_text": f"{int(duration_min)} dk"
-                }
+        client = get_http_client("osrm")
+        response = await client.get(url, timeout=5.0)
+        data = response.json()
+        if data.get("code") == "Ok" and data.get("routes"):
+            route = data["routes"][0]
+            distance_m = route.get("distance", 0)
+            duration_s = route.get("duration", 0)
+            distance_km = distance_m / 1000
+            duration_min = duration_s / 60
+            logger.warning(f"⚠️ Google başarısız, OSRM fallback kullanıldı: {distance_km:.1f} km, {duration_min:.0f} dk")
+            osrm_info = {
+                "distance_km": round(distance_km, 1),
+                "duration_min": round(duration_min, 0),
+                "distance_text": f"{round(distance_km, 1)} km",
+                "duration_text": f"{int(duration_min)} dk"
+            }
+            await road_route_cache.store("osrm", *coords, osrm_info)
+            return osrm_info
     except Exception as e:
         logger.warning(f"Route info error: {e}")
 
     return None
 
 
+async def _google_distance_matrix_chunk(
+    origins: list, dest_lat: float, dest_lng: float, *, reverse: bool = False
+) -> list:
+    """
+    N origin × 1 hedef tek Distance Matrix isteği (reverse=True: hedef noktadan N noktaya, 1 × N).
+    Dönüş: origins sırasıyla road dict veya None.
+    """
+    api_key = (os.environ.get("GOOGLE_MAPS_API_KEY") or "").strip()
+    if not api_key or not origins:
+        return [None] * len(origins)
+    many = "|".join(f"{la},{lo}" for la, lo in origins)
+    one = f"{dest_lat},{dest_lng}"
+    params = {
+        "origins": one if reverse else many,
+        "destinations": many if reverse else one,
+        "mode": "driving",
+        "departure_time": "now",
+        "traffic_model": "best_guess",
+        "key": api_key,
+    }
+    client = get_http_client("google_maps")
+    response = await client.get(
+        "https://maps.googleapis.com/maps/api/distancematrix/json", params=params
+    )
+    data = response.json()
+    if data.get("status") != "OK":
+        logger.warning("⚠️ Google Distance Matrix hatası: %s", data.get("status"))
+        return [None] * len(origins)
+    rows = data.get("rows") or []
+    if reverse:
+        elements = ((rows[0] if rows else None) or {}).get("elements") or []
+    else:
+        elements = [((row or {}).get("elements") or [{}])[0] for row in rows]
+    out: list = []
+    for el in elements:
+        if (el or {}).get("status") != "OK":
+            out.append(None)
+            continue
+        out.append(_directions_leg_to_road_dict(el))
+    out.extend([None] * (len(origins) - len(out)))
+    return out
+
+
+async def _osrm_table_chunk(
+    origins: list, dest_lat: float, dest_lng: float, *, reverse: bool = False
+) -> list:
+    """
+    OSRM table servisi: origins → tek hedef (reverse=True: hedef → origins).
+    Dönüş: origin sırasıyla get_route_info biçimi veya None.
+    """
+    if not origins:
+        return []
+    coords = ";".join(f"{lo},{la}" for la, lo in origins) + f";{dest_lng},{dest_lat}"
+    n = len(origins)
+    many = ";".join(str(i) for i in range(n))
+    sources, destinations = (str(n), many) if reverse else (many, str(n))
+    url = (
+        f"https://router.project-osrm.org/table/v1/driving/{coords}"
+        f"?sources={sources}&destinations={destinations}&annotations=distance,duration"
+    )
+    client = get_http_client("osrm")
+    response = await client.get(url)
+    data = response.json()
+    if data.get("code") != "Ok":
+        logger.warning("⚠️ OSRM table hatası: %s", data.get("code"))
+        return [None] * n
+    distances = data.get("distances") or []
+    durations = data.get("durations") or []
+    out: list = []
+    for i in range(n):
+        try:
+            dist_m = distances[0][i] if reverse else distances[i][0]
+            dur_s = durations[0][i] if reverse else durations[i][0]
+        except (IndexError, TypeError):
+            dist_m = dur_s = None
+        if dist_m is None or dur_s is None:
+            out.append(None)
+            continue
+        distance_km = float(dist_m) / 1000
+        duration_min = float(dur_s) / 60
+        out.append(
+            {
+                "distance_km": round(distance_km, 1),
+                "duration_min": round(duration_min, 0),
+                "distance_text": f"{round(distance_km, 1)} km",
+                "duration_text": f"{int(duration_min)} dk",
+            }
+        )
+    return out
+
+
+async def get_route_matrix_to_point(
+    origins: list, dest_lat: float, dest_lng: float, *, reverse: bool = False
+) -> list:
+    """
+    N origin × 1 hedef yol mesafesi (sürücü→pickup sıralaması). reverse=True: hedef noktadan her
+    origin'e (tek sürücü → N pickup; /driver/requests). Dönüş: origins sırasıyla get_route_info
+    biçimi veya None. Sıra: route cache → Google Distance Matrix (parçalı) → OSRM table (parçalı) →
+    kalanlar için tekil get_route_info.
+    """
+    dlat, dlng = float(dest_lat), float(dest_lng)
+    pts = [(float(la), float(lo)) for la, lo in origins]
+    results: list = [None] * len(pts)
+    pending: list = []
+
+    def _leg(i: int) -> tuple:
+        """Cache anahtarı / tekil istek yönü: (başlangıç lat, lng, bitiş lat, lng)."""
+        la, lo = pts[i]
+        return (dlat, dlng, la, lo) if reverse else (la, lo, dlat, dlng)
+
+    for i in range(len(pts)):
+        hit = await road_route_cache.lookup("google", *_leg(i))
+        if hit:
+            results[i] = _route_info_from_road(hit)
+            continue
+        hit = await road_route_cache.lookup("osrm", *_leg(i))
+        if hit:
+            results[i] = hit
+            continue
+        pending.append(i)
+
+    async def _fill(chunk_size: int, fetch, namespace: str) -> None:
+        nonlocal pending
+        if not pending:
+            return
+        chunks = [pending[k:k + chunk_size] for k in range(0, len(pending), chunk_size)]
+        outs = await asyncio.gather(
+            *[fetch([pts[i] for i in ch], dlat, dlng, reverse=reverse) for ch in chunks],
+            return_exceptions=True,
+        )
+        still: list = []
+        for ch, out in zip(chunks, outs):
+            if isinstance(out, Exception):
+                logger.warning("route matrix %s parça hatası: %s", namespace, out)
+                still.extend(ch)
+                continue
+            for i, val in zip(ch, out):
+                if not val:
+                    still.append(i)
+                    continue
+                if namespace == "google":
+                    await road_route_cache.store("google", *_leg(i), val, traffic=val["used_traffic"])
+                    results[i] = _route_info_from_road(val)
+                else:
+                    await road_route_cache.store("osrm", *_leg(i), val)
+                    results[i] = val
+        pending = still
+
+    await _fill(ROUTE_MATRIX_GOOGLE_CHUNK, _google_distance_matrix_chunk, "google")
+    await _fill(ROUTE_MATRIX_OSRM_CHUNK, _osrm_table_chunk, "osrm")
+    if pending:
+        sem = asyncio.Semaphore(12)
+
+        async def _single(i: int):
+            async with sem:
+                results[i] = await get_route_info(*_leg(i))
+
+        await asyncio.gather(*[_single(i) for i in pending])
+    return results
+
+
 def _bbox_road_prefilter_ok(
     lat1: float, lng1: float, lat2: float, lng2: float, max_road_km: float
 ) -> bool:
@@ -2734,17 +4042,11 @@ async def _enrich_tag_pickup_from_driver_if_missing(tag: dict, driver_id: str) -
         except (TypeError, ValueError):
             pass
         resolved = await resolve_user_id(str(driver_id).strip())
-        udrv = (
-            supabase.table("users")
-            .select("latitude, longitude")
-            .eq("id", resolved)
-            .limit(1)
-            .execute()
-        )
-        if not udrv.data:
+        udrv = await _user_location_rows(resolved)
+        if not udrv:
             return
-        dlat = udrv.data[0].get("latitude")
-        dlng = udrv.data[0].get("longitude")
+        dlat = udrv[0].get("latitude")
+        dlng = udrv[0].get("longitude")
         if dlat is None or dlng is None:
             return
         ri = await get_route_info(float(dlat), float(dlng), float(plat), float(plng))
@@ -2782,7 +4084,7 @@ async def _check_user_logic(phone: str, device_id: str = None):
     try:
         result = None
         for candidate in _phone_lookup_candidates(phone):
-            result = supabase.table("users").select("*").eq("phone", candidate).execute()
+            result = await db.table("users").select("*").eq("phone", candidate).execute()
             if result.data:
                 break
         
@@ -2842,7 +4144,9 @@ import time
 # code/expires: son *başarılı* SMS ile set edilir (SMS hata verirse eski geçerli kod korunur)
 # last_api_attempt: her /send-otp çağrısında (çift tıklama / flood önleme)
 # last_sms_ok: son başarılı NetGSM yanıtı (NetGSM 85 / maliyet için soğuma)
-otp_storage: dict = {}
+otp_storage = shared_state.map("otp")
+# Kayıt TTL'i (kod süresi entry["expires"] ile ayrıca kontrol edilir; cooldown alanları için daha uzun)
+OTP_STORAGE_TTL_SEC = 3600
 
 # Başarılı OTP gönderimleri arası minimum süre (NetGSM aynı numara limiti + maliyet)
 OTP_SUCCESS_COOLDOWN_SECONDS = 60
@@ -3251,7 +4555,7 @@ async def send_otp(request: SendOtpBodyRequest = None, phone: str = None):
     logger.info(f"📱 OTP sender env NETGSM_MSGHEADER: {sender!r}")
     
     current_time = time.time()
-    entry = dict(otp_storage.get(cleaned_phone) or {})
+    entry = dict(await otp_storage.get(cleaned_phone) or {})
 
     # Süresi dolmuş kodu sil (diğer alanlar: last_sms_ok, last_api_attempt kalabilir)
     if entry.get("code") and entry.get("expires") and current_time > entry["expires"]:
@@ -3280,19 +4584,19 @@ async def send_otp(request: SendOtpBodyRequest = None, phone: str = None):
 
     # Deneme zamanı — kodu henüz yazma; SMS başarısız olursa eski geçerli kod korunur
     entry["last_api_attempt"] = current_time
-    otp_storage[cleaned_phone] = entry
+    await otp_storage.set(cleaned_phone, entry, ttl_sec=OTP_STORAGE_TTL_SEC)
 
     otp_code = str(random.randint(100000, 999999))
     message = f"Leylek TAG dogrulama kodunuz: {otp_code}"
     sms_result = await send_sms_via_netgsm(cleaned_phone, message)
 
     if sms_result["success"]:
-        otp_storage[cleaned_phone] = {
+        await otp_storage.set(cleaned_phone, {
             "code": otp_code,
             "expires": current_time + OTP_TTL_SECONDS,
             "last_sms_ok": current_time,
             "last_api_attempt": current_time,
-        }
+        }, ttl_sec=OTP_STORAGE_TTL_SEC)
         logger.info(f"✅ OTP gönderildi: {cleaned_phone}")
         return {"success": True, "message": "OTP gönderildi"}
     else:
@@ -3307,12 +4611,12 @@ async def send_otp(request: SendOtpBodyRequest = None, phone: str = None):
         fallback = os.getenv("OTP_SMS_FALLBACK_TEST", "").strip().lower() in ("1", "true", "yes")
         if fallback:
             logger.warning(f"⚠️ OTP_SMS_FALLBACK_TEST: {cleaned_phone} -> 123456")
-            otp_storage[cleaned_phone] = {
+            await otp_storage.set(cleaned_phone, {
                 "code": "123456",
                 "expires": current_time + OTP_TTL_SECONDS,
                 "last_sms_ok": current_time,
                 "last_api_attempt": current_time,
-            }
+            }, ttl_sec=OTP_STORAGE_TTL_SEC)
             return {
                 "success": True,
                 "message": "OTP gönderildi (test fallback)",
@@ -3352,12 +4656,12 @@ async def verify_otp(request: VerifyOtpRequest = None, phone: str = None, otp: s
     logger.info(f"📱 OTP verify for: {phone_number}")
     
     # OTP kontrolü (sadece başarılı SMS sonrası yazılan "code" ile)
-    stored_otp = otp_storage.get(phone_number)
+    stored_otp = await otp_storage.get(phone_number)
     
     if stored_otp and stored_otp.get("code"):
         # Süre kontrolü
         if time.time() > stored_otp.get("expires", 0):
-            del otp_storage[phone_number]
+            await otp_storage.pop(phone_number)
             raise HTTPException(status_code=400, detail="OTP süresi doldu, yeni kod isteyin")
         
         # Kod kontrolü
@@ -3365,7 +4669,7 @@ async def verify_otp(request: VerifyOtpRequest = None, phone: str = None, otp: s
             raise HTTPException(status_code=400, detail="Geçersiz OTP")
         
         # Başarılı - OTP'yi sil
-        del otp_storage[phone_number]
+        await otp_storage.pop(phone_number)
         logger.info(f"✅ OTP verified for: {phone_number}")
     else:
         # Fallback: Test modu için 123456 kabul et
@@ -3382,7 +4686,7 @@ async def verify_otp(request: VerifyOtpRequest = None, phone: str = None, otp: s
     # Kullanıcı var mı kontrol et (DB'de 905XX veya 5XX kayıtlı olabilir)
     result = None
     for candidate in _phone_lookup_candidates(phone_number):
-        result = supabase.table("users").select("*").eq("phone", candidate).execute()
+        result = await db.table("users").select("*").eq("phone", candidate).execute()
         if result.data:
             break
     
@@ -3395,7 +4699,7 @@ async def verify_otp(request: VerifyOtpRequest = None, phone: str = None, otp: s
             upd = {"last_login": datetime.utcnow().isoformat()}
             if dev_id:
                 upd["last_device_id"] = dev_id
-            supabase.table("users").update(upd).eq("id", user["id"]).execute()
+            await db.table("users").update(upd).eq("id", user["id"]).execute()
         except Exception as upd_err:
             logger.warning(f"verify_otp device update (ignored): {upd_err}")
         
@@ -3456,7 +4760,7 @@ async def set_pin(request: SetPinRequest = None, phone: str = None, pin: str = N
         canonical = _auth_normalize_or_raise(phone_val)
         pin_hash = hash_pin(pin_val)
         
-        user_row = _users_get_by_phone_flexible(canonical)
+        user_row = await _supabase_core.run_db(_users_get_by_phone_flexible, canonical)
         
         if user_row:
             # Güncelle + cihaz bağla; DB'de 5XX kaldıysa 905'e çek
@@ -3474,7 +4778,7 @@ async def set_pin(request: SetPinRequest = None, phone: str = None, pin: str = N
                 upd["last_device_id"] = dev_id
             if user_row.get("phone") != canonical:
                 upd["phone"] = canonical
-            supabase.table("users").update(upd).eq("id", user_row["id"]).execute()
+            await db.table("users").update(upd).eq("id", user_row["id"]).execute()
         else:
             # Yeni kullanıcı — tek canonical format
             insert_data = {
@@ -3494,10 +4798,10 @@ async def set_pin(request: SetPinRequest = None, phone: str = None, pin: str = N
                 insert_data["gender"] = gender_val
             if dev_id:
                 insert_data["last_device_id"] = dev_id
-            supabase.table("users").insert(insert_data).execute()
+            await db.table("users").insert(insert_data).execute()
         
         logger.info(f"✅ PIN ayarlandı: {canonical}")
-        refreshed = _users_get_by_phone_flexible(canonical)
+        refreshed = await _supabase_core.run_db(_users_get_by_phone_flexible, canonical)
         out = {"success": True, "message": "PIN ayarlandı"}
         if refreshed and refreshed.get("id"):
             out["access_token"] = issue_access_token(refreshed["id"])
@@ -3560,12 +4864,12 @@ async def verify_pin_endpoint(request: Request):
         if not client_ip and request.client:
             client_ip = request.client.host
         
-        user = _users_get_by_phone_flexible(canonical)
+        user = await _supabase_core.run_db(_users_get_by_phone_flexible, canonical)
         
         if not user:
             # Login log - başarısız
             try:
-                supabase.table("login_logs").insert({
+                await db.table("login_logs").insert({
                     "id": str(uuid.uuid4()),
                     "phone": canonical,
                     "ip_address": client_ip,
@@ -3581,7 +4885,7 @@ async def verify_pin_endpoint(request: Request):
         if not verify_pin(pin, user.get("pin_hash", "")):
             # Login log - başarısız PIN
             try:
-                supabase.table("login_logs").insert({
+                await db.table("login_logs").insert({
                     "id": str(uuid.uuid4()),
                     "user_id": user["id"],
                     "phone": canonical,
@@ -3597,7 +4901,7 @@ async def verify_pin_endpoint(request: Request):
         
         # Son giriş zamanını ve IP/cihaz bilgisini güncelle
         try:
-            supabase.table("users").update({
+            await db.table("users").update({
                 "last_login": datetime.utcnow().isoformat(),
                 "last_ip": client_ip,
                 "last_device_id": device_id,
@@ -3608,7 +4912,7 @@ async def verify_pin_endpoint(request: Request):
         
         # Login log - başarılı
         try:
-            supabase.table("login_logs").insert({
+            await db.table("login_logs").insert({
                 "id": str(uuid.uuid4()),
                 "user_id": user["id"],
                 "phone": canonical,
@@ -3665,7 +4969,7 @@ async def login(request: LoginRequest = None, phone: str = None, pin: str = None
             raise HTTPException(status_code=422, detail="Phone ve PIN gerekli")
         
         canonical = _auth_normalize_or_raise(phone_val)
-        user = _users_get_by_phone_flexible(canonical)
+        user = await _supabase_core.run_db(_users_get_by_phone_flexible, canonical)
         
         if not user:
             raise HTTPException(status_code=404, detail="Kullanıcı bulunamadı")
@@ -3674,7 +4978,7 @@ async def login(request: LoginRequest = None, phone: str = None, pin: str = None
             raise HTTPException(status_code=401, detail="Yanlış PIN")
         
         # Son giriş güncelle
-        supabase.table("users").update({
+        await db.table("users").update({
             "last_login": datetime.utcnow().isoformat(),
             "updated_at": datetime.utcnow().isoformat()
         }).eq("id", user["id"]).execute()
@@ -3750,7 +5054,7 @@ async def reset_pin(request: ResetPinRequest):
         if len(request.new_pin) != 6 or not request.new_pin.isdigit():
             raise HTTPException(status_code=400, detail="PIN 6 haneli rakamlardan oluşmalı")
         
-        user_row = _users_get_by_phone_flexible(canonical)
+        user_row = await _supabase_core.run_db(_users_get_by_phone_flexible, canonical)
         if not user_row:
             raise HTTPException(status_code=404, detail="Kullanıcı bulunamadı")
         
@@ -3764,7 +5068,7 @@ async def reset_pin(request: ResetPinRequest):
         }
         if user.get("phone") != canonical:
             upd["phone"] = canonical
-        supabase.table("users").update(upd).eq("id", user["id"]).execute()
+        await db.table("users").update(upd).eq("id", user["id"]).execute()
         
         logger.info(f"🔑 PIN sıfırlandı: {canonical}")
         return {"success": True, "message": "Şifreniz başarıyla güncellendi"}
@@ -3789,12 +5093,12 @@ async def add_admin(request: AddAdminRequest):
         
         canonical_new = _auth_normalize_or_raise(request.new_admin_phone)
         
-        user = _users_get_by_phone_flexible(canonical_new)
+        user = await _supabase_core.run_db(_users_get_by_phone_flexible, canonical_new)
         if not user:
             raise HTTPException(status_code=404, detail="Kullanıcı bulunamadı. Önce kayıt olmalı.")
         
         # is_admin true yap
-        supabase.table("users").update({
+        await db.table("users").update({
             "is_admin": True,
             "updated_at": datetime.utcnow().isoformat()
         }).eq("id", user["id"]).execute()
@@ -3816,7 +5120,7 @@ async def list_admins(admin_phone: str):
             raise HTTPException(status_code=403, detail="Admin yetkisi gerekli")
         
         # Veritabanındaki adminler
-        result = supabase.table("users").select("id, phone, name, created_at").eq("is_admin", True).execute()
+        result = await db.table("users").select("id, phone, name, created_at").eq("is_admin", True).execute()
         
         admins = result.data or []
         
@@ -3852,7 +5156,7 @@ async def register_user(request: RegisterRequest):
         # Kullanıcı var mı (905... veya 5XX kayıt)
         existing = None
         for cand in _phone_lookup_candidates(phone_normalized):
-            existing = supabase.table("users").select("id").eq("phone", cand).limit(1).execute()
+            existing = await db.table("users").select("id").eq("phone", cand).limit(1).execute()
             if existing.data:
                 break
         if existing and existing.data:
@@ -3901,7 +5205,7 @@ async def register_user(request: RegisterRequest):
         if request.device_id:
             user_data["last_device_id"] = request.device_id
         
-        result = supabase.table("users").insert(user_data).execute()
+        result = await db.table("users").insert(user_data).execute()
         
         if result.data:
             user = result.data[0]
@@ -3938,7 +5242,7 @@ async def register_user(request: RegisterRequest):
 async def get_user(user_id: str):
     """Kullanıcı bilgilerini getir"""
     try:
-        result = supabase.table("users").select("*").eq("id", user_id).execute()
+        result = await db.table("users").select("*").eq("id", user_id).execute()
         
         if not result.data:
             raise HTTPException(status_code=404, detail="Kullanıcı bulunamadı")
@@ -3968,17 +5272,29 @@ async def get_user(user_id: str):
 
 @api_router.post("/user/update-location")
 async def update_location(user_id: str, latitude: float, longitude: float):
-    """Kullanıcı konumunu güncelle"""
+    """Kullanıcı konumunu güncelle (bellekte anında; DB'ye location_ingestor toplu yazar)"""
     try:
         # MongoDB ID'yi UUID'ye çevir
         resolved_id = await resolve_user_id(user_id)
         
-        supabase.table("users").update({
-            "latitude": latitude,
-            "longitude": longitude,
-            "last_location_update": datetime.utcnow().isoformat()
-        }).eq("id", resolved_id).execute()
+        if resolved_id and _UUID_RE.match(str(resolved_id)):
+            status = location_ingestor.submit(resolved_id, latitude, longitude)
+            heatmap_presence_move(resolved_id, latitude, longitude)
+        else:
+            # Çözülemeyen (UUID olmayan) id: toplu RPC ::uuid cast'ini bozmasın, eski yol
+            status = None
+            await db.table("users").update({
+                "latitude": latitude,
+                "longitude": longitude,
+                "last_location_update": datetime.utcnow().isoformat()
+            }).eq("id", resolved_id).execute()
+        # Online sürücüyse grid indeksinde hücresini taşı (yolcu/offline için no-op)
+        driver_geo_index.update_location(resolved_id, latitude, longitude)
+        if resolved_id:
+            await _trip_location_fanout(str(resolved_id).strip().lower(), latitude, longitude)
         
+        if status == SUBMIT_THROTTLED:
+            return {"success": True, "throttled": True}
         return {"success": True}
     except Exception as e:
         logger.error(f"Update location error: {e}")
@@ -4003,7 +5319,7 @@ async def register_driver(
             "registered_at": datetime.utcnow().isoformat()
         }
         
-        supabase.table("users").update({
+        await db.table("users").update({
             "driver_details": driver_details,
             "updated_at": datetime.utcnow().isoformat()
         }).eq("id", user_id).execute()
@@ -4057,7 +5373,7 @@ async def submit_driver_kyc(data: DriverKYCSubmit):
                 raise HTTPException(status_code=422, detail="Araç fotoğrafı gerekli")
         
         # Kullanıcıyı kontrol et
-        user_result = supabase.table("users").select("*").eq("id", user_id).execute()
+        user_result = await db.table("users").select("*").eq("id", user_id).execute()
         if not user_result.data:
             raise HTTPException(status_code=404, detail="Kullanıcı bulunamadı")
         
@@ -4143,7 +5459,7 @@ async def submit_driver_kyc(data: DriverKYCSubmit):
         if selfie_url:
             driver_details["selfie_url"] = selfie_url
         
-        supabase.table("users").update({
+        await db.table("users").update({
             "driver_details": driver_details,
             "updated_at": datetime.utcnow().isoformat()
         }).eq("id", user_id).execute()
@@ -4167,7 +5483,7 @@ async def submit_driver_kyc(data: DriverKYCSubmit):
 async def get_driver_kyc_status(user_id: str):
     """Sürücü KYC durumunu kontrol et. Admin numaraları KYC olmadan sürücü sayılır."""
     try:
-        result = supabase.table("users").select("phone, driver_details").eq("id", user_id).execute()
+        result = await db.table("users").select("phone, driver_details").eq("id", user_id).execute()
         if not result.data:
             return {"kyc_status": "none", "is_driver": False}
         
@@ -4207,7 +5523,7 @@ async def get_pending_kyc_requests(admin_phone: str):
     
     try:
         # Bekleyen KYC'leri getir
-        result = supabase.table("users").select("id, name, phone, driver_details, created_at").not_.is_("driver_details", "null").execute()
+        result = await db.table("users").select("id, name, phone, driver_details, created_at").not_.is_("driver_details", "null").execute()
         
         pending_kycs = []
         for user in result.data:
@@ -4242,7 +5558,7 @@ async def approve_driver_kyc(admin_phone: str, user_id: str):
         raise HTTPException(status_code=403, detail="Yetkisiz erişim")
     
     try:
-        result = supabase.table("users").select("driver_details, name, push_token").eq("id", user_id).execute()
+        result = await db.table("users").select("driver_details, name, push_token").eq("id", user_id).execute()
         if not result.data:
             raise HTTPException(status_code=404, detail="Kullanıcı bulunamadı")
         
@@ -4258,11 +5574,12 @@ async def approve_driver_kyc(admin_phone: str, user_id: str):
         now = datetime.utcnow()
         active_until = (now + timedelta(days=60)).isoformat()
         
-        supabase.table("users").update({
+        await db.table("users").update({
             "driver_details": driver_details,
             "driver_active_until": active_until,
             "updated_at": now.isoformat()
         }).eq("id", user_id).execute()
+        await invalidate_driver_state(user_id)
         
         # Push bildirim gönder
         push_token = user.get("push_token")
@@ -4292,7 +5609,7 @@ async def reject_driver_kyc(admin_phone: str, user_id: str, reason: str = "Belge
         raise HTTPException(status_code=403, detail="Yetkisiz erişim")
     
     try:
-        result = supabase.table("users").select("driver_details, name, push_token").eq("id", user_id).execute()
+        result = await db.table("users").select("driver_details, name, push_token").eq("id", user_id).execute()
         if not result.data:
             raise HTTPException(status_code=404, detail="Kullanıcı bulunamadı")
         
@@ -4305,7 +5622,7 @@ async def reject_driver_kyc(admin_phone: str, user_id: str, reason: str = "Belge
             "kyc_rejected_at": datetime.utcnow().isoformat()
         })
         
-        supabase.table("users").update({
+        await db.table("users").update({
             "driver_details": driver_details,
             "updated_at": datetime.utcnow().isoformat()
         }).eq("id", user_id).execute()
@@ -4338,7 +5655,7 @@ async def get_all_kyc_requests(admin_phone: str):
         raise HTTPException(status_code=403, detail="Yetkisiz erişim")
     
     try:
-        result = supabase.table("users").select("id, name, phone, driver_details, created_at").not_.is_("driver_details", "null").execute()
+        result = await db.table("users").select("id, name, phone, driver_details, created_at").not_.is_("driver_details", "null").execute()
         
         pending_kycs = []
         approved_kycs = []
@@ -4396,11 +5713,12 @@ async def get_all_kyc_requests(admin_phone: str):
 async def block_user(user_id: str, blocked_user_id: str, reason: str = None):
     """Kullanıcı engelle"""
     try:
-        supabase.table("blocked_users").insert({
+        await db.table("blocked_users").insert({
             "user_id": user_id,
             "blocked_user_id": blocked_user_id,
             "reason": reason
         }).execute()
+        await invalidate_block_pair(user_id, blocked_user_id)
         
         return {"success": True, "message": "Kullanıcı engellendi"}
     except Exception as e:
@@ -4412,7 +5730,8 @@ async def block_user(user_id: str, blocked_user_id: str, reason: str = None):
 async def unblock_user(user_id: str, blocked_user_id: str):
     """Engeli kaldır"""
     try:
-        supabase.table("blocked_users").delete().eq("user_id", user_id).eq("blocked_user_id", blocked_user_id).execute()
+        await db.table("blocked_users").delete().eq("user_id", user_id).eq("blocked_user_id", blocked_user_id).execute()
+        await invalidate_block_pair(user_id, blocked_user_id)
         return {"success": True, "message": "Engel kaldırıldı"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -4421,7 +5740,7 @@ async def unblock_user(user_id: str, blocked_user_id: str):
 async def get_blocked_list(user_id: str):
     """Engellenen kullanıcılar listesi"""
     try:
-        result = supabase.table("blocked_users").select("blocked_user_id").eq("user_id", user_id).execute()
+        result = await db.table("blocked_users").select("blocked_user_id").eq("user_id", user_id).execute()
         blocked_ids = [r["blocked_user_id"] for r in result.data]
         return {"success": True, "blocked_users": blocked_ids}
     except Exception as e:
@@ -4435,11 +5754,11 @@ async def report_user(user_id: str, reported_user_id: str, reason: str = "other"
     """Kullanıcı şikayet et - Supabase'e kaydet, Admin görsün"""
     try:
         # Şikayet eden kullanıcı bilgisi
-        reporter_result = supabase.table("users").select("name, phone").eq("id", user_id).execute()
+        reporter_result = await db.table("users").select("name, phone").eq("id", user_id).execute()
         reporter_info = reporter_result.data[0] if reporter_result.data else {}
         
         # Şikayet edilen kullanıcı bilgisi
-        reported_result = supabase.table("users").select("name, phone, driver_details").eq("id", reported_user_id).execute()
+        reported_result = await db.table("users").select("name, phone, driver_details").eq("id", reported_user_id).execute()
         reported_info = reported_result.data[0] if reported_result.data else {}
         
         # Role belirleme
@@ -4461,7 +5780,7 @@ async def report_user(user_id: str, reported_user_id: str, reason: str = "other"
             "created_at": datetime.utcnow().isoformat()
         }
         
-        result = supabase.table("reports").insert(report_data).execute()
+        result = await db.table("reports").insert(report_data).execute()
         
         logger.info(f"⚠️ Şikayet kaydedildi: {user_id} -> {reported_user_id} ({reason})")
         return {"success": True, "message": "Şikayetiniz alındı. Admin inceleyecek.", "report_id": result.data[0]["id"] if result.data else None}
@@ -4476,10 +5795,10 @@ async def report_user(user_id: str, reported_user_id: str, reason: str = "other"
 async def get_all_reports(status: str = None, limit: int = 50):
     """Admin: Tüm şikayetleri getir"""
     try:
-        query = supabase.table("reports").select("*").order("created_at", desc=True).limit(limit)
+        query = db.table("reports").select("*").order("created_at", desc=True).limit(limit)
         if status:
             query = query.eq("status", status)
-        result = query.execute()
+        result = await query.execute()
         return {"success": True, "reports": result.data}
     except Exception as e:
         logger.error(f"Get reports error: {e}")
@@ -4494,7 +5813,7 @@ async def admin_community_city_requests(admin_phone: str, limit: int = 80):
             raise HTTPException(status_code=403, detail="Admin yetkisi gerekli")
         lim = max(1, min(int(limit), 200))
         result = (
-            supabase.table("reports")
+            await db.table("reports")
             .select("*")
             .eq("reason", "city_muhabbet_talep")
             .order("created_at", desc=True)
@@ -4520,7 +5839,7 @@ async def update_report_status(report_id: str, status: str, admin_notes: str = N
         if admin_notes:
             update_data["admin_notes"] = admin_notes
         
-        supabase.table("reports").update(update_data).eq("id", report_id).execute()
+        await db.table("reports").update(update_data).eq("id", report_id).execute()
         return {"success": True, "message": "Şikayet durumu güncellendi"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -4554,7 +5873,7 @@ async def create_tag(request: CreateTagRequest, user_id: str = None):
         resolved_id = await resolve_user_id(pid)
         
         # Kullanıcı bilgisi
-        user_result = supabase.table("users").select("name, city").eq("id", resolved_id).execute()
+        user_result = await db.table("users").select("name, city").eq("id", resolved_id).execute()
         user = user_result.data[0] if user_result.data else {}
         
         # Share link oluştur
@@ -4574,8 +5893,13 @@ async def create_tag(request: CreateTagRequest, user_id: str = None):
             "status": "pending",
             "share_link": share_link
         }
+        # Yolculuk mesafesi bir kez burada (driver/requests her poll'da yeniden hesaplamaz)
+        ri = await get_route_info(request.pickup_lat, request.pickup_lng, request.dropoff_lat, request.dropoff_lng)
+        if ri:
+            tag_data["distance_km"] = round(float(ri["distance_km"]), 2)
+            tag_data["estimated_minutes"] = max(1, int(ri["duration_min"]))
         
-        result = supabase.table("tags").insert(tag_data).execute()
+        result = await db.table("tags").insert(tag_data).execute()
         
         if result.data:
             logger.info(f"🏷️ TAG oluşturuldu: {result.data[0]['id']}")
@@ -4599,7 +5923,7 @@ async def get_passenger_history(user_id: str, limit: int = 20):
     try:
         resolved_id = await resolve_user_id(user_id)
         
-        result = supabase.table("tags").select("*").eq("passenger_id", resolved_id).in_("status", ["completed", "cancelled"]).order("created_at", desc=True).limit(limit).execute()
+        result = await db.table("tags").select("*").eq("passenger_id", resolved_id).in_("status", ["completed", "cancelled"]).order("created_at", desc=True).limit(limit).execute()
         
         trips = []
         for tag in result.data:
@@ -4625,7 +5949,7 @@ async def get_driver_history(user_id: str, limit: int = 20):
     try:
         resolved_id = await resolve_user_id(user_id)
         
-        result = supabase.table("tags").select("*").eq("driver_id", resolved_id).in_("status", ["completed", "cancelled"]).order("created_at", desc=True).limit(limit).execute()
+        result = await db.table("tags").select("*").eq("driver_id", resolved_id).in_("status", ["completed", "cancelled"]).order("created_at", desc=True).limit(limit).execute()
         
         trips = []
         for tag in result.data:
@@ -4678,7 +6002,7 @@ async def update_user_profile(request: UpdateProfileRequest):
         if request.city:
             update_data["city"] = request.city
         
-        supabase.table("users").update(update_data).eq("id", resolved_id).execute()
+        await db.table("users").update(update_data).eq("id", resolved_id).execute()
         
         logger.info(f"✅ Profil güncellendi: {resolved_id}")
         return {"success": True, "message": "Profil güncellendi"}
@@ -4699,7 +6023,7 @@ async def set_ride_vehicle_kind(user_id: str, role: str, vehicle_kind: str):
         if role not in ("passenger", "driver"):
             raise HTTPException(status_code=422, detail="role: passenger veya driver olmalı")
         resolved_id = await resolve_user_id(user_id)
-        res = supabase.table("users").select("driver_details").eq("id", resolved_id).execute()
+        res = await db.table("users").select("driver_details").eq("id", resolved_id).execute()
         if not res.data:
             raise HTTPException(status_code=404, detail="Kullanıcı bulunamadı")
         row = res.data[0]
@@ -4710,7 +6034,7 @@ async def set_ride_vehicle_kind(user_id: str, role: str, vehicle_kind: str):
             dd["vehicle_kind"] = vehicle_kind
         else:
             dd["passenger_preferred_vehicle"] = vehicle_kind
-        supabase.table("users").update({
+        await db.table("users").update({
             "driver_details": dd,
             "updated_at": datetime.utcnow().isoformat(),
         }).eq("id", resolved_id).execute()
@@ -4741,7 +6065,7 @@ async def create_request_alias(request: CreateTagRequest, user_id: str = None):
 async def get_trip_status(tag_id: str):
     """Yolculuk durumunu al - polling için"""
     try:
-        result = supabase.table("tags").select("*").eq("id", tag_id).execute()
+        result = await db.table("tags").select("*").eq("id", tag_id).execute()
         if result.data:
             return {"success": True, "tag": result.data[0]}
         return {"success": False, "error": "Trip bulunamadı"}
@@ -4764,7 +6088,7 @@ async def get_active_tag(passenger_id: str = None, user_id: str = None):
         resolved_id = await resolve_user_id(uid)
         
         # ÖNCELİK 1: Aktif tag'leri ara (waiting, matched, in_progress)
-        result = supabase.table("tags").select("*").eq("passenger_id", resolved_id).in_("status", ["waiting", "pending", "offers_received", "matched", "in_progress"]).order("created_at", desc=True).limit(1).execute()
+        result = await db.table("tags").select("*").eq("passenger_id", resolved_id).in_("status", ["waiting", "pending", "offers_received", "matched", "in_progress"]).order("created_at", desc=True).limit(1).execute()
         
         if result.data:
             tag = result.data[0]
@@ -4772,7 +6096,7 @@ async def get_active_tag(passenger_id: str = None, user_id: str = None):
             # Eğer şoför atandıysa, şoförün konumunu al
             driver_location = None
             if tag.get("driver_id"):
-                driver_result = supabase.table("users").select("latitude, longitude, name").eq("id", tag["driver_id"]).execute()
+                driver_result = await db.table("users").select("latitude, longitude, name").eq("id", tag["driver_id"]).execute()
                 if driver_result.data and driver_result.data[0].get("latitude"):
                     driver_location = {
                         "latitude": float(driver_result.data[0]["latitude"]),
@@ -4793,7 +6117,7 @@ async def get_active_tag(passenger_id: str = None, user_id: str = None):
         from datetime import timedelta
         ten_seconds_ago = (datetime.utcnow() - timedelta(seconds=10)).isoformat()
         
-        cancelled_result = supabase.table("tags").select("*").eq("passenger_id", resolved_id).eq("status", "cancelled").gte("cancelled_at", ten_seconds_ago).order("cancelled_at", desc=True).limit(1).execute()
+        cancelled_result = await db.table("tags").select("*").eq("passenger_id", resolved_id).eq("status", "cancelled").gte("cancelled_at", ten_seconds_ago).order("cancelled_at", desc=True).limit(1).execute()
         
         if cancelled_result.data:
             cancelled_tag = cancelled_result.data[0]
@@ -4816,25 +6140,18 @@ async def get_offers_for_passenger(passenger_id: str = None, user_id: str = None
         # MongoDB ID'yi UUID'ye çevir
         resolved_id = await resolve_user_id(pid)
         
-        # Engellenen kullanıcıları al
-        blocked_result = supabase.table("blocked_users").select("blocked_user_id").eq("user_id", resolved_id).execute()
-        blocked_ids = [r["blocked_user_id"] for r in blocked_result.data]
-        
-        # Beni engelleyenleri al
-        blocked_by_result = supabase.table("blocked_users").select("user_id").eq("blocked_user_id", resolved_id).execute()
-        blocked_by_ids = [r["user_id"] for r in blocked_by_result.data]
-        
-        all_blocked = list(set(blocked_ids + blocked_by_ids))
+        # Engellediklerim + beni engelleyenler (block_cache)
+        all_blocked = await block_cache.get(resolved_id)
         
         # Teklifleri getir
-        query = supabase.table("offers").select("*, users!offers_driver_id_fkey(name, rating, profile_photo, driver_details)").eq("tag_id", tag_id).eq("status", "pending")
+        query = db.table("offers").select("*, users!offers_driver_id_fkey(name, rating, profile_photo, driver_details)").eq("tag_id", tag_id).eq("status", "pending")
         
-        result = query.execute()
+        result = await query.execute()
         
         offers = []
         for offer in result.data:
             # Engelli kontrolü
-            if offer.get("driver_id") in all_blocked:
+            if str(offer.get("driver_id") or "").strip().lower() in all_blocked:
                 continue
             
             driver_info = offer.get("users", {}) or {}
@@ -4895,7 +6212,7 @@ async def accept_offer(request: AcceptOfferRequest = None, user_id: str = None,
         # 1. ÖNCE driver_id + tag_id ile bul (en güvenilir yol)
         if resolved_driver_for_query and tid:
             logger.info(f"🔍 Teklif aranıyor: driver_id={resolved_driver_for_query}, tag_id={tid}")
-            offer_result = supabase.table("offers").select("*").eq("driver_id", resolved_driver_for_query).eq("tag_id", tid).eq("status", "pending").execute()
+            offer_result = await db.table("offers").select("*").eq("driver_id", resolved_driver_for_query).eq("tag_id", tid).eq("status", "pending").execute()
             if offer_result.data:
                 offer = offer_result.data[0]
                 oid = offer["id"]
@@ -4904,7 +6221,7 @@ async def accept_offer(request: AcceptOfferRequest = None, user_id: str = None,
         # 2. driver_id + tag_id ile bulunamazsa, sadece tag_id ile en son teklifi bul
         if not offer and tid:
             logger.info(f"🔍 Son teklif aranıyor: tag_id={tid}")
-            offer_result = supabase.table("offers").select("*").eq("tag_id", tid).eq("status", "pending").order("created_at", desc=True).limit(1).execute()
+            offer_result = await db.table("offers").select("*").eq("tag_id", tid).eq("status", "pending").order("created_at", desc=True).limit(1).execute()
             if offer_result.data:
                 offer = offer_result.data[0]
                 oid = offer["id"]
@@ -4913,7 +6230,7 @@ async def accept_offer(request: AcceptOfferRequest = None, user_id: str = None,
         # 3. Hala bulunamazsa ve offer_id UUID formatındaysa dene
         if not offer and oid and not oid.startswith("offer_"):
             try:
-                offer_result = supabase.table("offers").select("*").eq("id", oid).execute()
+                offer_result = await db.table("offers").select("*").eq("id", oid).execute()
                 if offer_result.data:
                     offer = offer_result.data[0]
                     logger.info(f"✅ Teklif bulundu (uuid): {oid}")
@@ -4928,74 +6245,47 @@ async def accept_offer(request: AcceptOfferRequest = None, user_id: str = None,
         driver_id_final = offer["driver_id"]
         real_offer_id = offer["id"]
         
-        # TAG'i çek (passenger_id, pickup_lat/lng vs. için gerekli - önceden yoktu, bildirim hataya düşüyordu)
-        tag_result = supabase.table("tags").select("*").eq("id", tag_id_final).limit(1).execute()
-        tag = tag_result.data[0] if tag_result.data else {}
-        
-        # Şoför bilgisi
-        driver_result = supabase.table("users").select("name").eq("id", driver_id_final).execute()
-        driver_name = driver_result.data[0]["name"] if driver_result.data else "Şoför"
-        passenger_id_final = tag.get("passenger_id")
-        passenger_name = "Yolcu"
-        if passenger_id_final:
-            passenger_result = supabase.table("users").select("name").eq("id", passenger_id_final).execute()
-            if passenger_result.data:
-                passenger_name = passenger_result.data[0].get("name", "Yolcu")
+        # Şoför bilgisi (önce bellek: geo indeks / push önbelleği)
+        driver_name = await _match_user_name(driver_id_final, "Şoför")
         
         # Teklifi kabul et
-        supabase.table("offers").update({"status": "accepted"}).eq("id", real_offer_id).execute()
+        await db.table("offers").update({"status": "accepted"}).eq("id", real_offer_id).execute()
         
         # Diğer teklifleri reddet
-        supabase.table("offers").update({"status": "rejected"}).eq("tag_id", tag_id_final).neq("id", real_offer_id).execute()
+        await db.table("offers").update({"status": "rejected"}).eq("tag_id", tag_id_final).neq("id", real_offer_id).execute()
         
-        # TAG'i güncelle
-        supabase.table("tags").update({
+        # TAG'i güncelle (return=representation: güncel satır ayrıca okunmaz)
+        matched_at = datetime.utcnow().isoformat()
+        tag_result = await db.table("tags").update({
             "status": "matched",
             "driver_id": driver_id_final,
             "driver_name": driver_name,
             "accepted_offer_id": real_offer_id,
             "final_price": offer["price"],
-            "matched_at": datetime.utcnow().isoformat()
+            "matched_at": matched_at
         }).eq("id", tag_id_final).execute()
+        tag = tag_result.data[0] if tag_result.data else {"id": tag_id_final}
+        await waiting_tag_index_drop(tag_id_final)
 
-        match_payload = {
-            "tag_id": tag_id_final,
-            "offer_id": real_offer_id,
-            "passenger_id": passenger_id_final,
-            "passenger_name": passenger_name,
-            "driver_id": driver_id_final,
-            "driver_name": driver_name,
-            "pickup_location": tag.get("pickup_location"),
-            "dropoff_location": tag.get("dropoff_location"),
-            "pickup_lat": tag.get("pickup_lat"),
-            "pickup_lng": tag.get("pickup_lng"),
-            "dropoff_lat": tag.get("dropoff_lat"),
-            "dropoff_lng": tag.get("dropoff_lng"),
-            "offered_price": offer.get("price"),
-            "status": "matched",
-        }
-
-        # Eşleşme bildirimini her iki tarafa da socket ile anında gönder (sid veya normalized room)
-        try:
-            driver_room = _normalize_user_room(driver_id_final)
-            driver_sid = connected_users.get(str(driver_id_final).strip().lower()) or connected_users.get(driver_id_final)
-            driver_target = driver_sid if driver_sid else driver_room
-            passenger_target = None
-            if driver_target:
-                await sio.emit("offer_accepted", match_payload, room=driver_target)
-                await sio.emit("tag_matched", match_payload, room=driver_target)
-            if passenger_id_final:
-                passenger_room = _normalize_user_room(passenger_id_final)
-                passenger_sid = connected_users.get(str(passenger_id_final).strip().lower()) or connected_users.get(passenger_id_final)
-                passenger_target = passenger_sid if passenger_sid else passenger_room
-                if passenger_target:
-                    await sio.emit("tag_matched", match_payload, room=passenger_target)
-            logger.info(f"✅ Eşleşme socket: driver={driver_target or 'yok'}, passenger={passenger_target or 'yok'}")
-        except Exception as socket_err:
-            logger.warning(f"⚠️ Eşleşme socket emit hatası: {socket_err}")
-
-        # Eşleşme tam bu anda – güncel tag'den sürücü/yolcu id'leri ile ikisine bildirim (teklif bildirimiyle aynı yol)
-        push_result = await send_match_notification_to_both(tag_id_final, driver_id_final, passenger_id_final)
+        passenger_id_final = tag.get("passenger_id")
+        passenger_name = tag.get("passenger_name")
+        if passenger_id_final and not passenger_name:
+            passenger_name = await _match_user_name(passenger_id_final, "Yolcu")
+        pickup_distance_km, pickup_eta_min = await _match_pickup_estimate(driver_id_final, tag)
+        match_payload = build_match_payload(
+            tag,
+            driver_id=driver_id_final,
+            driver_name=driver_name,
+            passenger_id=passenger_id_final,
+            passenger_name=passenger_name,
+            offer_id=real_offer_id,
+            price=offer.get("price"),
+            pickup_distance_km=pickup_distance_km,
+            pickup_eta_min=pickup_eta_min,
+            matched_at=matched_at,
+        )
+        # Socket (alıcı başına tek yük) + push kuyruğu (teslimat arka planda)
+        push_result = await fan_out_match(match_payload, FLOW_ACCEPT_OFFER)
 
         logger.info(f"✅ Teklif kabul edildi: {real_offer_id} - Driver: {driver_id_final}")
         resp = {"success": True, "message": "Teklif kabul edildi", "driver_id": driver_id_final, "offer_id": real_offer_id}
@@ -5018,7 +6308,7 @@ async def cancel_tag_delete(tag_id: str, passenger_id: str = None, user_id: str
         # MongoDB ID'yi UUID'ye çevir
         resolved_id = await resolve_user_id(pid) if pid else None
 
-        tag_check = supabase.table("tags").select("created_at").eq("id", tag_id).limit(1).execute()
+        tag_check = await db.table("tags").select("created_at").eq("id", tag_id).limit(1).execute()
         tag = tag_check.data[0] if tag_check.data else {}
         created_at = tag.get("created_at")
         if created_at:
@@ -5028,7 +6318,7 @@ async def cancel_tag_delete(tag_id: str, passenger_id: str = None, user_id: str
                 logger.info("AUTO_CANCEL_BLOCKED (<20s)")
                 return {"success": False, "message": "Too early cancel blocked"}
         
-        update_query = supabase.table("tags").update({
+        update_query = db.table("tags").update({
             "status": "cancelled",
             "cancelled_at": datetime.utcnow().isoformat()
         }).eq("id", tag_id)
@@ -5036,10 +6326,10 @@ async def cancel_tag_delete(tag_id: str, passenger_id: str = None, user_id: str
         if resolved_id:
             update_query = update_query.eq("passenger_id", resolved_id)
         
-        update_query.execute()
+        await update_query.execute()
 
         try:
-            q_mem = dispatch_queues.get(tag_id, [])
+            q_mem = await dispatch_queues.get(tag_id, [])
             for e in q_mem:
                 if e.get("status") == "sent":
                     await emit_passenger_offer_revoked(e["driver_id"], tag_id)
@@ -5048,15 +6338,16 @@ async def cancel_tag_delete(tag_id: str, passenger_id: str = None, user_id: str
                     tsk = active_dispatch_tasks.pop(key, None)
                     if tsk and not tsk.done():
                         tsk.cancel()
-            dispatch_queues.pop(tag_id, None)
+            await dispatch_queues.pop(tag_id)
             dispatch_tag_context.pop(tag_id, None)
-            supabase.table("dispatch_queue").delete().eq("tag_id", tag_id).execute()
+            await db.table("dispatch_queue").delete().eq("tag_id", tag_id).execute()
         except Exception:
             pass
         try:
             await rolling_dispatch_stop(tag_id, revoke_offers=True)
         except Exception:
             pass
+        await waiting_tag_index_drop(tag_id)
         
         return {"success": True, "message": "TAG iptal edildi"}
     except Exception as e:
@@ -5077,7 +6368,7 @@ async def cancel_tag_post(request: CancelTagRequest = None, tag_id: str = None,
         # MongoDB ID'yi UUID'ye çevir
         resolved_id = await resolve_user_id(pid) if pid else None
 
-        tag_check = supabase.table("tags").select("created_at").eq("id", tid).limit(1).execute()
+        tag_check = await db.table("tags").select("created_at").eq("id", tid).limit(1).execute()
         tag = tag_check.data[0] if tag_check.data else {}
         created_at = tag.get("created_at")
         if created_at:
@@ -5088,7 +6379,7 @@ async def cancel_tag_post(request: CancelTagRequest = None, tag_id: str = None,
                 return {"success": False, "message": "Too early cancel blocked"}
         
         # 1. TAG'i iptal et
-        update_query = supabase.table("tags").update({
+        update_query = db.table("tags").update({
             "status": "cancelled",
             "cancelled_at": datetime.utcnow().isoformat()
         }).eq("id", tid)
@@ -5096,14 +6387,14 @@ async def cancel_tag_post(request: CancelTagRequest = None, tag_id: str = None,
         if resolved_id:
             update_query = update_query.eq("passenger_id", resolved_id)
         
-        update_query.execute()
+        await update_query.execute()
         
         # 2. Aktif teklifleri de iptal et
-        supabase.table("offers").update({"status": "rejected"}).eq("tag_id", tid).eq("status", "pending").execute()
+        await db.table("offers").update({"status": "rejected"}).eq("tag_id", tid).eq("status", "pending").execute()
         
         # 3. 🔥 Dispatch queue'dan sil - SÜRÜCÜLERDEN HEMEN KALDIR
         try:
-            q_mem = dispatch_queues.get(tid, [])
+            q_mem = await dispatch_queues.get(tid, [])
             for e in q_mem:
                 if e.get("status") == "sent":
                     await emit_passenger_offer_revoked(e["driver_id"], tid)
@@ -5112,9 +6403,9 @@ async def cancel_tag_post(request: CancelTagRequest = None, tag_id: str = None,
                     tsk = active_dispatch_tasks.pop(key, None)
                     if tsk and not tsk.done():
                         tsk.cancel()
-            dispatch_queues.pop(tid, None)
+            await dispatch_queues.pop(tid)
             dispatch_tag_context.pop(tid, None)
-            supabase.table("dispatch_queue").delete().eq("tag_id", tid).execute()
+            await db.table("dispatch_queue").delete().eq("tag_id", tid).execute()
             logger.info(f"🗑️ Dispatch queue temizlendi: {tid}")
         except Exception as dq_err:
             logger.warning(f"Dispatch queue temizleme hatası: {dq_err}")
@@ -5122,10 +6413,11 @@ async def cancel_tag_post(request: CancelTagRequest = None, tag_id: str = None,
             await rolling_dispatch_stop(tid, revoke_offers=True)
         except Exception:
             pass
+        await waiting_tag_index_drop(tid)
         
         # 4. 🔔 Socket ile tüm sürücülere bildir - TAG iptal edildi
         try:
-            await sio.emit("tag_cancelled", {"tag_id": tid}, room="drivers")
+            await sio.emit("tag_cancelled", {"tag_id": tid}, room=DRIVERS_ROOM)
             logger.info(f"📢 Tüm sürücülere iptal bildirimi gönderildi: {tid}")
         except Exception as socket_err:
             logger.warning(f"Socket emit hatası: {socket_err}")
@@ -5140,6 +6432,92 @@ async def cancel_tag_post(request: CancelTagRequest = None, tag_id: str = None,
 
 # ==================== DRIVER ENDPOINTS ====================
 
+# /driver/requests sürücü→pickup matrisi için süre bütçesi (aşılırsa kuş uçuşu tahmin; matris arka planda cache'i ısıtır)
+try:
+    DRIVER_REQUESTS_ROUTE_BUDGET_SEC = max(0.1, float(os.getenv("DRIVER_REQUESTS_ROUTE_BUDGET_SEC", "1.5")))
+except (TypeError, ValueError):
+    DRIVER_REQUESTS_ROUTE_BUDGET_SEC = 1.5
+
+# Bütçeyi aşıp arka planda süren matrisler: (sürücü konum hücresi ~100 m, pickup anahtarı) → task.
+# Aynı hücre + aynı pickup kümesi yeni matris açmaz (uçuştaki beklenir); başka isteğin matrisi iptal edilmez.
+# Uçuştaki matris sayısı DRIVER_ROUTE_MAX_INFLIGHT ile sınırlı — dolunca yeni matris yalnızca bütçe kadar yaşar.
+_driver_route_tasks: Dict[tuple, asyncio.Task] = {}
+try:
+    DRIVER_ROUTE_MAX_INFLIGHT = max(1, int(os.getenv("DRIVER_ROUTE_MAX_INFLIGHT", "64")))
+except (TypeError, ValueError):
+    DRIVER_ROUTE_MAX_INFLIGHT = 64
+
+
+def _driver_route_cell(lat: float, lng: float) -> tuple:
+    return (round(lat, 3), round(lng, 3))
+
+
+def _tag_trip_route(tag: dict) -> tuple:
+    """
+    Yolculuk (km, dk, tahmini_mi): tag oluşturulurken kaydedilen değer; eski satırda kuş uçuşu tahmin
+    (tahmini_mi=True).
+    """
+    try:
+        dk = float(tag.get("distance_km") or 0)
+        if dk > 0:
+            em = tag.get("estimated_minutes")
+            return dk, (float(em) if em else None), False
+    except (TypeError, ValueError):
+        pass
+    p = _coerce_latlng(tag.get("pickup_lat"), tag.get("pickup_lng"))
+    d = _coerce_latlng(tag.get("dropoff_lat"), tag.get("dropoff_lng"))
+    if p is None or d is None:
+        return None, None, False
+    return haversine_km(p[0], p[1], d[0], d[1]), float(_eta_minutes(p[0], p[1], d[0], d[1])), True
+
+
+async def _driver_pickup_routes(driver_lat, driver_lng, pickups: list) -> list:
+    """
+    Tek sürücü → N pickup: [(km, dk, tahmini_mi)] pickups sırasıyla (konumsuz satır (None, None, False)).
+    Ters yönlü matris (cache → Distance Matrix → OSRM table) DRIVER_REQUESTS_ROUTE_BUDGET_SEC içinde;
+    yetişmezse / rota yoksa kuş uçuşu tahmin. Bütçeyi aşan matris arka planda biter (cache ısınır); aynı
+    konum hücresi + aynı pickup kümesiyle gelen sonraki poll (aynı veya başka sürücü) yeni matris açmaz,
+    uçuştakini bekler. Uçuştaki matris sınırı doluysa yeni matris bütçe sonunda iptal edilir.
+    """
+    out = [(None, None, False)] * len(pickups)
+    origin = _coerce_latlng(driver_lat, driver_lng)
+    idx = [i for i, p in enumerate(pickups) if p is not None]
+    if origin is None or not idx:
+        return out
+    points = [pickups[i] for i in idx]
+    key = (_driver_route_cell(origin[0], origin[1]), tuple(points))
+    task = _driver_route_tasks.get(key)
+    tracked = True
+    if task is None or task.done():
+        task = asyncio.create_task(get_route_matrix_to_point(points, origin[0], origin[1], reverse=True))
+        tracked = len(_driver_route_tasks) < DRIVER_ROUTE_MAX_INFLIGHT
+        if tracked:
+            _driver_route_tasks[key] = task
+
+        def _forget(t: asyncio.Task, key=key) -> None:
+            if not t.cancelled():
+                t.exception()
+            if _driver_route_tasks.get(key) is t:
+                del _driver_route_tasks[key]
+
+        task.add_done_callback(_forget)
+    done, _pending = await asyncio.wait({task}, timeout=DRIVER_REQUESTS_ROUTE_BUDGET_SEC)
+    if task not in done and not tracked:
+        task.cancel()
+    routes = [None] * len(idx)
+    if task in done and not task.cancelled() and not task.exception():
+        routes = task.result()
+    else:
+        logger.info("driver/requests: rota bütçesi aşıldı/hata (%s pickup) — kuş uçuşu tahmin", len(idx))
+    for i, ri in zip(idx, routes):
+        if ri:
+            out[i] = (float(ri["distance_km"]), float(ri["duration_min"]), False)
+        else:
+            la, lo = pickups[i]
+            out[i] = (haversine_km(origin[0], origin[1], la, lo), float(_eta_minutes(origin[0], origin[1], la, lo)), True)
+    return out
+
+
 @api_router.get("/driver/requests")
 async def get_driver_requests(driver_id: str = None, user_id: str = None, latitude: float = None, longitude: float = None):
     """Şoför için yakındaki istekleri getir - ŞEHİR BAZLI (aynı şehirdeki tüm teklifler)"""
@@ -5152,43 +6530,28 @@ async def get_driver_requests(driver_id: str = None, user_id: str = None, latitu
         # MongoDB ID'yi UUID'ye çevir
         resolved_id = await resolve_user_id(did)
         
-        # 10 DAKİKADAN ESKİ TAG'LERİ OTOMATİK İPTAL ET
-        ten_min_ago = (datetime.utcnow() - timedelta(minutes=10)).isoformat()
-        try:
-            supabase.table("tags").update({"status": "expired"}).in_("status", ["pending", "offers_received"]).lt("created_at", ten_min_ago).execute()
-        except:
-            pass  # Hata olursa devam et
-        
-        # Sürücünün şehrini al
-        driver_result = supabase.table("users").select("city, latitude, longitude, driver_details").eq("id", resolved_id).execute()
-        driver_city = None
-        driver_lat = latitude
-        driver_lng = longitude
+        # 10 dakikadan eski tag'ler listelenmez (expired'a çeviren: tag_expiry_sweeper)
+        ten_min_ago = (datetime.utcnow() - timedelta(seconds=tag_expiry_sweeper.max_age_sec)).isoformat()
         
-        if driver_result.data:
-            driver_city = driver_result.data[0].get("city")
-            if not driver_lat:
-                driver_lat = driver_result.data[0].get("latitude")
-            if not driver_lng:
-                driver_lng = driver_result.data[0].get("longitude")
+        # Sürücünün şehri / konumu (bellekteki canlı konum DB satırından yeni olabilir)
+        driver_result = await db.table("users").select("city, latitude, longitude, driver_details, last_location_update").eq("id", resolved_id).execute()
+        driver_row = location_ingestor.overlay(resolved_id, driver_result.data[0]) if driver_result.data else {}
+        driver_city = driver_row.get("city")
+        driver_lat = latitude if latitude else driver_row.get("latitude")
+        driver_lng = longitude if longitude else driver_row.get("longitude")
         
-        # Engellenen kullanıcıları al
-        blocked_result = supabase.table("blocked_users").select("blocked_user_id").eq("user_id", resolved_id).execute()
-        blocked_ids = [r["blocked_user_id"] for r in blocked_result.data]
-        blocked_by_result = supabase.table("blocked_users").select("user_id").eq("blocked_user_id", resolved_id).execute()
-        blocked_by_ids = [r["user_id"] for r in blocked_by_result.data]
-        all_blocked = list(set(blocked_ids + blocked_by_ids))
+        # Engellediklerim + beni engelleyenler (block_cache)
+        all_blocked = await block_cache.get(resolved_id)
         
         # Pending TAG'leri getir - SADECE SON 10 DAKİKA İÇİNDEKİLER
-        result = supabase.table("tags").select("*, users!tags_passenger_id_fkey(name, rating, profile_photo, city, driver_details)").in_("status", ["pending", "offers_received"]).gte("created_at", ten_min_ago).order("created_at", desc=True).limit(100).execute()
+        result = await db.table("tags").select("*, users!tags_passenger_id_fkey(name, rating, profile_photo, city, driver_details)").in_("status", ["pending", "offers_received"]).gte("created_at", ten_min_ago).order("created_at", desc=True).limit(100).execute()
         
-        driver_eff = _effective_driver_vehicle_kind(
-            driver_result.data[0] if driver_result.data else {}
-        )
-        requests = []
-        for tag in result.data:
+        driver_eff = _effective_driver_vehicle_kind(driver_row)
+        # 1) Filtre (engelli / araç tipi / şehir) — ağ çağrısı yok
+        candidates = []
+        for tag in result.data or []:
             # Engelli kontrolü
-            if tag.get("passenger_id") in all_blocked:
+            if str(tag.get("passenger_id") or "").strip().lower() in all_blocked:
                 continue
             
             passenger_info = tag.get("users", {}) or {}
@@ -5201,36 +6564,22 @@ async def get_driver_requests(driver_id: str = None, user_id: str = None, latitu
             if driver_city and passenger_city:
                 if driver_city.lower().strip() != passenger_city.lower().strip():
                     continue
-            
-            # Mesafe hesapla (OSRM)
-            distance_km = None
-            duration_min = None
-            
-            target_lat = float(tag["pickup_lat"]) if tag.get("pickup_lat") else None
-            target_lng = float(tag["pickup_lng"]) if tag.get("pickup_lng") else None
-            
-            if driver_lat and driver_lng and target_lat and target_lng:
-                route_info = await get_route_info(driver_lat, driver_lng, target_lat, target_lng)
-                if route_info:
-                    distance_km = route_info["distance_km"]
-                    duration_min = route_info["duration_min"]
-            
-            # Yolculuk mesafesi (pickup -> dropoff)
-            trip_distance_km = None
-            trip_duration_min = None
-            if tag.get("pickup_lat") and tag.get("dropoff_lat"):
-                trip_route = await get_route_info(
-                    float(tag["pickup_lat"]), float(tag["pickup_lng"]),
-                    float(tag["dropoff_lat"]), float(tag["dropoff_lng"])
-                )
-                if trip_route:
-                    trip_distance_km = trip_route["distance_km"]
-                    trip_duration_min = trip_route["duration_min"]
-            
-            pk_km = round(distance_km, 1) if distance_km else None
-            pk_min = int(round(duration_min)) if duration_min else None
-            tr_km = round(trip_distance_km, 1) if trip_distance_km else None
-            tr_min = int(round(trip_duration_min)) if trip_duration_min else None
+            candidates.append((tag, passenger_info, passenger_city))
+
+        # 2) Sürücü → pickup: tek matris isteği (bütçeli), yolculuk mesafesi tag satırından
+        pickup_routes = await _driver_pickup_routes(
+            driver_lat,
+            driver_lng,
+            [_coerce_latlng(t.get("pickup_lat"), t.get("pickup_lng")) for t, _pi, _pc in candidates],
+        )
+
+        requests = []
+        for (tag, passenger_info, passenger_city), (distance_km, duration_min, estimated) in zip(candidates, pickup_routes):
+            trip_distance_km, trip_duration_min, trip_estimated = _tag_trip_route(tag)
+            pk_km = round(distance_km, 1) if distance_km is not None else None
+            pk_min = int(round(duration_min)) if duration_min is not None else None
+            tr_km = round(trip_distance_km, 1) if trip_distance_km is not None else None
+            tr_min = int(round(trip_duration_min)) if trip_duration_min is not None else None
             requests.append({
                 "id": tag["id"],
                 "passenger_id": tag["passenger_id"],
@@ -5248,16 +6597,22 @@ async def get_driver_requests(driver_id: str = None, user_id: str = None, latitu
                 "status": tag["status"],
                 "pickup_distance_km": pk_km,
                 "pickup_eta_min": pk_min,
+                "pickup_estimated": estimated,
                 "trip_distance_km": tr_km,
                 "trip_duration_min": tr_min,
                 "distance_to_passenger_km": pk_km,
                 "time_to_passenger_min": pk_min,
                 "distance_km": tr_km,
+                "distance_estimated": trip_estimated,
                 "estimated_minutes": tr_min,
                 "duration_min": pk_min,
                 "created_at": tag["created_at"]
             })
         
+        # 3) Yakından uzağa (konumsuz satırlar sonda)
+        requests.sort(
+            key=lambda r: (r["pickup_distance_km"] is None, r["pickup_distance_km"] if r["pickup_distance_km"] is not None else 0.0)
+        )
         return {"success": True, "requests": requests}
     except Exception as e:
         logger.error(f"Get driver requests error: {e}")
@@ -5271,11 +6626,14 @@ async def get_driver_nearby_passengers_map(
     latitude: float = None,
     longitude: float = None,
     radius_km: float = None,
+    zoom: int = 0,
 ):
     """
     Sürücü bekleme haritası: sürücü konumu etrafında radius_km (varsayılan DISPATCH_RADIUS_KM) içinde
     - Aktif yolcu talepleri (tag: waiting / pending / offers_received, alış noktası)
     - Uygulamada konumu güncel olan, talebi olmayan yolcular (hafif işaret; gizlilik: yalnızca kısa etiket)
+    - city_grid: sürücünün şehrinde en yoğun hücreler (zoom 0 = ~20 km, 1 / 2 = daha ince)
+    Listeler ve hücreler heatmap_tiles'tan; mesafeler kuş uçuşu (yol rotası: /driver/map-marker-route).
     """
     try:
         did = driver_id or user_id
@@ -5285,7 +6643,7 @@ async def get_driver_nearby_passengers_map(
         resolved_id = await resolve_user_id(did)
         rk = float(radius_km) if radius_km is not None else float(DISPATCH_RADIUS_KM)
 
-        driver_result = supabase.table("users").select("city, latitude, longitude, driver_details").eq("id", resolved_id).execute()
+        driver_result = await db.table("users").select("city, latitude, longitude, driver_details").eq("id", resolved_id).execute()
         driver_lat = latitude
         driver_lng = longitude
         if driver_result.data:
@@ -5306,211 +6664,79 @@ async def get_driver_nearby_passengers_map(
         driver_lat = float(driver_lat)
         driver_lng = float(driver_lng)
 
-        blocked_result = supabase.table("blocked_users").select("blocked_user_id").eq("user_id", resolved_id).execute()
-        blocked_ids = {r["blocked_user_id"] for r in (blocked_result.data or [])}
-        blocked_by_result = supabase.table("blocked_users").select("user_id").eq("blocked_user_id", resolved_id).execute()
-        blocked_by_ids = {r["user_id"] for r in (blocked_by_result.data or [])}
-        all_blocked = blocked_ids | blocked_by_ids
+        all_blocked = await block_cache.get(resolved_id)
 
         driver_eff = _effective_driver_vehicle_kind(driver_result.data[0] if driver_result.data else {})
-
+        await heatmap_tiles_ensure_fresh()
+        resolved_lower = str(resolved_id or "").strip().lower()
         ten_min_ago = (datetime.utcnow() - timedelta(minutes=10)).isoformat()
-        tag_res = (
-            supabase.table("tags")
-            .select(
-                "id, passenger_id, pickup_lat, pickup_lng, pickup_location, status, final_price, created_at, "
-                "passenger_preferred_vehicle, "
-                "users!tags_passenger_id_fkey(name, rating, profile_photo, city, driver_details, gender)"
-            )
-            .in_("status", ["waiting", "pending", "offers_received"])
-            .gte("created_at", ten_min_ago)
-            .order("created_at", desc=True)
-            .limit(150)
-            .execute()
-        )
 
         seeking = []
         active_passenger_ids = set()
 
-        for tag in tag_res.data or []:
-            if tag.get("passenger_id") in all_blocked:
-                continue
-            passenger_info = tag.get("users", {}) or {}
-            trip_pref = _trip_passenger_vehicle_pref(tag, passenger_info)
-            if not _driver_matches_passenger_vehicle_pref(driver_eff, trip_pref):
-                continue
-
-            plat = tag.get("pickup_lat")
-            plng = tag.get("pickup_lng")
-            if plat is None or plng is None:
+        for km, _key, _city, plat_f, plng_f, d in heatmap_tiles.nearby(driver_lat, driver_lng, rk, kind=KIND_SEEKING):
+            pid = d.get("passenger_id")
+            pid_norm = str(pid or "").strip().lower()
+            if pid_norm in all_blocked:
                 continue
-            try:
-                plat_f = float(plat)
-                plng_f = float(plng)
-            except (TypeError, ValueError):
-                continue
-
-            if not _bbox_road_prefilter_ok(driver_lat, driver_lng, plat_f, plng_f, rk):
+            if str(d.get("created_at") or "") < ten_min_ago:
                 continue
-            ri_seek = await get_route_info(driver_lat, driver_lng, plat_f, plng_f)
-            if not ri_seek or float(ri_seek["distance_km"]) > rk:
+            pvk = d.get("vehicle_pref") or "car"
+            if not _driver_matches_passenger_vehicle_pref(driver_eff, pvk):
                 continue
-            road_km = round(float(ri_seek["distance_km"]), 2)
-
-            pid = tag.get("passenger_id")
-            if pid:
-                active_passenger_ids.add(str(pid).strip().lower())
-
-            pname = passenger_info.get("name", "Yolcu") or "Yolcu"
-            label = (pname.split() or ["Yolcu"])[0][:20]
-
-            pvk = _trip_passenger_vehicle_pref(tag, passenger_info)
-            pg = passenger_info.get("gender") if isinstance(passenger_info, dict) else None
+            if pid_norm:
+                active_passenger_ids.add(pid_norm)
+            air_km = round(km, 2)
             seeking.append(
                 {
-                    "tag_id": tag["id"],
+                    "tag_id": d.get("tag_id"),
                     "passenger_id": pid,
                     "pickup_lat": plat_f,
                     "pickup_lng": plng_f,
-                    "pickup_location": (tag.get("pickup_location") or "")[:80],
-                    "status": tag.get("status"),
-                    "distance_km": road_km,
-                    "pickup_distance_km": road_km,
-                    "offered_price": tag.get("final_price") or tag.get("offered_price"),
-                    "label": label,
-                    "passenger_gender": pg if pg in ("female", "male") else None,
+                    "pickup_location": d.get("pickup_location") or "",
+                    "status": d.get("status"),
+                    "distance_km": air_km,
+                    "pickup_distance_km": air_km,
+                    "distance_estimated": True,
+                    "offered_price": d.get("offered_price"),
+                    "label": d.get("label") or "Yolcu",
+                    "passenger_gender": d.get("passenger_gender"),
                     "passenger_vehicle_kind": "motorcycle" if pvk == "motorcycle" else "car",
                 }
             )
 
-        nearby_app_users = []
-        forty_five_min_ago = (datetime.utcnow() - timedelta(minutes=45)).isoformat()
-
-        try:
-            pu = (
-                supabase.table("users")
-                .select("id, name, latitude, longitude, driver_online, updated_at, city, gender")
-                .neq("id", resolved_id)
-                .not_.is_("latitude", "null")
-                .not_.is_("longitude", "null")
-                .or_("driver_online.is.null,driver_online.eq.false")
-                .gte("updated_at", forty_five_min_ago)
-                .limit(280)
-                .execute()
-            )
-        except Exception as ex:
-            logger.warning(f"nearby-passengers-map users query fallback: {ex}")
-            pu = (
-                supabase.table("users")
-                .select("id, name, latitude, longitude, driver_online, city, gender")
-                .neq("id", resolved_id)
-                .not_.is_("latitude", "null")
-                .not_.is_("longitude", "null")
-                .or_("driver_online.is.null,driver_online.eq.false")
-                .limit(280)
-                .execute()
-            )
-
         driver_city_norm = ""
         driver_city_label = ""
         if driver_result.data:
             driver_city_label = str(driver_result.data[0].get("city") or "").strip()
             driver_city_norm = driver_city_label.lower()
 
-        # Şehir içi ~20x20 km hücre yoğunluğu (Türkiye enlemi için lat/lng adımı)
-        GRID_STEP_LAT = 0.18
-        GRID_STEP_LNG = 0.26
-        city_grid_counts: dict = {}
-
-        def _grid_add(plat: float, plng: float) -> None:
-            gi = int(math.floor(plat / GRID_STEP_LAT))
-            gj = int(math.floor(plng / GRID_STEP_LNG))
-            k = (gi, gj)
-            city_grid_counts[k] = city_grid_counts.get(k, 0) + 1
-
-        if driver_city_norm:
-            for tag in tag_res.data or []:
-                if tag.get("passenger_id") in all_blocked:
-                    continue
-                passenger_info = tag.get("users", {}) or {}
-                pcity = str(passenger_info.get("city") or "").strip().lower()
-                if pcity != driver_city_norm:
-                    continue
-                try:
-                    plat_f = float(tag.get("pickup_lat"))
-                    plng_f = float(tag.get("pickup_lng"))
-                except (TypeError, ValueError):
-                    continue
-                _grid_add(plat_f, plng_f)
-
-        seen_light = 0
+        nearby_app_users = []
         max_light = 55
-
-        for row in pu.data or []:
-            if seen_light >= max_light:
+        for km, _key, ucity, ulat, ulng, d in heatmap_tiles.nearby(driver_lat, driver_lng, rk, kind=KIND_APP_USER):
+            if len(nearby_app_users) >= max_light:
                 break
-            uid = str(row.get("id") or "").strip().lower()
-            if uid in all_blocked:
-                continue
-            if uid in active_passenger_ids:
-                continue
-            try:
-                ulat = float(row["latitude"])
-                ulng = float(row["longitude"])
-            except (TypeError, ValueError, KeyError):
-                continue
-            if driver_city_norm:
-                uc = str(row.get("city") or "").strip().lower()
-                if uc != driver_city_norm:
-                    continue
-            if not _bbox_road_prefilter_ok(driver_lat, driver_lng, ulat, ulng, rk):
+            uid = str(d.get("user_id") or "").strip().lower()
+            if uid == resolved_lower or uid in all_blocked or uid in active_passenger_ids:
                 continue
-            ri_u = await get_route_info(driver_lat, driver_lng, ulat, ulng)
-            if not ri_u or float(ri_u["distance_km"]) > rk:
+            if driver_city_norm and ucity != driver_city_norm:
                 continue
-            road_u = round(float(ri_u["distance_km"]), 2)
-            nm = row.get("name") or "Yolcu"
-            label = (nm.split() or ["Yakında"])[0][:12]
-            g = row.get("gender")
             nearby_app_users.append(
                 {
-                    "user_id": row["id"],
+                    "user_id": d.get("user_id"),
                     "latitude": ulat,
                     "longitude": ulng,
-                    "distance_km": road_u,
-                    "label": label,
-                    "passenger_gender": g if g in ("female", "male") else None,
+                    "distance_km": round(km, 2),
+                    "distance_estimated": True,
+                    "label": d.get("label") or "Yakında",
+                    "passenger_gender": d.get("passenger_gender"),
                 }
             )
-            seen_light += 1
-
-        if driver_city_norm:
-            for row in pu.data or []:
-                uid = str(row.get("id") or "").strip().lower()
-                if uid in all_blocked:
-                    continue
-                uc = str(row.get("city") or "").strip().lower()
-                if uc != driver_city_norm:
-                    continue
-                try:
-                    ulat = float(row["latitude"])
-                    ulng = float(row["longitude"])
-                except (TypeError, ValueError, KeyError):
-                    continue
-                _grid_add(ulat, ulng)
 
         city_grid = []
-        if city_grid_counts:
-            mx = max(city_grid_counts.values()) or 1
-            for (gi, gj), cnt in sorted(city_grid_counts.items(), key=lambda x: -x[1])[:48]:
-                city_grid.append(
-                    {
-                        "center_lat": (gi + 0.5) * GRID_STEP_LAT,
-                        "center_lng": (gj + 0.5) * GRID_STEP_LNG,
-                        "count": cnt,
-                        "intensity": round(min(1.0, cnt / mx), 3),
-                    }
-                )
+        if driver_city_norm:
+            hidden = heatmap_tiles.owner_cells(list(all_blocked) + [resolved_lower], driver_city_norm, zoom)
+            city_grid = heatmap_tiles.tiles(driver_city_norm, zoom, limit=48, exclude_cells=hidden)
 
         return {
             "success": True,
@@ -5521,12 +6747,71 @@ async def get_driver_nearby_passengers_map(
             "nearby_light_count": len(nearby_app_users),
             "driver_city": driver_city_label,
             "city_grid": city_grid,
+            "zoom": max(0, min(int(zoom), 2)),
         }
     except Exception as e:
         logger.error(f"nearby-passengers-map error: {e}")
         return {"success": False, "seeking": [], "nearby_app_users": [], "detail": str(e)}
 
 
+# /driver/map-marker-route: sürücü başına cache dışı (Google / OSRM) rota isteği aralığı; cache isabeti sayılmaz
+try:
+    MARKER_ROUTE_MIN_INTERVAL_SEC = max(0.0, float(os.getenv("MARKER_ROUTE_MIN_INTERVAL_SEC", "2")))
+except (TypeError, ValueError):
+    MARKER_ROUTE_MIN_INTERVAL_SEC = 2.0
+marker_route_rate = shared_state.map("marker_route_rate")
+
+
+@api_router.get("/driver/map-marker-route")
+async def get_driver_map_marker_route(
+    target_lat: float,
+    target_lng: float,
+    driver_id: str = None,
+    user_id: str = None,
+    latitude: float = None,
+    longitude: float = None,
+):
+    """
+    Bekleme haritasında dokunulan işaret: sürücü → işaret yol mesafesi / süresi (liste kuş uçuşu döner).
+    Başlangıç: latitude / longitude verilmezse sürücünün son konumu. Önce road_route_cache; cache dışı
+    istek sürücü başına MARKER_ROUTE_MIN_INTERVAL_SEC'te bir (aşımda 429).
+    """
+    did = driver_id or user_id
+    if not did:
+        return {"success": False, "detail": "driver_id veya user_id gerekli"}
+    resolved_id = str(await resolve_user_id(did) or "").strip().lower()
+    row = await driver_state_cache.get(resolved_id)
+    if not row:
+        return {"success": False, "detail": "Kullanıcı bulunamadı"}
+    row = location_ingestor.overlay(resolved_id, row)
+    origin = _coerce_latlng(
+        latitude if latitude is not None else row.get("latitude"),
+        longitude if longitude is not None else row.get("longitude"),
+    )
+    target = _coerce_latlng(target_lat, target_lng)
+    if origin is None or target is None:
+        return {"success": False, "detail": "no_driver_location" if origin is None else "invalid_target"}
+
+    coords = (origin[0], origin[1], target[0], target[1])
+    hit = await road_route_cache.lookup("google", *coords)
+    ri = _route_info_from_road(hit) if hit else await road_route_cache.lookup("osrm", *coords)
+    if not ri:
+        if MARKER_ROUTE_MIN_INTERVAL_SEC > 0 and not await marker_route_rate.set_if_absent(
+            resolved_id, 1, ttl_sec=MARKER_ROUTE_MIN_INTERVAL_SEC
+        ):
+            raise HTTPException(status_code=429, detail="Çok sık rota isteği; birkaç saniye sonra tekrar deneyin.")
+        ri = await get_route_info(*coords)
+    if not ri:
+        return {"success": False, "detail": "route_unavailable"}
+    return {
+        "success": True,
+        "distance_km": round(float(ri["distance_km"]), 2),
+        "duration_min": int(round(float(ri.get("duration_min") or 0))),
+        "distance_text": ri.get("distance_text"),
+        "duration_text": ri.get("duration_text"),
+    }
+
+
 class SendOfferRequest(BaseModel):
     tag_id: str
     price: float
@@ -5569,7 +6854,7 @@ async def send_offer(
         # COOLDOWN KALDIRILDI - Şoför istediği kadar teklif verebilir
         
         # Şoför bilgisi
-        driver_result = supabase.table("users").select("name, rating, profile_photo, driver_details, latitude, longitude").eq("id", resolved_id).execute()
+        driver_result = await db.table("users").select("name, rating, profile_photo, driver_details, latitude, longitude").eq("id", resolved_id).execute()
         if not driver_result.data:
             raise HTTPException(status_code=404, detail="Şoför bulunamadı")
         
@@ -5580,7 +6865,7 @@ async def send_offer(
         driver_lng = lng or driver.get("longitude")
         
         # TAG bilgisi
-        tag_result = supabase.table("tags").select("*").eq("id", tid).execute()
+        tag_result = await db.table("tags").select("*").eq("id", tid).execute()
         if not tag_result.data:
             raise HTTPException(status_code=404, detail="TAG bulunamadı")
         
@@ -5591,7 +6876,7 @@ async def send_offer(
             try:
                 pid = await resolve_user_id(tag["passenger_id"])
                 pu = (
-                    supabase.table("users")
+                    await db.table("users")
                     .select("driver_details")
                     .eq("id", pid)
                     .limit(1)
@@ -5632,11 +6917,11 @@ async def send_offer(
             offer_data["vehicle_photo"] = driver["driver_details"].get("vehicle_photo")
         
         # 1. TEKLİFİ ANINDA KAYDET
-        result = supabase.table("offers").insert(offer_data).execute()
+        result = await db.table("offers").insert(offer_data).execute()
         offer_id = result.data[0]["id"]
         
         # 2. TAG durumunu güncelle
-        supabase.table("tags").update({"status": "offers_received"}).eq("id", tid).execute()
+        await db.table("tags").update({"status": "offers_received"}).eq("id", tid).execute()
         
         logger.info(f"📤 Teklif ANINDA gönderildi: {resolved_id} -> {tid}")
 
@@ -5703,7 +6988,7 @@ async def send_offer(
                             trip_duration = route2.get("duration_min")
                 
                 # Teklifi güncelle
-                supabase.table("offers").update({
+                await db.table("offers").update({
                     "distance_to_passenger_km": round(distance_to_passenger, 1) if distance_to_passenger else None,
                     "estimated_arrival_min": int(estimated_arrival) if estimated_arrival else None,
                     "trip_distance_km": round(trip_distance, 1) if trip_distance else None,
@@ -5797,26 +7082,32 @@ async def driver_accept_offer_http(
         if len(tid) == 36 and tid.count("-") == 4:
             tid = tid.lower()
 
-        tag_result = supabase.table("tags").select("*").eq("id", tid).limit(1).execute()
-        if not tag_result.data:
-            raise HTTPException(status_code=404, detail="Teklif bulunamadı")
-
-        tag_row_pre = tag_result.data[0]
-        drv_chk = (
-            supabase.table("users")
-            .select("name, driver_details")
-            .eq("id", resolved_driver_id)
-            .limit(1)
-            .execute()
-        )
-        driver_eff_acc = _effective_driver_vehicle_kind(drv_chk.data[0] if drv_chk.data else {})
+        # Ön kontrol satırları bellekten (bekleyen tag indeksi / geo indeks); koşullu update yine status'a bakar
+        tag_row_pre = waiting_tag_index.get(tid)
+        if tag_row_pre is None:
+            tag_result = await db.table("tags").select("*").eq("id", tid).limit(1).execute()
+            if not tag_result.data:
+                raise HTTPException(status_code=404, detail="Teklif bulunamadı")
+            tag_row_pre = tag_result.data[0]
+        drv_row_acc = driver_geo_index.get(resolved_driver_id)
+        if drv_row_acc is None:
+            drv_chk = (
+                await db.table("users")
+                .select("name, driver_details")
+                .eq("id", resolved_driver_id)
+                .limit(1)
+                .execute()
+            )
+            drv_row_acc = drv_chk.data[0] if drv_chk.data else {}
+        driver_eff_acc = _effective_driver_vehicle_kind(drv_row_acc)
         pu_row_acc = None
         pid_acc = tag_row_pre.get("passenger_id")
-        if pid_acc:
+        # Tag'de tek sefer tercihi varsa yolcu profili gerekmez (_trip_passenger_vehicle_pref)
+        if pid_acc and _canonical_vehicle_kind(tag_row_pre.get("passenger_preferred_vehicle")) is None:
             try:
                 pid_r_acc = await resolve_user_id(str(pid_acc).strip())
                 pu_acc = (
-                    supabase.table("users")
+                    await db.table("users")
                     .select("driver_details")
                     .eq("id", pid_r_acc)
                     .limit(1)
@@ -5832,11 +7123,7 @@ async def driver_accept_offer_http(
                 status_code=403, detail="Bu talep için araç tipiniz uygun değil"
             )
 
-        driver_name = (
-            drv_chk.data[0]["name"]
-            if drv_chk and drv_chk.data and drv_chk.data[0].get("name")
-            else "Sürücü"
-        )
+        driver_name = drv_row_acc.get("name") or "Sürücü"
 
         matched_at = datetime.now(timezone.utc).isoformat()
         update_data = {
@@ -5850,7 +7137,7 @@ async def driver_accept_offer_http(
         # postgrest-py 2.x: update() sonrası .select() yok (SyncFilterRequestBuilder).
         # Varsayılan Prefer: return=representation ile güncellenen satır( lar) ur.data içinde gelir.
         ur = (
-            supabase.table("tags")
+            await db.table("tags")
             .update(update_data)
             .eq("id", tid)
             .in_("status", matchable_statuses)
@@ -5859,7 +7146,7 @@ async def driver_accept_offer_http(
         updated_tag = ur.data[0] if ur.data else None
 
         if not updated_tag:
-            ref = supabase.table("tags").select("*").eq("id", tid).limit(1).execute()
+            ref = await db.table("tags").select("*").eq("id", tid).limit(1).execute()
             row = ref.data[0] if ref.data else {}
             st = (row.get("status") or "").lower()
             did_row = str(row.get("driver_id") or "").strip().lower()
@@ -5870,14 +7157,16 @@ async def driver_accept_offer_http(
                     status_code=409, detail="Bu teklif artık mevcut değil veya eşleştirilemez"
                 )
 
+        rolling_state = None
         try:
-            await rolling_dispatch_stop(
+            rolling_state = await rolling_dispatch_stop(
                 tid, revoke_offers=True, except_driver_id=resolved_driver_id
             )
         except Exception as _rds:
             logger.warning(
                 f"rolling_dispatch_stop after driver/accept-offer HTTP (non-fatal): {_rds}"
             )
+        await waiting_tag_index_drop(tid)
         try:
             await handle_dispatch_accept(tid, resolved_driver_id)
         except Exception as _hda:
@@ -5888,90 +7177,27 @@ async def driver_accept_offer_http(
         passenger_id = updated_tag.get("passenger_id")
         if passenger_id:
             passenger_id = await resolve_user_id(str(passenger_id).strip())
-        passenger_name = "Yolcu"
-        if passenger_id:
-            pr = (
-                supabase.table("users")
-                .select("name")
-                .eq("id", passenger_id)
-                .limit(1)
-                .execute()
-            )
-            if pr.data and pr.data[0].get("name"):
-                passenger_name = pr.data[0]["name"]
-
-        pickup_distance_km = None
-        pickup_eta_min = None
-        try:
-            udrv = (
-                supabase.table("users")
-                .select("latitude, longitude")
-                .eq("id", resolved_driver_id)
-                .limit(1)
-                .execute()
-            )
-            plat, plng = updated_tag.get("pickup_lat"), updated_tag.get("pickup_lng")
-            if udrv.data and plat is not None and plng is not None:
-                dlat, dlng = udrv.data[0].get("latitude"), udrv.data[0].get("longitude")
-                if dlat is not None and dlng is not None:
-                    ri_pk = await get_route_info(
-                        float(dlat), float(dlng), float(plat), float(plng)
-                    )
-                    if ri_pk:
-                        pickup_distance_km = float(ri_pk["distance_km"])
-                        pickup_eta_min = int(ri_pk["duration_min"])
-        except Exception as _pke:
-            logger.warning(f"driver/accept-offer pickup_distance: {_pke}")
+        passenger_name = updated_tag.get("passenger_name")
+        if passenger_id and not passenger_name:
+            passenger_name = await _match_user_name(passenger_id, "Yolcu")
 
-        trip_dk = updated_tag.get("distance_km")
-        est_min = updated_tag.get("estimated_minutes")
+        pickup_distance_km, pickup_eta_min = await _match_pickup_for_accept(
+            rolling_state, resolved_driver_id, updated_tag
+        )
 
-        payload = {
-            "trip_id": tid,
-            "tag_id": tid,
-            "driver_id": resolved_driver_id,
-            "driver_name": driver_name,
-            "passenger_id": passenger_id,
-            "passenger_name": passenger_name,
-            "pickup_location": updated_tag.get("pickup_location"),
-            "dropoff_location": updated_tag.get("dropoff_location"),
-            "pickup_lat": updated_tag.get("pickup_lat"),
-            "pickup_lng": updated_tag.get("pickup_lng"),
-            "dropoff_lat": updated_tag.get("dropoff_lat"),
-            "dropoff_lng": updated_tag.get("dropoff_lng"),
-            "offered_price": updated_tag.get("offered_price")
-            or updated_tag.get("final_price"),
-            "final_price": updated_tag.get("final_price"),
-            "distance_km": trip_dk,
-            "trip_distance_km": trip_dk,
-            "pickup_distance_km": pickup_distance_km,
-            "pickup_eta_min": pickup_eta_min,
-            "estimated_minutes": est_min,
-            "trip_duration_min": est_min,
-            "status": "matched",
-            "matched_at": updated_tag.get("matched_at") or matched_at,
-            "passenger_payment_method": updated_tag.get("passenger_payment_method"),
-        }
-        try:
-            driver_sid = connected_users.get(
-                str(resolved_driver_id).strip().lower()
-            ) or connected_users.get(resolved_driver_id)
-            driver_room = _normalize_user_room(resolved_driver_id)
-            driver_target = driver_sid or driver_room
-            if driver_target:
-                await sio.emit("tag_matched", payload, room=driver_target)
-                await sio.emit("ride_matched", payload, room=driver_target)
-            if passenger_id:
-                passenger_sid = connected_users.get(
-                    str(passenger_id).strip().lower()
-                ) or connected_users.get(passenger_id)
-                passenger_room = _normalize_user_room(passenger_id)
-                passenger_target = passenger_sid or passenger_room
-                if passenger_target:
-                    await sio.emit("tag_matched", payload, room=passenger_target)
-                    await sio.emit("ride_matched", payload, room=passenger_target)
-        except Exception as sock_e:
-            logger.warning(f"driver/accept-offer HTTP socket emit: {sock_e}")
+        payload = build_match_payload(
+            {**updated_tag, "id": tid},
+            driver_id=resolved_driver_id,
+            driver_name=driver_name,
+            passenger_id=passenger_id,
+            passenger_name=passenger_name,
+            pickup_distance_km=pickup_distance_km,
+            pickup_eta_min=pickup_eta_min,
+            matched_at=updated_tag.get("matched_at") or matched_at,
+        )
+        await fan_out_match(payload, FLOW_DRIVER_ACCEPT_HTTP)
+        trip_dk = payload["distance_km"]
+        est_min = payload["estimated_minutes"]
 
         return {
             "success": True,
@@ -6002,7 +7228,7 @@ async def get_driver_active_trip(driver_id: str = None, user_id: str = None):
         resolved_id = await resolve_user_id(did)
         
         # ÖNCELİK 1: Aktif tag'leri ara (matched veya in_progress)
-        result = supabase.table("tags").select("*, users!tags_passenger_id_fkey(name, phone, rating, profile_photo, latitude, longitude)").eq("driver_id", resolved_id).in_("status", ["matched", "in_progress"]).order("matched_at", desc=True).limit(1).execute()
+        result = await db.table("tags").select("*, users!tags_passenger_id_fkey(name, phone, rating, profile_photo, latitude, longitude)").eq("driver_id", resolved_id).in_("status", ["matched", "in_progress"]).order("matched_at", desc=True).limit(1).execute()
         
         if result.data:
             tag = result.data[0]
@@ -6049,7 +7275,7 @@ async def get_driver_active_trip(driver_id: str = None, user_id: str = None):
             try:
                 pid_res = await resolve_user_id(tag["passenger_id"])
                 pg_r = (
-                    supabase.table("users")
+                    await db.table("users")
                     .select("gender")
                     .eq("id", pid_res)
                     .limit(1)
@@ -6098,7 +7324,7 @@ async def get_driver_active_trip(driver_id: str = None, user_id: str = None):
         from datetime import timedelta
         ten_seconds_ago = (datetime.utcnow() - timedelta(seconds=10)).isoformat()
         
-        cancelled_result = supabase.table("tags").select("*, users!tags_passenger_id_fkey(name, phone, rating, profile_photo, latitude, longitude)").eq("driver_id", resolved_id).eq("status", "cancelled").gte("cancelled_at", ten_seconds_ago).order("cancelled_at", desc=True).limit(1).execute()
+        cancelled_result = await db.table("tags").select("*, users!tags_passenger_id_fkey(name, phone, rating, profile_photo, latitude, longitude)").eq("driver_id", resolved_id).eq("status", "cancelled").gte("cancelled_at", ten_seconds_ago).order("cancelled_at", desc=True).limit(1).execute()
         
         if cancelled_result.data:
             cancelled_tag = cancelled_result.data[0]
@@ -6138,7 +7364,7 @@ async def get_driver_dispatch_pending_offer(user_id: str = None, driver_id: str
             return {"success": False, "offer": None, "detail": "user_id gerekli"}
         resolved_id = await resolve_user_id(did)
         dq = (
-            supabase.table("dispatch_queue")
+            await db.table("dispatch_queue")
             .select("*")
             .eq("driver_id", resolved_id)
             .eq("status", "sent")
@@ -6146,14 +7372,13 @@ async def get_driver_dispatch_pending_offer(user_id: str = None, driver_id: str
         )
         if not dq.data:
             return {"success": True, "offer": None}
-        cfg = await get_dispatch_config()
-        timeout = int(cfg.get("driver_offer_timeout", 10))
+        timeout = dispatch_config.driver_offer_timeout
         for row in dq.data:
             tid = row.get("tag_id")
             if not tid:
                 continue
             tr = (
-                supabase.table("tags")
+                await db.table("tags")
                 .select("*")
                 .eq("id", tid)
                 .eq("status", "waiting")
@@ -6170,7 +7395,7 @@ async def get_driver_dispatch_pending_offer(user_id: str = None, driver_id: str
                 try:
                     pid_r = await resolve_user_id(pid)
                     pu = (
-                        supabase.table("users")
+                        await db.table("users")
                         .select("driver_details")
                         .eq("id", pid_r)
                         .limit(1)
@@ -6182,7 +7407,7 @@ async def get_driver_dispatch_pending_offer(user_id: str = None, driver_id: str
                     pass
             pvk = _trip_passenger_vehicle_pref(tag, pu_row)
             drv = (
-                supabase.table("users")
+                await db.table("users")
                 .select("driver_details")
                 .eq("id", resolved_id)
                 .limit(1)
@@ -6196,16 +7421,10 @@ async def get_driver_dispatch_pending_offer(user_id: str = None, driver_id: str
             pk_km = row.get("distance_km")
             pk_min = None
             try:
-                dlu = (
-                    supabase.table("users")
-                    .select("latitude, longitude")
-                    .eq("id", resolved_id)
-                    .limit(1)
-                    .execute()
-                )
-                if dlu.data and tag.get("pickup_lat") is not None and tag.get("pickup_lng") is not None:
-                    d_la = float(dlu.data[0]["latitude"])
-                    d_lo = float(dlu.data[0]["longitude"])
+                dlu = await _user_location_rows(resolved_id)
+                if dlu and tag.get("pickup_lat") is not None and tag.get("pickup_lng") is not None:
+                    d_la = float(dlu[0]["latitude"])
+                    d_lo = float(dlu[0]["longitude"])
                     p_la = float(tag["pickup_lat"])
                     p_lo = float(tag["pickup_lng"])
                     ri_d = await get_route_info(d_la, d_lo, p_la, p_lo)
@@ -6256,27 +7475,27 @@ async def start_trip(driver_id: str = None, user_id: str = None, tag_id: str = N
         # MongoDB ID'yi UUID'ye çevir
         resolved_id = await resolve_user_id(did)
         
-        supabase.table("tags").update({
+        await db.table("tags").update({
             "status": "in_progress",
             "started_at": datetime.utcnow().isoformat()
         }).eq("id", tag_id).eq("driver_id", resolved_id).execute()
         
         # Trip lifecycle push: TRIP_STARTED → yolcu + sürücü
-        tag_row = supabase.table("tags").select("passenger_id, driver_id").eq("id", tag_id).limit(1).execute()
+        tag_row = await db.table("tags").select("passenger_id, driver_id").eq("id", tag_id).limit(1).execute()
         if tag_row.data:
             p_id = tag_row.data[0].get("passenger_id")
             d_id = tag_row.data[0].get("driver_id")
             try:
                 if p_id:
-                    asyncio.create_task(send_trip_push_and_log(
+                    await send_trip_push_and_log(
                         p_id, "trip_started", "Yolculuk başladı", "İyi yolculuklar.",
                         {"type": "trip_started", "tag_id": tag_id}
-                    ))
+                    )
                 if d_id:
-                    asyncio.create_task(send_trip_push_and_log(
+                    await send_trip_push_and_log(
                         d_id, "trip_started", "Yolculuk başladı", "Güvenli sürüşler.",
                         {"type": "trip_started", "tag_id": tag_id}
-                    ))
+                    )
             except Exception as notif_err:
                 logger.warning(f"⚠️ Trip started push gönderilemedi: {notif_err}")
         
@@ -6305,32 +7524,32 @@ async def complete_trip(driver_id: str = None, user_id: str = None, tag_id: str
         resolved_id = await resolve_user_id(did)
         
         # TAG'i güncelle
-        supabase.table("tags").update({
+        await db.table("tags").update({
             "status": "completed",
             "completed_at": datetime.utcnow().isoformat()
         }).eq("id", tag_id).eq("driver_id", resolved_id).execute()
         
         # TAG bilgisini al
-        tag_result = supabase.table("tags").select("passenger_id").eq("id", tag_id).execute()
+        tag_result = await db.table("tags").select("passenger_id").eq("id", tag_id).execute()
         if tag_result.data:
             passenger_id = tag_result.data[0]["passenger_id"]
             
             # Her iki kullanıcının trip sayısını artır
             for uid in [resolved_id, passenger_id]:
-                user_result = supabase.table("users").select("total_trips").eq("id", uid).execute()
+                user_result = await db.table("users").select("total_trips").eq("id", uid).execute()
                 if user_result.data:
                     current = user_result.data[0].get("total_trips", 0) or 0
-                    supabase.table("users").update({"total_trips": current + 1}).eq("id", uid).execute()
+                    await db.table("users").update({"total_trips": current + 1}).eq("id", uid).execute()
         
         # 🆕 Trip bittiğinde chat mesajlarını sil
         try:
-            delete_result = supabase.table("chat_messages").delete().eq("tag_id", tag_id).execute()
+            delete_result = await db.table("chat_messages").delete().eq("tag_id", tag_id).execute()
             logger.info(f"🗑️ Chat mesajları silindi: tag_id={tag_id}")
         except Exception as chat_err:
             logger.warning(f"⚠️ Chat mesajları silinemedi: {chat_err}")
         
         # 🔔 PUSH NOTIFICATIONS - TRIP_COMPLETED (trip lifecycle)
-        tag_info = supabase.table("tags").select("final_price, passenger_id, driver_id").eq("id", tag_id).execute()
+        tag_info = await db.table("tags").select("final_price, passenger_id, driver_id").eq("id", tag_id).execute()
         if tag_info.data:
             tag_data = tag_info.data[0]
             price = tag_data.get("final_price") or tag_data.get("offered_price", 0)
@@ -6339,19 +7558,19 @@ async def complete_trip(driver_id: str = None, user_id: str = None, tag_id: str
             d_id = tag_data.get("driver_id")
             try:
                 if p_id:
-                    asyncio.create_task(send_trip_push_and_log(
+                    await send_trip_push_and_log(
                         p_id, "trip_completed",
                         "Yolculuk tamamlandı",
                         "Bizi tercih ettiğiniz için teşekkür ederiz.",
                         {"type": "trip_completed", "tag_id": tag_id, "price": price}
-                    ))
+                    )
                 if d_id:
-                    asyncio.create_task(send_trip_push_and_log(
+                    await send_trip_push_and_log(
                         d_id, "trip_completed",
                         "Yolculuk tamamlandı",
                         f"Kazancınız: {fare_amount} TL. Yeni teklif almak için bekleme ekranına geçebilirsiniz.",
                         {"type": "trip_completed", "tag_id": tag_id, "earnings": price}
-                    ))
+                    )
             except Exception as notif_err:
                 logger.warning(f"⚠️ Trip completed push gönderilemedi: {notif_err}")
         
@@ -6380,7 +7599,7 @@ async def driver_on_the_way(driver_id: str = None, user_id: str = None, tag_id:
         if not did or not tag_id:
             raise HTTPException(status_code=422, detail="user_id ve tag_id gerekli")
         resolved_id = await resolve_user_id(did)
-        tag_result = supabase.table("tags").select("passenger_id, driver_id, status, pickup_lat, pickup_lng").eq("id", tag_id).eq("driver_id", resolved_id).limit(1).execute()
+        tag_result = await db.table("tags").select("passenger_id, driver_id, status, pickup_lat, pickup_lng").eq("id", tag_id).eq("driver_id", resolved_id).limit(1).execute()
         if not tag_result.data or tag_result.data[0].get("status") not in ("matched", "in_progress"):
             raise HTTPException(status_code=400, detail="Aktif yolculuk bulunamadı")
         row = tag_result.data[0]
@@ -6388,10 +7607,10 @@ async def driver_on_the_way(driver_id: str = None, user_id: str = None, tag_id:
         eta_min = 0
         distance_km_road = None
         try:
-            driver_loc = supabase.table("users").select("latitude, longitude").eq("id", resolved_id).limit(1).execute()
+            driver_loc = await _user_location_rows(resolved_id)
             p_lat, p_lng = row.get("pickup_lat"), row.get("pickup_lng")
-            if driver_loc.data and p_lat is not None and p_lng is not None:
-                d = driver_loc.data[0]
+            if driver_loc and p_lat is not None and p_lng is not None:
+                d = driver_loc[0]
                 dl, dg = d.get("latitude"), d.get("longitude")
                 if dl is not None and dg is not None:
                     route = await get_route_cached(
@@ -6417,12 +7636,12 @@ async def driver_on_the_way(driver_id: str = None, user_id: str = None, tag_id:
         else:
             body = "Sürücünüz size doğru geliyor."
         if passenger_id:
-            asyncio.create_task(send_trip_push_and_log(
+            await send_trip_push_and_log(
                 passenger_id, "driver_on_the_way",
                 title,
                 body,
                 {"type": "driver_on_the_way", "tag_id": tag_id, "eta_min": eta_min}
-            ))
+            )
         return {
             "success": True,
             "message": "Bildirim gönderildi",
@@ -6444,25 +7663,25 @@ async def driver_arrived(driver_id: str = None, user_id: str = None, tag_id: str
         if not did or not tag_id:
             raise HTTPException(status_code=422, detail="user_id ve tag_id gerekli")
         resolved_id = await resolve_user_id(did)
-        tag_result = supabase.table("tags").select("passenger_id, driver_id, status").eq("id", tag_id).eq("driver_id", resolved_id).limit(1).execute()
+        tag_result = await db.table("tags").select("passenger_id, driver_id, status").eq("id", tag_id).eq("driver_id", resolved_id).limit(1).execute()
         if not tag_result.data or tag_result.data[0].get("status") not in ("matched", "in_progress"):
             raise HTTPException(status_code=400, detail="Aktif yolculuk bulunamadı")
         row = tag_result.data[0]
         passenger_id = row.get("passenger_id")
         try:
             if passenger_id:
-                asyncio.create_task(send_trip_push_and_log(
+                await send_trip_push_and_log(
                     passenger_id, "driver_arrived",
                     "Sürücü sizi bekliyor",
                     "Sürücünüz bulunduğunuz konuma ulaştı.",
                     {"type": "driver_arrived", "tag_id": tag_id}
-                ))
-            asyncio.create_task(send_trip_push_and_log(
+                )
+            await send_trip_push_and_log(
                 resolved_id, "driver_arrived",
                 "Yolcuya ulaştınız",
                 "Yolcuyu aldığınızda yolculuğu başlatabilirsiniz.",
                 {"type": "driver_arrived", "tag_id": tag_id}
-            ))
+            )
         except Exception as notif_err:
             logger.warning(f"⚠️ driver_arrived push gönderilemedi: {notif_err}")
         return {"success": True, "message": "Bildirimler gönderildi"}
@@ -6510,7 +7729,7 @@ async def force_end_trip_http(
         else:
             resolved_id = str(resolved_id).strip()
 
-        tag_result = supabase.table("tags").select("*").eq("id", str(tag_id).strip()).limit(1).execute()
+        tag_result = await db.table("tags").select("*").eq("id", str(tag_id).strip()).limit(1).execute()
         if not tag_result.data:
             raise HTTPException(status_code=404, detail="TAG bulunamadı")
         tag = tag_result.data[0]
@@ -6588,7 +7807,7 @@ async def rate_user(rater_id: str, rated_user_id: str, rating: int, tag_id: str
             raise HTTPException(status_code=400, detail="Puan 1-5 arasında olmalı")
         
         # Mevcut rating bilgisi
-        user_result = supabase.table("users").select("rating, total_ratings").eq("id", rated_user_id).execute()
+        user_result = await db.table("users").select("rating, total_ratings").eq("id", rated_user_id).execute()
         if not user_result.data:
             raise HTTPException(status_code=404, detail="Kullanıcı bulunamadı")
         
@@ -6603,7 +7822,7 @@ async def rate_user(rater_id: str, rated_user_id: str, rating: int, tag_id: str
         # Puan sütununu yıldız ortalaması ile hizala (1–5 → 0–100)
         new_points = int(round(max(0, min(100, (new_rating - 1.0) / 4.0 * 100))))
 
-        supabase.table("users").update({
+        await db.table("users").update({
             "rating": new_rating,
             "total_ratings": new_total,
             "points": new_points,
@@ -6695,22 +7914,22 @@ class ExpoPushService:
             logger.info(f"🚀 Sending Expo push to {t}")
 
         try:
-            async with httpx.AsyncClient(http2=False, timeout=30) as client:
-                response = await client.post(
-                    ExpoPushService.EXPO_PUSH_URL,
-                    json=messages,
-                    headers=_expo_push_request_headers(),
-                    timeout=30,
-                )
-                result = response.json()
-                tickets = result.get("data") or []
-                sent = sum(1 for t in tickets if t.get("status") == "ok")
-                for t in tickets:
-                    if t.get("status") != "ok":
-                        logger.warning(
-                            f"Expo push ticket hata: status={t.get('status')} message={t.get('message')} details={t.get('details')}"
-                        )
-                return {"sent": sent, "failed": len(valid_tokens) - sent, "tickets": tickets}
+            client = get_http_client("expo")
+            response = await client.post(
+                ExpoPushService.EXPO_PUSH_URL,
+                json=messages,
+                headers=_expo_push_request_headers(),
+                timeout=30,
+            )
+            result = response.json()
+            tickets = result.get("data") or []
+            sent = sum(1 for t in tickets if t.get("status") == "ok")
+            for t in tickets:
+                if t.get("status") != "ok":
+                    logger.warning(
+                        f"Expo push ticket hata: status={t.get('status')} message={t.get('message')} details={t.get('details')}"
+                    )
+            return {"sent": sent, "failed": len(valid_tokens) - sent, "tickets": tickets}
         except Exception as e:
             logger.error(f"Push error: {e}")
             return {"sent": 0, "failed": len(valid_tokens)}
@@ -6753,16 +7972,16 @@ async def register_push_token_endpoint(
         raw_uid = str(_user_id).strip()
 
         # 1) ID ile doğrudan
-        user_check = supabase.table("users").select("id, name, phone").eq("id", raw_uid).limit(1).execute()
+        user_check = await db.table("users").select("id, name, phone").eq("id", raw_uid).limit(1).execute()
         if not user_check.data and "-" in raw_uid:
-            user_check = supabase.table("users").select("id, name, phone").eq("id", raw_uid.lower()).limit(1).execute()
+            user_check = await db.table("users").select("id, name, phone").eq("id", raw_uid.lower()).limit(1).execute()
 
         # 2) legacy mongo_id -> UUID
         if not user_check.data:
             try:
                 rid = await resolve_user_id(raw_uid)
                 if rid and rid != raw_uid:
-                    user_check = supabase.table("users").select("id, name, phone").eq("id", str(rid).strip().lower()).limit(1).execute()
+                    user_check = await db.table("users").select("id, name, phone").eq("id", str(rid).strip().lower()).limit(1).execute()
             except Exception as rid_err:
                 logger.warning(f"⚠️ Push token resolve_user_id uyarısı: {rid_err}")
 
@@ -6784,7 +8003,7 @@ async def register_push_token_endpoint(
                         if not candidate or candidate in seen:
                             continue
                         seen.add(candidate)
-                        user_check = supabase.table("users").select("id, name, phone").eq("phone", candidate).limit(1).execute()
+                        user_check = await db.table("users").select("id, name, phone").eq("phone", candidate).limit(1).execute()
                         if user_check.data:
                             break
             except Exception as phone_err:
@@ -6801,7 +8020,7 @@ async def register_push_token_endpoint(
         
         # Users tablosuna kaydet (push_token_type kolonu yoksa sadece token kaydet)
         try:
-            supabase.table("users").update({
+            await db.table("users").update({
                 "push_token": _push_token,
                 "push_token_type": "expo",
                 "push_token_updated_at": datetime.utcnow().isoformat()
@@ -6809,11 +8028,12 @@ async def register_push_token_endpoint(
         except Exception as col_err:
             # push_token_type kolonu yoksa sadece token'ı kaydet
             logger.warning(f"⚠️ push_token_type kolonu yok, sadece token kaydediliyor: {col_err}")
-            supabase.table("users").update({
+            await db.table("users").update({
                 "push_token": _push_token,
                 "push_token_updated_at": datetime.utcnow().isoformat()
             }).eq("id", resolved_user_id).execute()
         
+        await invalidate_push_user(resolved_user_id)
         logger.info(f"✅ Push token kaydedildi: {user_name} ({resolved_user_id}) - {_platform} - expo")
         return {
             "success": True,
@@ -6832,10 +8052,11 @@ async def register_push_token_endpoint(
 async def remove_push_token(user_id: str):
     """Push token sil"""
     try:
-        supabase.table("users").update({
+        await db.table("users").update({
             "push_token": None,
             "push_token_updated_at": None
         }).eq("id", user_id).execute()
+        await invalidate_push_user(user_id)
         
         return {"success": True}
     except Exception as e:
@@ -6849,7 +8070,7 @@ async def test_push_notification(user_id: str, title: str = "Test Bildirimi", bo
         logger.info(f"🧪 TEST: Push bildirim testi başlıyor: {user_id}")
         
         # Kullanıcı ve token bilgisi
-        user_result = supabase.table("users").select("id, name, phone, push_token, push_token_updated_at").eq("id", user_id).execute()
+        user_result = await db.table("users").select("id, name, phone, push_token, push_token_updated_at").eq("id", user_id).execute()
         
         if not user_result.data:
             return {"success": False, "error": "Kullanıcı bulunamadı", "user_id": user_id}
@@ -6945,7 +8166,7 @@ async def test_push_notification_by_phone(
         raise HTTPException(status_code=403, detail="Admin yetkisi gerekli")
     clean_phone = phone.replace("+90", "").replace("90", "", 1).replace(" ", "").replace("-", "")
     try:
-        user_result = supabase.table("users").select("id, name, push_token").eq("phone", clean_phone).execute()
+        user_result = await db.table("users").select("id, name, push_token").eq("phone", clean_phone).execute()
         if not user_result.data:
             return {"success": False, "error": "Bu numaraya kayıtlı kullanıcı bulunamadı", "phone": clean_phone}
         user = user_result.data[0]
@@ -6992,7 +8213,7 @@ async def test_push_user_by_phone(phone: str):
         for candidate in candidates:
             if not candidate:
                 continue
-            r = supabase.table("users").select("id, name, phone, push_token").eq("phone", candidate).limit(1).execute()
+            r = await db.table("users").select("id, name, phone, push_token").eq("phone", candidate).limit(1).execute()
             if r.data:
                 row = r.data[0]
                 token = row.get("push_token")
@@ -7008,7 +8229,7 @@ async def test_push_user_by_phone(phone: str):
         # Son deneme: phone içinde bu 10 rakam geçen kullanıcı (boşluk/tire ile kayıtlı olabilir)
         core = ten_digit
         if len(core) >= 10:
-            r = supabase.table("users").select("id, name, phone, push_token").like("phone", f"%{core}%").limit(5).execute()
+            r = await db.table("users").select("id, name, phone, push_token").like("phone", f"%{core}%").limit(5).execute()
             if r.data:
                 for row in r.data:
                     stored = (row.get("phone") or "")
@@ -7108,7 +8329,7 @@ async def admin_send_notification(request: AdminNotificationRequest):
     
     try:
         # Hedef kullanıcıları belirle
-        query = supabase.table("users").select("id, name, push_token")
+        query = db.table("users").select("id, name, push_token")
         
         if request.target == "drivers":
             # Sürücü bilgisi olanlar
@@ -7117,7 +8338,7 @@ async def admin_send_notification(request: AdminNotificationRequest):
             # Sürücü olmayanlar veya hiç sürücü bilgisi girmemişler
             query = query.is_("driver_details", "null")
         
-        result = query.execute()
+        result = await query.execute()
         users = result.data if result.data else []
         
         valid_user_ids = [
@@ -7157,15 +8378,15 @@ async def admin_push_stats(phone: str):
     
     try:
         # Toplam kullanıcı
-        total_result = supabase.table("users").select("id", count="exact").execute()
+        total_result = await db.table("users").select("id", count="exact").execute()
         total_users = total_result.count if total_result.count else 0
         
         # Push token olan kullanıcılar
-        with_token_result = supabase.table("users").select("id", count="exact").not_.is_("push_token", "null").execute()
+        with_token_result = await db.table("users").select("id", count="exact").not_.is_("push_token", "null").execute()
         with_token = with_token_result.count if with_token_result.count else 0
         
         # Sürücüler
-        drivers_result = supabase.table("users").select("id, push_token").not_.is_("driver_details", "null").execute()
+        drivers_result = await db.table("users").select("id, push_token").not_.is_("driver_details", "null").execute()
         drivers = drivers_result.data if drivers_result.data else []
         drivers_with_token = sum(1 for d in drivers if d.get("push_token"))
         
@@ -7181,6 +8402,34 @@ async def admin_push_stats(phone: str):
         return {"success": False, "error": str(e)}
 
 
+@api_router.get("/admin/outbound-stats")
+async def admin_outbound_stats(admin_phone: str):
+    """Dış entegrasyon havuzu doluluğu (httpx) + yol mesafesi cache + Supabase sorgu havuzu sayaçları."""
+    if not _is_admin_phone(admin_phone):
+        raise HTTPException(status_code=403, detail="Admin yetkisi gerekli")
+    return {
+        "success": True,
+        "http_pools": http_pool_stats(),
+        "route_cache": road_route_cache.stats(),
+        "supabase_db": _supabase_core.get_db_stats(),
+        "location_ingest": location_ingestor.stats(),
+        "trip_location_stream": trip_location_stream.stats(),
+        "shared_state": shared_state.stats(),
+        "dispatch_scheduler": dispatch_scheduler.stats(),
+        "presence": presence.stats(),
+        "driver_state_cache": driver_state_cache.stats(),
+        "dispatch_config": dispatch_config.stats(),
+        "offer_fanout": {"concurrency": DISPATCH_FANOUT_CONCURRENCY, **offer_ack_tracker.stats()},
+        "waiting_tag_index": waiting_tag_index.stats(),
+        "push_dispatcher": push_dispatcher.stats(),
+        "push_outbox": push_outbox.stats(),
+        "push_token_cache": push_token_cache.stats(),
+        "tag_expiry": tag_expiry_sweeper.stats(),
+        "block_cache": block_cache.stats(),
+        "heatmap_tiles": heatmap_tiles.stats(),
+    }
+
+
 @api_router.get("/admin/push-debug")
 async def admin_push_debug(admin_phone: str, limit: int = 50, phone: str = None):
     """
@@ -7209,7 +8458,7 @@ async def admin_push_debug(admin_phone: str, limit: int = 50, phone: str = None)
             ]
             cand = list({c for c in candidates if c})
             result = (
-                supabase.table("users")
+                await db.table("users")
                 .select("id, phone, name, push_token, push_token_updated_at")
                 .in_("phone", cand)
                 .limit(limit)
@@ -7218,7 +8467,7 @@ async def admin_push_debug(admin_phone: str, limit: int = 50, phone: str = None)
             users = result.data or []
             if not users and len(ten_digit) >= 10:
                 like_r = (
-                    supabase.table("users")
+                    await db.table("users")
                     .select("id, phone, name, push_token, push_token_updated_at")
                     .like("phone", f"%{ten_digit}%")
                     .limit(20)
@@ -7230,7 +8479,7 @@ async def admin_push_debug(admin_phone: str, limit: int = 50, phone: str = None)
                 filter_note = f"phone eşleşmesi: {cand}"
         else:
             result = (
-                supabase.table("users")
+                await db.table("users")
                 .select("id, phone, name, push_token, push_token_updated_at")
                 .not_.is_("push_token", "null")
                 .limit(limit)
@@ -7275,7 +8524,7 @@ async def admin_push_test(admin_phone: str):
         raise HTTPException(status_code=403, detail="Admin yetkisi gerekli")
     try:
         # İlk push_token'ı dolu kullanıcıyı al (created_at sırasına göre)
-        result = supabase.table("users").select("id, phone, name, push_token").not_.is_("push_token", "null").order("created_at", desc=True).limit(1).execute()
+        result = await db.table("users").select("id, phone, name, push_token").not_.is_("push_token", "null").order("created_at", desc=True).limit(1).execute()
         users = result.data or []
         if not users:
             logger.warning("push_test: Veritabanında push_token dolu hiç kullanıcı yok. Kullanıcılar giriş yapıp bildirim izni vermeli.")
@@ -7319,12 +8568,12 @@ async def admin_push_test(admin_phone: str):
         }
         headers = _expo_push_request_headers()
         logger.info(f"push_test: Expo'ya gönderiliyor – user_id={user.get('id')}, token={token[:30]}...")
-        async with httpx.AsyncClient(http2=False, timeout=30) as client:
-            response = await client.post(
-                "https://exp.host/--/api/v2/push/send",
-                json=[message],
-                headers=headers,
-            )
+        client = get_http_client("expo")
+        response = await client.post(
+            "https://exp.host/--/api/v2/push/send",
+            json=[message],
+            headers=headers,
+        )
         response_body = response.json() if response.headers.get("content-type", "").startswith("application/json") else {"raw_text": response.text[:1000]}
         logger.info(f"push_test: Expo yanıtı status={response.status_code}, body={response_body}")
         ticket0 = (response_body.get("data") or [{}])[0]
@@ -7393,7 +8642,7 @@ async def admin_push_test_by_phone(admin_phone: str, phone: str):
             )
 
         user_result = (
-            supabase.table("users")
+            await db.table("users")
             .select(
                 "id, name, phone, push_token, push_token_updated_at, driver_online, driver_active_until, latitude, longitude, driver_details"
             )
@@ -7405,7 +8654,7 @@ async def admin_push_test_by_phone(admin_phone: str, phone: str):
         ten_core = "".join(c for c in clean if c.isdigit())[-10:] if len(clean) >= 10 else clean
         if not rows and len(ten_core) >= 10:
             like_r = (
-                supabase.table("users")
+                await db.table("users")
                 .select(
                     "id, name, phone, push_token, push_token_updated_at, driver_online, driver_active_until, latitude, longitude, driver_details"
                 )
@@ -7478,7 +8727,7 @@ async def admin_push_test_by_phone(admin_phone: str, phone: str):
         test_body = "Yakınınızda yeni bir yolculuk isteği var."
         test_data = {"type": "new_offer", "tag_id": "test", "test": "true"}
         try:
-            supabase.table("notifications_log").insert({
+            await db.table("notifications_log").insert({
                 "type": "new_ride_request",
                 "user_id": user_id,
                 "title": test_title,
@@ -7522,7 +8771,7 @@ async def admin_driver_status(admin_phone: str, phone: str):
         if not clean.isdigit():
             return {"success": False, "error": "Geçersiz telefon numarası"}
         for candidate in [clean, "0" + clean if not clean.startswith("0") else clean]:
-            user_result = supabase.table("users").select(
+            user_result = await db.table("users").select(
                 "id, name, phone, driver_online, driver_active_until, latitude, longitude, driver_details"
             ).eq("phone", candidate).limit(1).execute()
             if user_result.data:
@@ -7584,7 +8833,7 @@ async def admin_driver_set_online(admin_phone: str, phone: str, hours: int = 24)
         if not clean.isdigit():
             return {"success": False, "error": "Geçersiz telefon numarası"}
         for candidate in [clean, "0" + clean if not clean.startswith("0") else clean]:
-            user_result = supabase.table("users").select("id, name, phone, driver_details").eq("phone", candidate).limit(1).execute()
+            user_result = await db.table("users").select("id, name, phone, driver_details").eq("phone", candidate).limit(1).execute()
             if user_result.data:
                 break
         else:
@@ -7593,11 +8842,13 @@ async def admin_driver_set_online(admin_phone: str, phone: str, hours: int = 24)
         user_id = user.get("id")
         now = datetime.utcnow()
         active_until = (now + timedelta(hours=max(1, min(hours, 720)))).isoformat()
-        supabase.table("users").update({
+        await db.table("users").update({
             "driver_online": True,
             "driver_active_until": active_until,
             "updated_at": now.isoformat(),
         }).eq("id", user_id).execute()
+        await invalidate_driver_state(user_id)
+        await driver_geo_index_refresh_driver(user_id)
         logger.info(f"✅ Admin: Sürücü online yapıldı: {user.get('name')} ({phone}) -> {hours}h paket")
         return {
             "success": True,
@@ -7621,7 +8872,7 @@ async def cleanup_invalid_tokens(admin_phone: str):
     
     try:
         # Token'ı olan tüm kullanıcıları al
-        result = supabase.table("users").select("id, name, push_token").not_.is_("push_token", "null").execute()
+        result = await db.table("users").select("id, name, push_token").not_.is_("push_token", "null").execute()
         
         cleaned = 0
         for user in result.data or []:
@@ -7629,7 +8880,8 @@ async def cleanup_invalid_tokens(admin_phone: str):
             # Test token'ları veya geçersiz formatları temizle
             # Not: Expo iki format üretebilir: ExponentPushToken[...] ve ExpoPushToken[...]
             if "TEST" in token or "test" in token or not ExpoPushService.is_valid_token(token):
-                supabase.table("users").update({"push_token": None}).eq("id", user["id"]).execute()
+                await db.table("users").update({"push_token": None}).eq("id", user["id"]).execute()
+                await invalidate_push_user(user["id"])
                 cleaned += 1
                 logger.info(f"🧹 Geçersiz token temizlendi: {user['name']} - {token[:30]}...")
         
@@ -7653,15 +8905,15 @@ async def admin_dashboard(admin_phone: str):
             raise HTTPException(status_code=403, detail="Admin yetkisi gerekli")
         
         # Kullanıcı sayıları
-        users_result = supabase.table("users").select("id, driver_details", count="exact").execute()
+        users_result = await db.table("users").select("id, driver_details", count="exact").execute()
         total_users = users_result.count or 0
         
         drivers = sum(1 for u in users_result.data if u.get("driver_details"))
         passengers = total_users - drivers
         
         # TAG istatistikleri
-        completed_result = supabase.table("tags").select("id", count="exact").eq("status", "completed").execute()
-        active_result = supabase.table("tags").select("id", count="exact").in_("status", ["pending", "offers_received", "matched", "in_progress"]).execute()
+        completed_result = await db.table("tags").select("id", count="exact").eq("status", "completed").execute()
+        active_result = await db.table("tags").select("id", count="exact").in_("status", ["pending", "offers_received", "matched", "in_progress"]).execute()
         
         return {
             "success": True,
@@ -7688,12 +8940,12 @@ async def admin_get_users(admin_phone: str, page: int = 1, limit: int = 20, sear
         
         offset = (page - 1) * limit
         
-        query = supabase.table("users").select("*", count="exact")
+        query = db.table("users").select("*", count="exact")
         
         if search:
             query = query.or_(f"phone.ilike.%{search}%,name.ilike.%{search}%")
         
-        result = query.order("created_at", desc=True).range(offset, offset + limit - 1).execute()
+        result = await query.order("created_at", desc=True).range(offset, offset + limit - 1).execute()
         
         users = []
         for u in result.data:
@@ -7729,7 +8981,7 @@ async def admin_get_settings(admin_phone: str):
         if admin_phone not in ADMIN_PHONE_NUMBERS:
             raise HTTPException(status_code=403, detail="Admin yetkisi gerekli")
         
-        result = supabase.table("app_settings").select("*").eq("type", "global").execute()
+        result = await db.table("app_settings").select("*").eq("type", "global").execute()
         
         if result.data:
             settings = result.data[0]
@@ -7759,7 +9011,7 @@ async def admin_update_settings(admin_phone: str, driver_radius_km: int = None,
         if max_call_duration_minutes is not None:
             updates["max_call_duration_minutes"] = max_call_duration_minutes
         
-        supabase.table("app_settings").update(updates).eq("type", "global").execute()
+        await db.table("app_settings").update(updates).eq("type", "global").execute()
         
         return {"success": True, "message": "Ayarlar güncellendi"}
     except Exception as e:
@@ -7778,24 +9030,24 @@ async def admin_send_notification(admin_phone: str, title: str, message: str, ta
         target_count = 0
         
         if target == "all":
-            result = supabase.table("users").select("id, push_token").execute()
+            result = await db.table("users").select("id, push_token").execute()
             target_count = len(result.data)
             target_user_ids = [r["id"] for r in result.data if r.get("id")]
             token_user_ids = [r["id"] for r in result.data if r.get("id") and ExpoPushService.is_valid_token(r.get("push_token"))]
         elif target == "drivers":
-            result = supabase.table("users").select("id, push_token, driver_details").execute()
+            result = await db.table("users").select("id, push_token, driver_details").execute()
             drivers = [r for r in result.data if r.get("driver_details")]
             target_count = len(drivers)
             target_user_ids = [r["id"] for r in drivers if r.get("id")]
             token_user_ids = [r["id"] for r in drivers if r.get("id") and ExpoPushService.is_valid_token(r.get("push_token"))]
         elif target == "passengers":
-            result = supabase.table("users").select("id, push_token, driver_details").execute()
+            result = await db.table("users").select("id, push_token, driver_details").execute()
             passengers = [r for r in result.data if not r.get("driver_details")]
             target_count = len(passengers)
             target_user_ids = [r["id"] for r in passengers if r.get("id")]
             token_user_ids = [r["id"] for r in passengers if r.get("id") and ExpoPushService.is_valid_token(r.get("push_token"))]
         elif target == "user" and user_id:
-            result = supabase.table("users").select("id, push_token").eq("id", user_id).execute()
+            result = await db.table("users").select("id, push_token").eq("id", user_id).execute()
             target_count = 1
             if result.data and result.data[0].get("id"):
                 target_user_ids = [result.data[0]["id"]]
@@ -7821,12 +9073,12 @@ async def admin_send_notification(admin_phone: str, title: str, message: str, ta
                 failed_count = len(token_user_ids)
         
         # Admin bilgisini al
-        admin_result = supabase.table("users").select("id").eq("phone", admin_phone).execute()
+        admin_result = await db.table("users").select("id").eq("phone", admin_phone).execute()
         admin_id = admin_result.data[0]["id"] if admin_result.data else None
         
         # Bildirimi veritabanına kaydet
         try:
-            supabase.table("notifications").insert({
+            await db.table("notifications").insert({
                 "title": title,
                 "message": message,
                 "target_type": target,
@@ -7867,7 +9119,7 @@ async def admin_get_notifications(admin_phone: str, limit: int = 50):
         if admin_phone not in ADMIN_PHONE_NUMBERS:
             raise HTTPException(status_code=403, detail="Admin yetkisi gerekli")
         
-        result = supabase.table("notifications").select("*").order("created_at", desc=True).limit(limit).execute()
+        result = await db.table("notifications").select("*").order("created_at", desc=True).limit(limit).execute()
         
         return {"success": True, "notifications": result.data, "total": len(result.data)}
     except Exception as e:
@@ -7885,7 +9137,7 @@ async def admin_cleanup_inactive_tags(admin_phone: str = None, max_inactive_minu
         cutoff_time = (datetime.utcnow() - timedelta(minutes=max_inactive_minutes)).isoformat()
         
         # Aktif TAG'leri bul (matched veya in_progress)
-        result = supabase.table("tags").select("id, passenger_id, driver_id, status, last_activity").in_("status", ["matched", "in_progress"]).execute()
+        result = await db.table("tags").select("id, passenger_id, driver_id, status, last_activity").in_("status", ["matched", "in_progress"]).execute()
         
         cleaned_count = 0
         for tag in result.data:
@@ -7898,7 +9150,7 @@ async def admin_cleanup_inactive_tags(admin_phone: str = None, max_inactive_minu
                     
                     if (now - activity_time).total_seconds() > max_inactive_minutes * 60:
                         # TAG'i iptal et
-                        supabase.table("tags").update({
+                        await db.table("tags").update({
                             "status": "cancelled",
                             "cancelled_at": datetime.utcnow().isoformat()
                         }).eq("id", tag["id"]).execute()
@@ -7926,7 +9178,7 @@ async def admin_toggle_user(admin_phone: str, user_id: str, is_active: bool):
         if admin_phone not in ADMIN_PHONE_NUMBERS:
             raise HTTPException(status_code=403, detail="Admin yetkisi gerekli")
         
-        supabase.table("users").update({"is_active": is_active}).eq("id", user_id).execute()
+        await db.table("users").update({"is_active": is_active}).eq("id", user_id).execute()
         
         return {"success": True, "message": f"Kullanıcı {'aktif' if is_active else 'pasif'} yapıldı"}
     except Exception as e:
@@ -7939,7 +9191,7 @@ async def admin_delete_user(admin_phone: str, user_id: str):
         if admin_phone not in ADMIN_PHONE_NUMBERS:
             raise HTTPException(status_code=403, detail="Admin yetkisi gerekli")
         
-        supabase.table("users").delete().eq("id", user_id).execute()
+        await db.table("users").delete().eq("id", user_id).execute()
         
         return {"success": True, "message": "Kullanıcı silindi"}
     except Exception as e:
@@ -7954,7 +9206,7 @@ async def admin_get_calls(admin_phone: str, limit: int = 100):
         if admin_phone not in ADMIN_PHONE_NUMBERS:
             raise HTTPException(status_code=403, detail="Admin yetkisi gerekli")
         
-        result = supabase.table("calls").select("*").order("created_at", desc=True).limit(limit).execute()
+        result = await db.table("calls").select("*").order("created_at", desc=True).limit(limit).execute()
         
         calls = []
         for call in result.data:
@@ -7964,12 +9216,12 @@ async def admin_get_calls(admin_phone: str, limit: int = 100):
             
             try:
                 if call.get("caller_id"):
-                    caller_result = supabase.table("users").select("name, phone").eq("id", call["caller_id"]).execute()
+                    caller_result = await db.table("users").select("name, phone").eq("id", call["caller_id"]).execute()
                     if caller_result.data:
                         caller_name = f"{caller_result.data[0].get('name', 'Bilinmiyor')} ({caller_result.data[0].get('phone', '')})"
                 
                 if call.get("receiver_id"):
-                    receiver_result = supabase.table("users").select("name, phone").eq("id", call["receiver_id"]).execute()
+                    receiver_result = await db.table("users").select("name, phone").eq("id", call["receiver_id"]).execute()
                     if receiver_result.data:
                         receiver_name = f"{receiver_result.data[0].get('name', 'Bilinmiyor')} ({receiver_result.data[0].get('phone', '')})"
             except:
@@ -8013,12 +9265,12 @@ async def admin_get_tags(admin_phone: str, limit: int = 100, status: str = None)
         if admin_phone not in ADMIN_PHONE_NUMBERS:
             raise HTTPException(status_code=403, detail="Admin yetkisi gerekli")
         
-        query = supabase.table("tags").select("*")
+        query = db.table("tags").select("*")
         
         if status:
             query = query.eq("status", status)
         
-        result = query.order("created_at", desc=True).limit(limit).execute()
+        result = await query.order("created_at", desc=True).limit(limit).execute()
         
         tags = []
         for tag in result.data:
@@ -8030,13 +9282,13 @@ async def admin_get_tags(admin_phone: str, limit: int = 100, status: str = None)
             
             try:
                 if tag.get("passenger_id"):
-                    p_result = supabase.table("users").select("name, phone").eq("id", tag["passenger_id"]).execute()
+                    p_result = await db.table("users").select("name, phone").eq("id", tag["passenger_id"]).execute()
                     if p_result.data:
                         passenger_name = p_result.data[0].get("name", "Bilinmiyor")
                         passenger_phone = p_result.data[0].get("phone", "")
                 
                 if tag.get("driver_id"):
-                    d_result = supabase.table("users").select("name, phone").eq("id", tag["driver_id"]).execute()
+                    d_result = await db.table("users").select("name, phone").eq("id", tag["driver_id"]).execute()
                     if d_result.data:
                         driver_name = d_result.data[0].get("name", "Bilinmiyor")
                         driver_phone = d_result.data[0].get("phone", "")
@@ -8076,25 +9328,25 @@ async def admin_get_user_detail(admin_phone: str, user_id: str):
             raise HTTPException(status_code=403, detail="Admin yetkisi gerekli")
         
         # Kullanıcı bilgisi
-        user_result = supabase.table("users").select("*").eq("id", user_id).execute()
+        user_result = await db.table("users").select("*").eq("id", user_id).execute()
         if not user_result.data:
             raise HTTPException(status_code=404, detail="Kullanıcı bulunamadı")
         
         user = user_result.data[0]
         
         # Kullanıcının TAG'leri (yolcu veya şoför olarak)
-        tags_result = supabase.table("tags").select("*").or_(f"passenger_id.eq.{user_id},driver_id.eq.{user_id}").order("created_at", desc=True).limit(50).execute()
+        tags_result = await db.table("tags").select("*").or_(f"passenger_id.eq.{user_id},driver_id.eq.{user_id}").order("created_at", desc=True).limit(50).execute()
         
         # Kullanıcının aramaları
-        calls_result = supabase.table("calls").select("*").or_(f"caller_id.eq.{user_id},receiver_id.eq.{user_id}").order("created_at", desc=True).limit(50).execute()
+        calls_result = await db.table("calls").select("*").or_(f"caller_id.eq.{user_id},receiver_id.eq.{user_id}").order("created_at", desc=True).limit(50).execute()
         
         # Kullanıcının şikayetleri (yapılan ve alınan)
-        reports_made = supabase.table("reports").select("*").eq("reporter_id", user_id).execute()
-        reports_received = supabase.table("reports").select("*").eq("reported_id", user_id).execute()
+        reports_made = await db.table("reports").select("*").eq("reporter_id", user_id).execute()
+        reports_received = await db.table("reports").select("*").eq("reported_id", user_id).execute()
         
         # Engelleme bilgisi
-        blocked_by_user = supabase.table("blocked_users").select("blocked_user_id").eq("user_id", user_id).execute()
-        blocked_user = supabase.table("blocked_users").select("user_id").eq("blocked_user_id", user_id).execute()
+        blocked_by_user = await db.table("blocked_users").select("blocked_user_id").eq("user_id", user_id).execute()
+        blocked_user = await db.table("blocked_users").select("user_id").eq("blocked_user_id", user_id).execute()
         
         return {
             "success": True,
@@ -8153,7 +9405,7 @@ async def upload_profile_photo(user_id: str, file: UploadFile = File(...)):
         public_url = supabase.storage.from_("profile-photos").get_public_url(file_path)
         
         # MongoDB'de güncelle
-        supabase.table("users").update({"profile_photo": public_url}).eq("id", user_id).execute()
+        await db.table("users").update({"profile_photo": public_url}).eq("id", user_id).execute()
         
         return {"success": True, "url": public_url}
     except Exception as e:
@@ -8179,11 +9431,11 @@ async def upload_vehicle_photo(user_id: str, file: UploadFile = File(...)):
         public_url = supabase.storage.from_("vehicle-photos").get_public_url(file_path)
         
         # Driver details güncelle
-        user_result = supabase.table("users").select("driver_details").eq("id", user_id).execute()
+        user_result = await db.table("users").select("driver_details").eq("id", user_id).execute()
         if user_result.data:
             driver_details = user_result.data[0].get("driver_details") or {}
             driver_details["vehicle_photo"] = public_url
-            supabase.table("users").update({"driver_details": driver_details}).eq("id", user_id).execute()
+            await db.table("users").update({"driver_details": driver_details}).eq("id", user_id).execute()
         
         return {"success": True, "url": public_url}
     except Exception as e:
@@ -8316,7 +9568,7 @@ async def start_call(request: StartCallRequest):
         # Son 5 saniyede arama yapılmış mı kontrol et (cooldown)
         five_seconds_ago = (datetime.utcnow() - timedelta(seconds=5)).isoformat()
         try:
-            recent_call = supabase.table("calls").select("id").eq("caller_id", request.caller_id).gte("created_at", five_seconds_ago).execute()
+            recent_call = await db.table("calls").select("id").eq("caller_id", request.caller_id).gte("created_at", five_seconds_ago).execute()
             if recent_call.data:
                 return {"success": False, "detail": "Lütfen 5 saniye bekleyin"}
         except:
@@ -8325,7 +9577,7 @@ async def start_call(request: StartCallRequest):
         # receiver_id yoksa tag_id'den bul
         receiver_id = request.receiver_id
         if not receiver_id and request.tag_id:
-            tag_result = supabase.table("tags").select("passenger_id, driver_id").eq("id", request.tag_id).execute()
+            tag_result = await db.table("tags").select("passenger_id, driver_id").eq("id", request.tag_id).execute()
             if tag_result.data:
                 tag = tag_result.data[0]
                 if tag.get("passenger_id") == request.caller_id:
@@ -8362,7 +9614,9 @@ async def start_call(request: StartCallRequest):
                 )
                 return bool(q2.data)
 
-            if _in_accepted_trust(_ca) or _in_accepted_trust(_re):
+            if await _supabase_core.run_db(_in_accepted_trust, _ca) or await _supabase_core.run_db(
+                _in_accepted_trust, _re
+            ):
                 return {
                     "success": False,
                     "detail": "busy",
@@ -8373,7 +9627,7 @@ async def start_call(request: StartCallRequest):
         
         # Önceki aktif aramaları iptal et (aynı kullanıcının tekrar araması için önce eski ringing kapanmalı)
         try:
-            supabase.table("calls").update({
+            await db.table("calls").update({
                 "status": "cancelled",
                 "ended_at": datetime.utcnow().isoformat()
             }).eq("status", "ringing").or_(f"caller_id.eq.{request.caller_id},receiver_id.eq.{request.caller_id}").execute()
@@ -8383,7 +9637,7 @@ async def start_call(request: StartCallRequest):
         # Karşı taraf başka bir görüşmede veya çalıyor mu (meşgul) — iptal sonrası kontrol
         try:
             busy = (
-                supabase.table("calls")
+                await db.table("calls")
                 .select("call_id")
                 .or_(f"caller_id.eq.{receiver_id},receiver_id.eq.{receiver_id}")
                 .in_("status", ["ringing", "connected"])
@@ -8409,7 +9663,7 @@ async def start_call(request: StartCallRequest):
         caller_name = request.caller_name
         if not caller_name:
             try:
-                caller_result = supabase.table("users").select("name").eq("id", request.caller_id).execute()
+                caller_result = await db.table("users").select("name").eq("id", request.caller_id).execute()
                 caller_name = caller_result.data[0]["name"] if caller_result.data else "Kullanıcı"
             except:
                 caller_name = "Kullanıcı"
@@ -8426,7 +9680,7 @@ async def start_call(request: StartCallRequest):
             "agora_token": receiver_token
         }
         
-        result = supabase.table("calls").insert(call_data).execute()
+        result = await db.table("calls").insert(call_data).execute()
         
         if not result.data:
             return {"success": False, "detail": "Arama kaydedilemedi"}
@@ -8463,7 +9717,7 @@ async def start_call(request: StartCallRequest):
             }
             if request.tag_id:
                 incoming_payload["tag_id"] = request.tag_id
-            receiver_sid = connected_users.get(receiver_id)
+            receiver_sid = await get_user_sid(receiver_id)
             if receiver_sid:
                 await sio.emit("incoming_call", incoming_payload, room=receiver_sid)
                 logger.info(f"📲 incoming_call socket: {receiver_id} sid={receiver_sid}")
@@ -8488,7 +9742,7 @@ async def check_incoming_call(user_id: str):
     """Gelen arama var mı kontrol et - Supabase'den oku"""
     try:
         # Bu kullanıcıya gelen aktif (ringing) arama var mı?
-        result = supabase.table("calls").select("*").eq("receiver_id", user_id).eq("status", "ringing").order("created_at", desc=True).limit(1).execute()
+        result = await db.table("calls").select("*").eq("receiver_id", user_id).eq("status", "ringing").order("created_at", desc=True).limit(1).execute()
         
         if result.data:
             call = result.data[0]
@@ -8496,7 +9750,7 @@ async def check_incoming_call(user_id: str):
             # 90 saniyeden eski aramayı otomatik "missed" yap
             created_at = datetime.fromisoformat(call["created_at"].replace("Z", "+00:00"))
             if datetime.now(created_at.tzinfo) - created_at > timedelta(seconds=90):
-                supabase.table("calls").update({
+                await db.table("calls").update({
                     "status": "missed",
                     "ended_at": datetime.utcnow().isoformat()
                 }).eq("call_id", call["call_id"]).execute()
@@ -8506,7 +9760,7 @@ async def check_incoming_call(user_id: str):
             caller_name = "Kullanıcı"
             caller_photo = None
             try:
-                caller_result = supabase.table("users").select("name, profile_photo").eq("id", call["caller_id"]).execute()
+                caller_result = await db.table("users").select("name, profile_photo").eq("id", call["caller_id"]).execute()
                 if caller_result.data:
                     caller_name = caller_result.data[0].get("name", "Kullanıcı")
                     caller_photo = caller_result.data[0].get("profile_photo")
@@ -8529,7 +9783,7 @@ async def check_incoming_call(user_id: str):
             }
         
         # Son iptal edilen aramayı kontrol et - ARAYAN İPTAL ETTİ Mİ?
-        cancelled_result = supabase.table("calls").select("*").eq("receiver_id", user_id).in_("status", ["cancelled", "ended", "rejected"]).order("ended_at", desc=True).limit(1).execute()
+        cancelled_result = await db.table("calls").select("*").eq("receiver_id", user_id).in_("status", ["cancelled", "ended", "rejected"]).order("ended_at", desc=True).limit(1).execute()
         
         if cancelled_result.data:
             cancelled_call = cancelled_result.data[0]
@@ -8559,7 +9813,7 @@ async def accept_call(user_id: str, call_id: str):
     """Aramayı kabul et - Supabase'de güncelle"""
     try:
         # Aramayı bul ve güncelle
-        result = supabase.table("calls").update({
+        result = await db.table("calls").update({
             "status": "connected",
             "answered_at": datetime.utcnow().isoformat()
         }).eq("call_id", call_id).eq("receiver_id", user_id).eq("status", "ringing").execute()
@@ -8587,20 +9841,20 @@ async def reject_call(user_id: str, call_id: str = None, tag_id: str = None):
     try:
         # call_id yoksa tag_id'den en son ringing aramayı bul
         if not call_id and tag_id:
-            call_result = supabase.table("calls").select("call_id").eq("tag_id", tag_id).eq("status", "ringing").order("created_at", desc=True).limit(1).execute()
+            call_result = await db.table("calls").select("call_id").eq("tag_id", tag_id).eq("status", "ringing").order("created_at", desc=True).limit(1).execute()
             if call_result.data:
                 call_id = call_result.data[0]["call_id"]
         
         # call_id yoksa kullanıcının en son ringing aramasını bul
         if not call_id:
-            call_result = supabase.table("calls").select("call_id").eq("receiver_id", user_id).eq("status", "ringing").order("created_at", desc=True).limit(1).execute()
+            call_result = await db.table("calls").select("call_id").eq("receiver_id", user_id).eq("status", "ringing").order("created_at", desc=True).limit(1).execute()
             if call_result.data:
                 call_id = call_result.data[0]["call_id"]
         
         if not call_id:
             return {"success": False, "detail": "Aktif arama bulunamadı"}
         
-        result = supabase.table("calls").update({
+        result = await db.table("calls").update({
             "status": "rejected",
             "ended_at": datetime.utcnow().isoformat(),
             "ended_by": user_id
@@ -8618,7 +9872,7 @@ async def reject_call(user_id: str, call_id: str = None, tag_id: str = None):
 async def check_call_status(user_id: str, call_id: str):
     """Arayan için arama durumunu kontrol et - Supabase'den oku"""
     try:
-        result = supabase.table("calls").select("*").eq("call_id", call_id).execute()
+        result = await db.table("calls").select("*").eq("call_id", call_id).execute()
         
         if not result.data:
             return {"success": True, "status": "ended", "should_close": True}
@@ -8650,7 +9904,7 @@ async def check_call_status(user_id: str, call_id: str):
             created_at = datetime.fromisoformat(call["created_at"].replace("Z", "+00:00"))
             if datetime.now(created_at.tzinfo) - created_at > timedelta(seconds=90):
                 # Timeout - missed olarak işaretle
-                supabase.table("calls").update({
+                await db.table("calls").update({
                     "status": "missed",
                     "ended_at": datetime.utcnow().isoformat()
                 }).eq("call_id", call_id).execute()
@@ -8673,7 +9927,7 @@ async def end_call(user_id: str, call_id: str = None):
     try:
         if call_id:
             # Belirli aramayı sonlandır
-            result = supabase.table("calls").update({
+            result = await db.table("calls").update({
                 "status": "ended",
                 "ended_at": datetime.utcnow().isoformat(),
                 "ended_by": user_id
@@ -8683,7 +9937,7 @@ async def end_call(user_id: str, call_id: str = None):
                 logger.info(f"📴 SUPABASE: Arama sonlandırıldı: {call_id} by {user_id}")
         else:
             # Bu kullanıcının tüm aktif aramalarını sonlandır
-            supabase.table("calls").update({
+            await db.table("calls").update({
                 "status": "ended",
                 "ended_at": datetime.utcnow().isoformat(),
                 "ended_by": user_id
@@ -8705,7 +9959,7 @@ async def cancel_call(user_id: str, call_id: str = None):
             if not call_id.startswith("call_"):
                 call_id = f"call_{call_id}"
             
-            result = supabase.table("calls").update({
+            result = await db.table("calls").update({
                 "status": "cancelled",
                 "ended_at": datetime.utcnow().isoformat(),
                 "ended_by": user_id
@@ -8715,7 +9969,7 @@ async def cancel_call(user_id: str, call_id: str = None):
                 logger.info(f"📵 SUPABASE: Arama iptal edildi: {call_id}")
         else:
             # Kullanıcının aktif ringing aramalarını iptal et
-            supabase.table("calls").update({
+            await db.table("calls").update({
                 "status": "cancelled",
                 "ended_at": datetime.utcnow().isoformat(),
                 "ended_by": user_id
@@ -8731,7 +9985,7 @@ async def cancel_call(user_id: str, call_id: str = None):
 async def get_call_history(user_id: str, limit: int = 20):
     """Kullanıcının arama geçmişini getir"""
     try:
-        result = supabase.table("calls").select("*").or_(f"caller_id.eq.{user_id},receiver_id.eq.{user_id}").order("created_at", desc=True).limit(limit).execute()
+        result = await db.table("calls").select("*").or_(f"caller_id.eq.{user_id},receiver_id.eq.{user_id}").order("created_at", desc=True).limit(limit).execute()
         
         calls = []
         for call in result.data:
@@ -8739,7 +9993,7 @@ async def get_call_history(user_id: str, limit: int = 20):
             other_id = call["receiver_id"] if call["caller_id"] == user_id else call["caller_id"]
             other_name = "Kullanıcı"
             try:
-                other_result = supabase.table("users").select("name").eq("id", other_id).execute()
+                other_result = await db.table("users").select("name").eq("id", other_id).execute()
                 if other_result.data:
                     other_name = other_result.data[0].get("name", "Kullanıcı")
             except:
@@ -8941,14 +10195,38 @@ async def api_trust_active(
 
 # ==================== DRIVER LOCATION TRACKING ====================
 
+# Takip yanıtlarındaki isim: canlı konum bellekten okunurken users SELECT'ini tekrarlamamak için
+_tracking_name_cache: Dict[str, Tuple[float, Optional[str]]] = {}
+_TRACKING_NAME_TTL_SEC = 600.0
+
+
+async def _tracked_user_location(user_id: str) -> Optional[dict]:
+    """
+    Takip ekranı konumu: bellekteki son ping (location_ingestor) + isim cache'i; yoksa tek users SELECT.
+    Dönüş: {latitude, longitude, last_location_update, name} veya None.
+    """
+    uid = str(user_id or "").strip().lower()
+    live = location_ingestor.get(uid)
+    cached = _tracking_name_cache.get(uid)
+    if live is not None and cached is not None and time.monotonic() - cached[0] < _TRACKING_NAME_TTL_SEC:
+        return {**live, "name": cached[1]}
+    result = await db.table("users").select("latitude, longitude, last_location_update, name").eq("id", user_id).execute()
+    if not result.data:
+        return None
+    user = location_ingestor.overlay(uid, result.data[0])
+    _tracking_name_cache[uid] = (time.monotonic(), user.get("name"))
+    if len(_tracking_name_cache) > 20000:
+        _tracking_name_cache.clear()
+    return user
+
+
 @api_router.get("/passenger/driver-location/{driver_id}")
 async def get_driver_location(driver_id: str):
-    """Şoför konumunu getir"""
+    """Şoför konumunu getir (canlı takip için socket join_trip / trip_location tercih edilir)"""
     try:
-        result = supabase.table("users").select("latitude, longitude, last_location_update, name").eq("id", driver_id).execute()
+        user = await _tracked_user_location(driver_id)
         
-        if result.data:
-            user = result.data[0]
+        if user:
             return {
                 "success": True,
                 "location": {
@@ -8968,10 +10246,9 @@ async def get_driver_location(driver_id: str):
 async def get_passenger_location(passenger_id: str):
     """Yolcu konumunu getir (şoför için)"""
     try:
-        result = supabase.table("users").select("latitude, longitude, last_location_update, name").eq("id", passenger_id).execute()
+        user = await _tracked_user_location(passenger_id)
         
-        if result.data:
-            user = result.data[0]
+        if user:
             return {
                 "success": True,
                 "location": {
@@ -8990,7 +10267,7 @@ async def get_passenger_location(passenger_id: str):
 # ==================== TRIP END REQUEST ====================
 
 # Aktif trip sonlandırma istekleri
-trip_end_requests = {}
+trip_end_requests = shared_state.map("trip_end_requests")
 
 @api_router.post("/trip/request-end")
 async def request_trip_end(tag_id: str, user_id: str = None, requester_id: str = None, user_type: str = None):
@@ -9010,7 +10287,7 @@ async def request_trip_end(tag_id: str, user_id: str = None, requester_id: str =
             }
         }
         
-        result = supabase.table("tags").update(update_data).eq("id", tag_id).execute()
+        result = await db.table("tags").update(update_data).eq("id", tag_id).execute()
         
         logger.info(f"🔚 Sonlandırma isteği: {tag_id} by {rid} ({user_type})")
         return {"success": True, "message": "Sonlandırma isteği gönderildi"}
@@ -9024,7 +10301,7 @@ async def request_trip_end(tag_id: str, user_id: str = None, requester_id: str =
 async def check_end_request(tag_id: str, user_id: str):
     """Sonlandırma isteği var mı kontrol et - Supabase'den oku"""
     try:
-        result = supabase.table("tags").select("end_request").eq("id", tag_id).execute()
+        result = await db.table("tags").select("end_request").eq("id", tag_id).execute()
         
         if result.data and len(result.data) > 0:
             request = result.data[0].get("end_request")
@@ -9048,7 +10325,7 @@ async def respond_end_request(tag_id: str, user_id: str, approved: bool = True):
     try:
         if approved:
             # Trip'i tamamla ve end_request'i temizle
-            supabase.table("tags").update({
+            await db.table("tags").update({
                 "status": "completed",
                 "completed_at": datetime.utcnow().isoformat(),
                 "end_request": None
@@ -9058,11 +10335,11 @@ async def respond_end_request(tag_id: str, user_id: str, approved: bool = True):
             return {"success": True, "approved": True, "message": "Yolculuk tamamlandı"}
         else:
             # İsteği reddet - end_request içindeki status'u güncelle
-            result = supabase.table("tags").select("end_request").eq("id", tag_id).execute()
+            result = await db.table("tags").select("end_request").eq("id", tag_id).execute()
             if result.data and result.data[0].get("end_request"):
                 end_request = result.data[0]["end_request"]
                 end_request["status"] = "rejected"
-                supabase.table("tags").update({"end_request": end_request}).eq("id", tag_id).execute()
+                await db.table("tags").update({"end_request": end_request}).eq("id", tag_id).execute()
             
             return {"success": True, "approved": False, "message": "Sonlandırma isteği reddedildi"}
     except Exception as e:
@@ -9073,11 +10350,10 @@ async def respond_end_request(tag_id: str, user_id: str, approved: bool = True):
 async def approve_trip_end(tag_id: str, user_id: str):
     """Sonlandırma isteğini onayla"""
     try:
-        if tag_id in trip_end_requests:
-            del trip_end_requests[tag_id]
+        await trip_end_requests.pop(tag_id)
         
         # Trip'i tamamla
-        supabase.table("tags").update({
+        await db.table("tags").update({
             "status": "completed",
             "completed_at": datetime.utcnow().isoformat()
         }).eq("id", tag_id).execute()
@@ -9119,7 +10395,7 @@ async def get_cached_tag(tag_id: str) -> dict | None:
         else:
             del _qr_cache[cache_key]
     
-    result = supabase.table("tags").select("id,passenger_id,driver_id,status").eq("id", tag_id).execute()
+    result = await db.table("tags").select("id,passenger_id,driver_id,status").eq("id", tag_id).execute()
     if result.data:
         tag = result.data[0]
         _qr_cache[cache_key] = (tag, current_time + 30)
@@ -9138,7 +10414,7 @@ async def get_cached_user(user_id: str) -> dict | None:
         else:
             del _user_cache[cache_key]
     
-    result = supabase.table("users").select("id,name,rating,total_trips,points").eq("id", user_id).execute()
+    result = await db.table("users").select("id,name,rating,total_trips,points").eq("id", user_id).execute()
     if result.data:
         user = result.data[0]
         _user_cache[cache_key] = (user, current_time + 60)
@@ -9192,11 +10468,11 @@ async def check_proximity_for_trip_end(
         
         # Aktif konum kontrolü - users tablosundan
         try:
-            other_user = supabase.table("users").select("latitude,longitude").eq("id", other_user_id).execute()
+            other_user = await _user_location_rows(other_user_id)
             
-            if other_user.data:
-                other_lat = other_user.data[0].get("latitude")
-                other_lng = other_user.data[0].get("longitude")
+            if other_user:
+                other_lat = other_user[0].get("latitude")
+                other_lng = other_user[0].get("longitude")
                 
                 if other_lat and other_lng:
                     # Mesafe hesapla
@@ -9239,7 +10515,7 @@ import secrets
 import hmac
 
 # Aktif trip QR kodları cache'i: {qr_token: {trip_id, driver_id, passenger_id, timestamp, expires}}
-active_trip_qr_codes: dict = {}
+active_trip_qr_codes = shared_state.map("trip_qr_codes")
 
 def generate_trip_qr_token(tag_id: str, driver_id: str, passenger_id: str) -> str:
     """Trip için güvenli QR token oluştur"""
@@ -9270,13 +10546,13 @@ async def get_trip_qr_code(tag_id: str, user_id: str):
         qr_token = generate_trip_qr_token(tag_id, driver_id, passenger_id)
         
         # 4. Cache'e kaydet (5 dakika geçerli)
-        active_trip_qr_codes[qr_token] = {
+        await active_trip_qr_codes.set(qr_token, {
             "tag_id": tag_id,
             "driver_id": driver_id,
             "passenger_id": passenger_id,
             "timestamp": timestamp,
             "expires": timestamp + 300  # 5 dakika
-        }
+        }, ttl_sec=300)
         
         # 5. Kullanıcı adını al (boş/whitespace adlarda split()[0] hatasını önle)
         user = await get_cached_user(driver_id)
@@ -9316,13 +10592,13 @@ async def verify_trip_qr(
     
     try:
         # 1. QR token'ı kontrol et
-        qr_data = active_trip_qr_codes.get(qr_token)
+        qr_data = await active_trip_qr_codes.get(qr_token)
         if not qr_data:
             return {"success": False, "detail": "Geçersiz veya süresi dolmuş QR kod"}
         
         # 2. Süre kontrolü
         if time.time() > qr_data["expires"]:
-            del active_trip_qr_codes[qr_token]
+            await active_trip_qr_codes.pop(qr_token)
             return {"success": False, "detail": "QR kod süresi dolmuş, yeni kod isteyin"}
         
         tag_id = qr_data["tag_id"]
@@ -9341,7 +10617,7 @@ async def verify_trip_qr(
         # 5. HIZLI: Yolculuğu bitir
         completed_at = datetime.utcnow().isoformat()
         
-        supabase.table("tags").update({
+        await db.table("tags").update({
             "status": "completed",
             "completed_at": completed_at,
             "end_method": "qr_dynamic"
@@ -9349,7 +10625,7 @@ async def verify_trip_qr(
         
         # Cache temizle
         invalidate_tag_cache(tag_id)
-        del active_trip_qr_codes[qr_token]
+        await active_trip_qr_codes.pop(qr_token)
         
         # 6. Kullanıcı isimlerini al (boş adlarda güvenli)
         driver_user = await get_cached_user(driver_id)
@@ -9416,12 +10692,12 @@ async def log_trip_completion(tag_id: str, driver_id: str, passenger_id: str, la
         # Her iki kullanıcıya +3 puan ver
         for uid in [passenger_id, driver_id]:
             try:
-                user_result = supabase.table("users").select("total_trips, points").eq("id", uid).execute()
+                user_result = await db.table("users").select("total_trips, points").eq("id", uid).execute()
                 if user_result.data:
                     current_trips = user_result.data[0].get("total_trips", 0) or 0
                     current_points = user_result.data[0].get("points", 100) or 100
                     
-                    supabase.table("users").update({
+                    await db.table("users").update({
                         "total_trips": current_trips + 1,
                         "points": current_points + 3
                     }).eq("id", uid).execute()
@@ -9430,7 +10706,7 @@ async def log_trip_completion(tag_id: str, driver_id: str, passenger_id: str, la
         
         # Trip log kaydet
         try:
-            supabase.table("trip_logs").insert({
+            await db.table("trip_logs").insert({
                 "tag_id": tag_id,
                 "driver_id": driver_id,
                 "passenger_id": passenger_id,
@@ -9517,14 +10793,14 @@ async def complete_trip_with_qr(request: Request):
         
         try:
             # end_method kolonunu eklemeyi dene
-            supabase.table("tags").update({
+            await db.table("tags").update({
                 **update_data,
                 "end_method": "qr"
             }).eq("id", tag_id).execute()
         except Exception as col_err:
             # Kolon yoksa sadece status güncelle
             logger.warning(f"end_method kolonu yok, sadece status güncelleniyor: {col_err}")
-            supabase.table("tags").update(update_data).eq("id", tag_id).execute()
+            await db.table("tags").update(update_data).eq("id", tag_id).execute()
         
         # Cache temizle
         invalidate_tag_cache(tag_id)
@@ -9660,7 +10936,7 @@ async def scan_qr_for_trip_end(
         # 2. HIZLI: Yolculuğu bitir
         completed_at = datetime.utcnow().isoformat()
         
-        supabase.table("tags").update({
+        await db.table("tags").update({
             "status": "completed",
             "completed_at": completed_at
         }).eq("id", tag_id).execute()
@@ -9670,7 +10946,7 @@ async def scan_qr_for_trip_end(
         
         # 3. QR tamamlama logunu kaydet (Admin için)
         try:
-            supabase.table("qr_completions").insert({
+            await db.table("qr_completions").insert({
                 "tag_id": tag_id,
                 "scanner_id": scanner_user_id,
                 "scanned_id": scanned_user_id,
@@ -9734,12 +11010,12 @@ async def update_trip_points_async(passenger_id: str, driver_id: str, tag_id: st
         # Her iki kullanıcıya +3 puan ver
         for uid in [passenger_id, driver_id]:
             try:
-                user_result = supabase.table("users").select("total_trips, rating, points").eq("id", uid).execute()
+                user_result = await db.table("users").select("total_trips, rating, points").eq("id", uid).execute()
                 if user_result.data:
                     current_trips = user_result.data[0].get("total_trips", 0) or 0
                     current_points = user_result.data[0].get("points", 100) or 100
                     
-                    supabase.table("users").update({
+                    await db.table("users").update({
                         "total_trips": current_trips + 1,
                         "points": current_points + 3  # +3 puan
                     }).eq("id", uid).execute()
@@ -9768,7 +11044,7 @@ async def rate_user_after_trip(
             return {"success": False, "detail": "Puan 1-5 arasında olmalı"}
         
         # Kullanıcının mevcut puanını al
-        user_result = supabase.table("users").select("rating, total_ratings").eq("id", rated_user_id).execute()
+        user_result = await db.table("users").select("rating, total_ratings").eq("id", rated_user_id).execute()
         
         if not user_result.data:
             return {"success": False, "detail": "Kullanıcı bulunamadı"}
@@ -9783,20 +11059,20 @@ async def rate_user_after_trip(
         new_rating = round(new_rating, 2)
         
         # Güncelle
-        supabase.table("users").update({
+        await db.table("users").update({
             "rating": new_rating,
             "total_ratings": new_total
         }).eq("id", rated_user_id).execute()
         
         # Tag'e puanlama bilgisi ekle
         try:
-            tag_result = supabase.table("tags").select("passenger_id, driver_id").eq("id", tag_id).execute()
+            tag_result = await db.table("tags").select("passenger_id, driver_id").eq("id", tag_id).execute()
             if tag_result.data:
                 tag = tag_result.data[0]
                 if rater_user_id == tag.get("passenger_id"):
-                    supabase.table("tags").update({"rating_by_passenger": rating}).eq("id", tag_id).execute()
+                    await db.table("tags").update({"rating_by_passenger": rating}).eq("id", tag_id).execute()
                 elif rater_user_id == tag.get("driver_id"):
-                    supabase.table("tags").update({"rating_by_driver": rating}).eq("id", tag_id).execute()
+                    await db.table("tags").update({"rating_by_driver": rating}).eq("id", tag_id).execute()
         except:
             pass
         
@@ -9823,7 +11099,7 @@ async def rate_user_after_trip(
 async def get_qr_completions(limit: int = 50):
     """Admin için QR ile tamamlanan yolculukları listele"""
     try:
-        result = supabase.table("qr_completions").select("*").order("completed_at", desc=True).limit(limit).execute()
+        result = await db.table("qr_completions").select("*").order("completed_at", desc=True).limit(limit).execute()
         
         completions = []
         for c in result.data:
@@ -9868,7 +11144,7 @@ async def create_payment_request(
         
         # Ödeme talebini kaydet
         try:
-            supabase.table("payment_requests").insert({
+            await db.table("payment_requests").insert({
                 "driver_id": driver_id,
                 "passenger_id": passenger_id,
                 "tag_id": tag_id,
@@ -9925,7 +11201,7 @@ async def verify_payment(
         }
         
         try:
-            supabase.table("payments").insert(payment_data).execute()
+            await db.table("payments").insert(payment_data).execute()
         except Exception as db_err:
             logger.warning(f"Payment kayıt hatası: {db_err}")
         
@@ -9960,7 +11236,7 @@ async def verify_payment(
 async def get_trip_logs(limit: int = 100, start_date: str = None, end_date: str = None):
     """Admin için detaylı yolculuk logları - Devlet raporu için"""
     try:
-        query = supabase.table("tags").select(
+        query = db.table("tags").select(
             "id, passenger_id, driver_id, status, created_at, completed_at, "
             "start_address, destination_address, price, distance_km, rating_by_passenger, rating_by_driver"
         ).order("created_at", desc=True).limit(limit)
@@ -9970,7 +11246,7 @@ async def get_trip_logs(limit: int = 100, start_date: str = None, end_date: str
         if end_date:
             query = query.lte("created_at", end_date)
         
-        result = query.execute()
+        result = await query.execute()
         
         logs = []
         for tag in result.data:
@@ -10004,7 +11280,7 @@ async def get_trip_logs(limit: int = 100, start_date: str = None, end_date: str
 async def get_payment_logs(limit: int = 100):
     """Admin için ödeme logları"""
     try:
-        result = supabase.table("payments").select("*").order("completed_at", desc=True).limit(limit).execute()
+        result = await db.table("payments").select("*").order("completed_at", desc=True).limit(limit).execute()
         
         logs = []
         for p in result.data:
@@ -10038,7 +11314,7 @@ async def rate_after_qr(
             return {"success": False, "detail": "Puan 1-5 arasında olmalı"}
         
         # Tag'i al
-        result = supabase.table("tags").select("*").eq("id", tag_id).execute()
+        result = await db.table("tags").select("*").eq("id", tag_id).execute()
         if not result.data:
             return {"success": False, "detail": "Yolculuk bulunamadı"}
         
@@ -10066,17 +11342,17 @@ async def rate_after_qr(
                 "rated_at": datetime.utcnow().isoformat()
             }
         }
-        supabase.table("tags").update(update_data).eq("id", tag_id).execute()
+        await db.table("tags").update(update_data).eq("id", tag_id).execute()
         
         # Puanlanan kullanıcının ortalama puanını güncelle
         all_ratings = []
         
         if rated_user_id == driver_id:
             # Sürücünün tüm puanlarını al
-            ratings_result = supabase.table("tags").select("rating_by_passenger").eq("driver_id", driver_id).not_.is_("rating_by_passenger", "null").execute()
+            ratings_result = await db.table("tags").select("rating_by_passenger").eq("driver_id", driver_id).not_.is_("rating_by_passenger", "null").execute()
         else:
             # Yolcunun tüm puanlarını al
-            ratings_result = supabase.table("tags").select("rating_by_driver").eq("passenger_id", passenger_id).not_.is_("rating_by_driver", "null").execute()
+            ratings_result = await db.table("tags").select("rating_by_driver").eq("passenger_id", passenger_id).not_.is_("rating_by_driver", "null").execute()
         
         if ratings_result.data:
             for r in ratings_result.data:
@@ -10089,7 +11365,7 @@ async def rate_after_qr(
         
         if all_ratings:
             avg_rating = sum(all_ratings) / len(all_ratings)
-            supabase.table("users").update({"rating": round(avg_rating, 2)}).eq("id", rated_user_id).execute()
+            await db.table("users").update({"rating": round(avg_rating, 2)}).eq("id", rated_user_id).execute()
         
         logger.info(f"⭐ Puanlama kaydedildi: tag={tag_id}, rater={rater_user_id}, rating={rating}")
         
@@ -10108,12 +11384,12 @@ async def get_qr_completions(admin_phone: str, limit: int = 50):
     """Admin için QR ile tamamlanan yolculukları listele"""
     try:
         # Admin kontrolü
-        admin_check = supabase.table("users").select("is_admin").eq("phone", admin_phone).execute()
+        admin_check = await db.table("users").select("is_admin").eq("phone", admin_phone).execute()
         if not admin_check.data or not admin_check.data[0].get("is_admin"):
             return {"success": False, "detail": "Yetkisiz erişim"}
         
         # QR ile tamamlanan yolculukları al
-        result = supabase.table("tags").select(
+        result = await db.table("tags").select(
             "*, users!tags_passenger_id_fkey(name, phone), users!tags_driver_id_fkey(name, phone)"
         ).eq("status", "completed").not_.is_("qr_completion", "null").order("completed_at", desc=True).limit(limit).execute()
         
@@ -10272,14 +11548,13 @@ async def handle_driver_accept_offer(sid, data):
 
     trip_id = tid
     tag = None
-    driver_phone = None
 
     # --- Tag + sürücü araç tipi; eşleşmezse reddet ---
     try:
         print("🚀 MATCH FLOW START")
         logger.info("MATCH FLOW START")
         tag_result = (
-            supabase.table("tags")
+            await db.table("tags")
             .select(
                 "id, status, passenger_id, passenger_preferred_vehicle, passenger_payment_method, "
                 "pickup_location, pickup_lat, pickup_lng, "
@@ -10296,7 +11571,7 @@ async def handle_driver_accept_offer(sid, data):
         # status='waiting' şartı kaldırıldı — doğrudan id ile UPDATE
 
         dr = (
-            supabase.table("users")
+            await db.table("users")
             .select("name, phone, push_token, driver_details")
             .eq("id", resolved_driver_id)
             .limit(1)
@@ -10304,7 +11579,7 @@ async def handle_driver_accept_offer(sid, data):
         )
         if not dr.data and "-" in str(resolved_driver_id):
             dr = (
-                supabase.table("users")
+                await db.table("users")
                 .select("name, phone, push_token")
                 .eq("id", str(resolved_driver_id).lower())
                 .limit(1)
@@ -10312,7 +11587,6 @@ async def handle_driver_accept_offer(sid, data):
             )
         if dr.data and dr.data[0].get("name"):
             driver_name = dr.data[0]["name"]
-        driver_phone = (dr.data[0].get("phone") or "").strip() if dr.data else None
 
         driver_eff_sock = _effective_driver_vehicle_kind(dr.data[0] if dr.data else {})
         pu_row_sock = None
@@ -10320,7 +11594,7 @@ async def handle_driver_accept_offer(sid, data):
             try:
                 pids = await resolve_user_id(str(tag["passenger_id"]).strip())
                 pus = (
-                    supabase.table("users")
+                    await db.table("users")
                     .select("driver_details")
                     .eq("id", pids)
                     .limit(1)
@@ -10339,18 +11613,19 @@ async def handle_driver_accept_offer(sid, data):
             )
             return
 
+        matched_at = datetime.now(timezone.utc).isoformat()
         _upd_body = {
             "status": "matched",
             "driver_id": resolved_driver_id,
             "driver_name": driver_name,
-            "matched_at": datetime.now(timezone.utc).isoformat(),
+            "matched_at": matched_at,
         }
-        supabase.table("tags").update(_upd_body).eq("id", tid).execute()
+        await db.table("tags").update(_upd_body).eq("id", tid).execute()
         # Orijinal tag_id farklı biçimdeyse (UUID büyük/küçük harf) bir kez daha dene
         if str(tag_id).strip() != tid:
             alt = str(tag_id).strip()
             print("RETRY UPDATE with alt id:", alt)
-            supabase.table("tags").update(_upd_body).eq("id", alt).execute()
+            await db.table("tags").update(_upd_body).eq("id", alt).execute()
         logger.info(
             f"driver_accept_offer UPDATE tag={tid} driver={resolved_driver_id}"
         )
@@ -10362,12 +11637,14 @@ async def handle_driver_accept_offer(sid, data):
 
     # --- Eşleşme sonrası: best-effort; hata offer_accepted_error üretmez ---
     try:
+        rolling_state = None
         try:
-            await rolling_dispatch_stop(
+            rolling_state = await rolling_dispatch_stop(
                 tid, revoke_offers=True, except_driver_id=resolved_driver_id
             )
         except Exception as _rds:
             logger.warning(f"rolling_dispatch_stop after driver_accept_offer (non-fatal): {_rds}")
+        await waiting_tag_index_drop(tid)
         try:
             await handle_dispatch_accept(tid, resolved_driver_id)
         except Exception as _hda:
@@ -10377,148 +11654,22 @@ async def handle_driver_accept_offer(sid, data):
         passenger_id = str(passenger_id).strip() if passenger_id else None
         if passenger_id:
             passenger_id = await resolve_user_id(passenger_id)
-        passenger_name = "Yolcu"
-        passenger_phone = None
-        pr = None
-        if passenger_id:
-            pr = supabase.table("users").select("name, phone, push_token").eq("id", passenger_id).limit(1).execute()
-            if not pr.data and "-" in passenger_id:
-                pr = (
-                    supabase.table("users")
-                    .select("name, phone, push_token")
-                    .eq("id", passenger_id.lower())
-                    .limit(1)
-                    .execute()
-                )
-            if pr and pr.data:
-                if pr.data[0].get("name"):
-                    passenger_name = pr.data[0]["name"]
-                passenger_phone = (pr.data[0].get("phone") or "").strip()
+        passenger_name = await _match_user_name(passenger_id, "Yolcu") if passenger_id else "Yolcu"
         if not passenger_id:
             logger.warning(f"driver_accept_offer: tag {tid} için passenger_id yok (push/socket kısıtlı)")
 
-        def _id_hint(uid):
-            if not uid:
-                return "?"
-            s = str(uid).strip()
-            if "-" in s:
-                return f"uuid:{s[-8:]}"
-            if s.isdigit() and len(s) >= 10:
-                return f"phone:{s[:4]}***"
-            return f"id:{s[:8]}"
-
-        logger.info(f"MATCH PUSH: driver_id={_id_hint(resolved_driver_id)} passenger_id={_id_hint(passenger_id)}")
-        match_data = {"event": "match", "trip_id": trip_id, "type": "matched", "tag_id": tid}
-
-        print("📲 SENDING PUSH DRIVER")
-        push_driver_ok = await send_push_notification(
-            resolved_driver_id,
-            "Eşleşme sağlandı",
-            "Yolcuya gitmek için tıklayın.",
-            match_data,
-        )
-        if not push_driver_ok and driver_phone and _looks_like_phone(driver_phone):
-            push_driver_ok = await send_push_notification(
-                driver_phone,
-                "Eşleşme sağlandı",
-                "Yolcuya gitmek için tıklayın.",
-                match_data,
-            )
-            if push_driver_ok:
-                logger.info("PUSH DRIVER SENT (retry by phone)")
-        logger.info("PUSH DRIVER SENT" if push_driver_ok else "PUSH DRIVER FAILED")
-
-        if passenger_id:
-            print("📲 SENDING PUSH PASSENGER")
-            push_p_ok = await send_push_notification(
-                passenger_id,
-                "Sürücü bulundu",
-                "Sürücünüz yola çıktı.",
-                match_data,
-            )
-            if not push_p_ok and passenger_phone and _looks_like_phone(passenger_phone):
-                push_p_ok = await send_push_notification(
-                    passenger_phone,
-                    "Sürücü bulundu",
-                    "Sürücünüz yola çıktı.",
-                    match_data,
-                )
-                if push_p_ok:
-                    logger.info("PUSH PASSENGER SENT (retry by phone)")
-            logger.info("PUSH PASSENGER SENT" if push_p_ok else "PUSH PASSENGER FAILED")
-
-        pickup_distance_km = None
-        pickup_eta_min = None
-        try:
-            udrv_sock = (
-                supabase.table("users")
-                .select("latitude, longitude")
-                .eq("id", resolved_driver_id)
-                .limit(1)
-                .execute()
-            )
-            plat_s, plng_s = tag.get("pickup_lat"), tag.get("pickup_lng")
-            if udrv_sock.data and plat_s is not None and plng_s is not None:
-                dlat_s, dlng_s = udrv_sock.data[0].get("latitude"), udrv_sock.data[0].get(
-                    "longitude"
-                )
-                if dlat_s is not None and dlng_s is not None:
-                    ri_sock = await get_route_info(
-                        float(dlat_s), float(dlng_s), float(plat_s), float(plng_s)
-                    )
-                    if ri_sock:
-                        pickup_distance_km = float(ri_sock["distance_km"])
-                        pickup_eta_min = int(ri_sock["duration_min"])
-        except Exception as _pks:
-            logger.warning(f"driver_accept_offer pickup_distance: {_pks}")
-
-        matched_at = datetime.utcnow().isoformat()
-        trip_dk_sock = tag.get("distance_km")
-        est_min_sock = tag.get("estimated_minutes")
-        payload = {
-            "trip_id": trip_id,
-            "tag_id": tid,
-            "driver_id": resolved_driver_id,
-            "driver_name": driver_name,
-            "passenger_id": passenger_id,
-            "passenger_name": passenger_name,
-            "pickup_location": tag.get("pickup_location"),
-            "dropoff_location": tag.get("dropoff_location"),
-            "pickup_lat": tag.get("pickup_lat"),
-            "pickup_lng": tag.get("pickup_lng"),
-            "dropoff_lat": tag.get("dropoff_lat"),
-            "dropoff_lng": tag.get("dropoff_lng"),
-            "offered_price": tag.get("offered_price") or tag.get("final_price"),
-            "final_price": tag.get("final_price"),
-            "distance_km": trip_dk_sock,
-            "trip_distance_km": trip_dk_sock,
-            "estimated_minutes": est_min_sock,
-            "trip_duration_min": est_min_sock,
-            "pickup_distance_km": pickup_distance_km,
-            "pickup_eta_min": pickup_eta_min,
-            "status": "matched",
-            "matched_at": matched_at,
-            "passenger_payment_method": tag.get("passenger_payment_method"),
-        }
-        driver_sid = connected_users.get(str(resolved_driver_id).strip().lower()) or connected_users.get(
-            resolved_driver_id
+        pickup_distance_km, pickup_eta_min = await _match_pickup_for_accept(rolling_state, resolved_driver_id, tag)
+        payload = build_match_payload(
+            {**tag, "id": trip_id},
+            driver_id=resolved_driver_id,
+            driver_name=driver_name,
+            passenger_id=passenger_id,
+            passenger_name=passenger_name,
+            pickup_distance_km=pickup_distance_km,
+            pickup_eta_min=pickup_eta_min,
+            matched_at=matched_at,
         )
-        driver_room = _normalize_user_room(resolved_driver_id)
-        driver_target = driver_sid or driver_room
-        if driver_target:
-            await sio.emit("offer_accepted_success", payload, room=driver_target)
-            await sio.emit("tag_matched", payload, room=driver_target)
-        # İstenen net match event: sürücü room'una ride_matched
-        await sio.emit("ride_matched", payload, room=f"user_{str(resolved_driver_id).strip().lower()}")
-        if passenger_id:
-            passenger_sid = connected_users.get(str(passenger_id).strip().lower()) or connected_users.get(passenger_id)
-            passenger_room = _normalize_user_room(passenger_id)
-            passenger_target = passenger_sid or passenger_room
-            if passenger_target:
-                await sio.emit("driver_matched", payload, room=passenger_target)
-                await sio.emit("tag_matched", payload, room=passenger_target)
-            # İstenen net match event: yolcu room'una ride_matched
-            await sio.emit("ride_matched", payload, room=f"user_{str(passenger_id).strip().lower()}")
+        await fan_out_match(payload, FLOW_DRIVER_ACCEPT_SOCKET)
         logger.info("SOCKET EMIT DONE driver_accept_offer")
     except Exception as e:
         logger.warning(f"driver_accept_offer post-match (non-fatal): {e}")
@@ -10546,7 +11697,7 @@ async def send_chat_message(msg: ChatMessageCreate):
     """
     try:
         prior = (
-            supabase.table("chat_messages")
+            await db.table("chat_messages")
             .select("id")
             .eq("tag_id", msg.tag_id)
             .eq("sender_id", msg.sender_id)
@@ -10563,7 +11714,7 @@ async def send_chat_message(msg: ChatMessageCreate):
             "created_at": datetime.utcnow().isoformat(),
         }
 
-        result = supabase.table("chat_messages").insert(message_data).execute()
+        result = await db.table("chat_messages").insert(message_data).execute()
 
         if not result.data:
             raise HTTPException(status_code=500, detail="Failed to save message")
@@ -10571,14 +11722,14 @@ async def send_chat_message(msg: ChatMessageCreate):
         saved_message = result.data[0]
         logger.info(f"💬 Chat message saved to Supabase: {saved_message['id']}")
 
-        sender_result = supabase.table("users").select("name").eq("id", msg.sender_id).execute()
+        sender_result = await db.table("users").select("name").eq("id", msg.sender_id).execute()
         sender_name = (
             (msg.sender_name or "").strip()
             or (sender_result.data[0].get("name", "Birisi") if sender_result.data else "Birisi")
         )
 
         tag_row = (
-            supabase.table("tags")
+            await db.table("tags")
             .select("driver_id, passenger_id")
             .eq("id", msg.tag_id)
             .limit(1)
@@ -10647,7 +11798,7 @@ async def get_chat_messages(tag_id: str, limit: int = 50, offset: int = 0):
     Pagination destekli
     """
     try:
-        result = supabase.table("chat_messages")\
+        result = await db.table("chat_messages")\
             .select("*")\
             .eq("tag_id", tag_id)\
             .order("created_at", desc=False)\
@@ -10679,7 +11830,7 @@ async def mark_messages_read(tag_id: str, user_id: str):
     Kullanıcının okuduğu mesajları işaretle
     """
     try:
-        result = supabase.table("chat_messages")\
+        result = await db.table("chat_messages")\
             .update({"read_at": datetime.utcnow().isoformat()})\
             .eq("tag_id", tag_id)\
             .eq("receiver_id", user_id)\
@@ -10694,13 +11845,8 @@ async def mark_messages_read(tag_id: str, user_id: str):
 # ==================== MARTI TAG - FİYAT HESAPLAMA ====================
 
 def haversine_distance(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
-    """İki nokta arası mesafe (km) - Kuş uçuşu"""
-    import math
-    R = 6371  # Dünya yarıçapı km
-    dlat = math.radians(lat2 - lat1)
-    dlng = math.radians(lng2 - lng1)
-    a = math.sin(dlat/2)**2 + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlng/2)**2
-    return R * 2 * math.asin(math.sqrt(a))
+    """İki nokta arası mesafe (km) - Kuş uçuşu (çok satır için: services/geo_arrays.GeoPoints)"""
+    return haversine_km(float(lat1), float(lng1), float(lat2), float(lng2))
 
 
 def _eta_minutes(from_lat: float, from_lng: float, to_lat: float, to_lng: float) -> int:
@@ -10748,6 +11894,11 @@ async def get_road_distance(origin_lat: float, origin_lng: float, dest_lat: floa
             )
             return None
 
+        coords = (float(origin_lat), float(origin_lng), float(dest_lat), float(dest_lng))
+        cached = await road_route_cache.lookup("google", *coords)
+        if cached:
+            return cached
+
         url = "https://maps.googleapis.com/maps/api/directions/json"
         base_params = {
             "origin": f"{origin_lat},{origin_lng}",
@@ -10756,30 +11907,34 @@ async def get_road_distance(origin_lat: float, origin_lng: float, dest_lat: floa
             "key": api_key,
         }
 
-        async with httpx.AsyncClient(http2=False, timeout=10.0) as client:
-            # 1) Trafik tahmini (bazı API kısıtlarında INVALID_REQUEST döner)
-            traffic_params = {
-                **base_params,
-                "departure_time": "now",
-                "traffic_model": "best_guess",
-            }
-            response = await client.get(url, params=traffic_params)
-            data = response.json()
-            if data.get("status") == "OK" and data.get("routes"):
-                return _directions_leg_to_road_dict(data["routes"][0]["legs"][0])
-            logger.warning(
-                "⚠️ Google Directions (trafikli) başarısız: %s — trafiksiz yeniden deneniyor",
-                data.get("status"),
-            )
+        client = get_http_client("google_maps")
+        # 1) Trafik tahmini (bazı API kısıtlarında INVALID_REQUEST döner)
+        traffic_params = {
+            **base_params,
+            "departure_time": "now",
+            "traffic_model": "best_guess",
+        }
+        response = await client.get(url, params=traffic_params)
+        data = response.json()
+        if data.get("status") == "OK" and data.get("routes"):
+            road = _directions_leg_to_road_dict(data["routes"][0]["legs"][0])
+            await road_route_cache.store("google", *coords, road, traffic=road["used_traffic"])
+            return road
+        logger.warning(
+            "⚠️ Google Directions (trafikli) başarısız: %s — trafiksiz yeniden deneniyor",
+            data.get("status"),
+        )
 
-            response2 = await client.get(url, params=base_params)
-            data2 = response2.json()
-            if data2.get("status") == "OK" and data2.get("routes"):
-                logger.info("📍 Google Directions: trafik parametresiz rota kullanıldı")
-                return _directions_leg_to_road_dict(data2["routes"][0]["legs"][0])
+        response2 = await client.get(url, params=base_params)
+        data2 = response2.json()
+        if data2.get("status") == "OK" and data2.get("routes"):
+            logger.info("📍 Google Directions: trafik parametresiz rota kullanıldı")
+            road = _directions_leg_to_road_dict(data2["routes"][0]["legs"][0])
+            await road_route_cache.store("google", *coords, road, traffic=road["used_traffic"])
+            return road
 
-            logger.warning(f"⚠️ Google Directions API hatası: {data2.get('status')}")
-            return None
+        logger.warning(f"⚠️ Google Directions API hatası: {data2.get('status')}")
+        return None
 
     except Exception as e:
         logger.error(f"❌ Google Directions API hatası: {e}")
@@ -10966,7 +12121,7 @@ async def _create_ride_offer_execute(payload: CreateRideOfferRequest):
         
         # Yolcu bilgisi + araç tercihi (driver_details.passenger_preferred_vehicle)
         passenger_result = (
-            supabase.table("users")
+            await db.table("users")
             .select("name, driver_details")
             .eq("id", passenger_id)
             .execute()
@@ -10985,7 +12140,7 @@ async def _create_ride_offer_execute(payload: CreateRideOfferRequest):
             try:
                 dd = _driver_details_as_dict(prow)
                 dd["passenger_preferred_vehicle"] = passenger_pref_vehicle
-                supabase.table("users").update({"driver_details": dd}).eq("id", passenger_id).execute()
+                await db.table("users").update({"driver_details": dd}).eq("id", passenger_id).execute()
             except Exception as sync_ve:
                 logger.warning(f"passenger_preferred_vehicle profil senkronu: {sync_ve}")
         
@@ -11094,7 +12249,7 @@ async def _create_ride_offer_execute(payload: CreateRideOfferRequest):
         for vname, insert_row in insert_variants:
             if vname != "full" and insert_row == insert_variants[0][1]:
                 continue
-            rd, err = _try_tags_insert(insert_row)
+            rd, err = await _supabase_core.run_db(_try_tags_insert, insert_row)
             if rd:
                 result_data = rd
                 used_variant = vname
@@ -11127,6 +12282,7 @@ async def _create_ride_offer_execute(payload: CreateRideOfferRequest):
                 f"(yolcu araç tercihi={passenger_pref_vehicle}, insert_variant={used_variant})"
             )
             logger.info(f"PASSENGER CREATED TAG {tag_id}")
+            await waiting_tag_index_add(tag)
             # Dağıtım hatası teklif oluşturmayı bozmasın (yolcu ekranında "Teklif oluşturulamadı" önlenir)
             notified = 0
             try:
@@ -11232,7 +12388,7 @@ async def accept_ride(tag_id: str, driver_id: str):
     try:
         resolved_driver_id = await resolve_user_id(driver_id)
         # Önce tag'in durumunu kontrol et (race condition önleme)
-        tag_result = supabase.table("tags").select("*").eq("id", tag_id).execute()
+        tag_result = await db.table("tags").select("*").eq("id", tag_id).execute()
         
         if not tag_result.data:
             return {"success": False, "error": "Teklif bulunamadı"}
@@ -11246,7 +12402,7 @@ async def accept_ride(tag_id: str, driver_id: str):
         logger.info("Accept: direct match mode")
 
         # Sürücü bilgisini al (araç tipi doğrulaması)
-        driver_result = supabase.table("users").select("name, phone, driver_details").eq("id", resolved_driver_id).execute()
+        driver_result = await db.table("users").select("name, phone, driver_details").eq("id", resolved_driver_id).execute()
         if not driver_result.data:
             return {"success": False, "error": "Şoför bulunamadı"}
         driver_eff_ar = _effective_driver_vehicle_kind(driver_result.data[0])
@@ -11256,7 +12412,7 @@ async def accept_ride(tag_id: str, driver_id: str):
             try:
                 pida_r = await resolve_user_id(str(pida).strip())
                 pu_ar = (
-                    supabase.table("users")
+                    await db.table("users")
                     .select("driver_details")
                     .eq("id", pida_r)
                     .limit(1)
@@ -11274,21 +12430,17 @@ async def accept_ride(tag_id: str, driver_id: str):
         # Yolcu bilgisini al - passenger_id kullan (tag'da bazen user_id olarak da saklanabilir)
         passenger_id = tag.get("passenger_id")
         if not passenger_id:
-            refetch = supabase.table("tags").select("passenger_id").eq("id", tag_id).limit(1).execute()
+            refetch = await db.table("tags").select("passenger_id").eq("id", tag_id).limit(1).execute()
             if refetch.data and refetch.data[0].get("passenger_id"):
                 passenger_id = refetch.data[0]["passenger_id"]
         if passenger_id:
             passenger_id = await resolve_user_id(passenger_id)
 
-        if passenger_id:
-            passenger_result = supabase.table("users").select("name, phone").eq("id", passenger_id).execute()
-            passenger_name = passenger_result.data[0]["name"] if passenger_result.data else "Yolcu"
-        else:
-            passenger_name = "Yolcu"
+        passenger_name = await _match_user_name(passenger_id, "Yolcu") if passenger_id else "Yolcu"
         
         # Atomik güncelleme - sadece status='waiting' ise güncelle
         # postgrest-py 2.x: update().select() kullanılamaz; return=representation varsayılan → data dolu
-        update_result = supabase.table("tags").update({
+        update_result = await db.table("tags").update({
             "status": "matched",
             "driver_id": resolved_driver_id,
             "driver_name": driver_name,
@@ -11301,37 +12453,31 @@ async def accept_ride(tag_id: str, driver_id: str):
         updated_tag = update_result.data[0]
         updated_tag["passenger_name"] = passenger_name
 
+        rolling_state = None
         try:
-            await rolling_dispatch_stop(
+            rolling_state = await rolling_dispatch_stop(
                 tag_id, revoke_offers=True, except_driver_id=resolved_driver_id
             )
         except Exception as _rds:
             logger.warning(f"rolling_dispatch_stop after accept_ride (non-fatal): {_rds}")
+        await waiting_tag_index_drop(tag_id)
 
-        # Socket: yolcu / sürücü (DB dispatch_queue kullanılmıyor)
-        match_socket_payload = {
-            "tag_id": tag_id,
-            "status": "matched",
-            "driver_id": resolved_driver_id,
-            "driver_name": driver_name,
-            "passenger_id": passenger_id,
-            "passenger_name": passenger_name,
-            "pickup_location": updated_tag.get("pickup_location"),
-            "pickup_lat": updated_tag.get("pickup_lat"),
-            "pickup_lng": updated_tag.get("pickup_lng"),
-            "dropoff_location": updated_tag.get("dropoff_location"),
-            "dropoff_lat": updated_tag.get("dropoff_lat"),
-            "dropoff_lng": updated_tag.get("dropoff_lng"),
-            "final_price": updated_tag.get("final_price"),
-            "matched_at": updated_tag.get("matched_at"),
-            "passenger_payment_method": updated_tag.get("passenger_payment_method"),
-        }
-        if passenger_id:
-            await emit_socket_event_to_user(passenger_id, "ride_accepted", match_socket_payload)
-        await emit_socket_event_to_user(resolved_driver_id, "ride_matched", match_socket_payload)
-        
-        # Push (Expo) — teklif kanalıyla aynı
-        await send_match_notification_to_both(tag_id, resolved_driver_id, passenger_id)
+        # Socket (yolcu ride_accepted, sürücü ride_matched) + push kuyruğu — tek yük (DB dispatch_queue kullanılmıyor)
+        pickup_distance_km, pickup_eta_min = await _match_pickup_for_accept(
+            rolling_state, resolved_driver_id, updated_tag
+        )
+        await fan_out_match(
+            build_match_payload(
+                {**updated_tag, "id": tag_id},
+                driver_id=resolved_driver_id,
+                driver_name=driver_name,
+                passenger_id=passenger_id,
+                passenger_name=passenger_name,
+                pickup_distance_km=pickup_distance_km,
+                pickup_eta_min=pickup_eta_min,
+            ),
+            FLOW_ACCEPT_RIDE,
+        )
         
         logger.info(f"✅ Eşleşme: {tag_id} - Sürücü: {driver_name}")
         
@@ -11353,7 +12499,7 @@ async def get_available_offers(driver_id: str, lat: float, lng: float, radius_km
     try:
         resolved_driver_id = await resolve_user_id(driver_id)
         dr_row = (
-            supabase.table("users")
+            await db.table("users")
             .select("driver_details")
             .eq("id", resolved_driver_id)
             .limit(1)
@@ -11362,7 +12508,7 @@ async def get_available_offers(driver_id: str, lat: float, lng: float, radius_km
         driver_eff = _effective_driver_vehicle_kind(dr_row.data[0] if dr_row.data else {})
 
         # Tüm bekleyen teklifleri al
-        result = supabase.table("tags").select("*")\
+        result = await db.table("tags").select("*")\
             .eq("status", "waiting")\
             .order("created_at", desc=True)\
             .limit(50)\
@@ -11420,7 +12566,7 @@ async def create_promo_code(admin_phone: str, hours: int, code: str = None, max_
             "created_at": datetime.utcnow().isoformat()
         }
         
-        result = supabase.table("promo_codes").insert(promo_data).execute()
+        result = await db.table("promo_codes").insert(promo_data).execute()
         
         logger.info(f"✅ Promosyon kodu oluşturuldu: {promo_code} ({hours} saat)")
         return {"success": True, "promo": result.data[0] if result.data else promo_data}
@@ -11435,7 +12581,7 @@ async def list_promo_codes(admin_phone: str):
         if admin_phone not in ADMIN_PHONE_NUMBERS:
             raise HTTPException(status_code=403, detail="Admin yetkisi gerekli")
         
-        result = supabase.table("promo_codes").select("*").order("created_at", desc=True).execute()
+        result = await db.table("promo_codes").select("*").order("created_at", desc=True).execute()
         
         return {"success": True, "promos": result.data or []}
     except Exception as e:
@@ -11449,7 +12595,7 @@ async def deactivate_promo(admin_phone: str, code: str):
         if admin_phone not in ADMIN_PHONE_NUMBERS:
             raise HTTPException(status_code=403, detail="Admin yetkisi gerekli")
         
-        supabase.table("promo_codes").update({"is_active": False}).eq("code", code.upper()).execute()
+        await db.table("promo_codes").update({"is_active": False}).eq("code", code.upper()).execute()
         
         return {"success": True, "message": "Promosyon kodu deaktive edildi"}
     except Exception as e:
@@ -11471,7 +12617,7 @@ async def admin_grant_driver_package_by_phone(admin_phone: str, phone: str, pack
         # Kullanıcıyı bul (905xx / 5xx varyantları için mevcut helper)
         user_row = None
         for candidate in _phone_lookup_candidates(clean_phone):
-            res = supabase.table("users").select("id, phone, driver_active_until").eq("phone", candidate).limit(1).execute()
+            res = await db.table("users").select("id, phone, driver_active_until").eq("phone", candidate).limit(1).execute()
             if res.data:
                 user_row = res.data[0]
                 break
@@ -11495,14 +12641,15 @@ async def admin_grant_driver_package_by_phone(admin_phone: str, phone: str, pack
 
         new_until = base + timedelta(hours=hours)
 
-        supabase.table("users").update({
+        await db.table("users").update({
             "driver_active_until": new_until.isoformat(),
             "updated_at": now.isoformat(),
         }).eq("id", user_row["id"]).execute()
+        await invalidate_driver_state(user_row["id"])
 
         # Log (tablo yoksa sorun etmeyelim)
         try:
-            supabase.table("driver_package_purchases").insert({
+            await db.table("driver_package_purchases").insert({
                 "user_id": user_row["id"],
                 "package_id": package_id,
                 "package_name": DRIVER_PACKAGES[package_id]["name"],
@@ -11536,7 +12683,7 @@ async def redeem_promo_code(user_id: str, code: str):
         code = code.upper().strip()
         
         # Promosyon kodunu kontrol et
-        result = supabase.table("promo_codes").select("*").eq("code", code).eq("is_active", True).execute()
+        result = await db.table("promo_codes").select("*").eq("code", code).eq("is_active", True).execute()
         
         if not result.data:
             return {"success": False, "error": "Geçersiz veya süresi dolmuş promosyon kodu"}
@@ -11548,12 +12695,12 @@ async def redeem_promo_code(user_id: str, code: str):
             return {"success": False, "error": "Bu promosyon kodu kullanım limitine ulaştı"}
         
         # Kullanıcı daha önce kullanmış mı?
-        usage_check = supabase.table("promo_usage").select("id").eq("user_id", user_id).eq("promo_code", code).execute()
+        usage_check = await db.table("promo_usage").select("id").eq("user_id", user_id).eq("promo_code", code).execute()
         if usage_check.data:
             return {"success": False, "error": "Bu promosyon kodunu daha önce kullandınız"}
         
         # Sürücünün mevcut aktif süresini al
-        user_result = supabase.table("users").select("driver_active_until").eq("id", user_id).execute()
+        user_result = await db.table("users").select("driver_active_until").eq("id", user_id).execute()
         
         current_until = None
         if user_result.data and user_result.data[0].get("driver_active_until"):
@@ -11567,17 +12714,18 @@ async def redeem_promo_code(user_id: str, code: str):
             new_until = now + timedelta(hours=promo["hours"])
         
         # Kullanıcıyı güncelle
-        supabase.table("users").update({
+        await db.table("users").update({
             "driver_active_until": new_until.isoformat()
         }).eq("id", user_id).execute()
+        await invalidate_driver_state(user_id)
         
         # Promosyon kullanım sayısını artır
-        supabase.table("promo_codes").update({
+        await db.table("promo_codes").update({
             "used_count": promo["used_count"] + 1
         }).eq("code", code).execute()
         
         # Kullanım kaydı oluştur
-        supabase.table("promo_usage").insert({
+        await db.table("promo_usage").insert({
             "user_id": user_id,
             "promo_code": code,
             "hours_added": promo["hours"],
@@ -11605,7 +12753,7 @@ async def toggle_driver_online(user_id: str, is_online: bool):
         now = datetime.utcnow()
         
         # Mevcut durumu al (admin için phone da lazım)
-        user_result = supabase.table("users").select(
+        user_result = await db.table("users").select(
             "phone, driver_online, driver_active_until, driver_activated_at"
         ).eq("id", user_id).execute()
         
@@ -11639,10 +12787,11 @@ async def toggle_driver_online(user_id: str, is_online: bool):
             if need_activate:
                 # Admin: ücretsiz 1 yıl aktif
                 active_until = (now + timedelta(days=365)).isoformat()
-                supabase.table("users").update({
+                await db.table("users").update({
                     "driver_active_until": active_until,
                     "updated_at": now.isoformat()
                 }).eq("id", user_id).execute()
+                await invalidate_driver_state(user_id)
         
         # KAPAMA İSTEĞİ - 3 saat kuralı (admin hariç)
         if not is_online and current_online and not is_admin_user:
@@ -11670,7 +12819,9 @@ async def toggle_driver_online(user_id: str, is_online: bool):
             # Kapanıyor - aktivasyon zamanını temizle
             update_data["driver_activated_at"] = None
         
-        supabase.table("users").update(update_data).eq("id", user_id).execute()
+        await db.table("users").update(update_data).eq("id", user_id).execute()
+        await invalidate_driver_state(user_id)
+        await driver_geo_index_refresh_driver(user_id)
         
         status_text = "aktif" if is_online else "pasif"
         logger.info(f"🚗 Sürücü {status_text}: {user_id}")
@@ -11688,7 +12839,7 @@ async def toggle_driver_online(user_id: str, is_online: bool):
 async def get_driver_activation_status(user_id: str):
     """Sürücünün aktivasyon durumunu getir"""
     try:
-        user_result = supabase.table("users").select(
+        user_result = await db.table("users").select(
             "driver_online, driver_active_until, driver_activated_at"
         ).eq("id", user_id).execute()
         
@@ -11751,7 +12902,7 @@ async def admin_full_dashboard(admin_phone: str):
         week_start = (now - timedelta(days=7)).isoformat()
         
         # Kullanıcı istatistikleri - push_token ve driver_active_until da al
-        users_result = supabase.table("users").select(
+        users_result = await db.table("users").select(
             "id, driver_details, driver_online, driver_active_until, created_at, push_token"
         ).execute()
         
@@ -11778,7 +12929,7 @@ async def admin_full_dashboard(admin_phone: str):
         new_users_today = 0
         try:
             nur = (
-                supabase.table("users")
+                await db.table("users")
                 .select("id", count="exact")
                 .gte("created_at", today_start)
                 .execute()
@@ -11788,15 +12939,15 @@ async def admin_full_dashboard(admin_phone: str):
             logger.warning(f"new_users_today count: {_nud}")
         
         # Trip istatistikleri
-        completed_today = supabase.table("tags").select("id", count="exact").eq("status", "completed").gte("completed_at", today_start).execute()
-        completed_week = supabase.table("tags").select("id", count="exact").eq("status", "completed").gte("completed_at", week_start).execute()
-        active_trips = supabase.table("tags").select("id", count="exact").in_("status", ["matched", "in_progress"]).execute()
-        waiting_trips = supabase.table("tags").select("id", count="exact").eq("status", "waiting").execute()
+        completed_today = await db.table("tags").select("id", count="exact").eq("status", "completed").gte("completed_at", today_start).execute()
+        completed_week = await db.table("tags").select("id", count="exact").eq("status", "completed").gte("completed_at", week_start).execute()
+        active_trips = await db.table("tags").select("id", count="exact").in_("status", ["matched", "in_progress"]).execute()
+        waiting_trips = await db.table("tags").select("id", count="exact").eq("status", "waiting").execute()
         
         # KYC istatistikleri
         kyc_pending_count = 0
         try:
-            kyc_pending = supabase.table("driver_kyc").select("id", count="exact").eq("status", "pending").execute()
+            kyc_pending = await db.table("driver_kyc").select("id", count="exact").eq("status", "pending").execute()
             kyc_pending_count = kyc_pending.count or 0
         except:
             pass
@@ -11804,7 +12955,7 @@ async def admin_full_dashboard(admin_phone: str):
         # Promosyon istatistikleri
         active_promos_count = 0
         try:
-            active_promos = supabase.table("promo_codes").select("id", count="exact").eq("is_active", True).execute()
+            active_promos = await db.table("promo_codes").select("id", count="exact").eq("is_active", True).execute()
             active_promos_count = active_promos.count or 0
         except:
             pass
@@ -11849,7 +13000,7 @@ async def admin_get_users_full(admin_phone: str, page: int = 1, limit: int = 20,
         
         offset = (page - 1) * limit
         
-        query = supabase.table("users").select("*", count="exact")
+        query = db.table("users").select("*", count="exact")
         
         if search:
             query = query.or_(f"phone.ilike.%{search}%,name.ilike.%{search}%")
@@ -11859,7 +13010,7 @@ async def admin_get_users_full(admin_phone: str, page: int = 1, limit: int = 20,
         elif filter_type == "online":
             query = query.eq("driver_online", True)
         
-        result = query.order("created_at", desc=True).range(offset, offset + limit - 1).execute()
+        result = await query.order("created_at", desc=True).range(offset, offset + limit - 1).execute()
         
         users = []
         for u in result.data:
@@ -11901,12 +13052,12 @@ async def admin_get_trips(admin_phone: str, page: int = 1, limit: int = 20, stat
         
         offset = (page - 1) * limit
         
-        query = supabase.table("tags").select("*", count="exact")
+        query = db.table("tags").select("*", count="exact")
         
         if status:
             query = query.eq("status", status)
         
-        result = query.order("created_at", desc=True).range(offset, offset + limit - 1).execute()
+        result = await query.order("created_at", desc=True).range(offset, offset + limit - 1).execute()
         
         return {
             "success": True,
@@ -11929,21 +13080,21 @@ async def admin_stats_period(admin_phone: str, days: int = 7):
             raise HTTPException(status_code=403, detail="Admin yetkisi gerekli")
         start_date = (datetime.utcnow() - timedelta(days=days)).isoformat()
         completed = (
-            supabase.table("tags")
+            await db.table("tags")
             .select("completed_at, final_price")
             .eq("status", "completed")
             .gte("completed_at", start_date)
             .execute()
         )
         cancelled = (
-            supabase.table("tags")
+            await db.table("tags")
             .select("cancelled_at")
             .eq("status", "cancelled")
             .gte("cancelled_at", start_date)
             .execute()
         )
         new_users = (
-            supabase.table("users")
+            await db.table("users")
             .select("created_at", count="exact")
             .gte("created_at", start_date)
             .execute()
@@ -11971,7 +13122,7 @@ async def admin_get_login_logs(admin_phone: str, page: int = 1, limit: int = 50)
         
         offset = (page - 1) * limit
         
-        result = supabase.table("login_logs").select("*", count="exact").order("created_at", desc=True).range(offset, offset + limit - 1).execute()
+        result = await db.table("login_logs").select("*", count="exact").order("created_at", desc=True).range(offset, offset + limit - 1).execute()
         
         return {
             "success": True,
@@ -11994,7 +13145,7 @@ async def admin_ban_user(admin_phone: str, user_id: str, is_banned: bool = True)
             raise HTTPException(status_code=403, detail="Admin yetkisi gerekli")
         
         # is_active alanını güncelle (banned = is_active: false)
-        supabase.table("users").update({
+        await db.table("users").update({
             "is_active": not is_banned,
             "updated_at": datetime.utcnow().isoformat()
         }).eq("id", user_id).execute()
@@ -12014,7 +13165,7 @@ async def admin_add_driver_time(admin_phone: str, user_id: str, hours: int):
         if admin_phone not in ADMIN_PHONE_NUMBERS:
             raise HTTPException(status_code=403, detail="Admin yetkisi gerekli")
         
-        user_result = supabase.table("users").select("driver_active_until").eq("id", user_id).execute()
+        user_result = await db.table("users").select("driver_active_until").eq("id", user_id).execute()
         
         now = datetime.utcnow()
         current_until = None
@@ -12027,9 +13178,10 @@ async def admin_add_driver_time(admin_phone: str, user_id: str, hours: int):
         else:
             new_until = now + timedelta(hours=hours)
         
-        supabase.table("users").update({
+        await db.table("users").update({
             "driver_active_until": new_until.isoformat()
         }).eq("id", user_id).execute()
+        await invalidate_driver_state(user_id)
         
         logger.info(f"⏱️ Admin süre ekledi: {user_id} ({hours} saat)")
         
@@ -12062,11 +13214,12 @@ async def register_push_token(user_id: str, token: str, platform: str = "android
         # push_token_type kolonu yoksa geriye dönük uyumluluk için fallback
         try:
             update_payload["push_token_type"] = "expo"
-            supabase.table("users").update(update_payload).eq("id", user_id).execute()
+            await db.table("users").update(update_payload).eq("id", user_id).execute()
         except Exception:
             update_payload.pop("push_token_type", None)
-            supabase.table("users").update(update_payload).eq("id", user_id).execute()
+            await db.table("users").update(update_payload).eq("id", user_id).execute()
 
+        await invalidate_push_user(user_id)
         logger.info(f"📱 Push token kaydedildi: {user_id}")
         return {"success": True, "platform": platform, "token_type": "expo"}
     except Exception as e:
@@ -12081,6 +13234,61 @@ def _looks_like_phone(uid: str) -> bool:
     return len(digits) >= 10 and digits[:1] in "59"  # 5xxxxxxxxx veya 9xxxxxxxxx
 
 
+async def _resolve_push_user(user_id) -> Optional[dict]:
+    """user_id (UUID veya telefon) → users satırı (push_token, name, id, phone) veya None (push_token_cache önde)."""
+    uid = str(user_id).strip() if user_id else ""
+    if not uid:
+        return None
+    hit, row = push_token_cache.lookup(uid)
+    if hit:
+        return row
+    row = await _lookup_push_user(uid)
+    push_token_cache.store(uid, row)
+    return row
+
+
+async def _lookup_push_user(uid: str) -> Optional[dict]:
+    """DB çözümlemesi: id, küçük harf id, telefon biçimleri, LIKE."""
+    user_result = await db.table("users").select("push_token, name, id, phone").eq("id", uid).limit(1).execute()
+    # UUID büyük/küçük harf farkı
+    if not user_result.data and "-" in uid:
+        user_result = await db.table("users").select("push_token, name, id, phone").eq("id", uid.lower()).limit(1).execute()
+    if user_result.data:
+        return user_result.data[0]
+    # Telefon ile fallback: E.164 normalize et, tüm olası DB formatlarını dene
+    if not _looks_like_phone(uid):
+        return None
+    phone_e164 = normalize_phone_e164(uid)
+    if not phone_e164:
+        return None
+    # DB'de +905..., 905..., 5326..., 0532... saklanabilir; hepsini dene
+    digits_only = "".join(c for c in phone_e164 if c.isdigit())  # 905326427412
+    ten_digit = digits_only[-10:] if len(digits_only) >= 10 else digits_only  # 5326427412
+    candidates = [
+        phone_e164,       # +905326427412
+        digits_only,      # 905326427412
+        ten_digit,        # 5326427412
+        "0" + ten_digit if len(ten_digit) == 10 else None,  # 05326427412
+    ]
+    seen = set()
+    for candidate in candidates:
+        if not candidate or candidate in seen:
+            continue
+        seen.add(candidate)
+        user_result = await db.table("users").select("push_token, name, id, phone").eq("phone", candidate).limit(1).execute()
+        if user_result.data:
+            logger.info(f"📱 Push: kullanıcı telefon ile bulundu (E.164={phone_e164})")
+            return user_result.data[0]
+    # Son deneme: phone içinde bu 10 rakam geçen (boşluk/tire ile kayıtlı olabilir)
+    if len(ten_digit) >= 10:
+        like_r = await db.table("users").select("push_token, name, id, phone").like("phone", f"%{ten_digit}%").limit(5).execute()
+        for row in like_r.data or []:
+            if ten_digit in "".join(c for c in (row.get("phone") or "") if c.isdigit()):
+                logger.info(f"📱 Push: kullanıcı telefon LIKE ile bulundu (core={ten_digit})")
+                return row
+    return None
+
+
 async def send_push_notification(user_id: str, title: str, body: str, data: dict = None):
     """Tek kullanıcıya Expo push bildirim gönder (users.push_token). user_id = UUID veya telefon (fallback)."""
     try:
@@ -12088,47 +13296,10 @@ async def send_push_notification(user_id: str, title: str, body: str, data: dict
         if not uid:
             logger.warning("❌ Push: user_id boş")
             return False
-        user_result = supabase.table("users").select("push_token, name, id, phone").eq("id", uid).limit(1).execute()
-        # UUID büyük/küçük harf farkı
-        if not user_result.data and "-" in uid:
-            user_result = supabase.table("users").select("push_token, name, id, phone").eq("id", uid.lower()).limit(1).execute()
-        # Telefon ile fallback: E.164 normalize et, tüm olası DB formatlarını dene
-        if not user_result.data and _looks_like_phone(uid):
-            phone_e164 = normalize_phone_e164(uid)
-            if phone_e164:
-                # DB'de +905..., 905..., 5326..., 0532... saklanabilir; hepsini dene
-                digits_only = "".join(c for c in phone_e164 if c.isdigit())  # 905326427412
-                ten_digit = digits_only[-10:] if len(digits_only) >= 10 else digits_only  # 5326427412
-                candidates = [
-                    phone_e164,       # +905326427412
-                    digits_only,      # 905326427412
-                    ten_digit,        # 5326427412
-                    "0" + ten_digit if len(ten_digit) == 10 else None,  # 05326427412
-                ]
-                seen = set()
-                for candidate in candidates:
-                    if not candidate or candidate in seen:
-                        continue
-                    seen.add(candidate)
-                    user_result = supabase.table("users").select("push_token, name, id, phone").eq("phone", candidate).limit(1).execute()
-                    if user_result.data:
-                        logger.info(f"📱 Push: kullanıcı telefon ile bulundu (E.164={phone_e164})")
-                        break
-                # Son deneme: phone içinde bu 10 rakam geçen (boşluk/tire ile kayıtlı olabilir)
-                if not user_result.data and len(ten_digit) >= 10:
-                    like_r = supabase.table("users").select("push_token, name, id, phone").like("phone", f"%{ten_digit}%").limit(5).execute()
-                    if like_r.data:
-                        for row in like_r.data:
-                            if ten_digit in "".join(c for c in (row.get("phone") or "") if c.isdigit()):
-                                class _R: pass
-                                user_result = _R()
-                                user_result.data = [row]
-                                logger.info(f"📱 Push: kullanıcı telefon LIKE ile bulundu (core={ten_digit})")
-                                break
-        if not user_result.data:
+        row = await _resolve_push_user(uid)
+        if not row:
             logger.warning(f"❌ Push: kullanıcı bulunamadı (user_id={uid[:20]}...) – ID veya telefon veritabanında yok.")
             return False
-        row = user_result.data[0]
         uid = row.get("id") or uid
         token = row.get("push_token")
         user_name = row.get("name", "Unknown")
@@ -12151,59 +13322,99 @@ async def send_push_notification(user_id: str, title: str, body: str, data: dict
         return False
 
 
-async def send_match_notification_to_both(tag_id: str, driver_id: str, passenger_id: str) -> dict:
+async def _match_user_name(user_id, default: str) -> str:
+    """Eşleşme yükü için isim: geo indeks / push önbelleği, yoksa users.name."""
+    row = driver_geo_index.get(user_id)
+    if not row:
+        _hit, row = push_token_cache.lookup(user_id)
+    if row and row.get("name"):
+        return row["name"]
+    res = await db.table("users").select("name").eq("id", user_id).limit(1).execute()
+    return (res.data[0].get("name") if res.data else None) or default
+
+
+async def _match_pickup_estimate(driver_id, tag: dict) -> tuple:
     """
-    Eşleşme tam bu anda – sürücü ve yolcuya anında bildirim.
-    Teklif bildirimi çalıştığı için aynı type (new_offer) + event=match ile Expo'ya gidiyor.
-    Returns: {"driver": bool, "passenger": bool}
+    Sürücü → pickup (km, dk): bellekteki konum (location_ingestor / geo indeks) + rota cache'i;
+    cache'te yoksa kuş uçuşu tahmini (Directions'a gidilmez). Konum yoksa (None, None).
     """
-    out = {"driver": False, "passenger": False}
-    logger.info(f"📢 EŞLEŞME BİLDİRİMİ BAŞLADI: tag_id={tag_id}, driver_id={driver_id}, passenger_id={passenger_id}")
+    pickup = _coerce_latlng((tag or {}).get("pickup_lat"), (tag or {}).get("pickup_lng"))
+    if pickup is None or not driver_id:
+        return None, None
+    pos = location_ingestor.get(driver_id) or driver_geo_index.get(driver_id)
+    if pos is None:
+        try:
+            rows = await _user_location_rows(driver_id)
+        except Exception as e:
+            logger.warning(f"Eşleşme pickup konumu okunamadı: {e}")
+            rows = []
+        pos = rows[0] if rows else None
+    ll = _coerce_latlng((pos or {}).get("latitude"), (pos or {}).get("longitude"))
+    if ll is None:
+        return None, None
+    hit = await road_route_cache.lookup("google", ll[0], ll[1], pickup[0], pickup[1])
+    info = _route_info_from_road(hit) if hit else await road_route_cache.lookup("osrm", ll[0], ll[1], pickup[0], pickup[1])
+    if info:
+        return float(info["distance_km"]), int(info["duration_min"])
+    km = haversine_km(ll[0], ll[1], pickup[0], pickup[1])
+    return round(km, 2), _eta_minutes(ll[0], ll[1], pickup[0], pickup[1])
+
+
+async def _match_pickup_for_accept(rolling_state: Optional[dict], driver_id: str, tag: dict) -> tuple:
+    """
+    Kabulde pickup (km, dk): sürücüye giden teklifteki rota (rolling aday girdisi), yoksa bellek konumu +
+    rota cache'i (_match_pickup_estimate; ağ çağrısı yok).
+    """
+    entry = _rolling_candidate_entry(rolling_state, driver_id)
+    if entry and entry.get("distance_km") is not None:
+        eta = int(entry["duration_min"]) if entry.get("duration_min") is not None else None
+        return float(entry["distance_km"]), eta
     try:
-        tag_row = supabase.table("tags").select("id, passenger_id, driver_id, pickup_lat, pickup_lng, final_price").eq("id", tag_id).limit(1).execute()
-        if not tag_row.data:
-            logger.warning(f"🔔 Eşleşme bildirimi: tag bulunamadı {tag_id}")
-            return out
-        row = tag_row.data[0]
-        d_id = str(row.get("driver_id") or driver_id or "").strip() or None
-        p_id = str(row.get("passenger_id") or passenger_id or "").strip() or None
-        if not d_id and not p_id:
-            logger.warning(f"🔔 Eşleşme bildirimi: driver_id ve passenger_id yok")
-            return out
-        eta_min = 0
+        return await _match_pickup_estimate(driver_id, tag)
+    except Exception as e:
+        logger.warning(f"eşleşme pickup mesafesi: {e}")
+        return None, None
+
+
+async def fan_out_match(payload: dict, flow: str) -> dict:
+    """
+    Eşleşme yükünü iki tarafa gönder: alıcı başına aynı yük, akışın olay adlarıyla (match_event_names),
+    push'lar outbox'a (kayıt beklenir, teslimat arka planda). Dönüş: {"driver", "passenger"} — push kuyruğa alındı mı.
+    """
+    for role, uid in ((ROLE_DRIVER, payload.get("driver_id")), (ROLE_PASSENGER, payload.get("passenger_id"))):
+        if not uid:
+            continue
+        key = str(uid).strip().lower()
         try:
-            if d_id and row.get("pickup_lat") is not None and row.get("pickup_lng") is not None:
-                loc = supabase.table("users").select("latitude, longitude").eq("id", d_id).limit(1).execute()
-                if loc.data and loc.data[0].get("latitude") is not None:
-                    eta_min = _eta_minutes(
-                        loc.data[0].get("latitude"), loc.data[0].get("longitude"),
-                        float(row["pickup_lat"]), float(row["pickup_lng"])
-                    )
-        except Exception:
-            pass
-        driver_body = f"Yolcuya {eta_min} dk. Yolcuya git için tıklayın." if eta_min else "Yolcuya git için tıklayın."
-        passenger_title = "Paylaşımlı yolculuk başladı"
-        passenger_body = "Sürücüye yazmak için tıklayın."
-        # Teklif bildirimi gibi type=new_offer kullan (cihazda aynı kanal/aynı davranış); event=match ile uygulama eşleşme ekranına gidebilir
-        base_data = {"type": "new_offer", "event": "match", "tag_id": tag_id, "eta_min": eta_min}
-        if d_id:
-            driver_data = {**base_data, "role": "driver", "price": int(row.get("final_price") or row.get("offered_price") or 0)}
-            out["driver"] = await send_trip_push_and_log(d_id, "new_ride_request", "Eşleşme sağlandı", driver_body, driver_data)
-            logger.info(f"🔔 Eşleşme push sürücü: {d_id[:8]}... sonuç={out['driver']}")
-        if p_id:
-            passenger_data = {**base_data, "role": "passenger"}
-            out["passenger"] = await send_trip_push_and_log(p_id, "new_ride_request", passenger_title, passenger_body, passenger_data)
-            logger.info(f"🔔 Eşleşme push yolcu: {p_id[:8]}... sonuç={out['passenger']}")
-        logger.info(f"📢 EŞLEŞME BİLDİRİMİ BİTTİ: tag_id={tag_id}, driver={out['driver']}, passenger={out['passenger']}")
-    except Exception as e:
-        logger.exception(f"🔔 send_match_notification_to_both hata: {e}")
-    return out
+            target = await get_user_sid(key) or _normalize_user_room(key)
+            for name in match_event_names(role, flow):
+                await sio.emit(name, payload, room=target)
+        except Exception as e:
+            logger.warning(f"⚠️ Eşleşme socket emit hatası ({role}): {e}")
+    # Kuyruğa alma (outbox insert) beklenir; Expo teslimatı push_outbox'ta arka planda
+    queued = {ROLE_DRIVER: False, ROLE_PASSENGER: False}
+    messages = match_push_messages(payload)
+    results = await asyncio.gather(
+        *[
+            send_trip_push_and_log(msg["user_id"], MATCH_PUSH_TYPE, msg["title"], msg["body"], msg["data"])
+            for msg in messages
+        ],
+        return_exceptions=True,
+    )
+    for msg, ok in zip(messages, results):
+        if isinstance(ok, Exception):
+            logger.warning(f"⚠️ Eşleşme push kuyruğa alınamadı ({msg['role']}): {ok}")
+            continue
+        queued[msg["role"]] = bool(ok)
+    logger.info(f"📢 Eşleşme fan-out: tag_id={payload.get('tag_id')} push={queued}")
+    return queued
 
 
 async def send_trip_push_and_log(user_id: str, notification_type: str, title: str, body: str, data: dict = None) -> bool:
     """
-    Trip lifecycle (ve diğer) bildirimleri: önce notifications_log'a yaz, sonra push gönder.
-    Tüm bildirimler loglanır (token yoksa bile). user_id users.id (UUID string) olmalı.
+    Trip lifecycle (ve diğer) bildirimleri: notifications_log'a pending satır yazılır, push_outbox gönderir.
+    Tüm bildirimler loglanır (token yoksa satır failed olur). user_id users.id (UUID string) olmalı.
+    Dönüş: kuyruğa alındı mı (Expo sonucu beklenmez).
     """
     uid = str(user_id).strip() if user_id else None
     if not uid:
@@ -12211,34 +13422,79 @@ async def send_trip_push_and_log(user_id: str, notification_type: str, title: st
         return False
     payload = data or {}
     payload.setdefault("type", notification_type)
-    try:
-        supabase.table("notifications_log").insert({
-            "type": notification_type,
-            "user_id": uid,
-            "title": title,
-            "body": body,
-            "created_at": datetime.utcnow().isoformat(),
-        }).execute()
-    except Exception as log_err:
-        logger.warning(f"⚠️ notifications_log insert failed: {log_err}")
-    ok = await send_push_notification(uid, title, body, payload)
+    ok = await push_outbox.enqueue(
+        user_id=uid, notification_type=notification_type, title=title, body=body, data=payload
+    )
     if not ok:
-        logger.warning(f"⚠️ Trip push gönderilemedi: user_id={uid}, type={notification_type}, title={title!r}")
+        logger.warning(f"⚠️ Trip push kuyruğa alınamadı: user_id={uid}, type={notification_type}, title={title!r}")
     return ok
 
 
+async def _prune_unregistered_push_tokens(tokens: list) -> None:
+    """Expo DeviceNotRegistered: token users'tan silinir (sonraki gönderimler boşa gitmesin)."""
+    res = await db.table("users").update({"push_token": None}).in_("push_token", list(tokens)).execute()
+    for row in res.data or []:
+        await invalidate_push_user(row.get("id"))
+
+
+# Toplu push: 100'lük Expo istekleri eşzamanlı; biletlerin receipt'leri arka planda, geçersiz token temizliği
+push_dispatcher = PushDispatcher.from_env(
+    headers=_expo_push_request_headers,
+    on_unregistered=_prune_unregistered_push_tokens,
+)
+# users.push_token toplu okuma: in_() başına id sayısı
+try:
+    PUSH_TOKEN_LOOKUP_CHUNK = max(1, int(os.getenv("PUSH_TOKEN_LOOKUP_CHUNK", "500")))
+except (TypeError, ValueError):
+    PUSH_TOKEN_LOOKUP_CHUNK = 500
+
+
 async def send_push_notifications_to_users(user_ids: list, title: str, body: str, data: dict = None) -> dict:
-    """Birden fazla kullanıcıya, tekil send_push_notification fonksiyonu ile gönder."""
-    sent = 0
-    failed = 0
+    """
+    Birden fazla kullanıcıya: UUID'lerin token'ları push_token_cache'ten, eksikleri toplu okunur;
+    push_dispatcher ile gönderilir. UUID olmayan / bulunamayan id'ler (telefon vb.) tekil
+    send_push_notification yoluna düşer.
+    """
+    ids = [str(u).strip() for u in (user_ids or []) if u is not None and str(u).strip()]
+    found: set = set()
+    token_by_user: dict = {}
+
+    def _take(rid: str, row: dict) -> None:
+        found.add(rid)
+        token = (row.get("push_token") or "").strip()
+        if ExpoPushService.is_valid_token(token):
+            token_by_user[rid] = token
+
+    keys = []
+    for key in dict.fromkeys(i.lower() for i in ids if _UUID_RE.match(i)):
+        hit, row = push_token_cache.lookup(key)
+        if hit and row is not None:
+            _take(key, row)
+        elif not hit:
+            keys.append(key)
+    for i in range(0, len(keys), PUSH_TOKEN_LOOKUP_CHUNK):
+        res = await db.table("users").select("id, push_token, name, phone").in_("id", keys[i:i + PUSH_TOKEN_LOOKUP_CHUNK]).execute()
+        push_token_cache.store_many(res.data or [])
+        for row in res.data or []:
+            _take(str(row.get("id") or "").strip().lower(), row)
 
-    for user_id in user_ids or []:
-        if await send_push_notification(user_id, title, body, data):
-            sent += 1
-        else:
-            failed += 1
+    sent = 0
+    if token_by_user:
+        result = await push_dispatcher.send(token_by_user.values(), title, body, data)
+        ok_tokens = result["ok_tokens"]
+        sent += sum(1 for i in ids if token_by_user.get(i.lower()) in ok_tokens)
+
+    leftovers = [i for i in ids if i.lower() not in found]
+    if leftovers:
+        outs = await bounded_gather(
+            leftovers,
+            lambda uid: send_push_notification(uid, title, body, data),
+            limit=push_dispatcher.concurrency,
+        )
+        sent += sum(1 for ok in outs if ok)
 
-    return {"sent": sent, "failed": failed, "total": len(user_ids or [])}
+    total = len(user_ids or [])
+    return {"sent": sent, "failed": total - sent, "total": total}
 
 def _expo_push_data_stringify(data: Optional[dict]) -> dict:
     """
@@ -12273,14 +13529,12 @@ async def _expo_get_push_receipts(ticket_ids: list) -> dict:
         return {}
     await asyncio.sleep(1.8)
     try:
-        import httpx
-
-        async with httpx.AsyncClient(http2=False, timeout=30) as client:
-            r = await client.post(
-                "https://exp.host/--/api/v2/push/getReceipts",
-                json={"ids": ids},
-                headers=_expo_push_request_headers(),
-            )
+        client = get_http_client("expo")
+        r = await client.post(
+            "https://exp.host/--/api/v2/push/getReceipts",
+            json={"ids": ids},
+            headers=_expo_push_request_headers(),
+        )
         if r.status_code != 200:
             logger.warning(f"Expo getReceipts HTTP {r.status_code}: {r.text[:500]}")
             return {"http_status": r.status_code, "body": r.text[:800]}
@@ -12293,7 +13547,6 @@ async def _expo_get_push_receipts(ticket_ids: list) -> dict:
 async def _send_expo_and_get_receipt(token: str, title: str, body: str, data: dict = None):
     """Expo Push API'ye istek atar; (success, receipt_dict) döner. receipt Expo'nun data[0] objesidir."""
     try:
-        import httpx
         payload = _expo_push_data_stringify(data or {})
         notification_type = payload.get("type")
         channel_id = expo_android_channel_id_for_type(notification_type)
@@ -12314,35 +13567,35 @@ async def _send_expo_and_get_receipt(token: str, title: str, body: str, data: di
 
         headers = _expo_push_request_headers()
 
-        async with httpx.AsyncClient(http2=False, timeout=30) as client:
-            response = await client.post(
-                "https://exp.host/--/api/v2/push/send",
-                json=messages_payload,
-                headers=headers,
-            )
+        client = get_http_client("expo")
+        response = await client.post(
+            "https://exp.host/--/api/v2/push/send",
+            json=messages_payload,
+            headers=headers,
+        )
 
-            logger.info(f"🔔 Expo API yanıtı: status={response.status_code}")
-            logger.info(f"📨 Expo response: {response.status_code} {response.text[:1000]}")
-
-            if response.status_code != 200:
-                return False, {"http_status": response.status_code, "body": response.text[:500]}
-
-            response_data = response.json()
-            receipts = response_data.get("data") or []
-            if not receipts:
-                return False, {"error": "boş receipt listesi"}
-            first = receipts[0]
-            if first.get("status") == "error":
-                err_msg = first.get("message", "bilinmeyen hata")
-                err_details = first.get("details") or first
-                logger.error(f"❌ Expo API hatası: {err_msg} | details={err_details}")
-                return False, first
-            tid = first.get("id")
-            if tid:
-                logger.info(f"✅ Expo push bilet id={tid} (FCM gerçek sonuç için getReceipts kullanın)")
-            else:
-                logger.info(f"✅ Expo push başarılı (receipt status={first.get('status', 'ok')})")
-            return True, first
+        logger.info(f"🔔 Expo API yanıtı: status={response.status_code}")
+        logger.info(f"📨 Expo response: {response.status_code} {response.text[:1000]}")
+
+        if response.status_code != 200:
+            return False, {"http_status": response.status_code, "body": response.text[:500]}
+
+        response_data = response.json()
+        receipts = response_data.get("data") or []
+        if not receipts:
+            return False, {"error": "boş receipt listesi"}
+        first = receipts[0]
+        if first.get("status") == "error":
+            err_msg = first.get("message", "bilinmeyen hata")
+            err_details = first.get("details") or first
+            logger.error(f"❌ Expo API hatası: {err_msg} | details={err_details}")
+            return False, first
+        tid = first.get("id")
+        if tid:
+            logger.info(f"✅ Expo push bilet id={tid} (FCM gerçek sonuç için getReceipts kullanın)")
+        else:
+            logger.info(f"✅ Expo push başarılı (receipt status={first.get('status', 'ok')})")
+        return True, first
     except Exception as e:
         logger.error(f"❌ Expo API exception: {e}")
         return False, {"exception": str(e)}
@@ -12354,38 +13607,77 @@ async def send_expo_notification(token: str, title: str, body: str, data: dict =
     return success
 
 
-async def send_expo_push(token: str, title: str, body: str) -> bool:
+async def send_expo_push(
+    token: str, title: str, body: str, *, user_id: Optional[str] = None, data: Optional[dict] = None
+) -> bool:
     """
-    Basit helper: token -> Expo Push API'ye gönder.
+    Basit helper: token -> push_outbox (gönderim arka planda, istek yolunu bekletmez).
     Sadece push gönderimi ekler; dispatch/vehicle filtrelerine dokunmaz.
     """
-    try:
-        if not token:
-            logger.warning("send_expo_push: token None/boş")
-            return False
-
-        # 5 saniyelik hard timeout: expo tarafı takılırsa event-loop bloke olmasın.
-        ok, _ = await asyncio.wait_for(
-            _send_expo_and_get_receipt(
-                token=token,
-                title=title,
-                body=body,
-                data={"type": "new_offer"},
-            ),
-            timeout=5.0,
-        )
-        return ok
-    except asyncio.TimeoutError:
-        logger.warning("send_expo_push: timeout (5s)")
-        return False
-    except Exception as e:
-        logger.warning(f"send_expo_push failed: {e}")
+    if not token:
+        logger.warning("send_expo_push: token None/boş")
         return False
+    return await push_outbox.enqueue(
+        user_id=user_id,
+        notification_type="new_offer",
+        title=title,
+        body=body,
+        data=data or {"type": "new_offer"},
+        push_token=token,
+    )
+
+
+# Expo ticket hata kodları: tekrar denenir (diğerleri kalıcı hata)
+_EXPO_RETRYABLE_ERRORS = frozenset({"MessageRateExceeded"})
+
+
+async def _deliver_outbox_push(item: dict) -> tuple:
+    """push_outbox teslimatı: token (satırda yoksa users'tan) → Expo. Dönüş: (OUTCOME_*, açıklama)."""
+    token = item.get("push_token")
+    if not token:
+        row = await _resolve_push_user(item.get("user_id"))
+        token = (row or {}).get("push_token")
+    if not token:
+        return OUTBOX_DROP, "no_push_token"
+    if not ExpoPushService.is_valid_token(token):
+        return OUTBOX_DROP, "invalid_token"
+    data = item.get("data") or {}
+    if isinstance(data, str):
+        try:
+            data = json.loads(data)
+        except ValueError:
+            data = {}
+    ok, ticket = await _send_expo_and_get_receipt(token, item.get("title") or "", item.get("body") or "", data)
+    if ok:
+        return OUTBOX_SENT, None
+    ticket = ticket or {}
+    code = (ticket.get("details") or {}).get("error") if isinstance(ticket.get("details"), dict) else None
+    if code == "DeviceNotRegistered":
+        await _prune_unregistered_push_tokens([token])
+        return OUTBOX_DROP, code
+    if ticket.get("status") == "error":
+        return (OUTBOX_RETRY if code in _EXPO_RETRYABLE_ERRORS else OUTBOX_DROP), code or ticket.get("message")
+    status = int(ticket.get("http_status") or 0)
+    if 400 <= status < 500 and status != 429:
+        return OUTBOX_DROP, f"http_{status}"
+    return OUTBOX_RETRY, f"http_{status}" if status else ticket.get("exception") or "expo_error"
+
+
+def _create_push_outbox_store():
+    """PUSH_OUTBOX_STORE=supabase|memory — supabase: notifications_log (sql_migrations/create_push_outbox.sql)."""
+    if (os.getenv("PUSH_OUTBOX_STORE") or "supabase").strip().lower() == "memory":
+        return MemoryOutboxStore()
+    return SupabaseOutboxStore(_supabase_core.AsyncSupabase(lambda: supabase))
+
+
+# Yolculuk / teklif push'ları: kalıcı outbox + worker havuzu (tekrar deneme, alıcı başına tekilleştirme, hız sınırı)
+push_outbox = PushOutbox.from_env(_create_push_outbox_store(), _deliver_outbox_push)
+
 
 async def send_bulk_push_notification(title: str, body: str, target: str = "all", data: dict = None):
     """Toplu push bildirim gönder - users.push_token kaynağını kullanır."""
     try:
-        query = supabase.table("users").select("id, push_token, driver_details, driver_online")
+        query = db.table("users").select("id, push_token, driver_details, driver_online")
         
         if target == "drivers":
             # Sadece sürücülere (driver_details olan)
@@ -12397,31 +13689,33 @@ async def send_bulk_push_notification(title: str, body: str, target: str = "all"
             # Sadece online sürücülere
             query = query.eq("driver_online", True)
         
-        result = query.execute()
+        result = await query.execute()
         
         if not result.data:
             return 0
         
-        user_ids = [
-            user["id"]
+        # Token'lar bu sorguda zaten var: push_dispatcher'a doğrudan (kullanıcı id'den yeniden çözümleme yok)
+        tokens = [
+            user["push_token"].strip()
             for user in result.data
             if user.get("id")
             and user.get("push_token")
-            and ExpoPushService.is_valid_token(user.get("push_token"))
+            and ExpoPushService.is_valid_token(user["push_token"].strip())
         ]
 
-        if not user_ids:
+        if not tokens:
             logger.info(f"📭 Push token'ı olan kullanıcı bulunamadı (target={target})")
             return 0
 
-        send_result = await send_push_notifications_to_users(user_ids, title, body, data)
-        sent_count = send_result["sent"]
+        send_result = await push_dispatcher.send(tokens, title, body, data)
+        ok_tokens = send_result["ok_tokens"]
+        sent_count = sum(1 for t in tokens if t in ok_tokens)
 
-        logger.info(f"📤 Toplu push gönderildi: {sent_count}/{send_result['total']} kullanıcı - {title}")
+        logger.info(f"📤 Toplu push gönderildi: {sent_count}/{len(tokens)} kullanıcı - {title}")
         
         # Admin bildirimini kaydet
         try:
-            supabase.table("admin_notifications_log").insert({
+            await db.table("admin_notifications_log").insert({
                 "title": title,
                 "body": body,
                 "target": target,
@@ -12453,7 +13747,7 @@ async def admin_send_push(admin_phone: str, title: str, body: str, target: str =
                 "sent_by": admin_phone,
                 "created_at": datetime.utcnow().isoformat()
             }
-            supabase.table("notifications").insert(notification_data).execute()
+            await db.table("notifications").insert(notification_data).execute()
         except Exception as save_err:
             logger.warning(f"Bildirim kaydedilemedi (tablo olmayabilir): {save_err}")
         
@@ -12472,15 +13766,15 @@ async def admin_send_push(admin_phone: str, title: str, body: str, target: str =
             # Hedef kitle sayıları (0 kişiye gidince nedenini göstermek için)
             try:
                 if target == "all":
-                    r = supabase.table("users").select("id, push_token").execute()
+                    r = await db.table("users").select("id, push_token").execute()
                     total_users = len(r.data or [])
                     users_with_token = sum(1 for u in (r.data or []) if u.get("push_token") and ExpoPushService.is_valid_token(u.get("push_token")))
                 elif target == "drivers":
-                    r = supabase.table("users").select("id, push_token, driver_details").not_.is_("driver_details", "null").execute()
+                    r = await db.table("users").select("id, push_token, driver_details").not_.is_("driver_details", "null").execute()
                     total_users = len(r.data or [])
                     users_with_token = sum(1 for u in (r.data or []) if u.get("push_token") and ExpoPushService.is_valid_token(u.get("push_token")))
                 elif target == "passengers":
-                    r = supabase.table("users").select("id, push_token, driver_details").execute()
+                    r = await db.table("users").select("id, push_token, driver_details").execute()
                     passengers = [u for u in (r.data or []) if not u.get("driver_details")]
                     total_users = len(passengers)
                     users_with_token = sum(1 for u in passengers if u.get("push_token") and ExpoPushService.is_valid_token(u.get("push_token")))
@@ -12514,7 +13808,7 @@ async def admin_get_notification_history(admin_phone: str, page: int = 1, limit:
         
         offset = (page - 1) * limit
         
-        result = supabase.table("admin_notifications").select("*", count="exact").order("created_at", desc=True).range(offset, offset + limit - 1).execute()
+        result = await db.table("admin_notifications").select("*", count="exact").order("created_at", desc=True).range(offset, offset + limit - 1).execute()
         
         return {
             "success": True,
@@ -12551,8 +13845,7 @@ async def reject_ride(tag_id: str, driver_id: str):
 async def get_dispatch_config_api():
     """Dispatch queue ayarlarını getir"""
     try:
-        config = await get_dispatch_config()
-        return {"success": True, "config": config}
+        return {"success": True, "config": dict(dispatch_config.get()), "version": dispatch_config.version}
     except Exception as e:
         return {"success": False, "error": str(e)}
 
@@ -12561,24 +13854,14 @@ async def update_dispatch_config_api(request: Request):
     """Dispatch queue ayarlarını güncelle (Admin only)"""
     try:
         body = await request.json()
+        if not isinstance(body, dict):
+            return {"success": False, "error": "config JSON nesnesi olmalı"}
         
-        # Config tablosuna kaydet
-        import json
-        config_value = json.dumps(body)
-        
-        # Upsert - varsa güncelle, yoksa ekle
-        try:
-            existing = supabase.table("config").select("*").eq("key", "dispatch_config").execute()
-            if existing.data:
-                supabase.table("config").update({"value": config_value}).eq("key", "dispatch_config").execute()
-            else:
-                supabase.table("config").insert({"key": "dispatch_config", "value": config_value}).execute()
-        except:
-            # Tablo yoksa in-memory güncelle
-            DISPATCH_CONFIG.update(body)
+        # Config tablosuna kaydet (tablo yoksa yalnızca bellekte), sürümü artır, tüm worker'lara yayınla
+        version = await dispatch_config.save(body)
         
-        logger.info(f"✅ Dispatch config güncellendi: {body}")
-        return {"success": True, "config": body}
+        logger.info(f"✅ Dispatch config güncellendi (sürüm {version}): {body}")
+        return {"success": True, "config": body, "version": version}
     except Exception as e:
         logger.error(f"❌ Update dispatch config error: {e}")
         return {"success": False, "error": str(e)}
@@ -12587,11 +13870,11 @@ async def update_dispatch_config_api(request: Request):
 async def get_dispatch_queue(tag_id: str):
     """Belirli bir tag için dispatch queue durumunu getir (yolcu bekleme ekranı için özet alanlar)."""
     try:
-        queue = list(dispatch_queues.get(tag_id, []) or [])
+        queue = list(await dispatch_queues.get(tag_id, []) or [])
         if not queue:
             try:
                 result = (
-                    supabase.table("dispatch_queue")
+                    await db.table("dispatch_queue")
                     .select("*")
                     .eq("tag_id", tag_id)
                     .order("priority")
@@ -12601,8 +13884,7 @@ async def get_dispatch_queue(tag_id: str):
             except Exception:
                 queue = []
 
-        cfg = await get_dispatch_config()
-        timeout_default = int(cfg.get("driver_offer_timeout", 10) or 10)
+        timeout_default = dispatch_config.driver_offer_timeout or 10
         total_drivers = len(queue)
         current_index = 0
         timeout_remaining = timeout_default
@@ -12676,7 +13958,7 @@ async def community_city_join_request(user_id: str, requested_city: str):
         rid = await resolve_user_id(user_id)
         city_clean = (requested_city or "").strip()
         prof = (
-            supabase.table("users")
+            await db.table("users")
             .select("name, phone, city, driver_details")
             .eq("id", rid)
             .limit(1)
@@ -12705,7 +13987,7 @@ async def community_city_join_request(user_id: str, requested_city: str):
             "status": "pending",
             "created_at": datetime.utcnow().isoformat(),
         }
-        supabase.table("reports").insert(report_data).execute()
+        await db.table("reports").insert(report_data).execute()
         logger.info(f"📬 Muhabbet şehir talebi: {city_clean} — user {rid}")
         return {"success": True, "message": "Talebiniz yöneticilere iletildi."}
     except Exception as e:
@@ -12717,13 +13999,13 @@ async def community_city_join_request(user_id: str, requested_city: str):
 async def get_community_messages(limit: int = 50, offset: int = 0, city: Optional[str] = None):
     """Son mesajları getir (şehir ve sayfalama destekli)"""
     try:
-        query = supabase.table("community_messages").select("*")
+        query = db.table("community_messages").select("*")
         
         # Şehir filtresi
         if city:
             query = query.eq("city", city)
         
-        response = query.order("created_at", desc=True).range(offset, offset + limit - 1).execute()
+        response = await query.order("created_at", desc=True).range(offset, offset + limit - 1).execute()
         
         return {"success": True, "messages": response.data, "count": len(response.data)}
     except Exception as e:
@@ -12732,12 +14014,9 @@ async def get_community_messages(limit: int = 50, offset: int = 0, city: Optiona
 
 @api_router.get("/community/online-count")
 async def community_online_count(city: str):
-    """Şehirdeki online kullanıcı sayısı (yaklaşık)"""
+    """Şehirdeki online kullanıcı sayısı (socket kayıtlı kullanıcılar — presence kaydı)"""
     try:
-        # Son 5 dakikada aktif kullanıcıları say
-        five_mins_ago = (datetime.utcnow() - timedelta(minutes=5)).isoformat()
-        result = supabase.table("users").select("id", count="exact").eq("city", city).gte("last_active", five_mins_ago).execute()
-        return {"count": result.count or 0}
+        return {"count": await online_user_count(city)}
     except Exception as e:
         # Fallback: rastgele sayı
         import random
@@ -12786,7 +14065,7 @@ async def create_community_message(msg: CommunityMessageCreate):
             "city": msg.city or "Genel"
         }
         
-        response = supabase.table("community_messages").insert(data).execute()
+        response = await db.table("community_messages").insert(data).execute()
         
         if response.data:
             return {"success": True, "message": response.data[0]}
@@ -12801,7 +14080,7 @@ async def like_community_message(req: CommunityLikeRequest):
     """Mesajı beğen"""
     try:
         # Önce mevcut likes_count'u al
-        response = supabase.table("community_messages")\
+        response = await db.table("community_messages")\
             .select("likes_count")\
             .eq("id", req.message_id)\
             .single()\
@@ -12814,7 +14093,7 @@ async def like_community_message(req: CommunityLikeRequest):
         new_likes = current_likes + 1
         
         # Güncelle
-        update_response = supabase.table("community_messages")\
+        update_response = await db.table("community_messages")\
             .update({"likes_count": new_likes})\
             .eq("id", req.message_id)\
             .execute()
@@ -12842,7 +14121,7 @@ async def delete_community_message(message_id: str, user_id: str):
     """Kendi mesajını sil"""
     try:
         # Sadece kendi mesajını silebilir
-        response = supabase.table("community_messages")\
+        response = await db.table("community_messages")\
             .delete()\
             .eq("id", message_id)\
             .eq("user_id", user_id)\
@@ -12872,7 +14151,7 @@ async def delete_user_account(
         logger.warning(f"🗑️ HESAP SİLME İSTEĞİ: {user_id}")
         
         # 1. Kullanıcıyı bul
-        user_result = supabase.table("users").select("*").eq("id", user_id).limit(1).execute()
+        user_result = await db.table("users").select("*").eq("id", user_id).limit(1).execute()
         
         if not user_result.data:
             return {"success": False, "error": "Kullanıcı bulunamadı"}
@@ -12880,7 +14159,7 @@ async def delete_user_account(
         user = user_result.data[0]
         
         # 2. Kullanıcıyı devre dışı bırak (soft delete)
-        supabase.table("users").update({
+        await db.table("users").update({
             "is_active": False,
             "is_banned": True,
             "deleted_at": datetime.utcnow().isoformat(),
@@ -12891,20 +14170,20 @@ async def delete_user_account(
         }).eq("id", user_id).execute()
         
         # 3. Aktif TAG'leri iptal et
-        supabase.table("tags").update({
+        await db.table("tags").update({
             "status": "cancelled",
             "cancelled_at": datetime.utcnow().isoformat(),
             "cancel_reason": "account_deleted"
         }).eq("passenger_id", user_id).in_("status", ["waiting", "pending", "offers_received", "matched", "in_progress"]).execute()
         
-        supabase.table("tags").update({
+        await db.table("tags").update({
             "status": "cancelled",
             "cancelled_at": datetime.utcnow().isoformat(),
             "cancel_reason": "account_deleted"
         }).eq("driver_id", user_id).in_("status", ["matched", "in_progress"]).execute()
         
         # 4. Community mesajlarını anonimleştir (kolon adı insert ile aynı: name)
-        supabase.table("community_messages").update({
+        await db.table("community_messages").update({
             "name": "Silinmiş Kullanıcı",
             "user_id": None,
         }).eq("user_id", user_id).execute()
@@ -12946,41 +14225,36 @@ async def get_nearby_drivers(
     try:
         pref = _canonical_vehicle_kind(passenger_vehicle_kind)
         now = datetime.utcnow().isoformat()
-        q = supabase.table("users").select(
+        q = db.table("users").select(
             "id, name, latitude, longitude, rating, driver_details"
         ).eq("driver_online", True)
-        drivers_result = _apply_driver_active_until_filter(q, now).execute()
-        
+        drivers_result = await _apply_driver_active_until_filter(q, now).execute()
+        rows = drivers_result.data or []
+        if pref is not None:
+            rows = [d for d in rows if _effective_driver_vehicle_kind(d) == pref]
+
+        # Tüm satırlar tek vektörel geçişte; sonuç yakından uzağa
+        pts = GeoPoints.from_rows(rows)
+        idx, dists = pts.within(lat, lng, radius_km)
         nearby_drivers = []
-        for driver in (drivers_result.data or []):
-            if pref is not None:
-                if _effective_driver_vehicle_kind(driver) != pref:
-                    continue
-            d_lat = driver.get("latitude")
-            d_lng = driver.get("longitude")
-            if d_lat and d_lng:
-                distance = haversine_distance(lat, lng, d_lat, d_lng)
-                if distance <= radius_km:
-                    vehicle = None
-                    if driver.get("driver_details"):
-                        details = driver["driver_details"]
-                        if isinstance(details, dict):
-                            vehicle = f"{details.get('vehicle_brand', '')} {details.get('vehicle_model', '')}".strip()
-                    
-                    vk_drv = _effective_driver_vehicle_kind(driver)
-                    nearby_drivers.append({
-                        "id": driver["id"],
-                        "name": driver.get("name", "Sürücü"),
-                        "latitude": d_lat,
-                        "longitude": d_lng,
-                        "rating": driver.get("rating"),
-                        "vehicle": vehicle,
-                        "distance_km": round(distance, 1),
-                        "vehicle_kind": vk_drv,
-                    })
-        
-        # Mesafeye göre sırala
-        nearby_drivers.sort(key=lambda x: x["distance_km"])
+        for driver, distance in zip(pts.take(idx), dists):
+            vehicle = None
+            if driver.get("driver_details"):
+                details = driver["driver_details"]
+                if isinstance(details, dict):
+                    vehicle = f"{details.get('vehicle_brand', '')} {details.get('vehicle_model', '')}".strip()
+
+            vk_drv = _effective_driver_vehicle_kind(driver)
+            nearby_drivers.append({
+                "id": driver["id"],
+                "name": driver.get("name", "Sürücü"),
+                "latitude": driver.get("latitude"),
+                "longitude": driver.get("longitude"),
+                "rating": driver.get("rating"),
+                "vehicle": vehicle,
+                "distance_km": round(distance, 1),
+                "vehicle_kind": vk_drv,
+            })
         
         return {
             "success": True,
@@ -13011,7 +14285,7 @@ async def get_nearby_activity(
             try:
                 rid = await resolve_user_id(did)
                 du = (
-                    supabase.table("users")
+                    await db.table("users")
                     .select("driver_details")
                     .eq("id", rid)
                     .limit(1)
@@ -13022,38 +14296,35 @@ async def get_nearby_activity(
             except Exception:
                 pass
         # 1. Yakındaki aktif (bekleyen) yolculukları al
-        active_tags = supabase.table("tags").select(
+        active_tags = await db.table("tags").select(
             "id, pickup_lat, pickup_lng, pickup_location, status, final_price, passenger_preferred_vehicle"
         ).eq("status", "waiting").execute()
         
         nearby_tags = []
         region_counts = {}  # Bölge yoğunluğu
         
-        for tag in (active_tags.data or []):
-            tag_lat = tag.get("pickup_lat")
-            tag_lng = tag.get("pickup_lng")
-            if tag_lat and tag_lng:
-                distance = haversine_distance(lat, lng, tag_lat, tag_lng)
-                if distance <= radius_km:
-                    if driver_eff_map is not None:
-                        pref_tag = _trip_passenger_vehicle_pref(tag, None)
-                        if not _driver_matches_passenger_vehicle_pref(driver_eff_map, pref_tag):
-                            continue
-                    nearby_tags.append({
-                        "id": tag["id"],
-                        "lat": tag_lat,
-                        "lng": tag_lng,
-                        "location": tag.get("pickup_location", ""),
-                        "price": tag.get("final_price", 0),
-                        "distance_km": round(distance, 1)
-                    })
-                    
-                    # Bölge yoğunluğu hesapla
-                    location = tag.get("pickup_location", "")
-                    if location:
-                        # İlk kelimeyi bölge olarak al (örn: "Çankaya")
-                        region = location.split(",")[0].split("/")[0].strip()
-                        region_counts[region] = region_counts.get(region, 0) + 1
+        tag_pts = GeoPoints.from_rows(active_tags.data, "pickup_lat", "pickup_lng")
+        tag_idx, tag_dists = tag_pts.within(lat, lng, radius_km, sort=False)
+        for tag, distance in zip(tag_pts.take(tag_idx), tag_dists):
+            if driver_eff_map is not None:
+                pref_tag = _trip_passenger_vehicle_pref(tag, None)
+                if not _driver_matches_passenger_vehicle_pref(driver_eff_map, pref_tag):
+                    continue
+            nearby_tags.append({
+                "id": tag["id"],
+                "lat": tag.get("pickup_lat"),
+                "lng": tag.get("pickup_lng"),
+                "location": tag.get("pickup_location", ""),
+                "price": tag.get("final_price", 0),
+                "distance_km": round(distance, 1)
+            })
+            
+            # Bölge yoğunluğu hesapla
+            location = tag.get("pickup_location", "")
+            if location:
+                # İlk kelimeyi bölge olarak al (örn: "Çankaya")
+                region = location.split(",")[0].split("/")[0].strip()
+                region_counts[region] = region_counts.get(region, 0) + 1
         
         # 2. Yoğun bölgeleri belirle (2+ istek olan yerler)
         busy_regions = [
@@ -13063,18 +14334,13 @@ async def get_nearby_activity(
         
         # 3. Yakındaki online sürücü sayısı (isteğe bağlı araç tipi filtresi)
         now = datetime.utcnow().isoformat()
-        q = supabase.table("users").select("id, latitude, longitude, driver_details").eq("driver_online", True)
-        drivers_result = _apply_driver_active_until_filter(q, now).execute()
+        q = db.table("users").select("id, latitude, longitude, driver_details").eq("driver_online", True)
+        drivers_result = await _apply_driver_active_until_filter(q, now).execute()
         
-        nearby_drivers = 0
-        for d in (drivers_result.data or []):
-            if pref is not None:
-                if _effective_driver_vehicle_kind(d) != pref:
-                    continue
-            d_lat, d_lng = d.get("latitude"), d.get("longitude")
-            if d_lat and d_lng:
-                if haversine_distance(lat, lng, d_lat, d_lng) <= radius_km:
-                    nearby_drivers += 1
+        driver_rows = drivers_result.data or []
+        if pref is not None:
+            driver_rows = [d for d in driver_rows if _effective_driver_vehicle_kind(d) == pref]
+        nearby_drivers = GeoPoints.from_rows(driver_rows).count_within(lat, lng, radius_km)
         
         return {
             "success": True,
@@ -13092,7 +14358,7 @@ async def get_nearby_activity(
 async def get_driver_status(user_id: str):
     """Sürücünün aktif durumunu ve kalan süresini getir"""
     try:
-        result = supabase.table("users").select("driver_active_until, driver_online, driver_details").eq("id", user_id).execute()
+        result = await db.table("users").select("driver_active_until, driver_online, driver_details").eq("id", user_id).execute()
         
         if not result.data:
             return {"success": False, "detail": "Kullanıcı bulunamadı"}
@@ -13152,9 +14418,11 @@ async def get_driver_status(user_id: str):
                     }
                 else:
                     # Süre dolmuş - otomatik offline yap
-                    supabase.table("users").update({
+                    await db.table("users").update({
                         "driver_online": False
                     }).eq("id", user_id).execute()
+                    await invalidate_driver_state(user_id)
+                    driver_geo_index.remove(user_id)
                     
                     return {
                         "success": True,
@@ -13196,7 +14464,7 @@ async def activate_driver_package(user_id: str, package_id: str):
             return {"success": False, "detail": "En az 24 saatlik paket satın alabilirsiniz"}
         
         # Kullanıcı kontrolü
-        result = supabase.table("users").select("driver_details, driver_active_until").eq("id", user_id).execute()
+        result = await db.table("users").select("driver_details, driver_active_until").eq("id", user_id).execute()
         if not result.data:
             return {"success": False, "detail": "Kullanıcı bulunamadı"}
         
@@ -13229,15 +14497,17 @@ async def activate_driver_package(user_id: str, package_id: str):
             new_until = now + timedelta(hours=hours)
         
         # Güncelle
-        supabase.table("users").update({
+        await db.table("users").update({
             "driver_active_until": new_until.isoformat(),
             "driver_online": True,
             "updated_at": now.isoformat()
         }).eq("id", user_id).execute()
+        await invalidate_driver_state(user_id)
+        await driver_geo_index_refresh_driver(user_id)
         
         # Paket satın alma logunu kaydet
         try:
-            supabase.table("driver_package_purchases").insert({
+            await db.table("driver_package_purchases").insert({
                 "user_id": user_id,
                 "package_id": package_id,
                 "package_name": package["name"],
@@ -13266,10 +14536,12 @@ async def activate_driver_package(user_id: str, package_id: str):
 async def driver_go_offline(user_id: str):
     """Sürücüyü offline yap (manuel)"""
     try:
-        supabase.table("users").update({
+        await db.table("users").update({
             "driver_online": False,
             "updated_at": datetime.utcnow().isoformat()
         }).eq("id", user_id).execute()
+        driver_geo_index.remove(user_id)
+        await invalidate_driver_state(user_id)
         
         logger.info(f"🔴 Sürücü offline oldu: {user_id}")
         return {"success": True, "message": "Offline oldunuz"}
@@ -13281,7 +14553,7 @@ async def driver_go_offline(user_id: str):
 async def driver_go_online(user_id: str):
     """Sürücüyü online yap (aktif paketi varsa). Admin numaraları otomatik 1 yıl paket alır."""
     try:
-        result = supabase.table("users").select("phone, driver_active_until, driver_details").eq("id", user_id).execute()
+        result = await db.table("users").select("phone, driver_active_until, driver_details").eq("id", user_id).execute()
         if not result.data:
             return {"success": False, "detail": "Kullanıcı bulunamadı"}
         
@@ -13296,10 +14568,11 @@ async def driver_go_online(user_id: str):
             if not driver_active_until:
                 now_admin = datetime.utcnow()
                 admin_until = (now_admin + timedelta(days=365)).isoformat()
-                supabase.table("users").update({
+                await db.table("users").update({
                     "driver_active_until": admin_until,
                     "updated_at": now_admin.isoformat()
                 }).eq("id", user_id).execute()
+                await invalidate_driver_state(user_id)
                 driver_active_until = admin_until
         else:
             # KYC kontrolü (admin değilse)
@@ -13320,10 +14593,12 @@ async def driver_go_online(user_id: str):
             except Exception:
                 return {"success": False, "detail": "Paket süresi kontrol edilemedi"}
         
-        supabase.table("users").update({
+        await db.table("users").update({
             "driver_online": True,
             "updated_at": datetime.utcnow().isoformat()
         }).eq("id", user_id).execute()
+        await invalidate_driver_state(user_id)
+        await driver_geo_index_refresh_driver(user_id)
         
         logger.info(f"🟢 Sürücü online oldu: {user_id}")
         return {"success": True, "message": "Online oldunuz"}
@@ -13343,7 +14618,7 @@ async def get_driver_dashboard(user_id: str):
     """Sürücü dashboard bilgilerini getir - Kazanç paneli için"""
     try:
         # 1. Kullanıcı bilgilerini al
-        user_result = supabase.table("users").select("*").eq("id", user_id).execute()
+        user_result = await db.table("users").select("*").eq("id", user_id).execute()
         if not user_result.data:
             return {"success": False, "detail": "Kullanıcı bulunamadı"}
         
@@ -13357,10 +14632,11 @@ async def get_driver_dashboard(user_id: str):
         if is_admin and not driver_active_until:
             now_temp = datetime.utcnow()
             admin_until = (now_temp + timedelta(days=365)).isoformat()
-            supabase.table("users").update({
+            await db.table("users").update({
                 "driver_active_until": admin_until,
                 "updated_at": now_temp.isoformat()
             }).eq("id", user_id).execute()
+            await invalidate_driver_state(user_id)
             driver_active_until = admin_until
             user["driver_active_until"] = admin_until
         
@@ -13373,14 +14649,14 @@ async def get_driver_dashboard(user_id: str):
         week_start = (now - timedelta(days=days_since_monday)).replace(hour=0, minute=0, second=0, microsecond=0)
         
         # 3. Bugünkü tamamlanan yolculukları al
-        today_trips_result = supabase.table("tags").select("id, final_price, completed_at").eq("driver_id", user_id).eq("status", "completed").gte("completed_at", today_start.isoformat()).execute()
+        today_trips_result = await db.table("tags").select("id, final_price, completed_at").eq("driver_id", user_id).eq("status", "completed").gte("completed_at", today_start.isoformat()).execute()
         
         today_trips = today_trips_result.data or []
         today_trips_count = len(today_trips)
         today_earnings = sum([t.get("final_price", 0) or 0 for t in today_trips])
         
         # 4. Haftalık tamamlanan yolculukları al
-        weekly_trips_result = supabase.table("tags").select("id, final_price, completed_at").eq("driver_id", user_id).eq("status", "completed").gte("completed_at", week_start.isoformat()).execute()
+        weekly_trips_result = await db.table("tags").select("id, final_price, completed_at").eq("driver_id", user_id).eq("status", "completed").gte("completed_at", week_start.isoformat()).execute()
         
         weekly_trips = weekly_trips_result.data or []
         weekly_trips_count = len(weekly_trips)
@@ -13545,7 +14821,7 @@ async def log_login_attempt(user_id: str, phone: str, ip_address: str, device_id
             "country": "TR" if is_turkey_ip(ip_address) else "FOREIGN",
             "created_at": datetime.utcnow().isoformat()
         }
-        supabase.table("login_logs").insert(log_data).execute()
+        await db.table("login_logs").insert(log_data).execute()
     except Exception as e:
         logger.error(f"Login log error: {e}")
 
@@ -13566,7 +14842,7 @@ async def secure_login(request: Request, phone: str, pin: str, device_id: str =
             )
         
         # Kullanıcıyı bul (905 / 5XX kayıt uyumu)
-        user = _users_get_by_phone_flexible(canonical)
+        user = await _supabase_core.run_db(_users_get_by_phone_flexible, canonical)
         
         if not user:
             await log_login_attempt(None, canonical, client_ip, device_id, device_info, False, "USER_NOT_FOUND")
@@ -13587,7 +14863,7 @@ async def secure_login(request: Request, phone: str, pin: str, device_id: str =
             raise HTTPException(status_code=401, detail="Yanlış PIN")
         
         # Başarılı giriş - güncelle
-        supabase.table("users").update({
+        await db.table("users").update({
             "last_login": datetime.utcnow().isoformat(),
             "last_ip": client_ip,
             "last_device_id": device_id,
@@ -13631,7 +14907,7 @@ async def admin_soft_delete_user(admin_phone: str, user_id: str, reason: str = "
             raise HTTPException(status_code=403, detail="Admin yetkisi gerekli")
         
         # Sadece is_active = false yaparak hesabı devre dışı bırak
-        supabase.table("users").update({
+        await db.table("users").update({
             "is_active": False,
             "updated_at": datetime.utcnow().isoformat()
         }).eq("id", user_id).execute()
@@ -13650,10 +14926,12 @@ async def admin_set_driver_offline(admin_phone: str, driver_id: str):
         if admin_phone not in ADMIN_PHONE_NUMBERS:
             raise HTTPException(status_code=403, detail="Admin yetkisi gerekli")
         
-        supabase.table("users").update({
+        await db.table("users").update({
             "driver_online": False,
             "updated_at": datetime.utcnow().isoformat()
         }).eq("id", driver_id).execute()
+        await invalidate_driver_state(driver_id)
+        driver_geo_index.remove(driver_id)
         
         return {"success": True, "message": "Sürücü offline yapıldı"}
     except Exception as e:
@@ -13668,7 +14946,7 @@ async def admin_get_online_drivers(admin_phone: str):
         if admin_phone not in ADMIN_PHONE_NUMBERS:
             raise HTTPException(status_code=403, detail="Admin yetkisi gerekli")
         
-        result = supabase.table("users").select(
+        result = await db.table("users").select(
             "id, name, phone, city, rating, latitude, longitude, driver_online, driver_active_until, last_activity"
         ).eq("driver_online", True).execute()
         
@@ -13700,7 +14978,7 @@ async def admin_get_active_trips(admin_phone: str):
             raise HTTPException(status_code=403, detail="Admin yetkisi gerekli")
         
         # Aktif ve eşleşmiş yolculukları getir
-        result = supabase.table("tags").select("*").in_("status", ["waiting", "matched", "in_progress"]).execute()
+        result = await db.table("tags").select("*").in_("status", ["waiting", "matched", "in_progress"]).execute()
         
         trips = []
         for tag in (result.data or []):
@@ -13710,12 +14988,12 @@ async def admin_get_active_trips(admin_phone: str):
             
             try:
                 if tag.get("passenger_id"):
-                    p_result = supabase.table("users").select("name, phone").eq("id", tag["passenger_id"]).execute()
+                    p_result = await db.table("users").select("name, phone").eq("id", tag["passenger_id"]).execute()
                     if p_result.data:
                         passenger_name = f"{p_result.data[0].get('name', '-')} ({p_result.data[0].get('phone', '')})"
                 
                 if tag.get("driver_id"):
-                    d_result = supabase.table("users").select("name, phone").eq("id", tag["driver_id"]).execute()
+                    d_result = await db.table("users").select("name, phone").eq("id", tag["driver_id"]).execute()
                     if d_result.data:
                         driver_name = f"{d_result.data[0].get('name', '-')} ({d_result.data[0].get('phone', '')})"
             except:
@@ -13747,12 +15025,12 @@ async def admin_get_login_logs_full(admin_phone: str, page: int = 1, limit: int
         
         offset = (page - 1) * limit
         
-        query = supabase.table("login_logs").select("*", count="exact").order("created_at", desc=True)
+        query = db.table("login_logs").select("*", count="exact").order("created_at", desc=True)
         
         if filter_country:
             query = query.eq("country", filter_country)
         
-        result = query.range(offset, offset + limit - 1).execute()
+        result = await query.range(offset, offset + limit - 1).execute()
         
         return {
             "success": True, 
@@ -13773,7 +15051,7 @@ async def admin_get_promotions(admin_phone: str):
         if admin_phone not in ADMIN_PHONE_NUMBERS:
             raise HTTPException(status_code=403, detail="Admin yetkisi gerekli")
         
-        result = supabase.table("promotions").select("*").order("created_at", desc=True).execute()
+        result = await db.table("promotions").select("*").order("created_at", desc=True).execute()
         
         return {"success": True, "promotions": result.data or []}
     except Exception as e:
@@ -13800,7 +15078,7 @@ async def admin_create_promotion(admin_phone: str, code: str = None, hours: int
             "created_at": datetime.utcnow().isoformat()
         }
         
-        result = supabase.table("promotions").insert(promo_data).execute()
+        result = await db.table("promotions").insert(promo_data).execute()
         
         return {"success": True, "promotion": result.data[0] if result.data else promo_data}
     except Exception as e:
@@ -13814,7 +15092,7 @@ async def admin_toggle_promotion(admin_phone: str, promo_id: str, is_active: boo
         if admin_phone not in ADMIN_PHONE_NUMBERS:
             raise HTTPException(status_code=403, detail="Admin yetkisi gerekli")
         
-        supabase.table("promotions").update({"is_active": is_active}).eq("id", promo_id).execute()
+        await db.table("promotions").update({"is_active": is_active}).eq("id", promo_id).execute()
         
         return {"success": True, "message": f"Promosyon {'aktif' if is_active else 'pasif'} yapıldı"}
     except Exception as e:
@@ -13841,7 +15119,7 @@ async def admin_test_push(payload: AdminTestPushRequest):
     """
     try:
         user_result = (
-            supabase
+            await db
             .table("users")
             .select("id, name, push_token")
             .eq("id", payload.user_id)
@@ -13888,18 +15166,18 @@ async def admin_send_push_notification(admin_phone: str, title: str, message: st
         target_rows = []
         
         if target == "all":
-            result = supabase.table("users").select("id, push_token").execute()
+            result = await db.table("users").select("id, push_token").execute()
             target_rows = result.data or []
         elif target == "drivers":
-            result = supabase.table("users").select("id, push_token").eq("driver_online", True).execute()
+            result = await db.table("users").select("id, push_token").eq("driver_online", True).execute()
             target_rows = result.data or []
         elif target == "passengers":
             # Driver olmayan kullanıcılar
-            result = supabase.table("users").select("id, push_token, driver_online").execute()
+            result = await db.table("users").select("id, push_token, driver_online").execute()
             target_rows = [u for u in (result.data or []) if not u.get("driver_online")]
         elif target == "specific" and user_ids:
             ids = [uid.strip() for uid in user_ids.split(",")]
-            result = supabase.table("users").select("id, push_token").in_("id", ids).execute()
+            result = await db.table("users").select("id, push_token").in_("id", ids).execute()
             target_rows = result.data or []
         
         token_user_ids = [
@@ -13918,7 +15196,7 @@ async def admin_send_push_notification(admin_phone: str, title: str, message: st
         failed_count = push_result["failed"]
         
         # Log kaydet
-        supabase.table("notification_logs").insert({
+        await db.table("notification_logs").insert({
             "id": str(uuid.uuid4()),
             "admin_phone": admin_phone,
             "title": title,
@@ -13960,9 +15238,9 @@ async def get_directions(origin_lat: float, origin_lng: float, dest_lat: float,
             "key": GOOGLE_MAPS_API_KEY,
         }
         
-        async with httpx.AsyncClient(http2=False, timeout=30) as client:
-            response = await client.get(url, params=params, timeout=10.0)
-            data = response.json()
+        client = get_http_client("google_maps")
+        response = await client.get(url, params=params, timeout=10.0)
+        data = response.json()
         
         if data.get("status") != "OK":
             return {"success": False, "error": data.get("status")}
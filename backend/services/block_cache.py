@@ -0,0 +1,175 @@
+"""
+Engelleme ilişkisi önbelleği — kullanıcı → engellediği + onu engelleyen kullanıcılar (simetrik küme, TTL'li).
+
+Sürücü akışları (driver/requests, nearby-passengers-map, yolcu teklif listesi) her poll'da iki blocked_users
+sorgusu (engellediklerim + beni engelleyenler) yapıyordu. Burada:
+- get(id): önbellekte taze küme varsa DB'ye gitmez; filtre = küme üyeliği
+- prefetch(ids): eksik kullanıcılar tek loader çağrısıyla (socket register'da arka planda)
+- invalidate(a, b): /user/block ve /user/unblock sonrası iki tarafın kümesi düşer; kullanıcı başına nesil
+  sayacı artar → o sırada uçuşta olan yükleme (engel öncesi okunmuş) sonucu yazılmaz
+- Aynı kullanıcı için eşzamanlı ıskalar tek yüklemeyi (uçuştaki future) bekler
+
+Ortam: BLOCK_CACHE_TTL_SEC (varsayılan 300). Yalnızca event loop içinden kullanılır (kilit yok).
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, FrozenSet, Iterable, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+_EMPTY: FrozenSet[str] = frozenset()
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return max(0.0, float((os.getenv(name) or str(default)).strip()))
+    except (TypeError, ValueError):
+        return default
+
+
+def _key(user_id: Any) -> str:
+    return str(user_id).strip().lower() if user_id is not None else ""
+
+
+class BlockCache:
+    """
+    loader(ids): blocked_users satırları ({user_id, blocked_user_id}) — user_id VEYA blocked_user_id
+    ids içinde olanlar. user → frozenset(karşı taraf id'leri, küçük harf).
+    """
+
+    def __init__(
+        self,
+        loader: Callable[[List[str]], Awaitable[List[dict]]],
+        *,
+        ttl_sec: float = 300.0,
+        max_entries: int = 100000,
+    ) -> None:
+        self._loader = loader
+        self.ttl_sec = float(ttl_sec)
+        self.max_entries = max(1, int(max_entries))
+        self._sets: Dict[str, Tuple[FrozenSet[str], float]] = {}
+        self._generation: Dict[str, int] = {}
+        self._inflight: Dict[str, "asyncio.Future[None]"] = {}
+        self._counters: Dict[str, int] = {
+            "hits": 0,
+            "misses": 0,
+            "loads": 0,
+            "load_errors": 0,
+            "invalidations": 0,
+            "stale_loads": 0,
+            "coalesced": 0,
+        }
+
+    @classmethod
+    def from_env(cls, loader: Callable[[List[str]], Awaitable[List[dict]]]) -> "BlockCache":
+        return cls(loader, ttl_sec=_env_float("BLOCK_CACHE_TTL_SEC", 300.0))
+
+    def _fresh(self, uid: str) -> bool:
+        item = self._sets.get(uid)
+        return item is not None and time.monotonic() - item[1] < self.ttl_sec
+
+    async def prefetch(self, user_ids: Iterable[Any]) -> int:
+        """
+        Taze kümesi olmayan ve yüklemesi sürmeyen kullanıcıları tek loader çağrısıyla yükle; uçuştaki
+        yüklemeleri bekle. Dönüş: bu çağrının yüklediği kullanıcı sayısı.
+        """
+        wanted = [u for u in dict.fromkeys(_key(x) for x in user_ids) if u and not self._fresh(u)]
+        waiting = [self._inflight[u] for u in wanted if u in self._inflight]
+        missing = [u for u in wanted if u not in self._inflight]
+        if waiting:
+            self._counters["coalesced"] += len(waiting)
+        if not missing:
+            if waiting:
+                await asyncio.gather(*waiting, return_exceptions=True)
+            return 0
+        fut: "asyncio.Future[None]" = asyncio.get_running_loop().create_future()
+        for u in missing:
+            self._inflight[u] = fut
+        started_gen = {u: self._generation.get(u, 0) for u in missing}
+        try:
+            await self._load(missing, started_gen)
+        finally:
+            for u in missing:
+                if self._inflight.get(u) is fut:
+                    del self._inflight[u]
+            fut.set_result(None)
+        if waiting:
+            await asyncio.gather(*waiting, return_exceptions=True)
+        return len(missing)
+
+    async def _load(self, missing: List[str], started_gen: Dict[str, int]) -> None:
+        try:
+            rows = await self._loader(missing)
+        except Exception as e:
+            self._counters["load_errors"] += 1
+            logger.warning("Engelleme listesi yüklemesi başarısız (%s kullanıcı): %s", len(missing), e)
+            return
+        self._counters["loads"] += 1
+        if len(self._sets) + len(missing) > self.max_entries:
+            self._prune()
+        wanted = set(missing)
+        found: Dict[str, set] = {u: set() for u in missing}
+        for row in rows or []:
+            a, b = _key(row.get("user_id")), _key(row.get("blocked_user_id"))
+            if not a or not b:
+                continue
+            if a in wanted:
+                found[a].add(b)
+            if b in wanted:
+                found[b].add(a)
+        now = time.monotonic()
+        for uid, others in found.items():
+            if self._generation.get(uid, 0) != started_gen[uid]:
+                # Yükleme sürerken block / unblock oldu: okunan küme bayat, yazılmaz (sonraki get yeniden yükler)
+                self._counters["stale_loads"] += 1
+                continue
+            self._sets[uid] = (frozenset(others), now)
+
+    async def get(self, user_id: Any) -> FrozenSet[str]:
+        """Kullanıcının engellediği ve onu engelleyen id'ler. Yükleme başarısızsa RuntimeError (filtre atlanmaz)."""
+        uid = _key(user_id)
+        if not uid:
+            return _EMPTY
+        if self._fresh(uid):
+            self._counters["hits"] += 1
+            return self._sets[uid][0]
+        self._counters["misses"] += 1
+        for _attempt in range(2):
+            gen = self._generation.get(uid, 0)
+            await self.prefetch([uid])
+            item = self._sets.get(uid)
+            if item is not None or self._generation.get(uid, 0) == gen:
+                break
+            # Yükleme sürerken invalidate geldi, sonuç atıldı: bir kez taze okuma
+        if item is None:
+            raise RuntimeError("engelleme listesi yüklenemedi")
+        return item[0]
+
+    def invalidate(self, *user_ids: Any) -> None:
+        for u in user_ids:
+            uid = _key(u)
+            if not uid:
+                continue
+            self._generation[uid] = self._generation.get(uid, 0) + 1
+            if self._sets.pop(uid, None) is not None:
+                self._counters["invalidations"] += 1
+
+    def clear(self) -> None:
+        self._sets.clear()
+
+    def _prune(self) -> None:
+        cutoff = time.monotonic() - self.ttl_sec
+        for uid in [u for u, (_s, ts) in self._sets.items() if ts < cutoff]:
+            self._sets.pop(uid, None)
+        if len(self._sets) >= self.max_entries:
+            self._sets.clear()
+        if len(self._generation) >= self.max_entries:
+            # Uçuştaki yüklemelerin nesli korunur; düşen nesil 0'a döner → o anki eski yükleme yine atılır
+            self._generation = {u: g for u, g in self._generation.items() if u in self._inflight}
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self._counters, "entries": len(self._sets), "ttl_sec": self.ttl_sec}
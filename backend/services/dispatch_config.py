@@ -0,0 +1,191 @@
+"""
+Sürümlü ayar önbelleği — config tablosundaki JSON ayarın süreç içi dondurulmuş kopyası.
+
+get_dispatch_config() her çağrıda config tablosunu okuyup json.loads yapıyordu (her yeni tag / online olan
+her sürücü için). Burada:
+- get(): varsayılanlar + kayıtlı değerler, MappingProxyType (salt okunur), G/Ç yok
+- Kayıtlı JSON içinde `_version` tutulur; save() sürümü artırır, satırı yazar ve paylaşılan duruma
+  (services/shared_state.py) `config_changed` yayınlar → tüm worker'lar yeni değeri DB'ye gitmeden uygular
+- Kaçan yayınlara karşı CONFIG_REFRESH_SEC aralıkla DB'den tazeleme (yalnızca daha yeni sürüm uygulanır;
+  `_version` taşımayan eski / elle düzenlenmiş satır her tazelemede içerik değiştiyse yeniden uygulanır)
+
+DispatchConfig: max_driver_dispatch / matching_radius_km / driver_offer_timeout / enabled tipli erişimcileri.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+from types import MappingProxyType
+from typing import Any, Awaitable, Callable, Dict, Mapping, Optional
+
+logger = logging.getLogger(__name__)
+
+CONFIG_CHANGED_CHANNEL = "config_changed"
+VERSION_KEY = "_version"
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return max(1.0, float((os.getenv(name) or str(default)).strip()))
+    except (TypeError, ValueError):
+        return default
+
+
+class VersionedConfig:
+    """
+    Tek config anahtarı için önbellek. loader() → kayıtlı JSON metni (yoksa None);
+    saver(text) → satırı yazar. backend: publish/subscribe sunan paylaşılan durum.
+    """
+
+    def __init__(
+        self,
+        key: str,
+        defaults: Mapping[str, Any],
+        *,
+        loader: Callable[[], Awaitable[Optional[str]]],
+        saver: Callable[[str], Awaitable[None]],
+        backend: Any = None,
+        refresh_sec: float = 60.0,
+    ) -> None:
+        self.key = key
+        self._defaults = dict(defaults)
+        self._loader = loader
+        self._saver = saver
+        self._backend = backend
+        self.refresh_sec = float(refresh_sec)
+        self._version = 0
+        self._snapshot: Mapping[str, Any] = MappingProxyType(dict(self._defaults))
+        self._task: Optional[asyncio.Task] = None
+        self._counters: Dict[str, int] = {"loads": 0, "load_errors": 0, "applied": 0, "published": 0}
+
+    # ---------- okuma ----------
+
+    def get(self) -> Mapping[str, Any]:
+        """Dondurulmuş ayar (G/Ç yok)."""
+        return self._snapshot
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def _int(self, name: str, default: int) -> int:
+        try:
+            return int(self._snapshot.get(name, default))
+        except (TypeError, ValueError):
+            return default
+
+    def _float(self, name: str, default: float) -> float:
+        try:
+            return float(self._snapshot.get(name, default))
+        except (TypeError, ValueError):
+            return default
+
+    # ---------- uygulama ----------
+
+    def apply(self, values: Mapping[str, Any], version: int, *, force: bool = False) -> bool:
+        """
+        Daha yeni sürümse uygula. force=True (sürümsüz satır): sürüm karşılaştırılmaz, içerik değiştiyse
+        uygulanır ve mevcut sürüm korunur. Dönüş: uygulandı mı.
+        """
+        version = int(version or 0)
+        if not force and (version < self._version or (version == self._version and self._counters["applied"])):
+            return False
+        merged = {**self._defaults, **{k: v for k, v in dict(values).items() if k != VERSION_KEY}}
+        if force and self._counters["applied"] and merged == dict(self._snapshot):
+            return False
+        self._snapshot = MappingProxyType(merged)
+        self._version = max(version, self._version) if force else version
+        self._counters["applied"] += 1
+        return True
+
+    async def refresh(self) -> bool:
+        try:
+            raw = await self._loader()
+        except Exception as e:
+            self._counters["load_errors"] += 1
+            logger.warning("Ayar okunamadı (%s): %s", self.key, e)
+            return False
+        self._counters["loads"] += 1
+        if not raw:
+            return False
+        try:
+            values = json.loads(raw) if isinstance(raw, str) else dict(raw)
+        except (TypeError, ValueError) as e:
+            logger.warning("Ayar JSON geçersiz (%s): %s", self.key, e)
+            return False
+        return self.apply(values, int(values.get(VERSION_KEY) or 0), force=VERSION_KEY not in values)
+
+    async def save(self, values: Mapping[str, Any]) -> int:
+        """Sürümü artırıp kaydet ve tüm worker'lara yayınla. Dönüş: yeni sürüm."""
+        await self.refresh()
+        version = self._version + 1
+        stored = {**{k: v for k, v in dict(values).items() if k != VERSION_KEY}, VERSION_KEY: version}
+        try:
+            await self._saver(json.dumps(stored))
+        except Exception as e:
+            # Tablo yoksa yalnızca bellekte (eski davranış); yayın yine yapılır
+            logger.warning("Ayar kaydedilemedi (%s), yalnızca bellekte: %s", self.key, e)
+        self.apply(stored, version)
+        if self._backend is not None:
+            try:
+                await self._backend.publish(
+                    CONFIG_CHANGED_CHANNEL, {"key": self.key, "version": version, "values": stored}
+                )
+                self._counters["published"] += 1
+            except Exception as e:
+                logger.warning("Ayar değişikliği yayınlanamadı (%s): %s", self.key, e)
+        return version
+
+    async def _on_changed(self, message: Any) -> None:
+        if isinstance(message, dict) and message.get("key") == self.key:
+            if self.apply(message.get("values") or {}, int(message.get("version") or 0)):
+                logger.info("Ayar güncellendi (%s) sürüm=%s", self.key, self._version)
+
+    # ---------- yaşam döngüsü ----------
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.refresh_sec)
+            await self.refresh()
+
+    async def start(self) -> None:
+        """Startup: ilk yükleme + abonelik + periyodik tazeleme."""
+        await self.refresh()
+        if self._backend is not None:
+            await self._backend.subscribe(CONFIG_CHANGED_CHANNEL, self._on_changed)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self._counters, "key": self.key, "version": self._version}
+
+
+class DispatchConfig(VersionedConfig):
+    """dispatch_config anahtarı için tipli erişimciler."""
+
+    @classmethod
+    def from_env(cls, defaults: Mapping[str, Any], **kwargs: Any) -> "DispatchConfig":
+        return cls("dispatch_config", defaults, refresh_sec=_env_float("CONFIG_REFRESH_SEC", 60.0), **kwargs)
+
+    @property
+    def max_driver_dispatch(self) -> int:
+        return self._int("max_driver_dispatch", 10)
+
+    @property
+    def matching_radius_km(self) -> float:
+        return self._float("matching_radius_km", 20.0)
+
+    @property
+    def driver_offer_timeout(self) -> int:
+        return self._int("driver_offer_timeout", 10)
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self._snapshot.get("enabled", True))
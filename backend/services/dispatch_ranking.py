@@ -0,0 +1,74 @@
+"""
+Rolling dispatch aday sırası — etkin dispatch sırasında artımlı yeniden sıralama.
+
+Rolling state'teki `drivers` listesi iki bölgedir: [0:cursor) bu turda teklif gidenler, [cursor:) bekleyenler
+(rank_key'e göre sıralı). merge_candidates():
+- yeni / yer değiştirmiş sürücüleri bekleyen bölgeye sıralı ekler (en iyi sıradaki bir sonraki batch'e girer)
+- bekleyen bölgedeki düşen sürücüleri (çevrimdışı / yarıçap dışı) çıkarır
+- bu turda teklif almış sürücünün girdisini yerinde günceller (aynı turda ikinci teklif yok)
+Mevcut adayların rotası yeniden hesaplanmaz; yalnızca verilen güncellemeler uygulanır.
+"""
+from __future__ import annotations
+
+from bisect import bisect_right
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+def rank_key(entry: dict) -> Tuple[float, float]:
+    """Yakın olan önce, eşitlikte yüksek puan (find_eligible_drivers ile aynı sıra)."""
+    return (float(entry.get("distance_km") or 0.0), -float(entry.get("rating") or 0.0))
+
+
+def merge_candidates(
+    drivers: List[dict],
+    cursor: int,
+    updates: Iterable[dict],
+    drop_ids: Optional[Iterable[str]] = None,
+) -> Tuple[List[dict], int, Dict[str, int]]:
+    """
+    drivers/cursor üzerine güncellemeleri uygula. updates: eligible girdileri (driver_id anahtarlı).
+    Dönüş: (yeni liste, yeni cursor, {"added", "moved", "dropped"}).
+    """
+    cursor = max(0, min(int(cursor), len(drivers)))
+    offered = list(drivers[:cursor])
+    pending = list(drivers[cursor:])
+    counts = {"added": 0, "moved": 0, "dropped": 0}
+
+    drop = {str(d).strip().lower() for d in (drop_ids or [])}
+    if drop:
+        kept = [e for e in pending if str(e.get("driver_id")).strip().lower() not in drop]
+        counts["dropped"] = len(pending) - len(kept)
+        pending = kept
+
+    offered_pos: Dict[str, int] = {str(e.get("driver_id")).strip().lower(): i for i, e in enumerate(offered)}
+    pending_ids = {str(e.get("driver_id")).strip().lower() for e in pending}
+    for upd in updates:
+        did = str(upd.get("driver_id") or "").strip().lower()
+        if not did:
+            continue
+        if did in offered_pos:
+            offered[offered_pos[did]] = upd
+            counts["moved"] += 1
+            continue
+        if did in pending_ids:
+            pending = [e for e in pending if str(e.get("driver_id")).strip().lower() != did]
+            counts["moved"] += 1
+        else:
+            counts["added"] += 1
+        keys = [rank_key(e) for e in pending]
+        pending.insert(bisect_right(keys, rank_key(upd)), upd)
+        pending_ids.add(did)
+
+    return offered + pending, len(offered), counts
+
+
+def pending_driver_ids(drivers: List[dict], cursor: int) -> List[str]:
+    return [str(e.get("driver_id")).strip().lower() for e in drivers[max(0, int(cursor)):]]
+
+
+def known_positions(drivers: List[dict]) -> Dict[str, Tuple[Optional[float], Optional[float]]]:
+    """driver_id → rota hesaplandığı andaki (lat, lng) (eski girdilerde None)."""
+    out: Dict[str, Tuple[Optional[float], Optional[float]]] = {}
+    for e in drivers:
+        out[str(e.get("driver_id")).strip().lower()] = (e.get("lat"), e.get("lng"))
+    return out
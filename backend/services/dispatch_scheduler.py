@@ -0,0 +1,418 @@
+"""
+Kalıcı dispatch zamanlayıcısı — bellekte timing wheel, işler journal'a yazılır.
+
+Rolling dispatch'in 20 sn'lik batch zamanlayıcısı önceden `asyncio.create_task(sleep)` idi: deploy /
+restart anında tüm bekleyen tag'ler sahipsiz kalıyordu. Burada:
+
+- schedule(job_id, due_at, kind, payload): işi journal'a yaz + wheel'e koy (aynı job_id → üzerine yazar)
+- cancel(job_id): wheel + journal'dan sil
+- Wheel: DISPATCH_WHEEL_TICK_MS çözünürlüklü dairesel kovalar; döngü monoton saate göre bir sonraki tick'e
+  uyur, gecikmeyi (lag) ölçer, handler'ları ayrı task olarak çalıştırır (yavaş handler diğer zamanlayıcıları
+  geciktirmez)
+- Çalıştırmadan önce journal.claim(job): çoklu worker'da işi yalnızca bir süreç çalıştırır. Her schedule()
+  yeni bir token üretir; claim id + token ile karşılaştırıp siler — orphan poller'ın elindeki bayat kopya
+  aynı id ile yeniden planlanmış işi silemez
+- start(): journal'daki işleri yükler (restart sonrası kaldığı yerden); ayrıca DISPATCH_SCHEDULER_POLL_SEC
+  aralıkla süresi geçmiş işleri journal'dan toplar (işi planlayan worker öldüyse)
+
+Journal arka uçları: Redis sorted set (REDIS_URL), Supabase `dispatch_timers` tablosu
+(sql_migrations/create_dispatch_timers.sql) veya bellek (test / tek süreç, kalıcı değil).
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import math
+import os
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[[dict], Awaitable[None]]
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return max(0.0, float((os.getenv(name) or str(default)).strip()))
+    except (TypeError, ValueError):
+        return default
+
+
+def _job(job_id: str, due_at: float, kind: str, payload: Optional[dict], token: Optional[str] = None) -> dict:
+    """token: planlama örneği kimliği (None → yeni); token'sız eski journal kayıtlarında ""."""
+    return {
+        "id": job_id,
+        "due_at": float(due_at),
+        "kind": kind,
+        "payload": dict(payload or {}),
+        "token": uuid.uuid4().hex if token is None else token,
+    }
+
+
+# ==================== JOURNAL ====================
+
+
+class MemoryJobJournal:
+    """Süreç içi journal (kalıcı değil) — testler ve REDIS/tablo yokken."""
+
+    kind = "memory"
+
+    def __init__(self) -> None:
+        self._jobs: Dict[str, dict] = {}
+
+    async def add(self, job: dict) -> None:
+        self._jobs[job["id"]] = dict(job)
+
+    async def remove(self, job_id: str) -> None:
+        self._jobs.pop(job_id, None)
+
+    async def claim(self, job: dict) -> bool:
+        current = self._jobs.get(job["id"])
+        if current is None or current.get("token", "") != job.get("token", ""):
+            return False
+        del self._jobs[job["id"]]
+        return True
+
+    async def load_all(self) -> List[dict]:
+        return [dict(j) for j in self._jobs.values()]
+
+    async def load_due(self, before: float) -> List[dict]:
+        return [dict(j) for j in self._jobs.values() if j["due_at"] <= before]
+
+
+class RedisJobJournal:
+    """
+    Redis: sorted set (skor = due_at) + hash (iş gövdesi) + hash (token).
+    claim = Lua ile token karşılaştır + ZREM (tek kazanan, bayat kopya kaybeder).
+    """
+
+    kind = "redis"
+
+    _CLAIM_LUA = """
+if redis.call('HGET', KEYS[3], ARGV[1]) ~= ARGV[2] then
+  return 0
+end
+redis.call('ZREM', KEYS[1], ARGV[1])
+redis.call('HDEL', KEYS[2], ARGV[1])
+redis.call('HDEL', KEYS[3], ARGV[1])
+return 1
+"""
+
+    def __init__(self, client: Any, prefix: str = "leylek") -> None:
+        self._r = client
+        self._zkey = f"{prefix}:dispatch_timers:due"
+        self._hkey = f"{prefix}:dispatch_timers:jobs"
+        self._tkey = f"{prefix}:dispatch_timers:tokens"
+
+    async def add(self, job: dict) -> None:
+        pipe = self._r.pipeline()
+        pipe.hset(self._hkey, job["id"], json.dumps(job))
+        pipe.hset(self._tkey, job["id"], job["token"])
+        pipe.zadd(self._zkey, {job["id"]: job["due_at"]})
+        await pipe.execute()
+
+    async def remove(self, job_id: str) -> None:
+        pipe = self._r.pipeline()
+        pipe.zrem(self._zkey, job_id)
+        pipe.hdel(self._hkey, job_id)
+        pipe.hdel(self._tkey, job_id)
+        await pipe.execute()
+
+    async def claim(self, job: dict) -> bool:
+        if not job.get("token"):
+            # Token'sız eski kayıt: yalnızca id ile
+            if not await self._r.zrem(self._zkey, job["id"]):
+                return False
+            await self._r.hdel(self._hkey, job["id"])
+            return True
+        won = await self._r.eval(self._CLAIM_LUA, 3, self._zkey, self._hkey, self._tkey, job["id"], job["token"])
+        return bool(won)
+
+    async def _load(self, ids: List[Any]) -> List[dict]:
+        if not ids:
+            return []
+        raw = await self._r.hmget(self._hkey, ids)
+        return [json.loads(r) for r in raw if r]
+
+    async def load_all(self) -> List[dict]:
+        return await self._load(await self._r.zrange(self._zkey, 0, -1))
+
+    async def load_due(self, before: float) -> List[dict]:
+        return await self._load(await self._r.zrangebyscore(self._zkey, "-inf", before))
+
+
+class SupabaseJobJournal:
+    """
+    Supabase `dispatch_timers` tablosu. db: supabase_client.AsyncSupabase.
+    claim = DELETE ... WHERE id AND token RETURNING (silinen satır dönen süreç kazanır).
+    """
+
+    kind = "supabase"
+    table = "dispatch_timers"
+
+    def __init__(self, db: Any) -> None:
+        self._db = db
+
+    @staticmethod
+    def _to_row(job: dict) -> dict:
+        return {
+            "id": job["id"],
+            "kind": job["kind"],
+            "due_at": datetime.fromtimestamp(job["due_at"], tz=timezone.utc).isoformat(),
+            "payload": job["payload"],
+            "token": job["token"],
+        }
+
+    @staticmethod
+    def _from_row(row: dict) -> dict:
+        due = str(row.get("due_at") or "").replace("Z", "+00:00")
+        try:
+            dt = datetime.fromisoformat(due)
+            if dt.tzinfo is None:
+                dt = dt.replace(tzinfo=timezone.utc)
+            due_at = dt.timestamp()
+        except ValueError:
+            due_at = time.time()
+        return _job(
+            str(row["id"]), due_at, str(row.get("kind") or ""), row.get("payload") or {}, str(row.get("token") or "")
+        )
+
+    async def add(self, job: dict) -> None:
+        await self._db.table(self.table).upsert(self._to_row(job), on_conflict="id").execute()
+
+    async def remove(self, job_id: str) -> None:
+        await self._db.table(self.table).delete().eq("id", job_id).execute()
+
+    async def claim(self, job: dict) -> bool:
+        query = self._db.table(self.table).delete().eq("id", job["id"])
+        if job.get("token"):
+            query = query.eq("token", job["token"])
+        res = await query.execute()
+        return bool(res.data)
+
+    async def load_all(self) -> List[dict]:
+        res = await self._db.table(self.table).select("*").order("due_at").limit(5000).execute()
+        return [self._from_row(r) for r in (res.data or [])]
+
+    async def load_due(self, before: float) -> List[dict]:
+        cutoff = datetime.fromtimestamp(before, tz=timezone.utc).isoformat()
+        res = (
+            await self._db.table(self.table)
+            .select("*")
+            .lte("due_at", cutoff)
+            .order("due_at")
+            .limit(500)
+            .execute()
+        )
+        return [self._from_row(r) for r in (res.data or [])]
+
+
+# ==================== TIMING WHEEL ====================
+
+
+class DispatchScheduler:
+    """Tek seviyeli hashed timing wheel + journal."""
+
+    def __init__(
+        self,
+        journal: Any,
+        *,
+        tick_ms: float = 100.0,
+        slots: int = 1024,
+        poll_sec: float = 5.0,
+        orphan_grace_sec: float = 3.0,
+    ) -> None:
+        self.journal = journal
+        self.tick_sec = max(0.01, float(tick_ms) / 1000.0)
+        self.slots = max(8, int(slots))
+        self.poll_sec = float(poll_sec)
+        self.orphan_grace_sec = float(orphan_grace_sec)
+        self._wheel: List[Dict[str, dict]] = [dict() for _ in range(self.slots)]
+        self._slot_of: Dict[str, int] = {}
+        self._handlers: Dict[str, Handler] = {}
+        self._tick = 0
+        # Tick 0 = oluşturma anı; start() öncesi schedule() edilen işler de doğru kovaya düşer
+        self._origin_mono = time.monotonic()
+        self._origin_wall = time.time()
+        self._task: Optional[asyncio.Task] = None
+        self._poll_task: Optional[asyncio.Task] = None
+        self._running: set = set()
+        self._counters: Dict[str, float] = {
+            "scheduled": 0,
+            "cancelled": 0,
+            "fired": 0,
+            "claim_lost": 0,
+            "handler_errors": 0,
+            "recovered": 0,
+            "max_lag_ms": 0.0,
+            "total_lag_ms": 0.0,
+        }
+
+    @classmethod
+    def from_env(cls, journal: Any) -> "DispatchScheduler":
+        return cls(
+            journal,
+            tick_ms=_env_float("DISPATCH_WHEEL_TICK_MS", 100.0),
+            slots=int(_env_float("DISPATCH_WHEEL_SLOTS", 1024)),
+            poll_sec=_env_float("DISPATCH_SCHEDULER_POLL_SEC", 5.0),
+        )
+
+    def register_handler(self, kind: str, handler: Handler) -> None:
+        self._handlers[kind] = handler
+
+    # ---------- wheel ----------
+
+    def _now_tick(self) -> int:
+        return int((time.monotonic() - self._origin_mono) / self.tick_sec)
+
+    def _wall_to_tick(self, due_at: float) -> int:
+        return int(math.ceil((due_at - self._origin_wall) / self.tick_sec))
+
+    def _insert(self, job: dict) -> None:
+        self._remove(job["id"])
+        target = max(self._wall_to_tick(job["due_at"]), self._tick + 1)
+        slot = target % self.slots
+        job = dict(job)
+        job["_target_tick"] = target
+        self._wheel[slot][job["id"]] = job
+        self._slot_of[job["id"]] = slot
+
+    def _remove(self, job_id: str) -> bool:
+        slot = self._slot_of.pop(job_id, None)
+        if slot is None:
+            return False
+        return self._wheel[slot].pop(job_id, None) is not None
+
+    def pending(self) -> int:
+        return len(self._slot_of)
+
+    # ---------- genel API ----------
+
+    async def schedule(self, job_id: str, due_at: float, kind: str, payload: Optional[dict] = None) -> None:
+        job = _job(job_id, due_at, kind, payload)
+        try:
+            await self.journal.add(job)
+        except Exception as e:
+            # Journal yazılamazsa iş yine bellekte çalışır (restart'ta kaybolur)
+            logger.warning("dispatch journal add %s: %s", job_id, e)
+        self._insert(job)
+        self._counters["scheduled"] += 1
+
+    async def cancel(self, job_id: str) -> None:
+        if self._remove(job_id):
+            self._counters["cancelled"] += 1
+        try:
+            await self.journal.remove(job_id)
+        except Exception as e:
+            logger.warning("dispatch journal remove %s: %s", job_id, e)
+
+    async def _fire(self, job: dict) -> None:
+        try:
+            if not await self.journal.claim(job):
+                self._counters["claim_lost"] += 1
+                return
+        except Exception as e:
+            logger.warning("dispatch journal claim %s: %s — yine de çalıştırılıyor", job["id"], e)
+        lag_ms = max(0.0, (time.time() - job["due_at"]) * 1000.0)
+        self._counters["fired"] += 1
+        self._counters["total_lag_ms"] += lag_ms
+        self._counters["max_lag_ms"] = max(self._counters["max_lag_ms"], lag_ms)
+        handler = self._handlers.get(job["kind"])
+        if handler is None:
+            logger.warning("dispatch scheduler: handler yok kind=%s job=%s", job["kind"], job["id"])
+            return
+        try:
+            await handler(dict(job["payload"]))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self._counters["handler_errors"] += 1
+            logger.warning("dispatch job %s hata: %s", job["id"], e)
+
+    def _spawn(self, job: dict) -> None:
+        task = asyncio.create_task(self._fire(job))
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+
+    async def _run(self) -> None:
+        while True:
+            target = self._now_tick()
+            # Geride kalınan her tick işlenir (event loop yoğunken atlanan kova olmaz)
+            while self._tick < target:
+                self._tick += 1
+                bucket = self._wheel[self._tick % self.slots]
+                if not bucket:
+                    continue
+                due = [j for j in bucket.values() if j["_target_tick"] <= self._tick]
+                for job in due:
+                    bucket.pop(job["id"], None)
+                    self._slot_of.pop(job["id"], None)
+                    self._spawn(job)
+            next_at = self._origin_mono + (self._tick + 1) * self.tick_sec
+            await asyncio.sleep(max(0.0, next_at - time.monotonic()))
+
+    async def _poll_orphans(self) -> None:
+        """Başka (ölmüş) worker'ın planladığı, süresi geçmiş işleri topla."""
+        while True:
+            await asyncio.sleep(self.poll_sec)
+            try:
+                jobs = await self.journal.load_due(time.time() - self.orphan_grace_sec)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("dispatch journal poll: %s", e)
+                continue
+            for job in jobs:
+                if job["id"] in self._slot_of:
+                    continue
+                self._counters["recovered"] += 1
+                self._spawn(job)
+
+    async def start(self) -> int:
+        """Journal'daki işleri yükle ve döngüleri başlat. Dönüş: geri yüklenen iş sayısı."""
+        if self._task is not None and not self._task.done():
+            return 0
+        loaded = 0
+        try:
+            for job in await self.journal.load_all():
+                self._insert(job)
+                loaded += 1
+        except Exception as e:
+            # Tablo yok / Redis erişilemiyor: zamanlayıcı yine çalışsın, yalnızca kalıcılık kaybolur
+            logger.error(
+                "dispatch journal yüklenemedi (%s): %s — bellek journal'a geçildi (restart'ta işler kaybolur)",
+                getattr(self.journal, "kind", "?"),
+                e,
+            )
+            self.journal = MemoryJobJournal()
+        self._task = asyncio.create_task(self._run())
+        if self.poll_sec > 0:
+            self._poll_task = asyncio.create_task(self._poll_orphans())
+        logger.info(
+            "✅ Dispatch scheduler: journal=%s geri_yüklenen=%s tick=%sms",
+            getattr(self.journal, "kind", "?"),
+            loaded,
+            int(self.tick_sec * 1000),
+        )
+        return loaded
+
+    async def stop(self) -> None:
+        """Döngüleri durdur; journal'daki işler bir sonraki açılışta devam eder."""
+        for task in (self._task, self._poll_task, *list(self._running)):
+            if task is not None and not task.done():
+                task.cancel()
+        self._task = self._poll_task = None
+
+    def stats(self) -> Dict[str, Any]:
+        fired = self._counters["fired"] or 0
+        return {
+            **{k: (round(v, 1) if isinstance(v, float) else v) for k, v in self._counters.items()},
+            "avg_lag_ms": round(self._counters["total_lag_ms"] / fired, 1) if fired else 0.0,
+            "pending": self.pending(),
+            "journal": getattr(self.journal, "kind", "?"),
+            "tick_ms": int(self.tick_sec * 1000),
+        }
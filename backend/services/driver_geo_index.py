@@ -0,0 +1,242 @@
+"""
+Çevrimiçi sürücü konum indeksi — süreç içi grid (ızgara) kovaları.
+
+- Kova anahtarı: (vehicle_kind, hücre_lat, hücre_lng); hücre boyu DRIVER_GEO_INDEX_CELL_DEG (derece)
+- Güncelleme: konum ping'i, online/offline geçişi; periyodik olarak Supabase'den tam uzlaştırma (replace_all)
+- Sorgu: yarıçap / k-en-yakın — DB round-trip ve tüm online satırların Python döngüsü yerine yalnızca komşu hücreler
+
+Yalnızca event loop içinden kullanılır (kilit yok). Çoklu worker'da her süreç kendi kopyasını
+uzlaştırır; is_ready() False iken çağıran DB taramasına dönmelidir.
+"""
+from __future__ import annotations
+
+import logging
+import math
+import os
+import time
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEG_LAT = 111.0
+
+try:
+    DEFAULT_CELL_DEG = max(0.005, min(1.0, float(os.getenv("DRIVER_GEO_INDEX_CELL_DEG", "0.05"))))
+except (TypeError, ValueError):
+    DEFAULT_CELL_DEG = 0.05
+
+# Indekste tutulan users kolonları (find_eligible_drivers satır biçimi ile aynı)
+DRIVER_ROW_KEYS = (
+    "id",
+    "name",
+    "rating",
+    "latitude",
+    "longitude",
+    "driver_active_until",
+    "driver_online",
+    "driver_details",
+)
+
+_CellKey = Tuple[str, int, int]
+
+
+def haversine_km(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """İki nokta arası kuş uçuşu km."""
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp = p2 - p1
+    dl = math.radians(lng2 - lng1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return EARTH_RADIUS_KM * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+
+def _coerce_latlng(lat: Any, lng: Any) -> Optional[Tuple[float, float]]:
+    if lat is None or lng is None:
+        return None
+    if str(lat).strip() == "" or str(lng).strip() == "":
+        return None
+    try:
+        return float(lat), float(lng)
+    except (TypeError, ValueError):
+        return None
+
+
+class DriverGeoIndex:
+    """Sürücü id → satır + grid kovaları (araç tipine göre ayrık)."""
+
+    def __init__(self, cell_deg: float = DEFAULT_CELL_DEG) -> None:
+        self.cell_deg = float(cell_deg)
+        self._rows: Dict[str, dict] = {}
+        self._cell_of: Dict[str, _CellKey] = {}
+        self._buckets: Dict[_CellKey, Set[str]] = {}
+        self._last_reconcile_mono: Optional[float] = None
+
+    # ---------- yardımcılar ----------
+
+    @staticmethod
+    def _key(driver_id: Any) -> str:
+        return str(driver_id).strip().lower() if driver_id is not None else ""
+
+    def _cell(self, kind: str, lat: float, lng: float) -> _CellKey:
+        return (kind, int(math.floor(lat / self.cell_deg)), int(math.floor(lng / self.cell_deg)))
+
+    def _unlink(self, did: str) -> None:
+        cell = self._cell_of.pop(did, None)
+        if cell is None:
+            return
+        bucket = self._buckets.get(cell)
+        if bucket is not None:
+            bucket.discard(did)
+            if not bucket:
+                del self._buckets[cell]
+
+    # ---------- yazma ----------
+
+    def upsert(self, row: dict, vehicle_kind: str) -> bool:
+        """
+        Online sürücü satırını ekle/güncelle. Konumu olmayan satır indeksten çıkarılır.
+        Dönüş: indekste konumlu olarak var mı.
+        """
+        did = self._key((row or {}).get("id"))
+        if not did:
+            return False
+        stored = {k: row.get(k) for k in DRIVER_ROW_KEYS if k in row}
+        stored["id"] = did
+        stored["vehicle_kind"] = (vehicle_kind or "car").strip().lower()
+        self._unlink(did)
+        ll = _coerce_latlng(stored.get("latitude"), stored.get("longitude"))
+        if ll is None:
+            self._rows.pop(did, None)
+            return False
+        self._rows[did] = stored
+        cell = self._cell(stored["vehicle_kind"], ll[0], ll[1])
+        self._cell_of[did] = cell
+        self._buckets.setdefault(cell, set()).add(did)
+        return True
+
+    def update_location(self, driver_id: Any, lat: Any, lng: Any) -> bool:
+        """Yalnızca indekste olan (online) sürücünün konumunu taşır. Dönüş: güncellendi mi."""
+        did = self._key(driver_id)
+        row = self._rows.get(did)
+        if row is None:
+            return False
+        ll = _coerce_latlng(lat, lng)
+        if ll is None:
+            return False
+        row["latitude"], row["longitude"] = ll
+        new_cell = self._cell(row["vehicle_kind"], ll[0], ll[1])
+        if self._cell_of.get(did) != new_cell:
+            self._unlink(did)
+            self._cell_of[did] = new_cell
+            self._buckets.setdefault(new_cell, set()).add(did)
+        return True
+
+    def remove(self, driver_id: Any) -> bool:
+        did = self._key(driver_id)
+        self._unlink(did)
+        return self._rows.pop(did, None) is not None
+
+    def replace_all(self, rows: Iterable[Tuple[dict, str]]) -> int:
+        """Supabase uzlaştırması: (satır, vehicle_kind) listesiyle tüm indeksi yeniden kur."""
+        self._rows.clear()
+        self._cell_of.clear()
+        self._buckets.clear()
+        n = 0
+        for row, kind in rows:
+            if self.upsert(row, kind):
+                n += 1
+        self._last_reconcile_mono = time.monotonic()
+        return n
+
+    # ---------- okuma ----------
+
+    def is_ready(self, max_age_sec: float) -> bool:
+        """En az bir uzlaştırma yapıldı ve max_age_sec'ten eski değil."""
+        if self._last_reconcile_mono is None:
+            return False
+        return (time.monotonic() - self._last_reconcile_mono) <= float(max_age_sec)
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __contains__(self, driver_id: Any) -> bool:
+        return self._key(driver_id) in self._rows
+
+    def get(self, driver_id: Any) -> Optional[dict]:
+        row = self._rows.get(self._key(driver_id))
+        return dict(row) if row is not None else None
+
+    def query_radius(
+        self,
+        lat: float,
+        lng: float,
+        radius_km: float,
+        *,
+        vehicle_kinds: Optional[Iterable[str]] = None,
+        exclude_ids: Optional[Iterable[Any]] = None,
+    ) -> List[Tuple[float, dict]]:
+        """
+        Kuş uçuşu radius_km içindeki sürücüler: [(km, satır kopyası)] yakından uzağa.
+        vehicle_kinds None → tüm tipler.
+        """
+        r = max(0.0, float(radius_km))
+        lat, lng = float(lat), float(lng)
+        dlat = r / KM_PER_DEG_LAT
+        dlng = r / (KM_PER_DEG_LAT * max(0.01, math.cos(math.radians(lat))))
+        y0 = int(math.floor((lat - dlat) / self.cell_deg))
+        y1 = int(math.floor((lat + dlat) / self.cell_deg))
+        x0 = int(math.floor((lng - dlng) / self.cell_deg))
+        x1 = int(math.floor((lng + dlng) / self.cell_deg))
+        if vehicle_kinds is None:
+            kinds = {k for (k, _y, _x) in self._buckets.keys()}
+        else:
+            kinds = {str(k).strip().lower() for k in vehicle_kinds if k}
+        excl = {self._key(x) for x in (exclude_ids or []) if x is not None}
+
+        out: List[Tuple[float, dict]] = []
+        for kind in kinds:
+            for cy in range(y0, y1 + 1):
+                for cx in range(x0, x1 + 1):
+                    bucket = self._buckets.get((kind, cy, cx))
+                    if not bucket:
+                        continue
+                    for did in bucket:
+                        if did in excl:
+                            continue
+                        row = self._rows[did]
+                        d = haversine_km(lat, lng, row["latitude"], row["longitude"])
+                        if d <= r:
+                            out.append((d, dict(row)))
+        out.sort(key=lambda t: t[0])
+        return out
+
+    def nearest(
+        self,
+        lat: float,
+        lng: float,
+        k: int,
+        max_radius_km: float,
+        *,
+        vehicle_kinds: Optional[Iterable[str]] = None,
+        exclude_ids: Optional[Iterable[Any]] = None,
+    ) -> List[Tuple[float, dict]]:
+        """k en yakın sürücü; halkayı ikiye katlayarak genişletir (max_radius_km ile sınırlı)."""
+        if k <= 0:
+            return []
+        r = min(float(max_radius_km), max(self.cell_deg * KM_PER_DEG_LAT, 1.0))
+        while True:
+            hits = self.query_radius(lat, lng, r, vehicle_kinds=vehicle_kinds, exclude_ids=exclude_ids)
+            if len(hits) >= k or r >= max_radius_km:
+                return hits[:k]
+            r = min(float(max_radius_km), r * 2)
+
+    def stats(self) -> dict:
+        age = None
+        if self._last_reconcile_mono is not None:
+            age = round(time.monotonic() - self._last_reconcile_mono, 1)
+        return {
+            "drivers": len(self._rows),
+            "cells": len(self._buckets),
+            "cell_deg": self.cell_deg,
+            "last_reconcile_age_sec": age,
+        }
@@ -0,0 +1,115 @@
+"""
+Sürücü durum anlık görüntüsü — dispatch teklifi öncesi uygunluk + push token (kısa TTL, süreç içi).
+
+Rolling batch'te her sürücü için ayrı ayrı users SELECT (uygunluk ×2 + push token) yapılıyordu.
+Bu önbellek aynı satırı (driver_online, driver_active_until, latitude, longitude, push_token) tutar:
+- prefetch(ids): eksik/bayat sürücüler tek loader çağrısıyla (users.in_("id", ...)) yüklenir
+- get(id): önbellekte taze kayıt varsa DB'ye gitmez; yoksa tek sürücü yükler
+- DB'de olmayan sürücü de (None) TTL boyunca önbelleklenir
+- invalidate(id): driver_online / driver_active_until yazan her uçta (toggle, go-online/offline, admin,
+  paket / promosyon, süre dolumu ile otomatik offline) ve push token kaydı-silme sonrası çağrılır
+
+Ortam: DRIVER_STATE_TTL_SEC (varsayılan 10). Yalnızca event loop içinden kullanılır (kilit yok).
+"""
+from __future__ import annotations
+
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DRIVER_STATE_COLUMNS = "id, driver_online, driver_active_until, latitude, longitude, push_token"
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return max(0.0, float((os.getenv(name) or str(default)).strip()))
+    except (TypeError, ValueError):
+        return default
+
+
+class DriverStateCache:
+    """driver_id (küçük harf) → users satırı (veya None), TTL'li."""
+
+    def __init__(
+        self,
+        loader: Callable[[List[str]], Awaitable[List[dict]]],
+        *,
+        ttl_sec: float = 10.0,
+        max_entries: int = 50000,
+    ) -> None:
+        self._loader = loader
+        self.ttl_sec = float(ttl_sec)
+        self.max_entries = max(1, int(max_entries))
+        # uid -> (row | None, monotonic)
+        self._rows: Dict[str, Tuple[Optional[dict], float]] = {}
+        self._counters: Dict[str, int] = {"hits": 0, "misses": 0, "loads": 0, "load_errors": 0, "invalidations": 0}
+
+    @classmethod
+    def from_env(cls, loader: Callable[[List[str]], Awaitable[List[dict]]]) -> "DriverStateCache":
+        return cls(loader, ttl_sec=_env_float("DRIVER_STATE_TTL_SEC", 10.0))
+
+    @staticmethod
+    def _key(driver_id: Any) -> str:
+        return str(driver_id).strip().lower() if driver_id is not None else ""
+
+    def _fresh(self, uid: str) -> bool:
+        item = self._rows.get(uid)
+        return item is not None and time.monotonic() - item[1] < self.ttl_sec
+
+    async def prefetch(self, driver_ids: Iterable[Any]) -> int:
+        """Taze kaydı olmayan sürücüleri tek sorguyla yükle. Dönüş: yüklenen (istenen) sürücü sayısı."""
+        missing: List[str] = []
+        seen = set()
+        for d in driver_ids:
+            uid = self._key(d)
+            if uid and uid not in seen and not self._fresh(uid):
+                seen.add(uid)
+                missing.append(uid)
+        if not missing:
+            return 0
+        try:
+            rows = await self._loader(missing)
+        except Exception as e:
+            self._counters["load_errors"] += 1
+            logger.warning("Sürücü durum yüklemesi başarısız (%s sürücü): %s", len(missing), e)
+            return 0
+        self._counters["loads"] += 1
+        if len(self._rows) + len(missing) > self.max_entries:
+            self._prune()
+        now = time.monotonic()
+        by_id = {self._key(r.get("id")): r for r in rows or [] if r.get("id")}
+        for uid in missing:
+            self._rows[uid] = (by_id.get(uid), now)
+        return len(missing)
+
+    async def get(self, driver_id: Any) -> Optional[dict]:
+        uid = self._key(driver_id)
+        if not uid:
+            return None
+        if self._fresh(uid):
+            self._counters["hits"] += 1
+            return self._rows[uid][0]
+        self._counters["misses"] += 1
+        await self.prefetch([uid])
+        item = self._rows.get(uid)
+        return item[0] if item else None
+
+    def invalidate(self, driver_id: Any) -> None:
+        if self._rows.pop(self._key(driver_id), None) is not None:
+            self._counters["invalidations"] += 1
+
+    def clear(self) -> None:
+        self._rows.clear()
+
+    def _prune(self) -> None:
+        cutoff = time.monotonic() - self.ttl_sec
+        for uid in [u for u, (_, ts) in self._rows.items() if ts < cutoff]:
+            self._rows.pop(uid, None)
+        if len(self._rows) >= self.max_entries:
+            self._rows.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self._counters, "entries": len(self._rows), "ttl_sec": self.ttl_sec}
@@ -0,0 +1,129 @@
+"""
+Vektörel kuş uçuşu mesafe — satırların koordinatları bitişik NumPy dizilerinde, tek geçişte mesafe / yarıçap / k-en-yakın.
+
+/drivers/nearby ve /driver/nearby-activity her online sürücü ve bekleyen tag için haversine_distance'ı
+satır satır çağırıyordu. Burada:
+- GeoPoints.from_rows(rows, lat_key, lng_key): geçerli koordinatlı satırlar → float64 radyan dizileri + cos(lat)
+  (boş / sayı olmayan / 0 koordinat = konum yok, satır atlanır)
+- distances_km(lat, lng): tüm satırlar için km (haversine, tek geçiş)
+- within(lat, lng, radius_km): yarıçap maskesi → (satır indeksleri, km); sort=True iken yakından uzağa
+- count_within(): yalnızca sayı (yoğunluk göstergeleri)
+- k_nearest(lat, lng, k, radius_km=None): argpartition ile en yakın k (tam sıralama yok)
+
+Benchmark (backend/ içinden): python -m benchmarks.geo_bench --drivers 10000
+"""
+from __future__ import annotations
+
+import math
+from typing import Any, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from services.driver_geo_index import EARTH_RADIUS_KM
+
+
+def _coord(value: Any) -> Optional[float]:
+    if value is None or value == "":
+        return None
+    try:
+        f = float(value)
+    except (TypeError, ValueError):
+        return None
+    if f == 0.0 or not math.isfinite(f):
+        return None
+    return f
+
+
+def haversine_km_many(lat: float, lng: float, lats_rad: np.ndarray, lngs_rad: np.ndarray, cos_lats: np.ndarray) -> np.ndarray:
+    """(lat, lng) derece → radyan dizilerindeki noktalar: km dizisi."""
+    p = math.radians(lat)
+    s_dlat = np.sin((lats_rad - p) * 0.5)
+    s_dlng = np.sin((lngs_rad - math.radians(lng)) * 0.5)
+    a = s_dlat * s_dlat + math.cos(p) * cos_lats * (s_dlng * s_dlng)
+    np.minimum(a, 1.0, out=a)
+    return (2.0 * EARTH_RADIUS_KM) * np.arcsin(np.sqrt(a))
+
+
+class GeoPoints:
+    """rows[i] ↔ lat_rad[i] / lng_rad[i]; sorgular rows indeksleri döndürür."""
+
+    __slots__ = ("rows", "lat_rad", "lng_rad", "cos_lat")
+
+    def __init__(self, rows: Sequence[Any], lats: Sequence[float], lngs: Sequence[float]) -> None:
+        if len(rows) != len(lats) or len(rows) != len(lngs):
+            raise ValueError("rows / lats / lngs uzunlukları farklı")
+        self.rows = list(rows)
+        self.lat_rad = np.radians(np.asarray(lats, dtype=np.float64))
+        self.lng_rad = np.radians(np.asarray(lngs, dtype=np.float64))
+        self.cos_lat = np.cos(self.lat_rad)
+
+    @classmethod
+    def from_rows(
+        cls, rows: Optional[Iterable[dict]], lat_key: str = "latitude", lng_key: str = "longitude"
+    ) -> "GeoPoints":
+        rows = rows if isinstance(rows, list) else list(rows or [])
+        n = len(rows)
+        try:
+            # Hızlı yol: sütunlar doğrudan float64'e (None / 0 / "" → NaN); metin koordinatta yavaş yola düşer
+            lats = np.fromiter((r.get(lat_key) or np.nan for r in rows), dtype=np.float64, count=n)
+            lngs = np.fromiter((r.get(lng_key) or np.nan for r in rows), dtype=np.float64, count=n)
+        except (TypeError, ValueError):
+            return cls._from_rows_checked(rows, lat_key, lng_key)
+        keep = np.isfinite(lats) & np.isfinite(lngs) & (lats != 0.0) & (lngs != 0.0)
+        if keep.all():
+            return cls(rows, lats, lngs)
+        return cls([rows[i] for i in np.flatnonzero(keep).tolist()], lats[keep], lngs[keep])
+
+    @classmethod
+    def _from_rows_checked(cls, rows: List[dict], lat_key: str, lng_key: str) -> "GeoPoints":
+        kept: List[dict] = []
+        lats: List[float] = []
+        lngs: List[float] = []
+        for row in rows:
+            la = _coord(row.get(lat_key))
+            lo = _coord(row.get(lng_key))
+            if la is None or lo is None:
+                continue
+            kept.append(row)
+            lats.append(la)
+            lngs.append(lo)
+        return cls(kept, lats, lngs)
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def distances_km(self, lat: float, lng: float) -> np.ndarray:
+        return haversine_km_many(float(lat), float(lng), self.lat_rad, self.lng_rad, self.cos_lat)
+
+    def within(
+        self, lat: float, lng: float, radius_km: float, *, sort: bool = True
+    ) -> Tuple[List[int], List[float]]:
+        """Yarıçap içindeki satır indeksleri ve km'leri (sort=False: rows sırası korunur)."""
+        if not self.rows:
+            return [], []
+        d = self.distances_km(lat, lng)
+        idx = np.flatnonzero(d <= float(radius_km))
+        if sort and idx.size > 1:
+            idx = idx[np.argsort(d[idx], kind="stable")]
+        return idx.tolist(), d[idx].tolist()
+
+    def count_within(self, lat: float, lng: float, radius_km: float) -> int:
+        if not self.rows:
+            return 0
+        return int(np.count_nonzero(self.distances_km(lat, lng) <= float(radius_km)))
+
+    def k_nearest(
+        self, lat: float, lng: float, k: int, *, radius_km: Optional[float] = None
+    ) -> Tuple[List[int], List[float]]:
+        """En yakın k satır (yakından uzağa); radius_km verilirse yalnızca yarıçap içinden."""
+        if not self.rows or k <= 0:
+            return [], []
+        d = self.distances_km(lat, lng)
+        cand = np.flatnonzero(d <= float(radius_km)) if radius_km is not None else np.arange(d.size)
+        if cand.size > k:
+            cand = cand[np.argpartition(d[cand], k - 1)[:k]]
+        cand = cand[np.argsort(d[cand], kind="stable")]
+        return cand.tolist(), d[cand].tolist()
+
+    def take(self, indices: Iterable[int]) -> List[Any]:
+        return [self.rows[i] for i in indices]
@@ -0,0 +1,274 @@
+"""
+Sürücü bekleme haritası yoğunluk karoları — şehir başına önceden sayılmış hücreler + yakın işaret indeksi.
+
+GET /driver/nearby-passengers-map her istekte 150 tag + 280 kullanıcı okuyup city_grid_counts'u baştan
+kuruyor, yakındaki her uygulama kullanıcısı için (en fazla 55) get_route_info çağırıyordu. Burada:
+- Noktalar: açık tag'ler (KIND_SEEKING) ve talebi olmayan güncel kullanıcılar (KIND_APP_USER); her nokta
+  eklenirken / taşınırken / silinirken yalnızca kendi hücre sayaçları değişir (ZOOM_STEPS başına bir hücre)
+- tiles(city, zoom): hazır sayaçlardan en yoğun hücreler — maliyet şehrin hücre sayısı kadar
+- nearby(lat, lng, radius_km): yarıçap kutusunun zoom 0 hücrelerindeki noktalar, haversine ile (yol rotası yok;
+  rota yalnızca sürücünün dokunduğu işaret için ayrı uçtan)
+- replace_all(): periyodik tam yenileme (kaçan olaylar / bayat kullanıcılar için)
+
+Zoom 0 = mevcut 0.18° × 0.26° (~20 km) hücre; 1 ve 2 yarıya / çeyreğe bölünmüş hücreler.
+Yalnızca event loop içinden kullanılır (kilit yok).
+"""
+from __future__ import annotations
+
+import math
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from services.driver_geo_index import KM_PER_DEG_LAT, haversine_km
+
+ZOOM_STEPS: Tuple[Tuple[float, float], ...] = ((0.18, 0.26), (0.09, 0.13), (0.045, 0.065))
+
+KIND_SEEKING = "seeking"
+KIND_APP_USER = "app_user"
+
+Cell = Tuple[int, int]
+
+
+def _city_key(city: Any) -> str:
+    return str(city or "").strip().lower()
+
+
+def _owner_key(owner: Any) -> str:
+    return str(owner or "").strip().lower()
+
+
+def cell_of(lat: float, lng: float, zoom: int = 0) -> Cell:
+    step_lat, step_lng = ZOOM_STEPS[zoom]
+    return int(math.floor(lat / step_lat)), int(math.floor(lng / step_lng))
+
+
+class _Point:
+    __slots__ = ("key", "kind", "owner", "city", "lat", "lng", "data", "cells")
+
+    def __init__(self, key: str, kind: str, owner: str, city: str, lat: float, lng: float, data: dict) -> None:
+        self.key = key
+        self.kind = kind
+        self.owner = owner
+        self.city = city
+        self.lat = lat
+        self.lng = lng
+        self.data = data
+        self.cells: Tuple[Cell, ...] = tuple(cell_of(lat, lng, z) for z in range(len(ZOOM_STEPS)))
+
+
+class HeatmapTiles:
+    """
+    key ("tag:<id>" / "user:<id>") → nokta; (şehir, zoom) → hücre sayaçları; zoom 0 hücre → anahtarlar;
+    owner (yolcu / kullanıcı id, küçük harf) → anahtarlar (istek başına engelli düşümü için).
+    """
+
+    def __init__(self) -> None:
+        self._points: Dict[str, _Point] = {}
+        self._counts: Dict[Tuple[str, int], Dict[Cell, int]] = {}
+        self._members: Dict[Cell, set] = {}
+        self._by_owner: Dict[str, set] = {}
+        self._built_mono: Optional[float] = None
+        self._counters: Dict[str, int] = {"rebuilds": 0, "upserts": 0, "removes": 0, "moves": 0}
+
+    # --- iç sayaçlar ---
+    def _attach(self, p: _Point) -> None:
+        self._points[p.key] = p
+        self._members.setdefault(p.cells[0], set()).add(p.key)
+        if p.owner:
+            self._by_owner.setdefault(p.owner, set()).add(p.key)
+        if p.city:
+            for z, cell in enumerate(p.cells):
+                counts = self._counts.setdefault((p.city, z), {})
+                counts[cell] = counts.get(cell, 0) + 1
+
+    def _detach(self, p: _Point) -> None:
+        self._points.pop(p.key, None)
+        members = self._members.get(p.cells[0])
+        if members is not None:
+            members.discard(p.key)
+            if not members:
+                del self._members[p.cells[0]]
+        owned = self._by_owner.get(p.owner)
+        if owned is not None:
+            owned.discard(p.key)
+            if not owned:
+                del self._by_owner[p.owner]
+        if p.city:
+            for z, cell in enumerate(p.cells):
+                counts = self._counts.get((p.city, z))
+                if counts is None:
+                    continue
+                left = counts.get(cell, 0) - 1
+                if left > 0:
+                    counts[cell] = left
+                else:
+                    counts.pop(cell, None)
+                    if not counts:
+                        del self._counts[(p.city, z)]
+
+    # --- yazım ---
+    def upsert(
+        self,
+        key: str,
+        *,
+        kind: str,
+        owner: Any = None,
+        city: Any = None,
+        lat: Any = None,
+        lng: Any = None,
+        data: Optional[dict] = None,
+    ) -> bool:
+        """Nokta ekle / güncelle. Geçersiz koordinat → False (varsa eski nokta düşer)."""
+        try:
+            lat_f, lng_f = float(lat), float(lng)
+        except (TypeError, ValueError):
+            self.remove(key)
+            return False
+        old = self._points.get(key)
+        if old is not None:
+            self._detach(old)
+        self._attach(_Point(key, kind, _owner_key(owner), _city_key(city), lat_f, lng_f, dict(data or {})))
+        self._counters["upserts"] += 1
+        return True
+
+    def move(self, key: str, lat: float, lng: float) -> bool:
+        """Bilinen noktanın konumu (presence ping'i); bilinmeyen anahtar yok sayılır."""
+        old = self._points.get(key)
+        if old is None:
+            return False
+        self._detach(old)
+        self._attach(_Point(key, old.kind, old.owner, old.city, float(lat), float(lng), old.data))
+        self._counters["moves"] += 1
+        return True
+
+    def remove(self, key: str) -> bool:
+        old = self._points.get(key)
+        if old is None:
+            return False
+        self._detach(old)
+        self._counters["removes"] += 1
+        return True
+
+    def replace_all(self, points: Iterable[dict]) -> int:
+        """Tam yenileme: [{key, kind, owner, city, lat, lng, data}] — önceki tüm noktalar atılır."""
+        self._points.clear()
+        self._counts.clear()
+        self._members.clear()
+        self._by_owner.clear()
+        n = 0
+        for item in points:
+            try:
+                lat_f, lng_f = float(item["lat"]), float(item["lng"])
+            except (KeyError, TypeError, ValueError):
+                continue
+            old = self._points.get(item["key"])
+            if old is not None:
+                self._detach(old)
+            self._attach(
+                _Point(
+                    item["key"],
+                    item["kind"],
+                    _owner_key(item.get("owner")),
+                    _city_key(item.get("city")),
+                    lat_f,
+                    lng_f,
+                    dict(item.get("data") or {}),
+                )
+            )
+            n += 1
+        self._built_mono = time.monotonic()
+        self._counters["rebuilds"] += 1
+        return n
+
+    # --- okuma ---
+    def is_ready(self, max_age_sec: float) -> bool:
+        return self._built_mono is not None and time.monotonic() - self._built_mono <= max_age_sec
+
+    def tiles(
+        self, city: Any, zoom: int = 0, *, limit: int = 48, exclude_cells: Optional[Dict[Cell, int]] = None
+    ) -> List[dict]:
+        """
+        En yoğun `limit` hücre (center_lat, center_lng, count, intensity). exclude_cells: bu istek için
+        düşülecek sayılar (owner_cells() — ör. engelli kullanıcıların noktaları), hücre başına çıkarılır.
+        """
+        zoom = max(0, min(int(zoom), len(ZOOM_STEPS) - 1))
+        counts = self._counts.get((_city_key(city), zoom))
+        if not counts:
+            return []
+        if exclude_cells:
+            counts = {c: n - exclude_cells.get(c, 0) for c, n in counts.items()}
+            counts = {c: n for c, n in counts.items() if n > 0}
+            if not counts:
+                return []
+        step_lat, step_lng = ZOOM_STEPS[zoom]
+        mx = max(counts.values()) or 1
+        out = []
+        for (gi, gj), cnt in sorted(counts.items(), key=lambda x: -x[1])[: max(1, int(limit))]:
+            out.append(
+                {
+                    "center_lat": (gi + 0.5) * step_lat,
+                    "center_lng": (gj + 0.5) * step_lng,
+                    "count": cnt,
+                    "intensity": round(min(1.0, cnt / mx), 3),
+                }
+            )
+        return out
+
+    def nearby(
+        self, lat: float, lng: float, radius_km: float, *, kind: Optional[str] = None
+    ) -> List[Tuple[float, str, str, float, float, dict]]:
+        """Yarıçap içindeki noktalar, yakından uzağa: (km, key, şehir, lat, lng, data)."""
+        step_lat, step_lng = ZOOM_STEPS[0]
+        dlat = radius_km / KM_PER_DEG_LAT
+        dlng = radius_km / (KM_PER_DEG_LAT * max(0.01, math.cos(math.radians(lat))))
+        i0, j0 = cell_of(lat - dlat, lng - dlng)
+        i1, j1 = cell_of(lat + dlat, lng + dlng)
+        hits = []
+        for gi in range(i0, i1 + 1):
+            for gj in range(j0, j1 + 1):
+                for key in self._members.get((gi, gj), ()):
+                    p = self._points[key]
+                    if kind is not None and p.kind != kind:
+                        continue
+                    if abs(p.lat - lat) > dlat or abs(p.lng - lng) > dlng:
+                        continue
+                    km = haversine_km(lat, lng, p.lat, p.lng)
+                    if km <= radius_km:
+                        hits.append((km, key, p.city, p.lat, p.lng, p.data))
+        hits.sort(key=lambda h: h[0])
+        return hits
+
+    def get(self, key: str) -> Optional[dict]:
+        p = self._points.get(key)
+        if p is None:
+            return None
+        return {"kind": p.kind, "city": p.city, "lat": p.lat, "lng": p.lng, "data": p.data}
+
+    def owner_cells(self, owners: Iterable[Any], city: Any, zoom: int = 0) -> Dict[Cell, int]:
+        """Verilen sahiplerin bu şehir / zoom'daki nokta sayıları, hücre başına (tiles(exclude_cells=) için)."""
+        ck = _city_key(city)
+        zoom = max(0, min(int(zoom), len(ZOOM_STEPS) - 1))
+        out: Dict[Cell, int] = {}
+        if not ck:
+            return out
+        for owner in owners:
+            for key in self._by_owner.get(_owner_key(owner), ()):
+                p = self._points[key]
+                if p.city == ck:
+                    out[p.cells[zoom]] = out.get(p.cells[zoom], 0) + 1
+        return out
+
+    def stats(self) -> Dict[str, Any]:
+        age = None
+        if self._built_mono is not None:
+            age = round(time.monotonic() - self._built_mono, 1)
+        kinds: Dict[str, int] = {}
+        for p in self._points.values():
+            kinds[p.kind] = kinds.get(p.kind, 0) + 1
+        return {
+            **self._counters,
+            "points": len(self._points),
+            "by_kind": kinds,
+            "cities": len({c for c, _z in self._counts}),
+            "last_build_age_sec": age,
+        }
@@ -0,0 +1,150 @@
+"""
+Paylaşılan httpx.AsyncClient havuzu — sağlayıcı (host) başına tek client.
+
+Her çağrıda yeni AsyncClient açmak TCP+TLS el sıkışması demek; bunun yerine keep-alive havuzu:
+- startup'ta start_http_clients(), shutdown'da close_http_clients()
+- get_http_client("expo") → hazır client (yoksa / farklı event loop'taysa tembel oluşturur)
+- İstek bazlı timeout çağrı yerinde verilebilir (client.get(..., timeout=5.0))
+
+Ortam değişkenleri:
+- HTTP_POOL_MAX_CONNECTIONS (varsayılan 50), HTTP_POOL_MAX_KEEPALIVE (20), HTTP_POOL_KEEPALIVE_EXPIRY (30 sn)
+- HTTP2_DISABLED=1 → HTTP/2 kapalı (h2 paketi yoksa zaten kapalı)
+"""
+from __future__ import annotations
+
+import asyncio
+import importlib.util
+import logging
+import os
+from typing import Any, Dict, Optional, Tuple
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Sağlayıcı profilleri: http2 yalnızca sağlayıcı destekliyorsa (Google, Expo, OpenAI)
+CLIENT_PROFILES: Dict[str, Dict[str, Any]] = {
+    "google_maps": {"http2": True, "timeout": 10.0},
+    "osrm": {"http2": False, "timeout": 8.0},
+    "expo": {"http2": True, "timeout": 30.0},
+    "openai": {"http2": True, "timeout": 60.0},
+    "anthropic": {"http2": True, "timeout": 60.0},
+    "ip_lookup": {"http2": False, "timeout": 5.0},
+    "default": {"http2": False, "timeout": 30.0},
+}
+
+# name -> (client, oluşturulduğu event loop)
+_clients: Dict[str, Tuple[httpx.AsyncClient, Optional[asyncio.AbstractEventLoop]]] = {}
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return max(1, int((os.getenv(name) or str(default)).strip()))
+    except (TypeError, ValueError):
+        return default
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return max(0.0, float((os.getenv(name) or str(default)).strip()))
+    except (TypeError, ValueError):
+        return default
+
+
+def _http2_available() -> bool:
+    if (os.getenv("HTTP2_DISABLED") or "").strip().lower() in ("1", "true", "yes", "on"):
+        return False
+    return importlib.util.find_spec("h2") is not None
+
+
+def _pool_limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=_env_int("HTTP_POOL_MAX_CONNECTIONS", 50),
+        max_keepalive_connections=_env_int("HTTP_POOL_MAX_KEEPALIVE", 20),
+        keepalive_expiry=_env_float("HTTP_POOL_KEEPALIVE_EXPIRY", 30.0),
+    )
+
+
+def _current_loop() -> Optional[asyncio.AbstractEventLoop]:
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+def _create_client(name: str) -> httpx.AsyncClient:
+    profile = CLIENT_PROFILES.get(name) or CLIENT_PROFILES["default"]
+    return httpx.AsyncClient(
+        http2=bool(profile["http2"]) and _http2_available(),
+        timeout=profile["timeout"],
+        limits=_pool_limits(),
+    )
+
+
+def get_http_client(name: str = "default") -> httpx.AsyncClient:
+    """
+    Sağlayıcı için paylaşılan client. Kapalıysa veya başka bir event loop'a aitse yenisi açılır
+    (test / script ortamında asyncio.run her seferinde yeni loop kurar).
+    """
+    loop = _current_loop()
+    entry = _clients.get(name)
+    if entry is not None:
+        client, owner = entry
+        if not client.is_closed and (owner is None or loop is None or owner is loop):
+            return client
+    client = _create_client(name)
+    _clients[name] = (client, loop)
+    return client
+
+
+async def start_http_clients() -> None:
+    """Startup: tüm profiller için client'ları önceden oluştur."""
+    for name in CLIENT_PROFILES:
+        get_http_client(name)
+    logger.info(
+        "✅ HTTP client havuzu hazır: %s (http2=%s)",
+        ", ".join(CLIENT_PROFILES),
+        _http2_available(),
+    )
+
+
+async def close_http_clients() -> None:
+    """Shutdown: açık bağlantıları kapat."""
+    items = list(_clients.items())
+    _clients.clear()
+    for name, (client, _owner) in items:
+        try:
+            await client.aclose()
+        except Exception as e:
+            logger.warning("HTTP client kapatılamadı (%s): %s", name, e)
+
+
+def http_pool_stats() -> Dict[str, Dict[str, Any]]:
+    """
+    Havuz doluluk metrikleri (httpcore iç durumundan, en iyi çaba).
+    saturation = kullanımdaki bağlantı / max_connections; queued = bağlantı bekleyen istek.
+    """
+    out: Dict[str, Dict[str, Any]] = {}
+    max_conn = _pool_limits().max_connections or 0
+    for name, (client, _owner) in list(_clients.items()):
+        stats: Dict[str, Any] = {"closed": client.is_closed, "max_connections": max_conn}
+        try:
+            pool = client._transport._pool  # httpcore.AsyncConnectionPool
+            conns = list(pool.connections)
+            idle = sum(1 for c in conns if c.is_idle())
+            in_use = len(conns) - idle
+            requests = list(getattr(pool, "_requests", []) or [])
+            stats.update(
+                {
+                    "connections": len(conns),
+                    "idle": idle,
+                    "in_use": in_use,
+                    "requests_in_flight": len(requests),
+                    "queued": sum(1 for r in requests if getattr(r, "connection", None) is None),
+                    "saturation": round(in_use / max_conn, 3) if max_conn else None,
+                }
+            )
+        except Exception:
+            pass
+        out[name] = stats
+    return out
@@ -0,0 +1,263 @@
+"""
+Konum ping'i alımı — bellekte son konum + Supabase'e toplu (coalesced) yazım.
+
+Her GPS ping'i için users.update yerine:
+- submit(): son konum bellekte güncellenir (okumalar buradan); DB'ye yazılacaksa kullanıcı başına tek
+  bekleyen satır tutulur (yeni ping eskisinin üzerine yazar)
+- Yazım eşiği: son DB'ye yazılan konumdan LOCATION_WRITE_MIN_DISTANCE_M kadar uzaklaşmış ya da
+  LOCATION_WRITE_MAX_AGE_SEC geçmiş olmalı (durağan sürücü DB'yi meşgul etmez, last_location_update yine tazelenir)
+- Flush: LOCATION_FLUSH_INTERVAL_SEC aralıkla veya bekleyen satır LOCATION_FLUSH_BATCH_SIZE'a ulaşınca
+- Geri basınç: bekleyen satır LOCATION_MAX_PENDING'e ulaşınca yeni kullanıcılar kuyruğa alınmaz ("throttled");
+  son konum yine bellekte güncellenir, sonraki ping'de tekrar denenir
+- stop(): kapanışta kalan satırları yazar
+
+Yalnızca event loop içinden kullanılır (kilit yok). writer(rows) toplu yazımı yapar; hata verirse
+satırlar (daha yenisi gelmemişse) kuyruğa geri konur.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import math
+import os
+import time
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SUBMIT_QUEUED = "queued"
+SUBMIT_CACHED = "cached"
+SUBMIT_THROTTLED = "throttled"
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return max(0.0, float((os.getenv(name) or str(default)).strip()))
+    except (TypeError, ValueError):
+        return default
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return max(1, int((os.getenv(name) or str(default)).strip()))
+    except (TypeError, ValueError):
+        return default
+
+
+def _distance_m(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """Kısa mesafeler için eşdikdörtgen yaklaşımı (metre)."""
+    x = math.radians(lng2 - lng1) * math.cos(math.radians((lat1 + lat2) / 2.0))
+    y = math.radians(lat2 - lat1)
+    return 6371000.0 * math.hypot(x, y)
+
+
+class LocationIngestor:
+    """Kullanıcı başına son konum + toplu DB yazımı."""
+
+    def __init__(
+        self,
+        writer: Callable[[List[dict]], Awaitable[None]],
+        *,
+        flush_interval_sec: float = 2.0,
+        min_distance_m: float = 25.0,
+        max_age_sec: float = 30.0,
+        batch_size: int = 500,
+        max_pending: int = 20000,
+        live_ttl_sec: float = 3600.0,
+    ) -> None:
+        self._writer = writer
+        self.flush_interval_sec = max(0.05, float(flush_interval_sec))
+        self.min_distance_m = float(min_distance_m)
+        self.max_age_sec = float(max_age_sec)
+        self.batch_size = max(1, int(batch_size))
+        self.max_pending = max(1, int(max_pending))
+        self.live_ttl_sec = float(live_ttl_sec)
+        # uid -> (lat, lng, epoch_sn, iso)
+        self._latest: Dict[str, Tuple[float, float, float, str]] = {}
+        # uid -> (lat, lng, monotonic) — DB'ye en son yazılan
+        self._persisted: Dict[str, Tuple[float, float, float]] = {}
+        self._pending: Dict[str, dict] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._counters: Dict[str, int] = {
+            "pings": 0,
+            "queued": 0,
+            "cached_only": 0,
+            "throttled": 0,
+            "flushes": 0,
+            "rows_written": 0,
+            "write_errors": 0,
+        }
+
+    @classmethod
+    def from_env(cls, writer: Callable[[List[dict]], Awaitable[None]]) -> "LocationIngestor":
+        return cls(
+            writer,
+            flush_interval_sec=_env_float("LOCATION_FLUSH_INTERVAL_SEC", 2.0),
+            min_distance_m=_env_float("LOCATION_WRITE_MIN_DISTANCE_M", 25.0),
+            max_age_sec=_env_float("LOCATION_WRITE_MAX_AGE_SEC", 30.0),
+            batch_size=_env_int("LOCATION_FLUSH_BATCH_SIZE", 500),
+            max_pending=_env_int("LOCATION_MAX_PENDING", 20000),
+        )
+
+    @staticmethod
+    def _key(user_id: Any) -> str:
+        return str(user_id).strip().lower() if user_id is not None else ""
+
+    # ---------- yazma ----------
+
+    def submit(self, user_id: Any, latitude: float, longitude: float) -> str:
+        """Ping'i al (bloklamaz). Dönüş: queued | cached | throttled."""
+        uid = self._key(user_id)
+        if not uid:
+            return SUBMIT_CACHED
+        lat, lng = float(latitude), float(longitude)
+        now = time.time()
+        iso = datetime.utcfromtimestamp(now).isoformat()
+        self._latest[uid] = (lat, lng, now, iso)
+        self._counters["pings"] += 1
+
+        if uid not in self._pending and not self._needs_write(uid, lat, lng):
+            self._counters["cached_only"] += 1
+            return SUBMIT_CACHED
+        if uid not in self._pending and len(self._pending) >= self.max_pending:
+            self._counters["throttled"] += 1
+            self._signal()
+            return SUBMIT_THROTTLED
+        self._pending[uid] = {
+            "id": uid,
+            "latitude": lat,
+            "longitude": lng,
+            "last_location_update": iso,
+        }
+        self._counters["queued"] += 1
+        if len(self._pending) >= self.batch_size:
+            self._signal()
+        return SUBMIT_QUEUED
+
+    def _needs_write(self, uid: str, lat: float, lng: float) -> bool:
+        prev = self._persisted.get(uid)
+        if prev is None:
+            return True
+        if time.monotonic() - prev[2] >= self.max_age_sec:
+            return True
+        return _distance_m(prev[0], prev[1], lat, lng) >= self.min_distance_m
+
+    def _signal(self) -> None:
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def flush(self) -> int:
+        """Bekleyen satırları batch_size parçalarla yaz. Dönüş: yazılan satır."""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            written = 0
+            while self._pending:
+                uids = list(self._pending.keys())[: self.batch_size]
+                rows = [self._pending.pop(u) for u in uids]
+                try:
+                    await self._writer(rows)
+                except Exception as e:
+                    self._counters["write_errors"] += 1
+                    logger.warning("Konum toplu yazımı başarısız (%s satır): %s", len(rows), e)
+                    for row in rows:
+                        self._pending.setdefault(row["id"], row)
+                    break
+                mono = time.monotonic()
+                for row in rows:
+                    self._persisted[row["id"]] = (row["latitude"], row["longitude"], mono)
+                written += len(rows)
+            if written:
+                self._counters["flushes"] += 1
+                self._counters["rows_written"] += written
+            return written
+
+    # ---------- okuma ----------
+
+    def get(self, user_id: Any) -> Optional[dict]:
+        """Bellekteki son konum (users satırı biçiminde) veya None."""
+        item = self._latest.get(self._key(user_id))
+        if item is None:
+            return None
+        lat, lng, ts, iso = item
+        if self.live_ttl_sec and time.time() - ts > self.live_ttl_sec:
+            return None
+        return {"latitude": lat, "longitude": lng, "last_location_update": iso}
+
+    def overlay(self, user_id: Any, row: Optional[dict]) -> Optional[dict]:
+        """DB satırındaki konumu bellekteki daha yeni konumla değiştir (satır yoksa dokunmaz)."""
+        if not row:
+            return row
+        live = self.get(user_id)
+        if live is None:
+            return row
+        db_ts = str(row.get("last_location_update") or "")
+        if db_ts and db_ts[:26] > live["last_location_update"][:26]:
+            return row
+        out = dict(row)
+        out["latitude"] = live["latitude"]
+        out["longitude"] = live["longitude"]
+        if "last_location_update" in row:
+            out["last_location_update"] = live["last_location_update"]
+        return out
+
+    def _prune(self) -> None:
+        if not self.live_ttl_sec:
+            return
+        cutoff = time.time() - self.live_ttl_sec
+        stale = [u for u, v in self._latest.items() if v[2] < cutoff and u not in self._pending]
+        for u in stale:
+            self._latest.pop(u, None)
+            self._persisted.pop(u, None)
+
+    # ---------- yaşam döngüsü ----------
+
+    async def _run(self) -> None:
+        last_prune = time.monotonic()
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval_sec)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Konum flush döngüsü hatası: %s", e)
+            if time.monotonic() - last_prune >= 60.0:
+                self._prune()
+                last_prune = time.monotonic()
+
+    def start(self) -> None:
+        """Startup: flush döngüsünü başlat (event loop içinde)."""
+        if self._task is not None and not self._task.done():
+            return
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> int:
+        """Shutdown: döngüyü durdur, kalan satırları yaz."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._task = None
+        return await self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self._counters,
+            "pending": len(self._pending),
+            "live_users": len(self._latest),
+            "max_pending": self.max_pending,
+            "flush_interval_sec": self.flush_interval_sec,
+            "min_distance_m": self.min_distance_m,
+        }
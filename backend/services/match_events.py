@@ -0,0 +1,140 @@
+"""
+Eşleşme olayı — tek yük, alıcı başına tek socket olayı (+ eski istemci adları), push mesajları.
+
+Dört kabul akışı (accept_offer, driver/accept-offer HTTP, driver_accept_offer socket, accept_ride) eşleşmede
+her iki tarafa offer_accepted, tag_matched, ride_matched... olaylarını farklı yüklerle gönderiyor, push için
+tag'i ve sürücü konumunu yeniden okuyordu. Burada:
+- build_match_payload(): eldeki tag satırı + isimler + pickup mesafe/ETA'dan yük bir kez kurulur
+- match_event_names(role, flow): MATCH_EVENT_LEGACY_ALIASES=1 (varsayılan) iken akışın daha önce gönderdiği
+  adlar aynen (istemci useSocket her adı ayrı handler'a bağlar; ad eklenmez / çıkarılmaz); =0 iken yalnızca
+  asıl olay MATCH_EVENT ("ride_matched")
+- match_push_messages(): yükten sürücü / yolcu push'ları (ETA yeniden hesaplanmaz)
+"""
+from __future__ import annotations
+
+import os
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+MATCH_EVENT = "ride_matched"
+ROLE_DRIVER = "driver"
+ROLE_PASSENGER = "passenger"
+
+FLOW_ACCEPT_OFFER = "accept_offer"
+FLOW_DRIVER_ACCEPT_HTTP = "driver_accept_http"
+FLOW_DRIVER_ACCEPT_SOCKET = "driver_accept_socket"
+FLOW_ACCEPT_RIDE = "accept_ride"
+
+# Akış → rol → eski istemci olay adları (akışın eşleşmede gönderdiği adlar, aynı sırayla)
+LEGACY_ALIASES: Dict[str, Dict[str, Tuple[str, ...]]] = {
+    FLOW_ACCEPT_OFFER: {
+        ROLE_DRIVER: ("offer_accepted", "tag_matched"),
+        ROLE_PASSENGER: ("tag_matched",),
+    },
+    FLOW_DRIVER_ACCEPT_HTTP: {
+        ROLE_DRIVER: ("tag_matched", "ride_matched"),
+        ROLE_PASSENGER: ("tag_matched", "ride_matched"),
+    },
+    FLOW_DRIVER_ACCEPT_SOCKET: {
+        ROLE_DRIVER: ("offer_accepted_success", "tag_matched", "ride_matched"),
+        ROLE_PASSENGER: ("driver_matched", "tag_matched", "ride_matched"),
+    },
+    FLOW_ACCEPT_RIDE: {
+        ROLE_DRIVER: ("ride_matched",),
+        ROLE_PASSENGER: ("ride_accepted",),
+    },
+}
+
+LEGACY_ALIASES_ENABLED = (os.getenv("MATCH_EVENT_LEGACY_ALIASES", "1") or "1").strip().lower() not in (
+    "0",
+    "false",
+    "no",
+)
+
+MATCH_PUSH_TYPE = "new_ride_request"
+
+
+def match_event_names(role: str, flow: str, *, legacy: bool = LEGACY_ALIASES_ENABLED) -> Tuple[str, ...]:
+    """Alıcıya gidecek olay adları (her ad aynı yükle, bir kez). Bilinmeyen akış → yalnızca MATCH_EVENT."""
+    if not legacy:
+        return (MATCH_EVENT,)
+    return LEGACY_ALIASES.get(flow, {}).get(role) or (MATCH_EVENT,)
+
+
+def build_match_payload(
+    tag: dict,
+    *,
+    driver_id: str,
+    driver_name: Optional[str],
+    passenger_id: Optional[str],
+    passenger_name: Optional[str],
+    offer_id: Optional[str] = None,
+    price: Any = None,
+    pickup_distance_km: Optional[float] = None,
+    pickup_eta_min: Optional[int] = None,
+    matched_at: Optional[str] = None,
+) -> dict:
+    """Her iki tarafa giden eşleşme yükü (eski accept_offer + driver/accept-offer alanlarının birleşimi)."""
+    tag = tag or {}
+    tag_id = str(tag.get("id") or "").strip()
+    final_price = price if price is not None else tag.get("final_price")
+    trip_km = tag.get("distance_km")
+    est_min = tag.get("estimated_minutes")
+    return {
+        "trip_id": tag_id,
+        "tag_id": tag_id,
+        "offer_id": offer_id,
+        "driver_id": driver_id,
+        "driver_name": driver_name or "Sürücü",
+        "passenger_id": passenger_id,
+        "passenger_name": passenger_name or "Yolcu",
+        "pickup_location": tag.get("pickup_location"),
+        "dropoff_location": tag.get("dropoff_location"),
+        "pickup_lat": tag.get("pickup_lat"),
+        "pickup_lng": tag.get("pickup_lng"),
+        "dropoff_lat": tag.get("dropoff_lat"),
+        "dropoff_lng": tag.get("dropoff_lng"),
+        "offered_price": tag.get("offered_price") or final_price,
+        "final_price": final_price,
+        "distance_km": trip_km,
+        "trip_distance_km": trip_km,
+        "estimated_minutes": est_min,
+        "trip_duration_min": est_min,
+        "pickup_distance_km": pickup_distance_km,
+        "pickup_eta_min": pickup_eta_min,
+        "status": "matched",
+        "matched_at": matched_at or tag.get("matched_at") or datetime.utcnow().isoformat(),
+        "passenger_payment_method": tag.get("passenger_payment_method"),
+    }
+
+
+def match_push_messages(payload: dict) -> List[Dict[str, Any]]:
+    """[{user_id, role, title, body, data}] — teklif kanalıyla aynı type=new_offer + event=match."""
+    eta_min = int(payload.get("pickup_eta_min") or 0)
+    base = {"type": "new_offer", "event": "match", "tag_id": payload.get("tag_id"), "eta_min": eta_min}
+    out: List[Dict[str, Any]] = []
+    if payload.get("driver_id"):
+        try:
+            price = int(float(payload.get("final_price") or payload.get("offered_price") or 0))
+        except (TypeError, ValueError):
+            price = 0
+        out.append(
+            {
+                "user_id": str(payload["driver_id"]),
+                "role": ROLE_DRIVER,
+                "title": "Eşleşme sağlandı",
+                "body": f"Yolcuya {eta_min} dk. Yolcuya git için tıklayın." if eta_min else "Yolcuya git için tıklayın.",
+                "data": {**base, "role": ROLE_DRIVER, "price": price},
+            }
+        )
+    if payload.get("passenger_id"):
+        out.append(
+            {
+                "user_id": str(payload["passenger_id"]),
+                "role": ROLE_PASSENGER,
+                "title": "Paylaşımlı yolculuk başladı",
+                "body": "Sürücüye yazmak için tıklayın.",
+                "data": {**base, "role": ROLE_PASSENGER},
+            }
+        )
+    return out
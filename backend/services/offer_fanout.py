@@ -0,0 +1,109 @@
+"""
+Teklif dağıtımı (fan-out) yardımcıları — sınırlı eşzamanlılık + emit→ack gecikme ölçümü.
+
+- bounded_gather(): batch'teki sürücülere aynı anda en fazla `limit` görev (sıra korunur, hata yutulur)
+- OfferAckTracker: new_passenger_offer emit anı → istemci Socket.IO ack'i arası gecikme (ms);
+  ack gelmeyenler OFFER_ACK_TIMEOUT_SEC sonra "unacked" sayılır
+
+Yalnızca event loop içinden kullanılır (kilit yok).
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Iterable, List, Optional, Tuple, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return max(0.0, float((os.getenv(name) or str(default)).strip()))
+    except (TypeError, ValueError):
+        return default
+
+
+async def bounded_gather(
+    items: Iterable[T],
+    worker: Callable[[T], Awaitable[R]],
+    *,
+    limit: int,
+) -> List[Optional[R]]:
+    """worker(item) görevlerini en fazla `limit` eşzamanlı çalıştır; hata veren öğenin sonucu None."""
+    sem = asyncio.Semaphore(max(1, int(limit)))
+
+    async def _one(item: T) -> Optional[R]:
+        async with sem:
+            try:
+                return await worker(item)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("fan-out görevi başarısız: %s", e)
+                return None
+
+    return list(await asyncio.gather(*(_one(i) for i in items)))
+
+
+def _percentile(sorted_vals: List[float], pct: float) -> float:
+    if not sorted_vals:
+        return 0.0
+    idx = min(len(sorted_vals) - 1, max(0, int(round(pct / 100.0 * (len(sorted_vals) - 1)))))
+    return sorted_vals[idx]
+
+
+class OfferAckTracker:
+    """(tag_id, driver_id) → emit anı; ack geldiğinde gecikme örneği kaydedilir."""
+
+    def __init__(self, *, ack_timeout_sec: float = 60.0, window: int = 1000) -> None:
+        self.ack_timeout_sec = float(ack_timeout_sec)
+        self._sent: Dict[Tuple[str, str], float] = {}
+        self._samples_ms: Deque[float] = deque(maxlen=max(1, int(window)))
+        self._counters: Dict[str, int] = {"sent": 0, "acked": 0, "unacked": 0}
+
+    @classmethod
+    def from_env(cls) -> "OfferAckTracker":
+        return cls(ack_timeout_sec=_env_float("OFFER_ACK_TIMEOUT_SEC", 60.0))
+
+    @staticmethod
+    def _key(tag_id: Any, driver_id: Any) -> Tuple[str, str]:
+        return (str(tag_id).strip().lower(), str(driver_id).strip().lower())
+
+    def sent(self, tag_id: Any, driver_id: Any) -> None:
+        self._expire()
+        self._sent[self._key(tag_id, driver_id)] = time.monotonic()
+        self._counters["sent"] += 1
+
+    def acked(self, tag_id: Any, driver_id: Any) -> Optional[float]:
+        """Ack geldi; dönüş gecikme (ms) veya (kayıt yok/süresi geçmiş) None."""
+        started = self._sent.pop(self._key(tag_id, driver_id), None)
+        if started is None:
+            return None
+        ms = (time.monotonic() - started) * 1000.0
+        self._samples_ms.append(ms)
+        self._counters["acked"] += 1
+        return ms
+
+    def _expire(self) -> None:
+        cutoff = time.monotonic() - self.ack_timeout_sec
+        stale = [k for k, ts in self._sent.items() if ts < cutoff]
+        for k in stale:
+            del self._sent[k]
+        self._counters["unacked"] += len(stale)
+
+    def stats(self) -> Dict[str, Any]:
+        self._expire()
+        vals = sorted(self._samples_ms)
+        return {
+            **self._counters,
+            "pending": len(self._sent),
+            "ack_ms_p50": round(_percentile(vals, 50), 1),
+            "ack_ms_p95": round(_percentile(vals, 95), 1),
+            "ack_ms_max": round(vals[-1], 1) if vals else 0.0,
+        }
@@ -0,0 +1,137 @@
+"""
+Socket varlık (presence) kaydı — kullanıcı ↔ sid çift yönlü indeks (süreç içi).
+
+- Kullanıcı başına birden çok cihaz/sekme (sid); en son bağlanan sid birincil
+- add / remove_sid / get_sid / user_of: O(1) (disconnect'te tüm kullanıcıları tarama yok)
+- Kullanıcı anahtarı tek biçim: strip().lower() (eski kod ham + küçük harf iki kayıt tutuyordu)
+- Şehir bazlı çevrimiçi sayaç: set_city() ile; online_count(city) O(1)
+- Varlık zamanları: connected_at (ilk sid), last_seen (touch)
+
+Yalnızca event loop içinden kullanılır (kilit yok). Çoklu worker'da her süreç kendi soketlerini tutar;
+süreçler arası sid araması / sayım için server.py paylaşılan durumu (services/shared_state.py) kullanır.
+"""
+from __future__ import annotations
+
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+
+def _norm(value: Any) -> str:
+    return str(value).strip().lower() if value is not None else ""
+
+
+class PresenceRegistry:
+    def __init__(self) -> None:
+        # uid -> {sid: connected_at} (ekleme sırası korunur; son eleman birincil)
+        self._sids_by_user: Dict[str, Dict[str, float]] = {}
+        self._user_by_sid: Dict[str, str] = {}
+        # uid -> {"role", "city", "connected_at", "last_seen"}
+        self._meta: Dict[str, dict] = {}
+        self._city_counts: Counter = Counter()
+
+    # ---------- yazma ----------
+
+    def add(self, user_id: Any, sid: str, *, role: Optional[str] = None) -> str:
+        """sid'i kullanıcıya bağla (sid başka kullanıcıdaysa önce ondan ayrılır). Dönüş: normalize uid."""
+        uid = _norm(user_id)
+        if not uid or not sid:
+            return uid
+        prev = self._user_by_sid.get(sid)
+        if prev is not None and prev != uid:
+            self.remove_sid(sid)
+        now = time.time()
+        sids = self._sids_by_user.setdefault(uid, {})
+        sids.pop(sid, None)
+        sids[sid] = now
+        self._user_by_sid[sid] = uid
+        meta = self._meta.get(uid)
+        if meta is None:
+            meta = {"role": role, "city": None, "connected_at": now, "last_seen": now}
+            self._meta[uid] = meta
+        else:
+            meta["last_seen"] = now
+            if role:
+                meta["role"] = role
+        return uid
+
+    def remove_sid(self, sid: str) -> Optional[str]:
+        """sid'i kaldır. Dönüş: sid'in kullanıcısı (kayıt yoksa None)."""
+        uid = self._user_by_sid.pop(sid, None)
+        if uid is None:
+            return None
+        sids = self._sids_by_user.get(uid)
+        if sids is not None:
+            sids.pop(sid, None)
+            if not sids:
+                del self._sids_by_user[uid]
+                meta = self._meta.pop(uid, None)
+                city = (meta or {}).get("city")
+                if city:
+                    self._city_counts[city] -= 1
+                    if self._city_counts[city] <= 0:
+                        del self._city_counts[city]
+        return uid
+
+    def set_city(self, user_id: Any, city: Optional[str]) -> None:
+        """Çevrimiçi kullanıcının şehri (sayaç için). Çevrimdışıysa no-op."""
+        uid = _norm(user_id)
+        meta = self._meta.get(uid)
+        if meta is None:
+            return
+        new = (city or "").strip() or None
+        old = meta.get("city")
+        if old == new:
+            return
+        if old:
+            self._city_counts[old] -= 1
+            if self._city_counts[old] <= 0:
+                del self._city_counts[old]
+        if new:
+            self._city_counts[new] += 1
+        meta["city"] = new
+
+    def touch(self, user_id: Any) -> None:
+        meta = self._meta.get(_norm(user_id))
+        if meta is not None:
+            meta["last_seen"] = time.time()
+
+    # ---------- okuma ----------
+
+    def get_sid(self, user_id: Any) -> Optional[str]:
+        """Birincil (en son bağlanan) sid."""
+        sids = self._sids_by_user.get(_norm(user_id))
+        if not sids:
+            return None
+        return next(reversed(sids))
+
+    def sids(self, user_id: Any) -> List[str]:
+        return list(self._sids_by_user.get(_norm(user_id), {}).keys())
+
+    def user_of(self, sid: str) -> Optional[str]:
+        return self._user_by_sid.get(sid)
+
+    def is_online(self, user_id: Any) -> bool:
+        return _norm(user_id) in self._sids_by_user
+
+    def presence(self, user_id: Any) -> Optional[dict]:
+        uid = _norm(user_id)
+        meta = self._meta.get(uid)
+        if meta is None:
+            return None
+        return {**meta, "devices": len(self._sids_by_user.get(uid, {}))}
+
+    def online_count(self, city: Optional[str] = None) -> int:
+        if city is None:
+            return len(self._sids_by_user)
+        return int(self._city_counts.get((city or "").strip(), 0))
+
+    def city_counts(self) -> Dict[str, int]:
+        return dict(self._city_counts)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "online_users": len(self._sids_by_user),
+            "sockets": len(self._user_by_sid),
+            "cities": len(self._city_counts),
+        }
@@ -0,0 +1,227 @@
+"""
+Toplu Expo push dağıtıcısı — 100'lük parçalar, eşzamanlı istekler, bilet → receipt hattı.
+
+send_push_notifications_to_users() her kullanıcı için ayrı users sorgusu + tek mesajlık Expo POST'u
+yapıyordu (50k kullanıcılı duyuru = 100k sıralı istek). Burada:
+- send(): token'lar tekilleştirilir, expo_message_chunks() ile 100'lük parçalar, en fazla
+  PUSH_DISPATCH_CONCURRENCY eşzamanlı POST
+- 'ok' biletlerin id'leri bekletilir; PUSH_RECEIPT_DELAY_SEC sonra arka planda 1000'lik getReceipts
+- Bilette veya receipt'te DeviceNotRegistered → on_unregistered(token listesi) (users.push_token temizliği)
+
+Yalnızca event loop içinden kullanılır (kilit yok).
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+
+from services.http_clients import get_http_client
+from services.offer_fanout import bounded_gather
+from services.push_notification_service import (
+    EXPO_MAX_RECEIPT_IDS_PER_REQUEST,
+    EXPO_PUSH_URL,
+    EXPO_RECEIPTS_URL,
+    expo_message_chunks,
+)
+
+logger = logging.getLogger(__name__)
+
+UNREGISTERED_ERROR = "DeviceNotRegistered"
+# Bu süreden sonra receipt'i gelmeyen bilet bırakılır (Expo receipt'leri ~24 saat tutar)
+RECEIPT_MAX_AGE_SEC = 3600.0
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return max(0.0, float((os.getenv(name) or str(default)).strip()))
+    except (TypeError, ValueError):
+        return default
+
+
+def _error_code(item: Any) -> Optional[str]:
+    """Bilet / receipt hata kodu (details.error)."""
+    if not isinstance(item, dict) or item.get("status") != "error":
+        return None
+    details = item.get("details")
+    if isinstance(details, dict) and details.get("error"):
+        return str(details["error"])
+    return str(item.get("message") or "error")
+
+
+class PushDispatcher:
+    """
+    headers(): Expo istek başlıkları (EXPO_ACCESS_TOKEN); on_unregistered(tokens): geçersiz token temizliği.
+    client(): httpx.AsyncClient benzeri (post) — varsayılan paylaşılan "expo" havuzu.
+    """
+
+    def __init__(
+        self,
+        *,
+        headers: Callable[[], Dict[str, str]],
+        on_unregistered: Optional[Callable[[List[str]], Awaitable[Any]]] = None,
+        client: Optional[Callable[[], Any]] = None,
+        concurrency: int = 8,
+        receipt_delay_sec: float = 15.0,
+    ) -> None:
+        self._headers = headers
+        self._on_unregistered = on_unregistered
+        self._client = client or (lambda: get_http_client("expo"))
+        self.concurrency = max(1, int(concurrency))
+        self.receipt_delay_sec = float(receipt_delay_sec)
+        # bilet id → (token, gönderim anı)
+        self._pending: Dict[str, tuple] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._counters: Dict[str, int] = {
+            "requests": 0,
+            "request_errors": 0,
+            "sent": 0,
+            "failed": 0,
+            "receipts_checked": 0,
+            "receipt_errors": 0,
+            "pruned_tokens": 0,
+        }
+
+    @classmethod
+    def from_env(cls, **kwargs: Any) -> "PushDispatcher":
+        try:
+            concurrency = max(1, int(os.getenv("PUSH_DISPATCH_CONCURRENCY", "8")))
+        except (TypeError, ValueError):
+            concurrency = 8
+        return cls(
+            concurrency=concurrency,
+            receipt_delay_sec=_env_float("PUSH_RECEIPT_DELAY_SEC", 15.0),
+            **kwargs,
+        )
+
+    # ---------- gönderim ----------
+
+    async def _post_chunk(self, messages: List[dict]) -> List[dict]:
+        """Tek Expo isteği; dönüş mesaj sırasıyla biletler (istek hatasında hepsi error)."""
+        self._counters["requests"] += 1
+        try:
+            response = await self._client().post(
+                EXPO_PUSH_URL, json=messages, headers=self._headers(), timeout=30.0
+            )
+            if response.status_code == 200:
+                tickets = (response.json() or {}).get("data") or []
+                if len(tickets) == len(messages):
+                    return tickets
+            logger.warning("Expo push HTTP %s: %s", response.status_code, str(response.text)[:300])
+        except Exception as e:
+            logger.warning("Expo push isteği başarısız: %s", e)
+        self._counters["request_errors"] += 1
+        return [{"status": "error", "message": "request_failed"} for _ in messages]
+
+    async def send(
+        self, tokens: Iterable[str], title: str, body: str, data: Optional[dict] = None
+    ) -> Dict[str, Any]:
+        """
+        Token'lara aynı bildirimi gönder. Dönüş: {"sent", "failed", "ok_tokens": set}
+        (ok = Expo bileti kabul etti; gerçek teslim receipt hattında kontrol edilir).
+        """
+        unique = list(dict.fromkeys(t.strip() for t in tokens if t and str(t).strip()))
+        chunks = expo_message_chunks(unique, title, body, data)
+        results = await bounded_gather(chunks, self._post_chunk, limit=self.concurrency)
+
+        ok_tokens: set = set()
+        unregistered: List[str] = []
+        now = time.monotonic()
+        for messages, tickets in zip(chunks, results):
+            for msg, ticket in zip(messages, tickets or []):
+                token = msg["to"]
+                if isinstance(ticket, dict) and ticket.get("status") == "ok":
+                    ok_tokens.add(token)
+                    if ticket.get("id"):
+                        self._pending[str(ticket["id"])] = (token, now)
+                elif _error_code(ticket) == UNREGISTERED_ERROR:
+                    unregistered.append(token)
+        sent = len(ok_tokens)
+        failed = len(unique) - sent
+        self._counters["sent"] += sent
+        self._counters["failed"] += failed
+        if unregistered:
+            await self._prune(unregistered)
+        return {"sent": sent, "failed": failed, "ok_tokens": ok_tokens}
+
+    # ---------- receipt hattı ----------
+
+    async def _prune(self, tokens: List[str]) -> None:
+        tokens = list(dict.fromkeys(tokens))
+        self._counters["pruned_tokens"] += len(tokens)
+        logger.info("Expo DeviceNotRegistered: %s token temizleniyor", len(tokens))
+        if self._on_unregistered is None:
+            return
+        try:
+            await self._on_unregistered(tokens)
+        except Exception as e:
+            logger.warning("Geçersiz push token temizliği başarısız: %s", e)
+
+    async def check_receipts(self, *, force: bool = False) -> int:
+        """Süresi gelen biletlerin receipt'lerini 1000'lik parçalarla sorgula. Dönüş: sorgulanan bilet sayısı."""
+        cutoff = time.monotonic() - (0.0 if force else self.receipt_delay_sec)
+        due = [tid for tid, (_tok, ts) in self._pending.items() if ts <= cutoff]
+        if not due:
+            return 0
+        batches = [
+            due[i : i + EXPO_MAX_RECEIPT_IDS_PER_REQUEST]
+            for i in range(0, len(due), EXPO_MAX_RECEIPT_IDS_PER_REQUEST)
+        ]
+
+        async def _fetch(ids: List[str]) -> Dict[str, Any]:
+            response = await self._client().post(
+                EXPO_RECEIPTS_URL, json={"ids": ids}, headers=self._headers(), timeout=30.0
+            )
+            if response.status_code != 200:
+                raise RuntimeError(f"getReceipts HTTP {response.status_code}")
+            return (response.json() or {}).get("data") or {}
+
+        unregistered: List[str] = []
+        checked = 0
+        give_up = time.monotonic() - RECEIPT_MAX_AGE_SEC
+        for ids, receipts in zip(batches, await bounded_gather(batches, _fetch, limit=self.concurrency)):
+            if receipts is None:
+                continue  # bir sonraki turda tekrar denenir
+            for tid in ids:
+                receipt = receipts.get(tid)
+                if receipt is None and self._pending.get(tid, (None, 0.0))[1] > give_up:
+                    continue  # receipt henüz hazır değil
+                token, _ts = self._pending.pop(tid, (None, 0.0))
+                code = _error_code(receipt)
+                if code:
+                    self._counters["receipt_errors"] += 1
+                    if code == UNREGISTERED_ERROR and token:
+                        unregistered.append(token)
+                checked += 1
+        self._counters["receipts_checked"] += checked
+        if unregistered:
+            await self._prune(unregistered)
+        return checked
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(max(1.0, self.receipt_delay_sec))
+            try:
+                await self.check_receipts()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Expo receipt kontrolü hatası: %s", e)
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self._counters,
+            "pending_receipts": len(self._pending),
+            "concurrency": self.concurrency,
+        }
@@ -3,12 +3,12 @@ Push Notification Service Module
 Modüler tasarım - Mevcut sisteme dokunmaz
 """
 import json
-import httpx
 import logging
 from typing import List, Dict, Optional, Any, Mapping
 from datetime import datetime
 
 from expo_push_channels import expo_android_channel_id_for_data
+from services.http_clients import get_http_client
 
 logger = logging.getLogger(__name__)
 
@@ -31,6 +31,42 @@ def _stringify_expo_data(data: Optional[Mapping[str, Any]]) -> dict:
     return out
 
 EXPO_PUSH_URL = "https://exp.host/--/api/v2/push/send"
+EXPO_RECEIPTS_URL = "https://exp.host/--/api/v2/push/getReceipts"
+# Expo: istek başına en fazla 100 mesaj / getReceipts başına en fazla 1000 bilet
+EXPO_MAX_MESSAGES_PER_REQUEST = 100
+EXPO_MAX_RECEIPT_IDS_PER_REQUEST = 1000
+
+
+def is_expo_token(token: Optional[str]) -> bool:
+    return bool(token) and (token.startswith("ExponentPushToken[") or token.startswith("ExpoPushToken["))
+
+
+def expo_message_chunks(
+    push_tokens: List[str],
+    title: str,
+    body: str,
+    data: Optional[Dict] = None,
+    size: int = EXPO_MAX_MESSAGES_PER_REQUEST,
+) -> List[List[dict]]:
+    """Geçerli token'lar için Expo mesajları, istek başına `size`'lık parçalar (sıra korunur)."""
+    valid_tokens = [t for t in push_tokens if is_expo_token(t)]
+    str_data = _stringify_expo_data(data)
+    ch = expo_android_channel_id_for_data(str_data)
+    messages = [
+        {
+            "to": token,
+            "title": title,
+            "body": body,
+            "sound": "default",
+            "priority": "high",
+            "channelId": ch,
+            "data": str_data,
+        }
+        for token in valid_tokens
+    ]
+    size = max(1, min(int(size), EXPO_MAX_MESSAGES_PER_REQUEST))
+    return [messages[i : i + size] for i in range(0, len(messages), size)]
+
 
 class PushNotificationService:
     """Expo Push Notification servisi"""
@@ -63,25 +99,25 @@ class PushNotificationService:
                 "data": str_data,
             }
 
-            async with httpx.AsyncClient(http2=False, timeout=30) as client:
-                response = await client.post(
-                    EXPO_PUSH_URL,
-                    json=[message],
-                    headers={"Content-Type": "application/json", "Accept": "application/json"},
-                    timeout=10.0
-                )
-                
-                if response.status_code == 200:
-                    result = response.json()
-                    if result.get("data", [{}])[0].get("status") == "ok":
-                        logger.info(f"Push notification sent successfully")
-                        return True
-                    else:
-                        logger.error(f"Push notification failed: {result}")
-                        return False
+            client = get_http_client("expo")
+            response = await client.post(
+                EXPO_PUSH_URL,
+                json=[message],
+                headers={"Content-Type": "application/json", "Accept": "application/json"},
+                timeout=10.0
+            )
+
+            if response.status_code == 200:
+                result = response.json()
+                if result.get("data", [{}])[0].get("status") == "ok":
+                    logger.info(f"Push notification sent successfully")
+                    return True
                 else:
-                    logger.error(f"Push notification HTTP error: {response.status_code}")
+                    logger.error(f"Push notification failed: {result}")
                     return False
+            else:
+                logger.error(f"Push notification HTTP error: {response.status_code}")
+                return False
                     
         except Exception as e:
             logger.error(f"Push notification error: {e}")
@@ -97,58 +133,32 @@ class PushNotificationService:
         """Birden fazla kullanıcıya bildirim gönder"""
         sent = 0
         failed = 0
-        
+
         # Expo max 100 notification per request
-        valid_tokens = [
-            t
-            for t in push_tokens
-            if t
-            and (
-                t.startswith("ExponentPushToken[")
-                or t.startswith("ExpoPushToken[")
-            )
-        ]
-
-        str_data = _stringify_expo_data(data)
-        ch = expo_android_channel_id_for_data(str_data)
-        for i in range(0, len(valid_tokens), 100):
-            batch = valid_tokens[i : i + 100]
-            messages = [
-                {
-                    "to": token,
-                    "title": title,
-                    "body": body,
-                    "sound": "default",
-                    "priority": "high",
-                    "channelId": ch,
-                    "data": str_data,
-                }
-                for token in batch
-            ]
-            
+        for messages in expo_message_chunks(push_tokens, title, body, data):
             try:
-                async with httpx.AsyncClient(http2=False, timeout=30) as client:
-                    response = await client.post(
-                        EXPO_PUSH_URL,
-                        json=messages,
-                        headers={"Content-Type": "application/json"},
-                        timeout=30.0
-                    )
-                    
-                    if response.status_code == 200:
-                        result = response.json()
-                        for ticket in result.get("data", []):
-                            if ticket.get("status") == "ok":
-                                sent += 1
-                            else:
-                                failed += 1
-                    else:
-                        failed += len(batch)
-                        
+                client = get_http_client("expo")
+                response = await client.post(
+                    EXPO_PUSH_URL,
+                    json=messages,
+                    headers={"Content-Type": "application/json"},
+                    timeout=30.0
+                )
+
+                if response.status_code == 200:
+                    result = response.json()
+                    for ticket in result.get("data", []):
+                        if ticket.get("status") == "ok":
+                            sent += 1
+                        else:
+                            failed += 1
+                else:
+                    failed += len(messages)
+
             except Exception as e:
                 logger.error(f"Bulk push error: {e}")
-                failed += len(batch)
-        
+                failed += len(messages)
+
         return {"sent": sent, "failed": failed}
 
 
@@ -0,0 +1,441 @@
+"""
+Kalıcı push outbox — notifications_log satırı = gönderim işi; worker havuzu tekrar denemeyle boşaltır.
+
+Yolculuk bildirimleri (send_trip_push_and_log, eşleşme, dispatch teklifi) istek yolunda ya da sahipsiz
+create_task ile gönderiliyordu: Expo yavaşsa istek yavaşlıyor, süreç yeniden başlarsa push kayboluyordu.
+Burada:
+- enqueue(): satır status='sending' + kira (next_attempt_at) ile yazılır ve yerel kuyruğa konur (G/Ç: tek insert)
+- PUSH_OUTBOX_WORKERS worker: global hız sınırı (PUSH_OUTBOX_RATE_PER_SEC, süreç başına), deliver(),
+  sonuç satıra yazılır (sent / failed / pending + üstel geri çekilme)
+- Aynı alıcıya aynı bildirim (tip + tag_id + teklif turu offer_gen, yoksa başlık + metin) PUSH_OUTBOX_DEDUP_SEC
+  içinde bir kez gönderilir; tekrar da notifications_log'a status='deduped' satırı olarak yazılır (her bildirim loglanır)
+- Poller: kirası dolmuş / zamanı gelmiş satırları koşullu update ile sahiplenir (çöken süreçten kalanlar, retry'lar)
+
+Depolar: Supabase `notifications_log` (sql_migrations/create_push_outbox.sql) veya bellek (test / tek süreç).
+Outbox kolonları yoksa eski log satırı yazılır, push yalnızca bellek kuyruğunda denenir.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import random
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+OUTCOME_SENT = "sent"
+OUTCOME_RETRY = "retry"
+OUTCOME_DROP = "drop"
+
+# deliver(item) → (OUTCOME_*, açıklama)
+Deliver = Callable[[dict], Awaitable[Tuple[str, Optional[str]]]]
+
+OUTBOX_COLUMNS = "id, type, user_id, title, body, data, push_token, status, attempts, next_attempt_at, created_at"
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return max(0.0, float((os.getenv(name) or str(default)).strip()))
+    except (TypeError, ValueError):
+        return default
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return max(1, int(os.getenv(name, str(default))))
+    except (TypeError, ValueError):
+        return default
+
+
+def _iso(ts: float) -> str:
+    return datetime.fromtimestamp(ts, tz=timezone.utc).isoformat()
+
+
+def _parse_ts(value: Any) -> float:
+    try:
+        dt = datetime.fromisoformat(str(value or "").replace("Z", "+00:00"))
+    except ValueError:
+        return 0.0
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+def dedup_key(item: dict) -> Tuple[str, str, str]:
+    """
+    Alıcı (user_id, yoksa token) + tip + tag_id (yoksa başlık|metin). data.offer_gen varsa anahtara girer:
+    rolling dispatch aynı sürücüye yeni turda tekrar teklif ettiğinde push bastırılmaz.
+    """
+    data = item.get("data") or {}
+    who = str(item.get("user_id") or item.get("push_token") or "").strip().lower()
+    what = str(data.get("tag_id") or f"{item.get('title')}|{item.get('body')}")
+    if data.get("offer_gen") is not None:
+        what = f"{what}#{data['offer_gen']}"
+    return (who, str(data.get("type") or item.get("type") or ""), what)
+
+
+# ==================== DEPOLAR ====================
+
+
+class MemoryOutboxStore:
+    """Süreç içi depo (restart'ta kaybolur) — testler ve tek süreç. Biten (sent/failed) satırlar silinir."""
+
+    kind = "memory"
+
+    def __init__(self) -> None:
+        self.rows: Dict[str, dict] = {}
+
+    async def insert(self, item: dict) -> bool:
+        # Yalnızca gönderilecek satırlar tutulur (deduped gibi son durumlar finish'teki gibi düşer)
+        if item.get("status") in ("pending", "sending"):
+            self.rows[item["id"]] = dict(item)
+        return True
+
+    async def load_due(self, now: float, limit: int) -> List[dict]:
+        due = [
+            dict(r)
+            for r in self.rows.values()
+            if r.get("status") in ("pending", "sending") and _parse_ts(r.get("next_attempt_at")) <= now
+        ]
+        due.sort(key=lambda r: _parse_ts(r.get("next_attempt_at")))
+        return due[:limit]
+
+    async def claim(self, item_id: str, now: float, lease_until: float) -> bool:
+        row = self.rows.get(item_id)
+        if row is None or row.get("status") not in ("pending", "sending"):
+            return False
+        if _parse_ts(row.get("next_attempt_at")) > now:
+            return False
+        row.update({"status": "sending", "next_attempt_at": _iso(lease_until)})
+        return True
+
+    async def finish(self, item_id: str, fields: dict) -> None:
+        if fields.get("status") in ("sent", "failed"):
+            self.rows.pop(item_id, None)
+        elif item_id in self.rows:
+            self.rows[item_id].update(fields)
+
+
+class SupabaseOutboxStore:
+    """
+    Supabase `notifications_log`. db: supabase_client.AsyncSupabase.
+    claim = koşullu UPDATE (kirası dolmuş satırı yalnızca bir süreç alır).
+    """
+
+    kind = "supabase"
+    table = "notifications_log"
+
+    def __init__(self, db: Any) -> None:
+        self._db = db
+
+    async def insert(self, item: dict) -> bool:
+        """Dönüş: kalıcı mı. Outbox kolonları yoksa eski log satırı yazılır (False)."""
+        try:
+            await self._db.table(self.table).insert(item).execute()
+            return True
+        except Exception as e:
+            logger.warning("push outbox insert (outbox kolonları yok mu?): %s", e)
+        legacy = {k: item.get(k) for k in ("type", "user_id", "title", "body", "created_at")}
+        try:
+            await self._db.table(self.table).insert(legacy).execute()
+        except Exception as e:
+            logger.warning("notifications_log insert failed: %s", e)
+        return False
+
+    async def load_due(self, now: float, limit: int) -> List[dict]:
+        res = (
+            await self._db.table(self.table)
+            .select(OUTBOX_COLUMNS)
+            .in_("status", ["pending", "sending"])
+            .lte("next_attempt_at", _iso(now))
+            .order("next_attempt_at")
+            .limit(limit)
+            .execute()
+        )
+        return list(res.data or [])
+
+    async def claim(self, item_id: str, now: float, lease_until: float) -> bool:
+        res = (
+            await self._db.table(self.table)
+            .update({"status": "sending", "next_attempt_at": _iso(lease_until)})
+            .eq("id", item_id)
+            .in_("status", ["pending", "sending"])
+            .lte("next_attempt_at", _iso(now))
+            .execute()
+        )
+        return bool(res.data)
+
+    async def finish(self, item_id: str, fields: dict) -> None:
+        await self._db.table(self.table).update(fields).eq("id", item_id).execute()
+
+
+# ==================== OUTBOX ====================
+
+
+class _RateLimiter:
+    """Basit token bucket (süreç içi)."""
+
+    def __init__(self, rate_per_sec: float) -> None:
+        self.rate = float(rate_per_sec)
+        self._tokens = max(1.0, self.rate)
+        self._last = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        if self.rate <= 0:
+            return
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(max(1.0, self.rate), self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    return
+                await asyncio.sleep((1.0 - self._tokens) / self.rate)
+
+
+class PushOutbox:
+    """store: Memory/SupabaseOutboxStore; deliver(item) → (OUTCOME_*, açıklama)."""
+
+    def __init__(
+        self,
+        store: Any,
+        deliver: Deliver,
+        *,
+        workers: int = 4,
+        rate_per_sec: float = 30.0,
+        max_attempts: int = 6,
+        backoff_base_sec: float = 2.0,
+        backoff_max_sec: float = 300.0,
+        lease_sec: float = 120.0,
+        poll_sec: float = 5.0,
+        dedup_window_sec: float = 30.0,
+    ) -> None:
+        self.store = store
+        self._deliver = deliver
+        self.workers = max(1, int(workers))
+        self._rate = _RateLimiter(rate_per_sec)
+        self.max_attempts = max(1, int(max_attempts))
+        self.backoff_base_sec = float(backoff_base_sec)
+        self.backoff_max_sec = float(backoff_max_sec)
+        self.lease_sec = float(lease_sec)
+        self.poll_sec = float(poll_sec)
+        self.dedup_window_sec = float(dedup_window_sec)
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._recent: Dict[Tuple[str, str, str], float] = {}
+        self._in_flight: Set[str] = set()
+        self._tasks: List[asyncio.Task] = []
+        self._counters: Dict[str, int] = {
+            "enqueued": 0,
+            "deduped": 0,
+            "sent": 0,
+            "retried": 0,
+            "failed": 0,
+            "reclaimed": 0,
+            "store_errors": 0,
+        }
+
+    @classmethod
+    def from_env(cls, store: Any, deliver: Deliver) -> "PushOutbox":
+        return cls(
+            store,
+            deliver,
+            workers=_env_int("PUSH_OUTBOX_WORKERS", 4),
+            rate_per_sec=_env_float("PUSH_OUTBOX_RATE_PER_SEC", 30.0),
+            max_attempts=_env_int("PUSH_OUTBOX_MAX_ATTEMPTS", 6),
+            poll_sec=_env_float("PUSH_OUTBOX_POLL_SEC", 5.0),
+            dedup_window_sec=_env_float("PUSH_OUTBOX_DEDUP_SEC", 30.0),
+        )
+
+    # ---------- kuyruklama ----------
+
+    def _is_duplicate(self, item: dict) -> bool:
+        now = time.monotonic()
+        if len(self._recent) > 5000:
+            cutoff = now - self.dedup_window_sec
+            self._recent = {k: ts for k, ts in self._recent.items() if ts >= cutoff}
+        key = dedup_key(item)
+        last = self._recent.get(key)
+        if last is not None and now - last < self.dedup_window_sec:
+            return True
+        self._recent[key] = now
+        return False
+
+    async def enqueue(
+        self,
+        *,
+        user_id: Optional[str],
+        notification_type: str,
+        title: str,
+        body: str,
+        data: Optional[dict] = None,
+        push_token: Optional[str] = None,
+    ) -> bool:
+        """
+        Bildirimi kuyrukla (gönderimi beklemez). Dönüş: kabul edildi mi (tekrar ise de True).
+        Tekrar: gönderilmez, log satırı status='deduped' ile yine yazılır.
+        """
+        now = time.time()
+        item = {
+            "id": str(uuid.uuid4()),
+            "type": notification_type,
+            "user_id": str(user_id).strip() if user_id else None,
+            "title": title,
+            "body": body,
+            "data": dict(data or {}),
+            "push_token": push_token or None,
+            "status": "sending",
+            "attempts": 0,
+            "next_attempt_at": _iso(now + self.lease_sec),
+            "created_at": datetime.utcnow().isoformat(),
+        }
+        if not item["user_id"] and not item["push_token"]:
+            return False
+        if self._is_duplicate(item):
+            self._counters["deduped"] += 1
+            item.update({"status": "deduped", "next_attempt_at": None})
+            try:
+                await self.store.insert(item)
+            except Exception as e:
+                self._counters["store_errors"] += 1
+                logger.warning("push outbox deduped log satırı yazılamadı: %s", e)
+            return True
+        try:
+            durable = await self.store.insert(item)
+        except Exception as e:
+            self._counters["store_errors"] += 1
+            logger.warning("push outbox kaydı yazılamadı: %s", e)
+            durable = False
+        self._counters["enqueued"] += 1
+        self._queue.put_nowait((item, durable, time.monotonic() + self.lease_sec))
+        return True
+
+    # ---------- işleme ----------
+
+    def _backoff(self, attempts: int) -> float:
+        delay = min(self.backoff_max_sec, self.backoff_base_sec * (2 ** max(0, attempts - 1)))
+        return delay * random.uniform(0.8, 1.2)
+
+    async def _process(self, item: dict, durable: bool, lease_deadline: float) -> None:
+        if durable and time.monotonic() > lease_deadline:
+            # Kira bu süreçte beklerken doldu: başka süreç almadıysa yeniden sahiplen
+            now = time.time()
+            if not await self.store.claim(item["id"], now, now + self.lease_sec):
+                return
+        await self._rate.acquire()
+        try:
+            outcome, detail = await self._deliver(item)
+        except Exception as e:
+            outcome, detail = OUTCOME_RETRY, str(e)
+        attempts = int(item.get("attempts") or 0) + 1
+        now = time.time()
+        if outcome == OUTCOME_SENT:
+            fields = {"status": "sent", "attempts": attempts, "sent_at": _iso(now), "last_error": None}
+            self._counters["sent"] += 1
+        elif outcome == OUTCOME_DROP or attempts >= self.max_attempts:
+            fields = {"status": "failed", "attempts": attempts, "last_error": (detail or outcome)[:500]}
+            self._counters["failed"] += 1
+        else:
+            delay = self._backoff(attempts)
+            fields = {
+                "status": "pending",
+                "attempts": attempts,
+                "next_attempt_at": _iso(now + delay),
+                "last_error": (detail or outcome)[:500],
+            }
+            self._counters["retried"] += 1
+            if not durable:
+                retry = {**item, **fields}
+                asyncio.get_running_loop().call_later(
+                    delay, self._queue.put_nowait, (retry, False, float("inf"))
+                )
+        if durable:
+            try:
+                await self.store.finish(item["id"], fields)
+            except Exception as e:
+                self._counters["store_errors"] += 1
+                logger.warning("push outbox durum yazılamadı id=%s: %s", item["id"], e)
+
+    async def _worker(self) -> None:
+        while True:
+            item, durable, deadline = await self._queue.get()
+            self._in_flight.add(item["id"])
+            try:
+                await self._process(item, durable, deadline)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("push outbox işleme hatası: %s", e)
+            finally:
+                self._in_flight.discard(item["id"])
+                self._queue.task_done()
+
+    async def poll_once(self) -> int:
+        """Zamanı gelmiş satırları sahiplenip kuyruğa al. Dönüş: alınan satır sayısı."""
+        now = time.time()
+        taken = 0
+        for row in await self.store.load_due(now, self.workers * 25):
+            rid = str(row.get("id") or "")
+            if not rid or rid in self._in_flight:
+                continue
+            if await self.store.claim(rid, now, now + self.lease_sec):
+                taken += 1
+                self._queue.put_nowait((row, True, time.monotonic() + self.lease_sec))
+        self._counters["reclaimed"] += taken
+        return taken
+
+    async def _poll(self) -> None:
+        while True:
+            await asyncio.sleep(self.poll_sec)
+            if self._queue.qsize() >= self.workers * 25:
+                continue
+            try:
+                await self.poll_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("push outbox poll hatası (%s): %s", getattr(self.store, "kind", "?"), e)
+
+    # ---------- yaşam döngüsü ----------
+
+    def start(self) -> None:
+        if self._tasks:
+            return
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        if self.poll_sec > 0:
+            self._tasks.append(asyncio.create_task(self._poll()))
+        logger.info(
+            "✅ Push outbox: store=%s workers=%s rate=%s/sn",
+            getattr(self.store, "kind", "?"),
+            self.workers,
+            self._rate.rate,
+        )
+
+    async def drain(self, timeout: float = 5.0) -> bool:
+        """Yerel kuyruğun boşalmasını bekle (kapanış / test). Dönüş: boşaldı mı."""
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def stop(self) -> None:
+        """Görevleri durdur; kalıcı satırlar kira dolunca (bu veya başka süreçte) yeniden denenir."""
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self._counters,
+            "queued": self._queue.qsize(),
+            "in_flight": len(self._in_flight),
+            "store": getattr(self.store, "kind", "?"),
+            "workers": self.workers,
+            "rate_per_sec": self._rate.rate,
+        }
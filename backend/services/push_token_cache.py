@@ -0,0 +1,122 @@
+"""
+Push token çözümleyici önbelleği — user id / telefon → (id, push_token, name, phone), süreç içi TTL'li.
+
+send_push_notification() her bildirimde bir kullanıcı için yedi users sorgusuna kadar çıkabiliyordu
+(id, küçük harf id, dört telefon biçimi, LIKE taraması). Burada:
+- Anahtar: UUID → "id:<küçük harf>"; telefon → "tel:<son 10 hane>" (+90..., 90..., 0..., boşluk/tire
+  hepsi aynı anahtara düşer); satır hem id hem telefon anahtarına yazılır
+- lookup(): önbellekte varsa DB'ye gidilmez; bulunamayan kullanıcı kısa süre (negatif TTL) önbelleklenir
+- store_many(): toplu okumalardan (send_push_notifications_to_users) doldurma
+- invalidate(user_id): token kaydı / silme sonrası; id'ye bağlı tüm anahtarlar düşer
+
+Ortam: PUSH_TOKEN_CACHE_TTL_SEC (varsayılan 300). Yalnızca event loop içinden kullanılır (kilit yok).
+"""
+from __future__ import annotations
+
+import os
+import re
+import time
+from typing import Any, Dict, Iterable, Optional, Set, Tuple
+
+_UUID_RE = re.compile(r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$", re.I)
+_PHONE_CHARS_RE = re.compile(r"^[0-9+\s\-().]+$")
+
+ROW_KEYS = ("id", "push_token", "name", "phone")
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return max(0.0, float((os.getenv(name) or str(default)).strip()))
+    except (TypeError, ValueError):
+        return default
+
+
+def cache_key(value: Any) -> str:
+    """UUID / diğer id → "id:..."; 10+ haneli telefon → "tel:<son 10 hane>"; boş → ""."""
+    raw = str(value).strip() if value is not None else ""
+    if not raw:
+        return ""
+    if not _UUID_RE.match(raw) and _PHONE_CHARS_RE.match(raw):
+        digits = "".join(c for c in raw if c.isdigit())
+        if len(digits) >= 10:
+            return "tel:" + digits[-10:]
+    return "id:" + raw.lower()
+
+
+class PushTokenCache:
+    """anahtar → (satır | None, monotonic); id → o satırı gösteren anahtarlar (invalidate için)."""
+
+    def __init__(self, *, ttl_sec: float = 300.0, negative_ttl_sec: float = 30.0, max_entries: int = 100000) -> None:
+        self.ttl_sec = float(ttl_sec)
+        self.negative_ttl_sec = float(negative_ttl_sec)
+        self.max_entries = max(1, int(max_entries))
+        self._entries: Dict[str, Tuple[Optional[dict], float]] = {}
+        self._keys_by_id: Dict[str, Set[str]] = {}
+        self._counters: Dict[str, int] = {"hits": 0, "misses": 0, "stores": 0, "invalidations": 0}
+
+    @classmethod
+    def from_env(cls) -> "PushTokenCache":
+        return cls(ttl_sec=_env_float("PUSH_TOKEN_CACHE_TTL_SEC", 300.0))
+
+    def lookup(self, user_ref: Any) -> Tuple[bool, Optional[dict]]:
+        """Dönüş: (önbellekte mi, satır kopyası veya None = kullanıcı bulunamadı)."""
+        key = cache_key(user_ref)
+        item = self._entries.get(key) if key else None
+        if item is not None:
+            row, ts = item
+            ttl = self.ttl_sec if row is not None else self.negative_ttl_sec
+            if time.monotonic() - ts < ttl:
+                self._counters["hits"] += 1
+                return True, dict(row) if row is not None else None
+            self._entries.pop(key, None)
+        self._counters["misses"] += 1
+        return False, None
+
+    def store(self, user_ref: Any, row: Optional[dict]) -> None:
+        """Çözümleme sonucu: istenen anahtar + satırın id ve telefon anahtarları (row None → negatif)."""
+        if len(self._entries) >= self.max_entries:
+            self._prune()
+        now = time.monotonic()
+        keys = {k for k in (cache_key(user_ref),) if k}
+        stored = None
+        if row is not None and row.get("id"):
+            stored = {k: row.get(k) for k in ROW_KEYS}
+            uid = str(row["id"]).strip().lower()
+            keys.add(cache_key(uid))
+            if row.get("phone"):
+                keys.add(cache_key(row["phone"]))
+            self._keys_by_id.setdefault(uid, set()).update(keys)
+        for key in keys:
+            self._entries[key] = (stored, now)
+        self._counters["stores"] += 1
+
+    def store_many(self, rows: Iterable[dict]) -> int:
+        n = 0
+        for row in rows:
+            if row and row.get("id"):
+                self.store(row["id"], row)
+                n += 1
+        return n
+
+    def invalidate(self, user_id: Any) -> None:
+        uid = str(user_id).strip().lower() if user_id is not None else ""
+        if not uid:
+            return
+        keys = self._keys_by_id.pop(uid, set()) | {cache_key(uid)}
+        for key in keys:
+            self._entries.pop(key, None)
+        self._counters["invalidations"] += 1
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._keys_by_id.clear()
+
+    def _prune(self) -> None:
+        cutoff = time.monotonic() - self.ttl_sec
+        for key in [k for k, (_r, ts) in self._entries.items() if ts < cutoff]:
+            self._entries.pop(key, None)
+        if len(self._entries) >= self.max_entries:
+            self.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self._counters, "entries": len(self._entries), "ttl_sec": self.ttl_sec}
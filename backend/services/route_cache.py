@@ -0,0 +1,274 @@
+"""
+Yol mesafesi cache — iki katman (Google Directions / OSRM sonuçları).
+
+1) Süreç içi LRU + TTL (OrderedDict)
+2) İsteğe bağlı SQLite disk katmanı: ROUTE_CACHE_SQLITE_PATH doluysa açılır (restart sonrası sıcak cache)
+
+Anahtar: başlangıç/bitiş ROUTE_CACHE_GRID_DEG ızgarasına yuvarlanır (aynı pickup/sürücü hücreleri aynı kayıt).
+Trafikli sonuçlar ayrıca günün saat dilimine (Türkiye saati, hafta içi/sonu) göre kovalanır ve
+kısa TTL ile tutulur; trafiksiz sonuçlar saat dilimi olmadan uzun TTL ile tutulur.
+
+Ortam değişkenleri:
+- ROUTE_CACHE_GRID_DEG (varsayılan 0.002 ≈ 200 m)
+- ROUTE_CACHE_MAX_ENTRIES (bellek, 20000) / ROUTE_CACHE_DISK_MAX_ENTRIES (200000)
+- ROUTE_CACHE_TTL_SEC (trafiksiz, 21600) / ROUTE_CACHE_TRAFFIC_TTL_SEC (900)
+- ROUTE_CACHE_TOD_BUCKET_MIN (30)
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_TURKEY_TZ = timezone(timedelta(hours=3))
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float((os.getenv(name) or str(default)).strip().replace(",", "."))
+    except (TypeError, ValueError):
+        return default
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int((os.getenv(name) or str(default)).strip())
+    except (TypeError, ValueError):
+        return default
+
+
+class RouteCache:
+    """Bellek LRU + isteğe bağlı SQLite; değerler JSON'a çevrilebilir dict."""
+
+    def __init__(
+        self,
+        *,
+        grid_deg: float = 0.002,
+        max_entries: int = 20000,
+        ttl_sec: float = 21600.0,
+        traffic_ttl_sec: float = 900.0,
+        tod_bucket_min: int = 30,
+        sqlite_path: Optional[str] = None,
+        disk_max_entries: int = 200000,
+    ) -> None:
+        self.grid_deg = max(1e-5, float(grid_deg))
+        self.max_entries = max(1, int(max_entries))
+        self.ttl_sec = float(ttl_sec)
+        self.traffic_ttl_sec = float(traffic_ttl_sec)
+        self.tod_bucket_min = max(1, int(tod_bucket_min))
+        self.disk_max_entries = max(1, int(disk_max_entries))
+        self._mem: "OrderedDict[str, Tuple[float, dict]]" = OrderedDict()
+        self._counters: Dict[str, int] = {
+            "mem_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "puts": 0,
+            "evictions": 0,
+        }
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        self._disk_puts_since_prune = 0
+        if sqlite_path:
+            self._open_disk(sqlite_path)
+
+    @classmethod
+    def from_env(cls) -> "RouteCache":
+        return cls(
+            grid_deg=_env_float("ROUTE_CACHE_GRID_DEG", 0.002),
+            max_entries=_env_int("ROUTE_CACHE_MAX_ENTRIES", 20000),
+            ttl_sec=_env_float("ROUTE_CACHE_TTL_SEC", 21600.0),
+            traffic_ttl_sec=_env_float("ROUTE_CACHE_TRAFFIC_TTL_SEC", 900.0),
+            tod_bucket_min=_env_int("ROUTE_CACHE_TOD_BUCKET_MIN", 30),
+            sqlite_path=(os.getenv("ROUTE_CACHE_SQLITE_PATH") or "").strip() or None,
+            disk_max_entries=_env_int("ROUTE_CACHE_DISK_MAX_ENTRIES", 200000),
+        )
+
+    # ---------- anahtar ----------
+
+    def _snap(self, v: float) -> int:
+        return int(math.floor(float(v) / self.grid_deg))
+
+    def tod_bucket(self, now: Optional[datetime] = None) -> str:
+        """Türkiye saati: hafta içi/sonu + günün dakika kovası (ör. 'wd17')."""
+        t = (now or datetime.now(_TURKEY_TZ)).astimezone(_TURKEY_TZ)
+        day = "we" if t.weekday() >= 5 else "wd"
+        return f"{day}{(t.hour * 60 + t.minute) // self.tod_bucket_min}"
+
+    def make_key(
+        self,
+        namespace: str,
+        origin_lat: float,
+        origin_lng: float,
+        dest_lat: float,
+        dest_lng: float,
+        *,
+        traffic: bool = False,
+        now: Optional[datetime] = None,
+    ) -> str:
+        base = (
+            f"{namespace}:{self._snap(origin_lat)},{self._snap(origin_lng)}:"
+            f"{self._snap(dest_lat)},{self._snap(dest_lng)}"
+        )
+        return f"{base}:{self.tod_bucket(now)}" if traffic else base
+
+    # ---------- bellek katmanı ----------
+
+    def _mem_get(self, key: str) -> Optional[dict]:
+        item = self._mem.get(key)
+        if item is None:
+            return None
+        expires_at, value = item
+        if expires_at <= time.time():
+            self._mem.pop(key, None)
+            return None
+        self._mem.move_to_end(key)
+        return value
+
+    def _mem_put(self, key: str, value: dict, expires_at: float) -> None:
+        self._mem[key] = (expires_at, value)
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.max_entries:
+            self._mem.popitem(last=False)
+            self._counters["evictions"] += 1
+
+    # ---------- disk katmanı ----------
+
+    def _open_disk(self, path: str) -> None:
+        try:
+            conn = sqlite3.connect(path, check_same_thread=False, timeout=2.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS route_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS route_cache_expires ON route_cache(expires_at)")
+            conn.commit()
+            self._db = conn
+            logger.info("✅ Route cache disk katmanı açık: %s", path)
+        except Exception as e:
+            self._db = None
+            logger.warning("⚠️ Route cache SQLite açılamadı (%s) — yalnızca bellek: %s", path, e)
+
+    def _disk_get_sync(self, key: str) -> Optional[Tuple[float, dict]]:
+        if self._db is None:
+            return None
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT value, expires_at FROM route_cache WHERE key = ? AND expires_at > ?",
+                (key, time.time()),
+            ).fetchone()
+        if not row:
+            return None
+        try:
+            return float(row[1]), json.loads(row[0])
+        except (TypeError, ValueError):
+            return None
+
+    def _disk_put_sync(self, key: str, value: dict, expires_at: float) -> None:
+        if self._db is None:
+            return
+        with self._db_lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO route_cache(key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), expires_at),
+            )
+            self._disk_puts_since_prune += 1
+            if self._disk_puts_since_prune >= 500:
+                self._disk_puts_since_prune = 0
+                self._db.execute("DELETE FROM route_cache WHERE expires_at <= ?", (time.time(),))
+                # Kapasite aşımı: en erken sona erecekleri sil (LRU yaklaşımı)
+                self._db.execute(
+                    "DELETE FROM route_cache WHERE key IN ("
+                    "SELECT key FROM route_cache ORDER BY expires_at ASC "
+                    "LIMIT MAX(0, (SELECT COUNT(*) FROM route_cache) - ?))",
+                    (self.disk_max_entries,),
+                )
+            self._db.commit()
+
+    # ---------- genel API ----------
+
+    async def get(self, key: str, *, count_miss: bool = True) -> Optional[dict]:
+        value = self._mem_get(key)
+        if value is not None:
+            self._counters["mem_hits"] += 1
+            return dict(value)
+        if self._db is not None:
+            try:
+                hit = await asyncio.to_thread(self._disk_get_sync, key)
+            except Exception as e:
+                logger.warning("route cache disk get: %s", e)
+                hit = None
+            if hit is not None:
+                expires_at, value = hit
+                self._mem_put(key, value, expires_at)
+                self._counters["disk_hits"] += 1
+                return dict(value)
+        if count_miss:
+            self._counters["misses"] += 1
+        return None
+
+    async def put(self, key: str, value: dict, *, traffic: bool = False) -> None:
+        ttl = self.traffic_ttl_sec if traffic else self.ttl_sec
+        expires_at = time.time() + ttl
+        stored = dict(value)
+        self._mem_put(key, stored, expires_at)
+        self._counters["puts"] += 1
+        if self._db is not None:
+            try:
+                await asyncio.to_thread(self._disk_put_sync, key, stored, expires_at)
+            except Exception as e:
+                logger.warning("route cache disk put: %s", e)
+
+    async def lookup(
+        self,
+        namespace: str,
+        origin_lat: float,
+        origin_lng: float,
+        dest_lat: float,
+        dest_lng: float,
+    ) -> Optional[dict]:
+        """Önce bu saat diliminin trafikli kaydı, yoksa trafiksiz kayıt."""
+        coords = (origin_lat, origin_lng, dest_lat, dest_lng)
+        hit = await self.get(self.make_key(namespace, *coords, traffic=True), count_miss=False)
+        if hit is not None:
+            return hit
+        return await self.get(self.make_key(namespace, *coords, traffic=False))
+
+    async def store(
+        self,
+        namespace: str,
+        origin_lat: float,
+        origin_lng: float,
+        dest_lat: float,
+        dest_lng: float,
+        value: dict,
+        *,
+        traffic: bool = False,
+    ) -> None:
+        key = self.make_key(namespace, origin_lat, origin_lng, dest_lat, dest_lng, traffic=traffic)
+        await self.put(key, value, traffic=traffic)
+
+    def clear(self) -> None:
+        self._mem.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self._counters,
+            "mem_entries": len(self._mem),
+            "max_entries": self.max_entries,
+            "disk_enabled": self._db is not None,
+            "grid_deg": self.grid_deg,
+            "ttl_sec": self.ttl_sec,
+            "traffic_ttl_sec": self.traffic_ttl_sec,
+        }
@@ -0,0 +1,326 @@
+"""
+Süreçler arası paylaşılan durum — çoklu uvicorn worker / çoklu node için.
+
+Bellekteki dict'ler (connected_users, dispatch kuyrukları, OTP, QR...) her worker'da ayrı kaldığından
+sunucu `--workers 1` ile sınırlıydı. Bu modül aynı ad alanlı async map API'sini iki arka uçla sunar:
+
+- MemoryStateBackend: tek süreç / testler (değerler JSON olarak saklanır → Redis ile aynı kopya semantiği;
+  okunan değer üzerinde yerinde değişiklik kalıcı değildir, set() ile geri yazılmalıdır)
+- RedisStateBackend: REDIS_URL doluysa; anahtar `{prefix}:{map}:{key}`, değer JSON, isteğe bağlı TTL
+
+Yayın/abonelik: publish(channel, message) / subscribe(channel, handler) — bellekte aynı süreçteki
+handler'lar doğrudan çağrılır, Redis'te `{prefix}:{channel}` kanalıyla tüm worker'lara gider (ayar değişikliği vb.).
+
+Socket.IO tarafı için socketio_client_manager(): REDIS_URL varsa socketio.AsyncRedisManager
+(emit'ler tüm worker'lardaki soketlere ulaşır).
+
+Ortam değişkenleri:
+- REDIS_URL (ör. redis://localhost:6379/0) — boşsa bellek
+- SHARED_STATE_PREFIX (varsayılan "leylek")
+- SOCKETIO_REDIS_CHANNEL (varsayılan "leylek-socketio")
+"""
+from __future__ import annotations
+
+import asyncio
+import inspect
+import json
+import logging
+import os
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # redis paketi opsiyonel (tek worker / test)
+    aioredis = None
+
+
+def _dumps(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False, default=str)
+
+
+def _loads(raw: Any) -> Any:
+    if raw is None:
+        return None
+    if isinstance(raw, bytes):
+        raw = raw.decode("utf-8")
+    return json.loads(raw)
+
+
+async def _dispatch_message(handlers: List[Callable[[Any], Any]], channel: str, message: Any) -> None:
+    for handler in list(handlers):
+        try:
+            res = handler(message)
+            if inspect.isawaitable(res):
+                await res
+        except Exception as e:
+            logger.warning("Paylaşılan durum abonesi hatası (%s): %s", channel, e)
+
+
+# ==================== BELLEK ====================
+
+
+class MemoryStateMap:
+    """Tek süreç map'i; TTL okuma anında uygulanır."""
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self._data: Dict[str, Tuple[str, Optional[float]]] = {}
+
+    def _live(self, key: str) -> Optional[str]:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        raw, expires_at = item
+        if expires_at is not None and expires_at <= time.time():
+            self._data.pop(key, None)
+            return None
+        return raw
+
+    async def get(self, key: Any, default: Any = None) -> Any:
+        raw = self._live(str(key))
+        return default if raw is None else _loads(raw)
+
+    async def set(self, key: Any, value: Any, ttl_sec: Optional[float] = None) -> None:
+        expires_at = time.time() + float(ttl_sec) if ttl_sec else None
+        self._data[str(key)] = (_dumps(value), expires_at)
+
+    async def set_if_absent(self, key: Any, value: Any, ttl_sec: Optional[float] = None) -> bool:
+        if self._live(str(key)) is not None:
+            return False
+        await self.set(key, value, ttl_sec)
+        return True
+
+    async def pop(self, key: Any, default: Any = None) -> Any:
+        raw = self._live(str(key))
+        self._data.pop(str(key), None)
+        return default if raw is None else _loads(raw)
+
+    async def contains(self, key: Any) -> bool:
+        return self._live(str(key)) is not None
+
+    async def keys(self) -> List[str]:
+        return [k for k in list(self._data.keys()) if self._live(k) is not None]
+
+    async def items(self) -> List[Tuple[str, Any]]:
+        out = []
+        for k in list(self._data.keys()):
+            raw = self._live(k)
+            if raw is not None:
+                out.append((k, _loads(raw)))
+        return out
+
+    async def size(self) -> int:
+        return len(await self.keys())
+
+    async def clear(self) -> None:
+        self._data.clear()
+
+
+class MemoryStateBackend:
+    kind = "memory"
+
+    def __init__(self) -> None:
+        self._maps: Dict[str, MemoryStateMap] = {}
+        self._subscribers: Dict[str, List[Callable[[Any], Any]]] = {}
+
+    def map(self, name: str) -> MemoryStateMap:
+        if name not in self._maps:
+            self._maps[name] = MemoryStateMap(name)
+        return self._maps[name]
+
+    async def publish(self, channel: str, message: Any) -> None:
+        await _dispatch_message(self._subscribers.get(channel, []), channel, _loads(_dumps(message)))
+
+    async def subscribe(self, channel: str, handler: Callable[[Any], Any]) -> None:
+        self._subscribers.setdefault(channel, []).append(handler)
+
+    async def start(self) -> None:
+        return None
+
+    async def close(self) -> None:
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.kind, "maps": {n: len(m._data) for n, m in self._maps.items()}}
+
+
+# ==================== REDIS ====================
+
+
+class RedisStateMap:
+    """Redis map'i: her kayıt ayrı string anahtar (kayıt bazında TTL için)."""
+
+    def __init__(self, backend: "RedisStateBackend", name: str) -> None:
+        self.name = name
+        self._backend = backend
+        self._prefix = f"{backend.prefix}:{name}:"
+
+    @property
+    def _r(self):
+        return self._backend.client
+
+    def _k(self, key: Any) -> str:
+        return self._prefix + str(key)
+
+    async def get(self, key: Any, default: Any = None) -> Any:
+        raw = await self._r.get(self._k(key))
+        return default if raw is None else _loads(raw)
+
+    async def set(self, key: Any, value: Any, ttl_sec: Optional[float] = None) -> None:
+        if ttl_sec:
+            await self._r.set(self._k(key), _dumps(value), px=max(1, int(float(ttl_sec) * 1000)))
+        else:
+            await self._r.set(self._k(key), _dumps(value))
+
+    async def set_if_absent(self, key: Any, value: Any, ttl_sec: Optional[float] = None) -> bool:
+        px = max(1, int(float(ttl_sec) * 1000)) if ttl_sec else None
+        return bool(await self._r.set(self._k(key), _dumps(value), nx=True, px=px))
+
+    async def pop(self, key: Any, default: Any = None) -> Any:
+        raw = await self._r.getdel(self._k(key))
+        return default if raw is None else _loads(raw)
+
+    async def contains(self, key: Any) -> bool:
+        return bool(await self._r.exists(self._k(key)))
+
+    async def _scan_keys(self) -> List[str]:
+        out = []
+        async for k in self._r.scan_iter(match=self._prefix + "*", count=500):
+            out.append(k.decode("utf-8") if isinstance(k, bytes) else k)
+        return out
+
+    async def keys(self) -> List[str]:
+        n = len(self._prefix)
+        return [k[n:] for k in await self._scan_keys()]
+
+    async def items(self) -> List[Tuple[str, Any]]:
+        full = await self._scan_keys()
+        if not full:
+            return []
+        values = await self._r.mget(full)
+        n = len(self._prefix)
+        return [(k[n:], _loads(v)) for k, v in zip(full, values) if v is not None]
+
+    async def size(self) -> int:
+        return len(await self._scan_keys())
+
+    async def clear(self) -> None:
+        full = await self._scan_keys()
+        for i in range(0, len(full), 500):
+            await self._r.delete(*full[i : i + 500])
+
+
+class RedisStateBackend:
+    kind = "redis"
+
+    def __init__(self, url: str, prefix: str = "leylek") -> None:
+        if aioredis is None:
+            raise RuntimeError("redis paketi kurulu değil (pip install redis)")
+        self.url = url
+        self.prefix = prefix
+        self.client = aioredis.from_url(url, decode_responses=False)
+        self._maps: Dict[str, RedisStateMap] = {}
+        self._subscribers: Dict[str, List[Callable[[Any], Any]]] = {}
+        self._pubsub = None
+        self._listener: Optional[asyncio.Task] = None
+
+    def map(self, name: str) -> RedisStateMap:
+        if name not in self._maps:
+            self._maps[name] = RedisStateMap(self, name)
+        return self._maps[name]
+
+    def _channel(self, channel: str) -> str:
+        return f"{self.prefix}:{channel}"
+
+    async def publish(self, channel: str, message: Any) -> None:
+        await self.client.publish(self._channel(channel), _dumps(message))
+
+    async def subscribe(self, channel: str, handler: Callable[[Any], Any]) -> None:
+        first = channel not in self._subscribers
+        self._subscribers.setdefault(channel, []).append(handler)
+        if not first:
+            return
+        if self._pubsub is None:
+            self._pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        await self._pubsub.subscribe(self._channel(channel))
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.create_task(self._listen())
+
+    async def _listen(self) -> None:
+        n = len(self.prefix) + 1
+        while True:
+            try:
+                async for msg in self._pubsub.listen():
+                    if msg.get("type") != "message":
+                        continue
+                    ch = msg.get("channel")
+                    ch = ch.decode("utf-8") if isinstance(ch, bytes) else str(ch)
+                    channel = ch[n:]
+                    await _dispatch_message(self._subscribers.get(channel, []), channel, _loads(msg.get("data")))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Redis abonelik dinleyicisi hatası: %s — yeniden bağlanılıyor", e)
+                await asyncio.sleep(1.0)
+
+    async def start(self) -> None:
+        try:
+            await self.client.ping()
+            logger.info("✅ Paylaşılan durum: Redis (%s)", self.prefix)
+        except Exception as e:
+            logger.error("❌ Redis'e bağlanılamadı (%s): %s — paylaşılan durum çalışmaz", self.url, e)
+
+    async def close(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            self._listener = None
+        try:
+            if self._pubsub is not None:
+                await self._pubsub.aclose()
+            await self.client.aclose()
+        except Exception:
+            pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": self.kind,
+            "prefix": self.prefix,
+            "maps": sorted(self._maps),
+            "channels": sorted(self._subscribers),
+        }
+
+
+# ==================== FABRİKA ====================
+
+
+def _redis_url() -> str:
+    return (os.getenv("REDIS_URL") or "").strip()
+
+
+def create_state_backend():
+    """REDIS_URL + redis paketi varsa Redis, yoksa bellek."""
+    url = _redis_url()
+    if not url:
+        return MemoryStateBackend()
+    if aioredis is None:
+        logger.error("REDIS_URL ayarlı ama redis paketi yok — paylaşılan durum bellekte (tek worker)")
+        return MemoryStateBackend()
+    return RedisStateBackend(url, prefix=(os.getenv("SHARED_STATE_PREFIX") or "leylek").strip() or "leylek")
+
+
+def socketio_client_manager():
+    """REDIS_URL varsa socketio.AsyncRedisManager (çoklu worker emit), yoksa None (varsayılan bellek)."""
+    url = _redis_url()
+    if not url:
+        return None
+    if aioredis is None:
+        logger.error("REDIS_URL ayarlı ama redis paketi yok — Socket.IO tek süreç yöneticisiyle çalışıyor")
+        return None
+    import socketio
+
+    channel = (os.getenv("SOCKETIO_REDIS_CHANNEL") or "leylek-socketio").strip()
+    return socketio.AsyncRedisManager(url, channel=channel)
+
@@ -0,0 +1,139 @@
+"""
+Tag süre dolumu süpürücüsü — pending / offers_received tag'leri arka planda expired yapar.
+
+GET /driver/requests her poll'da tüm tablo üzerinde `tags.update(status=expired)` çalıştırıyordu
+(salt okuma uç noktası = her sürücü isteğinde tablo çapında UPDATE). Burada:
+- TAG_EXPIRY_SWEEP_SEC aralıkla: created_at'e göre en eski TAG_EXPIRY_BATCH aday id (kısmi indeks:
+  sql_migrations/create_tag_expiry_index.sql), ardından aynı durum koşuluyla tek UPDATE
+- UPDATE yalnızca hâlâ açık satırları döndürür; birden fazla worker aynı satırı iki kez bildirmez
+- on_expired(satırlar): socket olayları (tag_cancelled / remove_offer); sayaçlar stats() ile
+
+Ortam: TAG_EXPIRY_SWEEP_SEC (30), TAG_EXPIRY_MAX_AGE_SEC (600), TAG_EXPIRY_BATCH (500).
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+EXPIRABLE_STATUSES = ("pending", "offers_received")
+EXPIRED_STATUS = "expired"
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return max(0.0, float((os.getenv(name) or str(default)).strip()))
+    except (TypeError, ValueError):
+        return default
+
+
+class TagExpirySweeper:
+    """db: AsyncSupabase cephesi; on_expired(satırlar): süresi dolan tag'ler için bildirim."""
+
+    def __init__(
+        self,
+        db: Any,
+        on_expired: Optional[Callable[[List[dict]], Awaitable[Any]]] = None,
+        *,
+        interval_sec: float = 30.0,
+        max_age_sec: float = 600.0,
+        batch_limit: int = 500,
+    ) -> None:
+        self._db = db
+        self._on_expired = on_expired
+        self.interval_sec = max(1.0, float(interval_sec))
+        self.max_age_sec = float(max_age_sec)
+        self.batch_limit = max(1, int(batch_limit))
+        self._task: Optional[asyncio.Task] = None
+        self._last_run_mono: Optional[float] = None
+        self._last_duration_ms: Optional[float] = None
+        self._counters: Dict[str, int] = {"sweeps": 0, "expired": 0, "errors": 0}
+
+    @classmethod
+    def from_env(cls, db: Any, on_expired=None) -> "TagExpirySweeper":
+        try:
+            batch = max(1, int(os.getenv("TAG_EXPIRY_BATCH", "500")))
+        except (TypeError, ValueError):
+            batch = 500
+        return cls(
+            db,
+            on_expired,
+            interval_sec=_env_float("TAG_EXPIRY_SWEEP_SEC", 30.0),
+            max_age_sec=_env_float("TAG_EXPIRY_MAX_AGE_SEC", 600.0),
+            batch_limit=batch,
+        )
+
+    async def sweep_once(self, now: Optional[datetime] = None) -> List[dict]:
+        """Bir tur: süresi dolan en eski batch_limit tag'i expired yap. Dönüş: bu worker'ın güncellediği satırlar."""
+        started = time.monotonic()
+        cutoff = ((now or datetime.utcnow()) - timedelta(seconds=self.max_age_sec)).isoformat()
+        expired: List[dict] = []
+        try:
+            res = await (
+                self._db.table("tags")
+                .select("id")
+                .in_("status", list(EXPIRABLE_STATUSES))
+                .lt("created_at", cutoff)
+                .order("created_at")
+                .limit(self.batch_limit)
+                .execute()
+            )
+            ids = [r["id"] for r in res.data or [] if r.get("id")]
+            if ids:
+                upd = await (
+                    self._db.table("tags")
+                    .update({"status": EXPIRED_STATUS})
+                    .in_("id", ids)
+                    .in_("status", list(EXPIRABLE_STATUSES))
+                    .execute()
+                )
+                expired = list(upd.data or [])
+        except Exception as e:
+            self._counters["errors"] += 1
+            logger.warning("Tag süre dolumu taraması başarısız: %s", e)
+            return []
+        finally:
+            self._counters["sweeps"] += 1
+            self._last_run_mono = time.monotonic()
+            self._last_duration_ms = round((self._last_run_mono - started) * 1000.0, 1)
+
+        if expired:
+            self._counters["expired"] += len(expired)
+            logger.info("⏰ %s tag süresi doldu (expired)", len(expired))
+            if self._on_expired is not None:
+                try:
+                    await self._on_expired(expired)
+                except Exception as e:
+                    logger.warning("Süresi dolan tag bildirimi başarısız: %s", e)
+        return expired
+
+    async def _run(self) -> None:
+        while True:
+            await self.sweep_once()
+            await asyncio.sleep(self.interval_sec)
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        age = None
+        if self._last_run_mono is not None:
+            age = round(time.monotonic() - self._last_run_mono, 1)
+        return {
+            **self._counters,
+            "last_sweep_ms": self._last_duration_ms,
+            "last_sweep_age_sec": age,
+            "interval_sec": self.interval_sec,
+            "max_age_sec": self.max_age_sec,
+        }
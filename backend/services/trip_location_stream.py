@@ -0,0 +1,169 @@
+"""
+Eşleşmiş yolculuk için canlı konum yayını — Socket.IO `trip_{tag_id}` odası.
+
+Sürücü/yolcu konum ping'i (HTTP update-location veya socket location_update) geldiğinde, kullanıcı aktif bir
+yolculuğa kayıtlıysa karşı tarafa `trip_location` yayılır. Yayın sunucu tarafında süzülür:
+- Kullanıcı başına en fazla TRIP_LOCATION_MIN_INTERVAL_SEC'te bir
+- Son yayından TRIP_LOCATION_MIN_DELTA_M'den az hareket → yayın yok (TRIP_LOCATION_HEARTBEAT_SEC dolunca yine gönderilir)
+
+Yolculuk kaydı join_trip ile açılır; tag durumu TRIP_LOCATION_REVALIDATE_SEC aralıkla DB'den doğrulanır
+(bitmiş yolculuk kendiliğinden düşer). Çoklu worker'da üyelik ayrıca shared_state'te tutulur: ping'i alan worker
+yerelde kaydı yoksa oradan yükler (register(verified=False) → ilk yayında DB doğrulaması). Kayıtsız kullanıcılar
+TRIP_LOCATION_MISS_TTL_SEC boyunca negatif cache'lenir (her ping'de paylaşılan duruma gidilmez).
+Yalnızca event loop içinden kullanılır (kilit yok).
+"""
+from __future__ import annotations
+
+import logging
+import math
+import os
+import time
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_TRIP_STATUSES = ("matched", "in_progress")
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return max(0.0, float((os.getenv(name) or str(default)).strip()))
+    except (TypeError, ValueError):
+        return default
+
+
+def _distance_m(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    x = math.radians(lng2 - lng1) * math.cos(math.radians((lat1 + lat2) / 2.0))
+    y = math.radians(lat2 - lat1)
+    return 6371000.0 * math.hypot(x, y)
+
+
+def trip_room(tag_id: Any) -> str:
+    """Yolculuk odası adı (tag_id küçük harf)."""
+    return f"trip_{str(tag_id).strip().lower()}"
+
+
+class TripLocationStream:
+    """tag_id ↔ katılımcılar + kullanıcı başına yayın süzgeci."""
+
+    def __init__(
+        self,
+        *,
+        min_interval_sec: float = 1.0,
+        min_delta_m: float = 5.0,
+        heartbeat_sec: float = 10.0,
+        revalidate_sec: float = 60.0,
+        miss_ttl_sec: float = 5.0,
+    ) -> None:
+        self.min_interval_sec = float(min_interval_sec)
+        self.min_delta_m = float(min_delta_m)
+        self.heartbeat_sec = float(heartbeat_sec)
+        self.revalidate_sec = float(revalidate_sec)
+        self.miss_ttl_sec = float(miss_ttl_sec)
+        # tag_id -> {"tag_id", "passenger_id", "driver_id", "verified_mono"}
+        self._trips: Dict[str, dict] = {}
+        self._trip_of_user: Dict[str, str] = {}
+        # uid -> (lat, lng, monotonic) — son yayın
+        self._last_emit: Dict[str, Tuple[float, float, float]] = {}
+        # uid -> monotonic bitiş — paylaşılan üyelikte de yolculuğu olmayan kullanıcı
+        self._miss_until: Dict[str, float] = {}
+        self._counters: Dict[str, int] = {"emitted": 0, "throttled": 0, "suppressed": 0, "shared_loads": 0}
+
+    @classmethod
+    def from_env(cls) -> "TripLocationStream":
+        return cls(
+            min_interval_sec=_env_float("TRIP_LOCATION_MIN_INTERVAL_SEC", 1.0),
+            min_delta_m=_env_float("TRIP_LOCATION_MIN_DELTA_M", 5.0),
+            heartbeat_sec=_env_float("TRIP_LOCATION_HEARTBEAT_SEC", 10.0),
+            revalidate_sec=_env_float("TRIP_LOCATION_REVALIDATE_SEC", 60.0),
+            miss_ttl_sec=_env_float("TRIP_LOCATION_MISS_TTL_SEC", 5.0),
+        )
+
+    @staticmethod
+    def _key(value: Any) -> str:
+        return str(value).strip().lower() if value is not None else ""
+
+    # ---------- kayıt ----------
+
+    def register(self, tag_id: Any, passenger_id: Any, driver_id: Any, *, verified: bool = True) -> dict:
+        """verified=False: kayıt başka worker'ın üyeliğinden geldi — ilk yayında DB'den doğrulanır."""
+        tid = self._key(tag_id)
+        now = time.monotonic()
+        trip = {
+            "tag_id": tid,
+            "passenger_id": self._key(passenger_id),
+            "driver_id": self._key(driver_id),
+            "verified_mono": now if verified else now - self.revalidate_sec,
+        }
+        self._trips[tid] = trip
+        for uid in (trip["passenger_id"], trip["driver_id"]):
+            if uid:
+                self._trip_of_user[uid] = tid
+                self._miss_until.pop(uid, None)
+        if not verified:
+            self._counters["shared_loads"] += 1
+        return trip
+
+    def unregister(self, tag_id: Any) -> Optional[dict]:
+        trip = self._trips.pop(self._key(tag_id), None)
+        if trip is None:
+            return None
+        for uid in (trip["passenger_id"], trip["driver_id"]):
+            if self._trip_of_user.get(uid) == trip["tag_id"]:
+                self._trip_of_user.pop(uid, None)
+            self._last_emit.pop(uid, None)
+        return trip
+
+    def get(self, tag_id: Any) -> Optional[dict]:
+        return self._trips.get(self._key(tag_id))
+
+    def trip_for_user(self, user_id: Any) -> Optional[dict]:
+        tid = self._trip_of_user.get(self._key(user_id))
+        return self._trips.get(tid) if tid else None
+
+    def recently_missed(self, user_id: Any) -> bool:
+        until = self._miss_until.get(self._key(user_id))
+        return until is not None and until > time.monotonic()
+
+    def mark_miss(self, user_id: Any) -> None:
+        now = time.monotonic()
+        if len(self._miss_until) >= 10000:
+            self._miss_until = {k: v for k, v in self._miss_until.items() if v > now}
+        self._miss_until[self._key(user_id)] = now + self.miss_ttl_sec
+
+    def needs_revalidate(self, trip: dict) -> bool:
+        return time.monotonic() - trip["verified_mono"] >= self.revalidate_sec
+
+    def mark_verified(self, trip: dict) -> None:
+        trip["verified_mono"] = time.monotonic()
+
+    @staticmethod
+    def role_of(trip: dict, user_id: Any) -> Optional[str]:
+        uid = TripLocationStream._key(user_id)
+        if uid and uid == trip.get("driver_id"):
+            return "driver"
+        if uid and uid == trip.get("passenger_id"):
+            return "passenger"
+        return None
+
+    # ---------- süzgeç ----------
+
+    def should_emit(self, user_id: Any, lat: float, lng: float) -> bool:
+        """Aralık + hareket eşiği; True dönerse yayın kaydı güncellenir."""
+        uid = self._key(user_id)
+        now = time.monotonic()
+        prev = self._last_emit.get(uid)
+        if prev is not None:
+            elapsed = now - prev[2]
+            if elapsed < self.min_interval_sec:
+                self._counters["throttled"] += 1
+                return False
+            if elapsed < self.heartbeat_sec and _distance_m(prev[0], prev[1], lat, lng) < self.min_delta_m:
+                self._counters["suppressed"] += 1
+                return False
+        self._last_emit[uid] = (float(lat), float(lng), now)
+        self._counters["emitted"] += 1
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self._counters, "active_trips": len(self._trips)}
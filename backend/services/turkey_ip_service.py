@@ -3,10 +3,11 @@ Turkey IP Control Module
 Modüler tasarım - Mevcut sisteme dokunmaz
 Frontend'de kullanılacak IP kontrolü
 """
-import httpx
 import logging
 from typing import Tuple, Optional
 
+from services.http_clients import get_http_client
+
 logger = logging.getLogger(__name__)
 
 # Türkiye IP kontrol servisleri
@@ -33,25 +34,25 @@ class TurkeyIPService:
             return True, "TR"
         
         try:
-            async with httpx.AsyncClient(http2=False, timeout=5.0) as client:
-                # İlk servis: ipapi.co
-                try:
-                    response = await client.get(f"https://ipapi.co/{ip}/country/")
-                    if response.status_code == 200:
-                        country = response.text.strip().upper()
-                        return country == "TR", country
-                except:
-                    pass
-                
-                # Yedek servis: ip-api.com
-                try:
-                    response = await client.get(f"https://ip-api.com/json/{ip}?fields=countryCode")
-                    if response.status_code == 200:
-                        data = response.json()
-                        country = data.get("countryCode", "").upper()
-                        return country == "TR", country
-                except:
-                    pass
+            client = get_http_client("ip_lookup")
+            # İlk servis: ipapi.co
+            try:
+                response = await client.get(f"https://ipapi.co/{ip}/country/")
+                if response.status_code == 200:
+                    country = response.text.strip().upper()
+                    return country == "TR", country
+            except:
+                pass
+
+            # Yedek servis: ip-api.com
+            try:
+                response = await client.get(f"https://ip-api.com/json/{ip}?fields=countryCode")
+                if response.status_code == 200:
+                    data = response.json()
+                    country = data.get("countryCode", "").upper()
+                    return country == "TR", country
+            except:
+                pass
                 
         except Exception as e:
             logger.error(f"IP check error: {e}")
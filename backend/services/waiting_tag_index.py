@@ -0,0 +1,197 @@
+"""
+Bekleyen (status='waiting') yolculuk teklifleri indeksi — süreç içi grid kovaları.
+
+emit_existing_waiting_offers_to_driver() her online olan / kayıt olan sürücü için tüm waiting tag'leri
+DB'den tarıyordu (vardiya başında aynı taramanın yüzlerce kopyası). Burada:
+- Kova anahtarı: (yolcu araç tercihi, hücre_lat, hücre_lng); hücre boyu WAITING_TAG_INDEX_CELL_DEG (derece)
+- Güncelleme: ride/create (upsert), kabul / iptal / süre dolumu (remove); paylaşılan durum kanalı
+  `waiting_tags` ile diğer worker'lara yayılır (apply_event)
+- Kaçan olaylara karşı periyodik tam uzlaştırma (replace_all); is_ready() False iken çağıran DB taramasına döner
+
+Yalnızca event loop içinden kullanılır (kilit yok).
+"""
+from __future__ import annotations
+
+import logging
+import math
+import os
+import time
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from services.driver_geo_index import KM_PER_DEG_LAT, _coerce_latlng, haversine_km
+
+logger = logging.getLogger(__name__)
+
+WAITING_TAGS_CHANNEL = "waiting_tags"
+
+try:
+    DEFAULT_CELL_DEG = max(0.005, min(1.0, float(os.getenv("WAITING_TAG_INDEX_CELL_DEG", "0.05"))))
+except (TypeError, ValueError):
+    DEFAULT_CELL_DEG = 0.05
+
+# Catch-up teklifi için gereken tags kolonları (emit_existing_waiting_offers_to_driver satır biçimi)
+WAITING_TAG_KEYS = (
+    "id",
+    "passenger_id",
+    "passenger_name",
+    "pickup_lat",
+    "pickup_lng",
+    "pickup_location",
+    "dropoff_lat",
+    "dropoff_lng",
+    "dropoff_location",
+    "final_price",
+    "offered_price",
+    "distance_km",
+    "estimated_minutes",
+    "passenger_preferred_vehicle",
+    "passenger_payment_method",
+    "created_at",
+)
+
+_CellKey = Tuple[str, int, int]
+
+
+class WaitingTagIndex:
+    """Tag id → satır + grid kovaları (yolcu araç tercihine göre ayrık)."""
+
+    def __init__(self, cell_deg: float = DEFAULT_CELL_DEG) -> None:
+        self.cell_deg = float(cell_deg)
+        self._rows: Dict[str, dict] = {}
+        self._cell_of: Dict[str, _CellKey] = {}
+        self._buckets: Dict[_CellKey, Set[str]] = {}
+        self._last_reconcile_mono: Optional[float] = None
+        self._counters: Dict[str, int] = {"upserts": 0, "removes": 0, "queries": 0, "reconciles": 0}
+
+    @staticmethod
+    def _key(tag_id: Any) -> str:
+        return str(tag_id).strip().lower() if tag_id is not None else ""
+
+    def _cell(self, kind: str, lat: float, lng: float) -> _CellKey:
+        return (kind, int(math.floor(lat / self.cell_deg)), int(math.floor(lng / self.cell_deg)))
+
+    def _unlink(self, tid: str) -> None:
+        cell = self._cell_of.pop(tid, None)
+        if cell is None:
+            return
+        bucket = self._buckets.get(cell)
+        if bucket is not None:
+            bucket.discard(tid)
+            if not bucket:
+                del self._buckets[cell]
+
+    # ---------- yazma ----------
+
+    def upsert(self, tag: dict, vehicle_kind: str) -> bool:
+        """Waiting tag satırını ekle/güncelle. Pickup konumu olmayan satır çıkarılır. Dönüş: indekste mi."""
+        tid = self._key((tag or {}).get("id"))
+        if not tid:
+            return False
+        stored = {k: tag.get(k) for k in WAITING_TAG_KEYS if k in tag}
+        stored["id"] = str(tag.get("id")).strip()
+        stored["vehicle_kind"] = (vehicle_kind or "car").strip().lower()
+        self._unlink(tid)
+        ll = _coerce_latlng(stored.get("pickup_lat"), stored.get("pickup_lng"))
+        if ll is None:
+            self._rows.pop(tid, None)
+            return False
+        self._rows[tid] = stored
+        cell = self._cell(stored["vehicle_kind"], ll[0], ll[1])
+        self._cell_of[tid] = cell
+        self._buckets.setdefault(cell, set()).add(tid)
+        self._counters["upserts"] += 1
+        return True
+
+    def remove(self, tag_id: Any) -> bool:
+        tid = self._key(tag_id)
+        self._unlink(tid)
+        if self._rows.pop(tid, None) is None:
+            return False
+        self._counters["removes"] += 1
+        return True
+
+    def replace_all(self, rows: Iterable[Tuple[dict, str]]) -> int:
+        """DB uzlaştırması: (tag satırı, vehicle_kind) listesiyle tüm indeksi yeniden kur."""
+        self._rows.clear()
+        self._cell_of.clear()
+        self._buckets.clear()
+        n = 0
+        for row, kind in rows:
+            if self.upsert(row, kind):
+                n += 1
+        self._last_reconcile_mono = time.monotonic()
+        self._counters["reconciles"] += 1
+        return n
+
+    def apply_event(self, message: Any) -> bool:
+        """Paylaşılan durum kanalı mesajı: {"op": "upsert", "tag", "vehicle_kind"} | {"op": "remove", "tag_id"}."""
+        if not isinstance(message, dict):
+            return False
+        op = message.get("op")
+        if op == "upsert" and isinstance(message.get("tag"), dict):
+            return self.upsert(message["tag"], message.get("vehicle_kind") or "car")
+        if op == "remove":
+            return self.remove(message.get("tag_id"))
+        return False
+
+    # ---------- okuma ----------
+
+    def is_ready(self, max_age_sec: float) -> bool:
+        """En az bir uzlaştırma yapıldı ve max_age_sec'ten eski değil."""
+        if self._last_reconcile_mono is None:
+            return False
+        return (time.monotonic() - self._last_reconcile_mono) <= float(max_age_sec)
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __contains__(self, tag_id: Any) -> bool:
+        return self._key(tag_id) in self._rows
+
+    def get(self, tag_id: Any) -> Optional[dict]:
+        row = self._rows.get(self._key(tag_id))
+        return dict(row) if row is not None else None
+
+    def query_radius(
+        self,
+        lat: float,
+        lng: float,
+        radius_km: float,
+        *,
+        vehicle_kinds: Optional[Iterable[str]] = None,
+    ) -> List[Tuple[float, dict]]:
+        """Pickup'ı kuş uçuşu radius_km içindeki tag'ler: [(km, satır kopyası)] yakından uzağa."""
+        self._counters["queries"] += 1
+        r = max(0.0, float(radius_km))
+        lat, lng = float(lat), float(lng)
+        dlat = r / KM_PER_DEG_LAT
+        dlng = r / (KM_PER_DEG_LAT * max(0.01, math.cos(math.radians(lat))))
+        y0 = int(math.floor((lat - dlat) / self.cell_deg))
+        y1 = int(math.floor((lat + dlat) / self.cell_deg))
+        x0 = int(math.floor((lng - dlng) / self.cell_deg))
+        x1 = int(math.floor((lng + dlng) / self.cell_deg))
+        if vehicle_kinds is None:
+            kinds = {k for (k, _y, _x) in self._buckets.keys()}
+        else:
+            kinds = {str(k).strip().lower() for k in vehicle_kinds if k}
+
+        out: List[Tuple[float, dict]] = []
+        for kind in kinds:
+            for cy in range(y0, y1 + 1):
+                for cx in range(x0, x1 + 1):
+                    bucket = self._buckets.get((kind, cy, cx))
+                    if not bucket:
+                        continue
+                    for tid in bucket:
+                        row = self._rows[tid]
+                        d = haversine_km(lat, lng, float(row["pickup_lat"]), float(row["pickup_lng"]))
+                        if d <= r:
+                            out.append((d, dict(row)))
+        out.sort(key=lambda t: t[0])
+        return out
+
+    def stats(self) -> Dict[str, Any]:
+        age = None
+        if self._last_reconcile_mono is not None:
+            age = round(time.monotonic() - self._last_reconcile_mono, 1)
+        return {**self._counters, "tags": len(self._rows), "cells": len(self._buckets), "reconcile_age_sec": age}
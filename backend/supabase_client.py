@@ -5,10 +5,14 @@ Supabase client — backend yalnızca SERVICE ROLE ile çalışır.
 - Anon / public key bu süreçte tablo DML için kullanılmaz (RLS nedeniyle update 0 satır riski).
 """
 
+import asyncio
 import logging
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Optional
+from typing import Any, Callable, Optional
 
 from dotenv import load_dotenv
 from supabase import Client, create_client
@@ -69,6 +73,134 @@ def get_supabase_admin() -> Client | None:
     return _backend_client
 
 
+# ==================== ASYNC DATA ACCESS ====================
+# supabase-py client senkron (httpx.Client); async handler içinde .execute() event loop'u (ve Socket.IO'yu)
+# bloke eder. AsyncSupabase aynı sorgu zincirini sınırlı bir thread havuzunda çalıştırır:
+#   res = await db.table("users").select("id").eq("id", uid).limit(1).execute()
+
+try:
+    SUPABASE_DB_WORKERS = max(1, int((os.getenv("SUPABASE_DB_WORKERS") or "16").strip()))
+except ValueError:
+    SUPABASE_DB_WORKERS = 16
+try:
+    SUPABASE_SLOW_QUERY_MS = max(0.0, float((os.getenv("SUPABASE_SLOW_QUERY_MS") or "500").strip()))
+except ValueError:
+    SUPABASE_SLOW_QUERY_MS = 500.0
+
+_db_executor: Optional[ThreadPoolExecutor] = None
+_db_stats_lock = threading.Lock()
+_db_stats = {"queries": 0, "errors": 0, "slow": 0, "in_flight": 0, "max_in_flight": 0, "total_ms": 0.0}
+
+
+def _get_db_executor() -> ThreadPoolExecutor:
+    global _db_executor
+    if _db_executor is None:
+        _db_executor = ThreadPoolExecutor(
+            max_workers=SUPABASE_DB_WORKERS, thread_name_prefix="supabase-db"
+        )
+    return _db_executor
+
+
+def _run_timed(fn: Callable[..., Any], *args: Any) -> Any:
+    with _db_stats_lock:
+        _db_stats["in_flight"] += 1
+        _db_stats["max_in_flight"] = max(_db_stats["max_in_flight"], _db_stats["in_flight"])
+    t0 = time.perf_counter()
+    ok = False
+    try:
+        out = fn(*args)
+        ok = True
+        return out
+    finally:
+        ms = (time.perf_counter() - t0) * 1000.0
+        with _db_stats_lock:
+            _db_stats["in_flight"] -= 1
+            _db_stats["queries"] += 1
+            _db_stats["total_ms"] += ms
+            if not ok:
+                _db_stats["errors"] += 1
+            if SUPABASE_SLOW_QUERY_MS and ms >= SUPABASE_SLOW_QUERY_MS:
+                _db_stats["slow"] += 1
+        if SUPABASE_SLOW_QUERY_MS and ms >= SUPABASE_SLOW_QUERY_MS:
+            logger.warning("🐢 Yavaş Supabase sorgusu: %.0f ms (%s)", ms, getattr(fn, "__qualname__", fn))
+
+
+async def run_db(fn: Callable[..., Any], *args: Any) -> Any:
+    """Senkron Supabase çağrısını (ör. storage) sınırlı havuzda çalıştır."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_db_executor(), _run_timed, fn, *args)
+
+
+class _AsyncQuery:
+    """PostgREST builder vekili: zincir metodları aynen, execute() awaitable."""
+
+    __slots__ = ("_builder",)
+
+    def __init__(self, builder: Any) -> None:
+        self._builder = builder
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self._builder, name)
+        if not callable(attr):
+            # .not_ gibi property'ler yeni builder döndürür
+            return _AsyncQuery(attr)
+
+        def _chain(*args: Any, **kwargs: Any) -> Any:
+            out = attr(*args, **kwargs)
+            return _AsyncQuery(out) if hasattr(out, "execute") else out
+
+        return _chain
+
+    async def execute(self) -> Any:
+        return await run_db(self._builder.execute)
+
+
+class AsyncSupabase:
+    """
+    Senkron client'a async cephe. client_getter her çağrıda okunur (init_supabase sonrası / test yaması).
+    Yalnızca sorgu kökleri: table / from_ / rpc / schema.
+    """
+
+    def __init__(self, client_getter: Callable[[], Optional[Client]] = get_supabase) -> None:
+        self._client_getter = client_getter
+
+    def _client(self) -> Client:
+        client = self._client_getter()
+        if client is None:
+            raise RuntimeError("Supabase client başlatılmadı")
+        return client
+
+    def table(self, name: str) -> _AsyncQuery:
+        return _AsyncQuery(self._client().table(name))
+
+    def from_(self, name: str) -> _AsyncQuery:
+        return _AsyncQuery(self._client().from_(name))
+
+    def rpc(self, fn: str, params: Optional[dict] = None, **kwargs: Any) -> _AsyncQuery:
+        return _AsyncQuery(self._client().rpc(fn, params or {}, **kwargs))
+
+    def schema(self, name: str) -> "AsyncSupabase":
+        client = self._client().schema(name)
+        return AsyncSupabase(lambda: client)
+
+
+def get_db_stats() -> dict:
+    """Async veri erişimi sayaçları (süreç içi)."""
+    with _db_stats_lock:
+        snap = dict(_db_stats)
+    snap["avg_ms"] = round(snap["total_ms"] / snap["queries"], 1) if snap["queries"] else 0.0
+    snap["total_ms"] = round(snap["total_ms"], 1)
+    snap["workers"] = SUPABASE_DB_WORKERS
+    return snap
+
+
+def shutdown_db_executor() -> None:
+    global _db_executor
+    if _db_executor is not None:
+        _db_executor.shutdown(wait=False, cancel_futures=True)
+        _db_executor = None
+
+
 # ==================== STORAGE FUNCTIONS ====================
 
 
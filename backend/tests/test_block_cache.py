@@ -0,0 +1,86 @@
+"""
+Engelleme önbelleği — simetrik küme, tek toplu yükleme, invalidate, yükleme hatası.
+`py -3 -m pytest tests/test_block_cache.py -v`
+"""
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+
+from services.block_cache import BlockCache
+
+ROWS = [
+    {"user_id": "A", "blocked_user_id": "b"},
+    {"user_id": "c", "blocked_user_id": "a"},
+    {"user_id": "d", "blocked_user_id": "e"},
+]
+
+
+def test_symmetric_sets_cached_and_invalidated() -> None:
+    calls = []
+
+    async def loader(ids):
+        calls.append(list(ids))
+        wanted = set(ids)
+        return [r for r in ROWS if r["user_id"].lower() in wanted or r["blocked_user_id"].lower() in wanted]
+
+    async def run() -> None:
+        cache = BlockCache(loader)
+        assert await cache.prefetch(["a", "B", "x"]) == 3
+        assert await cache.get("A") == frozenset({"b", "c"})
+        assert await cache.get("b") == frozenset({"a"})
+        assert await cache.get("x") == frozenset()
+        assert len(calls) == 1
+
+        cache.invalidate("a", "b")
+        assert await cache.get("a") == frozenset({"b", "c"})
+        assert len(calls) == 2
+        assert cache.stats()["invalidations"] == 2
+
+    asyncio.run(run())
+
+
+def test_load_failure_raises_instead_of_skipping_filter() -> None:
+    async def loader(ids):
+        raise ConnectionError("db down")
+
+    async def run() -> None:
+        cache = BlockCache(loader)
+        with pytest.raises(RuntimeError):
+            await cache.get("a")
+        assert cache.stats()["load_errors"] == 1
+
+    asyncio.run(run())
+
+
+def test_concurrent_misses_coalesce_and_stale_load_is_discarded() -> None:
+    calls = []
+    gate = asyncio.Event()
+    rows = [{"user_id": "a", "blocked_user_id": "b"}]
+
+    async def loader(ids):
+        calls.append(list(ids))
+        snapshot = list(rows)
+        if len(calls) == 1:
+            await gate.wait()
+        return snapshot
+
+    async def run() -> None:
+        cache = BlockCache(loader)
+        first = asyncio.create_task(cache.get("a"))
+        second = asyncio.create_task(cache.get("a"))
+        await asyncio.sleep(0)
+        assert len(calls) == 1
+        assert cache.stats()["coalesced"] == 1
+
+        # Yükleme sürerken unblock: uçuştaki (eski) sonuç yazılmamalı
+        rows.clear()
+        cache.invalidate("a", "b")
+        gate.set()
+        assert await first == frozenset()
+        assert await second == frozenset()
+        assert cache.stats()["stale_loads"] == 1
+        assert await cache.get("a") == frozenset()
+
+    asyncio.run(run())
@@ -0,0 +1,36 @@
+"""
+Dispatch benchmark duman testi — küçük senaryo, sahte Supabase; sıcak yol gerilemelerini yakalar.
+`py -3 -m pytest tests/test_dispatch_bench.py -v`
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+
+from benchmarks.dispatch_bench import run_benchmark
+from benchmarks.fake_supabase import FakeSupabase
+
+
+def test_fake_supabase_filters_and_counts() -> None:
+    fake = FakeSupabase()
+    fake.table("users").insert([{"id": "A", "n": 1}, {"id": "b", "n": 2}, {"id": "c", "n": None}]).execute()
+    assert [r["id"] for r in fake.table("users").select("id").in_("id", ["a", "B"]).order("n", desc=True).execute().data] == ["b", "A"]
+    assert fake.table("users").select("id", count="exact").not_.is_("n", "null").execute().count == 2
+    fake.table("users").update({"n": 5}).eq("id", "c").execute()
+    assert fake.table("users").select("n").gte("n", 2).execute().data == [{"n": 2}, {"n": 5}]
+    assert fake.stats() == {"users.insert": 1, "users.select": 3, "users.update": 1}
+
+
+def test_small_dispatch_run_offers_every_tag() -> None:
+    logging.disable(logging.WARNING)
+    try:
+        report = asyncio.run(
+            run_benchmark(drivers=60, tags=5, db_latency_ms=0, route_latency_ms=0, push_latency_ms=0)
+        )
+    finally:
+        logging.disable(logging.NOTSET)
+    assert report["tags_offered"] == 5
+    assert report["accepted"] == 5
+    assert report["offers"] == 5 * 5
+    # Tag başına DB çağrısı bütçesi (start + batch + accept); artış sıcak yolda yeni sorgu demektir
+    assert report["db_calls_per_tag"] <= 25, report["db_calls_by_table"]
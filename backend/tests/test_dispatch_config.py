@@ -0,0 +1,79 @@
+"""
+Sürümlü dispatch ayarı — dondurulmuş okuma, sürüm artışı, worker'lar arası yayın.
+`py -3 -m pytest tests/test_dispatch_config.py -v`
+"""
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+
+from services.dispatch_config import DispatchConfig
+from services.shared_state import MemoryStateBackend
+
+DEFAULTS = {"matching_radius_km": 20, "max_driver_dispatch": 10, "driver_offer_timeout": 10, "enabled": True}
+
+
+def test_save_bumps_version_and_notifies_other_worker() -> None:
+    store = {"value": '{"driver_offer_timeout": 15}'}
+    backend = MemoryStateBackend()
+
+    async def loader():
+        return store["value"]
+
+    async def saver(text):
+        store["value"] = text
+
+    def make() -> DispatchConfig:
+        return DispatchConfig.from_env(DEFAULTS, loader=loader, saver=saver, backend=backend)
+
+    a, b = make(), make()
+
+    async def _run() -> None:
+        await a.start()
+        await b.start()
+        assert b.driver_offer_timeout == 15 and b.max_driver_dispatch == 10
+        store["value"] = None  # b yeni değeri DB'den değil yayından almalı
+        v = await a.save({"driver_offer_timeout": 30, "matching_radius_km": "12.5"})
+        assert v == 1
+        assert b.version == 1 and b.driver_offer_timeout == 30 and b.matching_radius_km == 12.5
+        a.stop()
+        b.stop()
+
+    asyncio.run(_run())
+    with pytest.raises(TypeError):
+        b.get()["enabled"] = False  # type: ignore[index]
+    assert '"_version": 1' in store["value"] and "_version" not in b.get()
+
+
+def test_older_version_is_ignored() -> None:
+    async def loader():
+        return None
+
+    async def saver(text):
+        return None
+
+    c = DispatchConfig.from_env(DEFAULTS, loader=loader, saver=saver)
+    assert c.apply({"max_driver_dispatch": 3}, 5)
+    assert not c.apply({"max_driver_dispatch": 7}, 4)
+    assert c.max_driver_dispatch == 3
+
+
+def test_unversioned_row_is_reapplied_on_refresh() -> None:
+    store = {"value": '{"max_driver_dispatch": 4}'}
+
+    async def loader():
+        return store["value"]
+
+    async def saver(text):
+        store["value"] = text
+
+    c = DispatchConfig.from_env(DEFAULTS, loader=loader, saver=saver)
+
+    async def _run() -> None:
+        assert await c.refresh() and c.max_driver_dispatch == 4
+        assert not await c.refresh()  # içerik aynı: yeniden uygulanmaz
+        store["value"] = '{"max_driver_dispatch": 6}'  # eski satır elle düzenlendi (_version yok)
+        assert await c.refresh() and c.max_driver_dispatch == 6 and c.version == 0
+
+    asyncio.run(_run())
@@ -0,0 +1,34 @@
+"""
+Rolling dispatch artımlı sıralama — yeni / yer değiştiren / düşen sürücüler.
+`py -3 -m pytest tests/test_dispatch_ranking.py -v`
+"""
+from __future__ import annotations
+
+from services.dispatch_ranking import merge_candidates, pending_driver_ids
+
+
+def _e(did: str, km: float, rating: float = 4.5) -> dict:
+    return {"driver_id": did, "distance_km": km, "rating": rating}
+
+
+def test_closer_new_driver_goes_to_next_batch_not_before_offered() -> None:
+    drivers = [_e("a", 1.0), _e("b", 2.0), _e("c", 3.0), _e("d", 4.0)]
+    merged, cursor, counts = merge_candidates(drivers, 2, [_e("new", 0.5), _e("mid", 3.5)])
+    assert cursor == 2
+    assert [e["driver_id"] for e in merged] == ["a", "b", "new", "c", "mid", "d"]
+    assert counts == {"added": 2, "moved": 0, "dropped": 0}
+
+
+def test_moved_and_dropped_drivers() -> None:
+    drivers = [_e("a", 1.0), _e("b", 2.0), _e("c", 3.0), _e("d", 4.0)]
+    merged, cursor, counts = merge_candidates(
+        drivers,
+        1,
+        [_e("d", 1.5), _e("a", 9.0)],
+        drop_ids=["C"],
+    )
+    # a bu turda teklif aldı: yerinde güncellenir; d öne geçer; c düşer
+    assert [e["driver_id"] for e in merged] == ["a", "d", "b"]
+    assert merged[0]["distance_km"] == 9.0 and cursor == 1
+    assert counts == {"added": 0, "moved": 2, "dropped": 1}
+    assert pending_driver_ids(merged, cursor) == ["d", "b"]
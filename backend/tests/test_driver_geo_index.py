@@ -0,0 +1,51 @@
+"""
+Sürücü grid indeksi — yerel doğrulama (DB yok).
+`py -3 -m pytest tests/test_driver_geo_index.py -v`
+"""
+from __future__ import annotations
+
+from services.driver_geo_index import DriverGeoIndex, haversine_km
+
+
+def _row(did: str, lat: float, lng: float) -> dict:
+    return {"id": did, "name": did, "rating": 4.5, "latitude": lat, "longitude": lng, "driver_online": True}
+
+
+def test_query_radius_sorted_and_filtered_by_kind() -> None:
+    idx = DriverGeoIndex(cell_deg=0.05)
+    idx.replace_all(
+        [
+            (_row("A", 41.0100, 29.0000), "car"),
+            (_row("B", 41.0500, 29.0000), "car"),
+            (_row("C", 41.0050, 29.0000), "motorcycle"),
+            (_row("D", 41.5000, 29.0000), "car"),
+        ]
+    )
+    hits = idx.query_radius(41.0, 29.0, 10.0, vehicle_kinds=["car"])
+    assert [r["id"] for _d, r in hits] == ["a", "b"]
+    assert hits[0][0] < hits[1][0]
+
+    all_kinds = idx.query_radius(41.0, 29.0, 10.0, exclude_ids=["A"])
+    assert [r["id"] for _d, r in all_kinds] == ["c", "b"]
+
+
+def test_update_location_moves_between_cells_and_remove() -> None:
+    idx = DriverGeoIndex(cell_deg=0.05)
+    idx.replace_all([(_row("x", 41.0, 29.0), "car")])
+    assert idx.update_location("X", 41.3, 29.0)
+    assert idx.query_radius(41.0, 29.0, 5.0) == []
+    assert len(idx.query_radius(41.3, 29.0, 1.0)) == 1
+    # İndekste olmayan (offline) kullanıcı için no-op
+    assert not idx.update_location("yolcu", 41.0, 29.0)
+    assert idx.remove("x")
+    assert len(idx) == 0
+
+
+def test_nearest_expands_ring_and_ready_flag() -> None:
+    idx = DriverGeoIndex(cell_deg=0.05)
+    assert not idx.is_ready(60)
+    idx.replace_all([(_row("n1", 41.0, 29.0), "car"), (_row("n2", 41.15, 29.0), "car")])
+    assert idx.is_ready(60)
+    hits = idx.nearest(41.0, 29.0, 2, 30.0)
+    assert [r["id"] for _d, r in hits] == ["n1", "n2"]
+    assert abs(hits[1][0] - haversine_km(41.0, 29.0, 41.15, 29.0)) < 1e-9
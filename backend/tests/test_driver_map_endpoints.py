@@ -0,0 +1,92 @@
+"""
+Sürücü bekleme haritası uçları — işaret rotası (sürücü doğrulama, cache önceliği, sürücü başına sınır) ve
+karo yenilemenin yalnızca harita isteğiyle başlayıp boşta durması. Supabase sahte, rota çağrısı sahte.
+`py -3 -m pytest tests/test_driver_map_endpoints.py -v`
+"""
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+import server
+from benchmarks.fake_supabase import FakeSupabase
+from services.route_cache import RouteCache
+
+DRIVER_ID = "11111111-1111-1111-1111-111111111111"
+
+
+@pytest.fixture
+def routes(monkeypatch):
+    fake = FakeSupabase()
+    fake.tables["users"] = [{"id": DRIVER_ID, "latitude": 40.75, "longitude": 30.37, "driver_online": True}]
+    monkeypatch.setattr(server, "supabase", fake)
+    monkeypatch.setattr(server, "road_route_cache", RouteCache())
+    monkeypatch.setattr(server, "marker_route_rate", server.shared_state.map("marker_route_rate_test"))
+    server.driver_state_cache.invalidate(DRIVER_ID)
+    calls = []
+
+    async def route_info(*coords):
+        calls.append(coords)
+        return {"distance_km": 3.24, "duration_min": 7, "distance_text": "3.2 km", "duration_text": "7 dk"}
+
+    monkeypatch.setattr(server, "get_route_info", route_info)
+    return calls
+
+
+def test_marker_route_requires_known_driver(routes) -> None:
+    async def run() -> None:
+        assert (await server.get_driver_map_marker_route(40.76, 30.38))["success"] is False
+        unknown = await server.get_driver_map_marker_route(
+            40.76, 30.38, driver_id="22222222-2222-2222-2222-222222222222"
+        )
+        assert unknown["success"] is False
+
+    asyncio.run(run())
+    assert routes == []
+
+
+def test_marker_route_rate_limits_uncached_requests_per_driver(routes) -> None:
+    async def run() -> None:
+        ok = await server.get_driver_map_marker_route(40.76, 30.38, driver_id=DRIVER_ID)
+        assert ok["success"] and ok["distance_km"] == 3.24
+        assert routes == [(40.75, 30.37, 40.76, 30.38)]  # başlangıç: sürücünün kayıtlı konumu
+
+        with pytest.raises(HTTPException) as exc:
+            await server.get_driver_map_marker_route(40.77, 30.39, driver_id=DRIVER_ID)
+        assert exc.value.status_code == 429
+
+        # Cache isabeti sınıra takılmaz ve dış çağrı yapmaz
+        cached = {"distance_km": 5.0, "duration_min": 9, "distance_text": "5 km", "duration_text": "9 dk"}
+        await server.road_route_cache.store("osrm", 40.75, 30.37, 40.78, 30.40, cached)
+        hit = await server.get_driver_map_marker_route(40.78, 30.40, driver_id=DRIVER_ID)
+        assert hit["distance_km"] == 5.0
+        assert len(routes) == 1
+
+    asyncio.run(run())
+
+
+def test_heatmap_refresh_loop_starts_on_request_and_stops_when_idle(monkeypatch) -> None:
+    refreshes = []
+
+    async def refresh():
+        refreshes.append(1)
+        return 0
+
+    monkeypatch.setattr(server, "heatmap_tiles_refresh", refresh)
+    monkeypatch.setattr(server, "HEATMAP_REFRESH_SEC", 0.01)
+    monkeypatch.setattr(server, "HEATMAP_IDLE_STOP_SEC", 0.05)
+    monkeypatch.setattr(server, "heatmap_tiles", server.HeatmapTiles())
+    monkeypatch.setattr(server, "_heatmap_loop_task", None)
+    monkeypatch.setattr(server, "_heatmap_refresh_task", None)
+
+    async def run() -> None:
+        await server.heatmap_tiles_ensure_fresh()
+        loop_task = server._heatmap_loop_task
+        assert loop_task is not None and not loop_task.done()
+        assert refreshes  # ilk istek tek yenilemeyi bekledi (döngüyle paylaşılır)
+        await asyncio.wait_for(loop_task, timeout=1.0)
+        assert loop_task.done()
+
+    asyncio.run(run())
@@ -0,0 +1,51 @@
+"""
+Sürücü yayın odası — role=driver ile register olan soket tag süre dolumu olaylarını gerçekten alır.
+Socket.IO sunucusu bellek içi; engine.io paketleri yakalanır (ağ yok).
+`py -3 -m pytest tests/test_driver_room.py -v`
+"""
+from __future__ import annotations
+
+import asyncio
+
+import server
+
+
+def test_driver_socket_receives_expiry_events(monkeypatch) -> None:
+    sio = server.sio
+    sent = []
+
+    async def send_eio(eio_sid, pkt):
+        sent.append((eio_sid, str(pkt.data)))
+
+    async def save_session(sid, data, namespace=None):
+        return None
+
+    async def resolve(uid):
+        return uid
+
+    monkeypatch.setattr(sio, "_send_eio_packet", send_eio)
+    monkeypatch.setattr(sio, "save_session", save_session)
+    monkeypatch.setattr(server, "verify_access_token", lambda token: token)
+    monkeypatch.setattr(server, "resolve_user_id", resolve)
+    monkeypatch.setattr(server, "emit_existing_waiting_offers_to_driver", resolve)
+    monkeypatch.setattr(server.block_cache, "prefetch", resolve)
+    monkeypatch.setattr(server, "_presence_load_city", resolve)
+
+    async def run() -> None:
+        driver_sid = await sio.manager.connect("eio-driver", "/")
+        passenger_sid = await sio.manager.connect("eio-passenger", "/")
+        await server.register(driver_sid, {"token": "driver-1", "role": "driver"})
+        await server.register(passenger_sid, {"token": "passenger-1", "role": "passenger"})
+        sent.clear()
+
+        await server._on_tags_expired([{"id": "tag-9"}])
+
+        got = [data for eio_sid, data in sent if eio_sid == "eio-driver"]
+        assert any("tag_cancelled" in d and "tag-9" in d for d in got)
+        assert any("remove_offer" in d for d in got)
+        assert not [1 for eio_sid, _d in sent if eio_sid == "eio-passenger"]
+
+        await sio.manager.disconnect(driver_sid, "/")
+        await sio.manager.disconnect(passenger_sid, "/")
+
+    asyncio.run(run())
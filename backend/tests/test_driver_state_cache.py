@@ -0,0 +1,49 @@
+"""
+Sürücü durum önbelleği — toplu yükleme, TTL, invalidate.
+`py -3 -m pytest tests/test_driver_state_cache.py -v`
+"""
+from __future__ import annotations
+
+import asyncio
+
+from services.driver_state_cache import DriverStateCache
+
+
+def _cache(calls: list, ttl_sec: float = 60.0) -> DriverStateCache:
+    async def loader(ids):
+        calls.append(list(ids))
+        return [{"id": i.upper(), "driver_online": True} for i in ids if i != "missing"]
+
+    return DriverStateCache(loader, ttl_sec=ttl_sec)
+
+
+def test_prefetch_loads_batch_in_one_call_then_hits() -> None:
+    calls: list = []
+    c = _cache(calls)
+
+    async def _run() -> None:
+        assert await c.prefetch(["D1", "d2", "missing", "d1"]) == 3
+        assert calls == [["d1", "d2", "missing"]]
+        assert (await c.get("d1"))["driver_online"] is True
+        assert await c.get("missing") is None
+        assert await c.prefetch(["d1", "d2"]) == 0
+        assert len(calls) == 1
+
+    asyncio.run(_run())
+    assert c.stats()["hits"] == 2
+
+
+def test_invalidate_and_ttl_force_reload() -> None:
+    calls: list = []
+    c = _cache(calls)
+    expired = _cache(calls, ttl_sec=0.0)
+
+    async def _run() -> None:
+        await c.get("d1")
+        c.invalidate("D1")
+        await c.get("d1")
+        await expired.get("d1")
+        await expired.get("d1")
+
+    asyncio.run(_run())
+    assert calls == [["d1"]] * 4
@@ -0,0 +1,47 @@
+"""
+Vektörel mesafe — satır satır haversine ile aynı sonuç, geçersiz koordinat atlama, k-en-yakın, benchmark duman testi.
+`py -3 -m pytest tests/test_geo_arrays.py -v`
+"""
+from __future__ import annotations
+
+import random
+
+from benchmarks.geo_bench import run_benchmark
+from services.driver_geo_index import haversine_km
+from services.geo_arrays import GeoPoints
+
+CENTER = (40.7569, 30.3783)
+
+
+def test_distances_and_radius_match_scalar_haversine() -> None:
+    rng = random.Random(7)
+    rows = [{"id": i, "latitude": CENTER[0] + rng.uniform(-0.5, 0.5), "longitude": CENTER[1] + rng.uniform(-0.5, 0.5)} for i in range(200)]
+    rows += [{"id": "none", "latitude": None, "longitude": 30.0}, {"id": "zero", "latitude": 0, "longitude": 0}]
+    rows += [{"id": "text", "latitude": "40.76", "longitude": "30.38"}, {"id": "bad", "latitude": "x", "longitude": 30.0}]
+    pts = GeoPoints.from_rows(rows)
+    assert len(pts) == 201
+    assert "text" in [r["id"] for r in pts.rows]
+
+    d = pts.distances_km(*CENTER)
+    for row, km in zip(pts.rows, d.tolist()):
+        assert abs(km - haversine_km(CENTER[0], CENTER[1], float(row["latitude"]), float(row["longitude"]))) < 1e-6
+
+    idx, dists = pts.within(CENTER[0], CENTER[1], 20.0)
+    expected = sorted(i for i, km in enumerate(d.tolist()) if km <= 20.0)
+    assert sorted(idx) == expected
+    assert dists == sorted(dists)
+    assert pts.count_within(CENTER[0], CENTER[1], 20.0) == len(expected)
+
+    k_idx, k_d = pts.k_nearest(CENTER[0], CENTER[1], 5)
+    assert k_idx == sorted(range(len(pts)), key=lambda i: d[i])[:5]
+    assert k_d == sorted(k_d)
+    assert pts.k_nearest(CENTER[0], CENTER[1], 5, radius_km=0.0) == ([], [])
+
+
+def test_empty_rows_and_small_bench_run() -> None:
+    empty = GeoPoints.from_rows(None, "pickup_lat", "pickup_lng")
+    assert empty.within(*CENTER, 10.0) == ([], [])
+    assert empty.count_within(*CENTER, 10.0) == 0
+    report = run_benchmark(drivers=500, queries=3)
+    assert report["matches"] is True
+    assert report["avg_hits"] > 0
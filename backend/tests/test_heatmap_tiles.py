@@ -0,0 +1,48 @@
+"""
+Bekleme haritası karoları — artımlı hücre sayaçları, zoom seviyeleri, yarıçap sorgusu, sahip düşümü.
+`py -3 -m pytest tests/test_heatmap_tiles.py -v`
+"""
+from __future__ import annotations
+
+from services.heatmap_tiles import KIND_APP_USER, KIND_SEEKING, HeatmapTiles
+
+
+def _tiles() -> HeatmapTiles:
+    t = HeatmapTiles()
+    t.replace_all(
+        [
+            {"key": "tag:1", "kind": KIND_SEEKING, "owner": "P1", "city": "Ankara", "lat": 39.93, "lng": 32.86},
+            {"key": "tag:2", "kind": KIND_SEEKING, "owner": "p2", "city": "ankara", "lat": 39.94, "lng": 32.87},
+            {"key": "user:u1", "kind": KIND_APP_USER, "owner": "u1", "city": "Ankara", "lat": 39.90, "lng": 32.99},
+            {"key": "tag:far", "kind": KIND_SEEKING, "owner": "p3", "city": "İzmir", "lat": 38.42, "lng": 27.14},
+        ]
+    )
+    return t
+
+
+def test_tile_counts_follow_upsert_move_remove() -> None:
+    t = _tiles()
+    assert t.is_ready(60)
+    assert [c["count"] for c in t.tiles("Ankara", 0)] == [3]
+    assert sorted(c["count"] for c in t.tiles("Ankara", 2)) == [1, 2]
+
+    t.move("user:u1", 39.93, 32.86)
+    assert [c["count"] for c in t.tiles("Ankara", 2)] == [3]
+    t.remove("tag:1")
+    t.remove("tag:2")
+    assert [c["count"] for c in t.tiles("Ankara", 0)] == [1]
+    t.upsert("tag:3", kind=KIND_SEEKING, owner="p4", city="Ankara", lat=39.93, lng=32.86)
+    assert t.tiles("Ankara", 0) == [{"center_lat": 39.87, "center_lng": 32.89, "count": 2, "intensity": 1.0}]
+    assert t.move("user:unknown", 39.0, 32.0) is False
+
+
+def test_nearby_and_owner_exclusion() -> None:
+    t = _tiles()
+    hits = t.nearby(39.92, 32.85, 5.0, kind=KIND_SEEKING)
+    assert [h[1] for h in hits] == ["tag:1", "tag:2"]
+    assert hits[0][0] < hits[1][0] < 5.0
+    assert [h[1] for h in t.nearby(39.92, 32.85, 30.0)] == ["tag:1", "tag:2", "user:u1"]
+
+    hidden = t.owner_cells(["p1", "nobody"], "Ankara", 0)
+    assert [c["count"] for c in t.tiles("Ankara", 0, exclude_cells=hidden)] == [2]
+    assert t.owner_cells(["p3"], "Ankara", 0) == {}
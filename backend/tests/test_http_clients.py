@@ -0,0 +1,86 @@
+"""
+Paylaşılan httpx client havuzu — event loop başına yeniden oluşturma, start/close, havuz metrikleri (ağ çağrısı yok).
+`py -3 -m pytest tests/test_http_clients.py -v`
+"""
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+
+from services import http_clients
+
+
+@pytest.fixture(autouse=True)
+def _clean_pool():
+    asyncio.run(http_clients.close_http_clients())
+    yield
+    asyncio.run(http_clients.close_http_clients())
+
+
+def test_same_loop_reuses_client_and_new_loop_recreates() -> None:
+    async def grab():
+        first = http_clients.get_http_client("osrm")
+        assert http_clients.get_http_client("osrm") is first
+        return first
+
+    a = asyncio.run(grab())
+    # asyncio.run yeni loop kurar: eski loop'un client'ı kullanılmaz
+    b = asyncio.run(grab())
+    assert a is not b
+    assert http_clients._clients["osrm"][0] is b
+
+
+def test_closed_client_is_replaced() -> None:
+    async def run() -> None:
+        first = http_clients.get_http_client("expo")
+        await first.aclose()
+        second = http_clients.get_http_client("expo")
+        assert second is not first and not second.is_closed
+
+    asyncio.run(run())
+
+
+def test_start_creates_all_profiles_and_close_clears() -> None:
+    async def run() -> None:
+        await http_clients.start_http_clients()
+        assert set(http_clients._clients) == set(http_clients.CLIENT_PROFILES)
+        clients = [c for c, _owner in http_clients._clients.values()]
+        await http_clients.close_http_clients()
+        assert http_clients._clients == {}
+        assert all(c.is_closed for c in clients)
+
+    asyncio.run(run())
+
+
+def test_unknown_profile_uses_default_timeout() -> None:
+    async def run() -> None:
+        client = http_clients.get_http_client("nope")
+        assert client.timeout.read == http_clients.CLIENT_PROFILES["default"]["timeout"]
+
+    asyncio.run(run())
+
+
+def test_pool_stats_reads_fresh_pool(monkeypatch) -> None:
+    monkeypatch.setenv("HTTP_POOL_MAX_CONNECTIONS", "10")
+
+    async def run() -> dict:
+        http_clients.get_http_client("osrm")
+        return http_clients.http_pool_stats()
+
+    stats = asyncio.run(run())["osrm"]
+    assert stats["max_connections"] == 10
+    assert stats["connections"] == 0 and stats["in_use"] == 0 and stats["queued"] == 0
+    assert stats["saturation"] == 0
+
+
+def test_pool_stats_degrades_without_private_attributes(monkeypatch) -> None:
+    class _Bare:
+        is_closed = False
+
+    monkeypatch.setitem(http_clients._clients, "google_maps", (_Bare(), None))
+
+    stats = http_clients.http_pool_stats()["google_maps"]
+
+    # httpcore iç düzeni değişirse yalnızca temel alanlar kalır, istisna yok
+    assert stats == {"closed": False, "max_connections": http_clients._pool_limits().max_connections}
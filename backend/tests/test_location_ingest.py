@@ -0,0 +1,83 @@
+"""
+Konum ping'i toplu yazımı — sahte writer ile (DB yok).
+`py -3 -m pytest tests/test_location_ingest.py -v`
+"""
+from __future__ import annotations
+
+import asyncio
+
+from services.location_ingest import (
+    SUBMIT_CACHED,
+    SUBMIT_QUEUED,
+    SUBMIT_THROTTLED,
+    LocationIngestor,
+)
+
+
+def _ingestor(**kw):
+    batches = []
+
+    async def _writer(rows):
+        batches.append(list(rows))
+
+    return LocationIngestor(_writer, **kw), batches
+
+
+def test_pings_coalesce_per_user_and_small_moves_stay_in_memory() -> None:
+    ing, batches = _ingestor(min_distance_m=25.0, max_age_sec=60.0)
+
+    async def _run() -> None:
+        assert ing.submit("U1", 41.0, 29.0) == SUBMIT_QUEUED
+        assert ing.submit("u1", 41.0005, 29.0) == SUBMIT_QUEUED  # aynı bekleyen satırın üzerine
+        assert await ing.flush() == 1
+        # ~5 m hareket: yalnızca bellek
+        assert ing.submit("u1", 41.00055, 29.0) == SUBMIT_CACHED
+        assert await ing.flush() == 0
+        # ~110 m: yazılır
+        assert ing.submit("u1", 41.0015, 29.0) == SUBMIT_QUEUED
+        assert await ing.flush() == 1
+
+    asyncio.run(_run())
+    assert batches[0] == [
+        {"id": "u1", "latitude": 41.0005, "longitude": 29.0, "last_location_update": batches[0][0]["last_location_update"]}
+    ]
+    assert ing.get("U1")["latitude"] == 41.0015
+
+
+def test_backpressure_and_failed_write_requeues() -> None:
+    calls = {"n": 0}
+
+    async def _flaky(rows):
+        calls["n"] += 1
+        if calls["n"] == 1:
+            raise RuntimeError("db down")
+
+    ing = LocationIngestor(_flaky, max_pending=2)
+
+    async def _run() -> None:
+        assert ing.submit("a", 41.0, 29.0) == SUBMIT_QUEUED
+        assert ing.submit("b", 41.0, 29.0) == SUBMIT_QUEUED
+        assert ing.submit("c", 41.0, 29.0) == SUBMIT_THROTTLED
+        assert ing.get("c") is not None  # okumalar yine taze
+        assert await ing.flush() == 0
+        assert ing.stats()["pending"] == 2
+        assert await ing.flush() == 2
+
+    asyncio.run(_run())
+    assert ing.stats()["write_errors"] == 1
+
+
+def test_overlay_prefers_newer_memory_and_stop_flushes() -> None:
+    ing, batches = _ingestor()
+
+    async def _run() -> None:
+        ing.start()
+        ing.submit("d1", 40.0, 30.0)
+        await ing.stop()
+
+    asyncio.run(_run())
+    assert sum(len(b) for b in batches) == 1
+    row = {"latitude": 1.0, "longitude": 2.0, "last_location_update": "2000-01-01T00:00:00"}
+    out = ing.overlay("d1", row)
+    assert (out["latitude"], out["longitude"]) == (40.0, 30.0)
+    assert ing.overlay("other", row) is row
@@ -0,0 +1,58 @@
+"""
+Eşleşme olayı — tek yük, rol başına olay adları ve push mesajları.
+`py -3 -m pytest tests/test_match_events.py -v`
+"""
+from __future__ import annotations
+
+from services.match_events import (
+    FLOW_ACCEPT_OFFER,
+    FLOW_ACCEPT_RIDE,
+    FLOW_DRIVER_ACCEPT_SOCKET,
+    MATCH_EVENT,
+    ROLE_DRIVER,
+    ROLE_PASSENGER,
+    build_match_payload,
+    match_event_names,
+    match_push_messages,
+)
+
+
+def _payload(**kw) -> dict:
+    tag = {"id": "t1", "pickup_lat": 41.0, "pickup_lng": 29.0, "final_price": 150, "distance_km": 7.5}
+    return build_match_payload(
+        tag, driver_id="d1", driver_name="Ali", passenger_id="p1", passenger_name=None, **kw
+    )
+
+
+def test_payload_and_event_names() -> None:
+    p = _payload(pickup_distance_km=2.1, pickup_eta_min=6)
+    assert p["trip_id"] == p["tag_id"] == "t1"
+    assert p["offered_price"] == p["final_price"] == 150
+    assert p["trip_distance_km"] == 7.5 and p["pickup_eta_min"] == 6
+    assert p["passenger_name"] == "Yolcu" and p["status"] == "matched"
+
+    assert match_event_names(ROLE_DRIVER, FLOW_ACCEPT_OFFER, legacy=False) == (MATCH_EVENT,)
+    assert match_event_names(ROLE_DRIVER, "unknown", legacy=True) == (MATCH_EVENT,)
+
+
+def test_event_names_keep_each_flow_alias_set() -> None:
+    # Akış başına önceki olay kümesi aynen: fazladan ride_matched eklenmez
+    assert match_event_names(ROLE_DRIVER, FLOW_ACCEPT_OFFER, legacy=True) == ("offer_accepted", "tag_matched")
+    assert match_event_names(ROLE_PASSENGER, FLOW_ACCEPT_OFFER, legacy=True) == ("tag_matched",)
+    assert match_event_names(ROLE_DRIVER, FLOW_DRIVER_ACCEPT_SOCKET, legacy=True) == (
+        "offer_accepted_success", "tag_matched", "ride_matched"
+    )
+    assert match_event_names(ROLE_PASSENGER, FLOW_ACCEPT_RIDE, legacy=True) == ("ride_accepted",)
+
+
+def test_push_messages_reuse_payload_eta() -> None:
+    msgs = {m["role"]: m for m in match_push_messages(_payload(pickup_eta_min=4))}
+    assert set(msgs) == {ROLE_DRIVER, ROLE_PASSENGER}
+    assert "4 dk" in msgs[ROLE_DRIVER]["body"]
+    assert msgs[ROLE_DRIVER]["data"]["price"] == 150
+    assert msgs[ROLE_PASSENGER]["data"] == {
+        "type": "new_offer", "event": "match", "tag_id": "t1", "eta_min": 4, "role": ROLE_PASSENGER
+    }
+
+    no_eta = match_push_messages(_payload())
+    assert no_eta[0]["body"] == "Yolcuya git için tıklayın."
@@ -0,0 +1,108 @@
+"""
+Eşleşme fan-out — push outbox kaydı beklenir (queued gerçek sonuç); kabul akışları tek yükle ve akışın
+önceki olay adlarıyla (fazladan ad yok) gönderir, rota / eski push yoluna gitmez.
+Supabase sahte, socket emit ve outbox yakalanır.
+`py -3 -m pytest tests/test_match_fanout.py -v`
+"""
+from __future__ import annotations
+
+import asyncio
+from collections import defaultdict
+
+import pytest
+
+import server
+from benchmarks.fake_supabase import FakeSupabase
+from services.match_events import FLOW_ACCEPT_OFFER
+
+DRIVER_ID = "11111111-1111-1111-1111-111111111111"
+PASSENGER_ID = "22222222-2222-2222-2222-222222222222"
+TAG_ID = "33333333-3333-3333-3333-333333333333"
+
+
+@pytest.fixture
+def captured(monkeypatch):
+    events = defaultdict(list)
+    enqueued = []
+
+    async def emit(name, payload=None, room=None, **kw):
+        events[str(room)].append(name)
+
+    async def enqueue(**kw):
+        enqueued.append((kw["user_id"], kw["title"]))
+        return True
+
+    async def no_network(*args, **kwargs):
+        raise AssertionError("eşleşmede ağ çağrısı / doğrudan push yapılmamalı")
+
+    monkeypatch.setattr(server.sio, "emit", emit)
+    monkeypatch.setattr(server.push_outbox, "enqueue", enqueue)
+    monkeypatch.setattr(server, "get_route_info", no_network)
+    monkeypatch.setattr(server, "send_push_notification", no_network)
+    return events, enqueued
+
+
+def _fake_db(monkeypatch) -> None:
+    fake = FakeSupabase()
+    fake.tables["users"] = [
+        {"id": DRIVER_ID, "name": "Ali", "driver_details": {"vehicle_kind": "car"}, "latitude": 40.75, "longitude": 30.37},
+        {"id": PASSENGER_ID, "name": "Ayşe", "driver_details": {}},
+    ]
+    fake.tables["tags"] = [
+        {
+            "id": TAG_ID,
+            "status": "waiting",
+            "passenger_id": PASSENGER_ID,
+            "pickup_lat": 40.76,
+            "pickup_lng": 30.38,
+            "final_price": 150,
+            "distance_km": 7.5,
+        }
+    ]
+    fake.tables["dispatch_queue"] = []
+    monkeypatch.setattr(server, "supabase", fake)
+
+
+def _room(uid: str) -> str:
+    return server._normalize_user_room(uid)
+
+
+def test_fan_out_match_awaits_enqueue_and_reports_result(monkeypatch, captured) -> None:
+    _events, enqueued = captured
+
+    async def enqueue(**kw):
+        enqueued.append(kw["user_id"])
+        return kw["user_id"] != "p1"
+
+    monkeypatch.setattr(server.push_outbox, "enqueue", enqueue)
+
+    queued = asyncio.run(
+        server.fan_out_match({"tag_id": "t1", "driver_id": "d1", "passenger_id": "p1"}, FLOW_ACCEPT_OFFER)
+    )
+
+    # fan_out_match dönmeden iki kayıt da yazılmış olmalı (create_task ile sonraya kalmaz)
+    assert sorted(enqueued) == ["d1", "p1"]
+    assert queued == {"driver": True, "passenger": False}
+
+
+def test_socket_accept_uses_single_fan_out(monkeypatch, captured) -> None:
+    events, enqueued = captured
+    _fake_db(monkeypatch)
+
+    asyncio.run(server.handle_driver_accept_offer("sid-1", {"tag_id": TAG_ID, "driver_id": DRIVER_ID}))
+
+    assert events[_room(DRIVER_ID)] == ["offer_accepted_success", "tag_matched", "ride_matched"]
+    assert events[_room(PASSENGER_ID)] == ["driver_matched", "tag_matched", "ride_matched"]
+    assert sorted(uid for uid, _t in enqueued) == sorted([DRIVER_ID, PASSENGER_ID])
+
+
+def test_accept_ride_keeps_its_event_names(monkeypatch, captured) -> None:
+    events, enqueued = captured
+    _fake_db(monkeypatch)
+
+    out = asyncio.run(server.accept_ride(TAG_ID, DRIVER_ID))
+
+    assert out["success"] is True
+    assert events[_room(DRIVER_ID)] == ["ride_matched"]
+    assert events[_room(PASSENGER_ID)] == ["ride_accepted"]
+    assert len(enqueued) == 2
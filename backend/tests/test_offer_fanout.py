@@ -0,0 +1,38 @@
+"""
+Teklif fan-out — sınırlı eşzamanlılık, ack gecikmesi.
+`py -3 -m pytest tests/test_offer_fanout.py -v`
+"""
+from __future__ import annotations
+
+import asyncio
+
+from services.offer_fanout import OfferAckTracker, bounded_gather
+
+
+def test_bounded_gather_limits_concurrency_and_keeps_order() -> None:
+    running = {"now": 0, "peak": 0}
+
+    async def worker(i: int):
+        running["now"] += 1
+        running["peak"] = max(running["peak"], running["now"])
+        await asyncio.sleep(0.01)
+        running["now"] -= 1
+        if i == 3:
+            raise RuntimeError("emit hatası")
+        return i * 10
+
+    out = asyncio.run(bounded_gather(range(6), worker, limit=2))
+    assert out == [0, 10, 20, None, 40, 50]
+    assert running["peak"] == 2
+
+
+def test_ack_tracker_records_latency_and_expires_unacked() -> None:
+    t = OfferAckTracker(ack_timeout_sec=60.0)
+    t.sent("TAG", "D1")
+    assert t.acked("tag", "d1") is not None
+    assert t.acked("tag", "d1") is None
+
+    t.ack_timeout_sec = 0.0
+    t.sent("tag", "d2")
+    st = t.stats()
+    assert st["sent"] == 2 and st["acked"] == 1 and st["unacked"] == 1 and st["pending"] == 0
@@ -0,0 +1,48 @@
+"""
+Socket varlık kaydı — çift yönlü indeks, çoklu cihaz, şehir sayacı.
+`py -3 -m pytest tests/test_presence_registry.py -v`
+"""
+from __future__ import annotations
+
+from services.presence_registry import PresenceRegistry
+
+
+def test_multi_device_disconnect_falls_back_to_other_sid() -> None:
+    p = PresenceRegistry()
+    assert p.add("ABC-1", "s1", role="driver") == "abc-1"
+    p.add("abc-1", "s2")
+    assert p.get_sid("ABC-1") == "s2"
+    assert p.sids("abc-1") == ["s1", "s2"]
+
+    assert p.remove_sid("s2") == "abc-1"
+    assert p.get_sid("abc-1") == "s1"
+    assert p.remove_sid("s1") == "abc-1"
+    assert not p.is_online("abc-1")
+    assert p.remove_sid("s1") is None
+    assert p.stats() == {"online_users": 0, "sockets": 0, "cities": 0}
+
+
+def test_city_counts_follow_presence() -> None:
+    p = PresenceRegistry()
+    p.add("u1", "s1")
+    p.add("u2", "s2")
+    p.set_city("u1", "İstanbul")
+    p.set_city("u2", "İstanbul")
+    p.set_city("offline", "Ankara")
+    assert p.online_count() == 2
+    assert p.online_count("İstanbul") == 2
+    assert p.online_count("Ankara") == 0
+
+    p.set_city("u2", "Ankara")
+    assert p.city_counts() == {"İstanbul": 1, "Ankara": 1}
+    p.remove_sid("s1")
+    assert p.online_count("İstanbul") == 0
+    assert p.online_count() == 1
+
+
+def test_sid_reassigned_to_other_user() -> None:
+    p = PresenceRegistry()
+    p.add("u1", "s1")
+    p.add("u2", "s1")
+    assert not p.is_online("u1")
+    assert p.user_of("s1") == "u2"
@@ -0,0 +1,85 @@
+"""
+Toplu Expo push — 100'lük parçalar, eşzamanlılık, DeviceNotRegistered temizliği (sahte HTTP istemcisi).
+`py -3 -m pytest tests/test_push_dispatcher.py -v`
+"""
+from __future__ import annotations
+
+import asyncio
+
+from services.push_dispatcher import PushDispatcher
+from services.push_notification_service import EXPO_PUSH_URL
+
+
+class _Resp:
+    def __init__(self, data: dict) -> None:
+        self.status_code = 200
+        self._data = data
+        self.text = ""
+
+    def json(self) -> dict:
+        return self._data
+
+
+class _FakeExpo:
+    """Token sonu 'dead]' → DeviceNotRegistered; 'gone]' → bilet ok, receipt'te DeviceNotRegistered."""
+
+    def __init__(self) -> None:
+        self.push_sizes: list = []
+        self.running = 0
+        self.peak = 0
+
+    async def post(self, url: str, json, headers=None, timeout=None) -> _Resp:
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        await asyncio.sleep(0.005)
+        self.running -= 1
+        if url == EXPO_PUSH_URL:
+            self.push_sizes.append(len(json))
+            tickets = []
+            for m in json:
+                if m["to"].endswith("dead]"):
+                    tickets.append({"status": "error", "details": {"error": "DeviceNotRegistered"}})
+                else:
+                    tickets.append({"status": "ok", "id": "r-" + m["to"]})
+            return _Resp({"data": tickets})
+        receipts = {}
+        for tid in json["ids"]:
+            receipts[tid] = (
+                {"status": "error", "details": {"error": "DeviceNotRegistered"}}
+                if tid.endswith("gone]")
+                else {"status": "ok"}
+            )
+        return _Resp({"data": receipts})
+
+
+def _run(pruned: list, expo: _FakeExpo, tokens: list) -> tuple:
+    async def on_unregistered(toks: list) -> None:
+        pruned.extend(toks)
+
+    d = PushDispatcher(headers=dict, on_unregistered=on_unregistered, client=lambda: expo, concurrency=3)
+
+    async def go():
+        out = await d.send(tokens, "Duyuru", "Merhaba", {"type": "admin_notification"})
+        checked = await d.check_receipts(force=True)
+        return out, checked, d.stats()
+
+    return asyncio.run(go())
+
+
+def test_send_chunks_by_100_with_bounded_concurrency() -> None:
+    expo = _FakeExpo()
+    tokens = [f"ExponentPushToken[{i}]" for i in range(450)] + ["ExponentPushToken[0]", "gecersiz"]
+    out, checked, st = _run([], expo, tokens)
+    assert sorted(expo.push_sizes) == [50, 100, 100, 100, 100]
+    assert expo.peak <= 3
+    assert out["sent"] == 450 and out["failed"] == 1
+    assert checked == 450 and st["pending_receipts"] == 0
+
+
+def test_device_not_registered_pruned_from_ticket_and_receipt() -> None:
+    pruned: list = []
+    tokens = ["ExponentPushToken[ok]", "ExponentPushToken[dead]", "ExponentPushToken[gone]"]
+    out, _checked, st = _run(pruned, _FakeExpo(), tokens)
+    assert out["ok_tokens"] == {"ExponentPushToken[ok]", "ExponentPushToken[gone]"}
+    assert pruned == ["ExponentPushToken[dead]", "ExponentPushToken[gone]"]
+    assert st["pruned_tokens"] == 2 and st["receipt_errors"] == 1
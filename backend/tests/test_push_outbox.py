@@ -0,0 +1,116 @@
+"""
+Push outbox — tekrar deneme, kalıcı hata, alıcı başına tekilleştirme, kirası dolan satırın sahiplenilmesi.
+`py -3 -m pytest tests/test_push_outbox.py -v`
+"""
+from __future__ import annotations
+
+import asyncio
+import time
+
+from services.push_outbox import (
+    OUTCOME_DROP,
+    OUTCOME_RETRY,
+    OUTCOME_SENT,
+    MemoryOutboxStore,
+    PushOutbox,
+    _iso,
+)
+
+
+def test_retry_then_sent_drop_and_dedup() -> None:
+    calls: dict = {}
+
+    async def deliver(item: dict):
+        n = calls[item["title"]] = calls.get(item["title"], 0) + 1
+        if item["title"] == "flaky" and n < 3:
+            return OUTCOME_RETRY, "http_503"
+        if item["title"] == "dead":
+            return OUTCOME_DROP, "DeviceNotRegistered"
+        return OUTCOME_SENT, None
+
+    async def go():
+        store = MemoryOutboxStore()
+        box = PushOutbox(store, deliver, workers=2, rate_per_sec=0, backoff_base_sec=0.01, poll_sec=0.02)
+        box.start()
+        for title in ("flaky", "dead", "ok"):
+            assert await box.enqueue(user_id="u1", notification_type="trip", title=title, body="b")
+        # Aynı tag için ikinci teklif push'u kuyruğa girmez
+        for _ in range(2):
+            await box.enqueue(
+                user_id="D1", notification_type="new_offer", title="Yeni", body="x",
+                data={"type": "new_offer", "tag_id": "T1"},
+            )
+        assert not await box.enqueue(user_id=None, notification_type="x", title="t", body="b")
+        for _ in range(50):
+            await asyncio.sleep(0.02)
+            if not store.rows:
+                break
+        box.stop()
+        return box.stats(), store.rows
+
+    st, rows = asyncio.run(go())
+    assert calls == {"flaky": 3, "dead": 1, "ok": 1, "Yeni": 1}
+    assert st["sent"] == 3 and st["failed"] == 1 and st["retried"] == 2 and st["deduped"] == 1
+    assert rows == {}
+
+
+def test_poll_reclaims_expired_lease_once() -> None:
+    sent: list = []
+
+    async def deliver(item: dict):
+        sent.append(item["id"])
+        return OUTCOME_SENT, None
+
+    async def go():
+        store = MemoryOutboxStore()
+        # Başka süreçte yazılmış, kirası dolmuş satır
+        store.rows["r1"] = {
+            "id": "r1", "user_id": "u", "title": "t", "body": "b", "data": {},
+            "status": "sending", "attempts": 0, "next_attempt_at": _iso(time.time() - 1),
+        }
+        a = PushOutbox(store, deliver, rate_per_sec=0, poll_sec=0)
+        b = PushOutbox(store, deliver, rate_per_sec=0, poll_sec=0)
+        taken = await a.poll_once() + await b.poll_once()
+        a.start()
+        await a.drain()
+        a.stop()
+        return taken
+
+    assert asyncio.run(go()) == 1
+    assert sent == ["r1"]
+
+
+def test_dedup_keys_on_offer_gen_and_still_logs() -> None:
+    sent: list = []
+
+    async def deliver(item: dict):
+        sent.append(item["data"].get("offer_gen"))
+        return OUTCOME_SENT, None
+
+    class _LogStore(MemoryOutboxStore):
+        def __init__(self) -> None:
+            super().__init__()
+            self.log: list = []
+
+        async def insert(self, item: dict) -> bool:
+            self.log.append(item["status"])
+            return await super().insert(item)
+
+    async def go():
+        store = _LogStore()
+        box = PushOutbox(store, deliver, rate_per_sec=0, poll_sec=0, dedup_window_sec=30)
+        box.start()
+        # Rolling: aynı sürücüye yeni turda tekrar teklif → yine gönderilir; aynı turun tekrarı bastırılır
+        for gen in ("rolling:1", "rolling:1", "rolling:3"):
+            await box.enqueue(
+                user_id="D1", notification_type="new_offer", title="Yeni", body="x",
+                data={"type": "new_offer", "tag_id": "T1", "offer_gen": gen},
+            )
+        await box.drain()
+        box.stop()
+        return store.log, box.stats()
+
+    log, st = asyncio.run(go())
+    assert sent == ["rolling:1", "rolling:3"]
+    assert log == ["sending", "deduped", "sending"]
+    assert st["deduped"] == 1
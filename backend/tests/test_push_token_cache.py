@@ -0,0 +1,36 @@
+"""
+Push token önbelleği — telefon biçimleri aynı satıra, negatif kayıt ve invalidate.
+`py -3 -m pytest tests/test_push_token_cache.py -v`
+"""
+from __future__ import annotations
+
+from services.push_token_cache import PushTokenCache, cache_key
+
+UID = "0F8FAD5B-D9CB-469F-A165-70867728950E"
+
+
+def test_phone_variants_share_row_until_invalidated() -> None:
+    cache = PushTokenCache(ttl_sec=60)
+    assert cache_key("+905326427412") == cache_key("0532 642 74 12") == cache_key("5326427412")
+    cache.store(UID, {"id": UID, "push_token": "ExponentPushToken[a]", "name": "Ali", "phone": "+905326427412"})
+
+    for ref in (UID.lower(), "05326427412", "90 532 642 74 12"):
+        hit, row = cache.lookup(ref)
+        assert hit and row["push_token"] == "ExponentPushToken[a]"
+
+    cache.invalidate(UID.lower())
+    assert cache.lookup("05326427412") == (False, None)
+    assert cache.lookup(UID) == (False, None)
+
+
+def test_negative_entry_and_bulk_store() -> None:
+    cache = PushTokenCache(ttl_sec=60, negative_ttl_sec=0)
+    cache.store("5550001122", None)
+    assert cache.lookup("5550001122") == (False, None)  # negatif TTL 0 → hemen düşer
+
+    cache = PushTokenCache(ttl_sec=60, negative_ttl_sec=60)
+    cache.store("5550001122", None)
+    assert cache.lookup("+90 555 000 11 22") == (True, None)
+    assert cache.store_many([{"id": "u1", "push_token": None}, {"push_token": "x"}]) == 1
+    assert cache.lookup("U1")[0]
+    assert cache.stats()["hits"] == 2
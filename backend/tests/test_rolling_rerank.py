@@ -0,0 +1,54 @@
+"""
+Rolling dispatch rerank — açılıştaki araç tipi filtresi korunur; rerank sırasında kapanan tag'e batch gönderilmez.
+`py -3 -m pytest tests/test_rolling_rerank.py -v`
+"""
+from __future__ import annotations
+
+import asyncio
+
+import server
+
+TAG = {"pickup_lat": 40.7569, "pickup_lng": 30.3783, "passenger_id": "p1", "passenger_preferred_vehicle": "car"}
+
+
+def test_rerank_keeps_relaxed_vehicle_filter(monkeypatch) -> None:
+    seen = []
+
+    def rows(plat, plng, r_km, pref, vehicle_filter):
+        seen.append(vehicle_filter)
+        return None
+
+    monkeypatch.setattr(server, "_find_eligible_candidate_rows", rows)
+    state = {"full_tag": TAG, "drivers": [], "cursor": 0, "gen": 1, "vehicle_filter": False}
+    asyncio.run(server._rolling_rerank_candidates("t1", state))
+    asyncio.run(server._rolling_rerank_candidates("t1", {**state, "vehicle_filter": True}))
+    assert seen == [False, True]
+
+
+def test_batch_bails_out_when_state_removed_during_rerank(monkeypatch) -> None:
+    sent = []
+
+    async def rerank(tag_id, state):
+        # Rota hesabı sürerken sürücü kabul etti → rolling_dispatch_stop state'i siler
+        await server.rolling_dispatch_index.pop(tag_id)
+
+    async def emit(user_id, event, data):
+        sent.append(event)
+
+    monkeypatch.setattr(server, "_rolling_rerank_candidates", rerank)
+    monkeypatch.setattr(server, "emit_socket_event_to_user", emit)
+
+    async def run() -> None:
+        state = {
+            "full_tag": TAG,
+            "drivers": [{"driver_id": "d1"}, {"driver_id": "d2"}],
+            "cursor": 0,
+            "gen": 1,
+            "current_batch": [],
+        }
+        await server.rolling_dispatch_index.set("t-bail", state, ttl_sec=60)
+        await server.rolling_dispatch_batch("t-bail")
+        assert await server.rolling_dispatch_index.get("t-bail") is None
+
+    asyncio.run(run())
+    assert "new_passenger_offer" not in sent
@@ -0,0 +1,73 @@
+"""
+Yol mesafesi cache — bellek + SQLite katmanı (ağ çağrısı yok).
+`py -3 -m pytest tests/test_route_cache.py -v`
+"""
+from __future__ import annotations
+
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from services.route_cache import RouteCache
+
+_ROUTE = {"distance_km": 4.2, "duration_min": 11, "used_traffic": True}
+
+
+def test_grid_snapping_shares_entry_between_nearby_points() -> None:
+    cache = RouteCache(grid_deg=0.002)
+
+    async def _run() -> None:
+        await cache.store("google", 41.00001, 29.00001, 41.05001, 29.02001, _ROUTE)
+        hit = await cache.lookup("google", 41.00019, 29.00019, 41.05019, 29.02019)
+        assert hit == _ROUTE
+        assert await cache.lookup("google", 41.01, 29.0, 41.05, 29.02) is None
+
+    asyncio.run(_run())
+    st = cache.stats()
+    assert st["mem_hits"] == 1 and st["misses"] == 1
+
+
+def test_traffic_entries_bucketed_by_time_of_day() -> None:
+    cache = RouteCache(tod_bucket_min=30)
+    tz = timezone(timedelta(hours=3))
+    morning = datetime(2026, 3, 2, 8, 10, tzinfo=tz)
+    evening = datetime(2026, 3, 2, 18, 10, tzinfo=tz)
+    k1 = cache.make_key("google", 41.0, 29.0, 41.1, 29.1, traffic=True, now=morning)
+    k2 = cache.make_key("google", 41.0, 29.0, 41.1, 29.1, traffic=True, now=evening)
+    assert k1 != k2
+    assert cache.make_key("google", 41.0, 29.0, 41.1, 29.1) not in (k1, k2)
+
+
+def test_lru_eviction_and_ttl_expiry() -> None:
+    cache = RouteCache(max_entries=2, ttl_sec=0.0)
+
+    async def _run() -> None:
+        await cache.put("a", {"v": 1})
+        assert await cache.get("a") is None  # ttl=0 → hemen sona erer
+
+    asyncio.run(_run())
+
+    cache = RouteCache(max_entries=2)
+
+    async def _run_lru() -> None:
+        await cache.put("a", {"v": 1})
+        await cache.put("b", {"v": 2})
+        await cache.get("a")
+        await cache.put("c", {"v": 3})
+        assert await cache.get("b") is None
+        assert await cache.get("a") == {"v": 1}
+
+    asyncio.run(_run_lru())
+    assert cache.stats()["evictions"] == 1
+
+
+def test_sqlite_tier_survives_new_instance(tmp_path) -> None:
+    path = str(tmp_path / "routes.sqlite")
+
+    async def _run() -> None:
+        first = RouteCache(sqlite_path=path)
+        await first.store("osrm", 41.0, 29.0, 41.1, 29.1, {"distance_km": 9.9})
+        second = RouteCache(sqlite_path=path)
+        assert await second.lookup("osrm", 41.0, 29.0, 41.1, 29.1) == {"distance_km": 9.9}
+        assert second.stats()["disk_hits"] == 1
+
+    asyncio.run(_run())
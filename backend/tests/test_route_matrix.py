@@ -0,0 +1,189 @@
+"""
+Sürücü → pickup yol matrisi — Distance Matrix / OSRM table ters yön ayrıştırma, bütçe aşımı, kuş uçuşu yedek.
+HTTP istemcisi sahte (ağ çağrısı yok).
+`py -3 -m pytest tests/test_route_matrix.py -v`
+"""
+from __future__ import annotations
+
+import asyncio
+from datetime import datetime
+
+import pytest
+
+import server
+from benchmarks.fake_supabase import FakeSupabase
+from services.route_cache import RouteCache
+
+DRIVER = (40.7569, 30.3783)
+PICKUPS = [(40.7600, 30.3800), (40.7700, 30.3900)]
+
+
+class _Resp:
+    def __init__(self, data: dict) -> None:
+        self._data = data
+
+    def json(self) -> dict:
+        return self._data
+
+
+class _Client:
+    def __init__(self, data: dict) -> None:
+        self.data = data
+        self.calls = []
+
+    async def get(self, url, params=None, timeout=None):
+        self.calls.append((url, params))
+        return _Resp(self.data)
+
+
+def _leg(meters: int, seconds: int) -> dict:
+    return {"status": "OK", "distance": {"value": meters}, "duration": {"value": seconds}}
+
+
+@pytest.fixture(autouse=True)
+def _isolated(monkeypatch):
+    monkeypatch.setattr(server, "road_route_cache", RouteCache())
+    server._driver_route_tasks.clear()
+    yield
+    server._driver_route_tasks.clear()
+
+
+def test_google_matrix_reverse_reads_single_row(monkeypatch) -> None:
+    monkeypatch.setenv("GOOGLE_MAPS_API_KEY", "k")
+    client = _Client({"status": "OK", "rows": [{"elements": [_leg(1200, 180), {"status": "ZERO_RESULTS"}]}]})
+    monkeypatch.setattr(server, "get_http_client", lambda name="default": client)
+
+    out = asyncio.run(server._google_distance_matrix_chunk(PICKUPS, *DRIVER, reverse=True))
+
+    params = client.calls[0][1]
+    assert params["origins"] == f"{DRIVER[0]},{DRIVER[1]}"
+    assert params["destinations"].count("|") == 1
+    assert out[0]["distance_km"] == 1.2 and out[0]["duration_min"] == 3
+    assert out[1] is None
+
+
+def test_google_matrix_forward_reads_one_element_per_row(monkeypatch) -> None:
+    monkeypatch.setenv("GOOGLE_MAPS_API_KEY", "k")
+    client = _Client({"status": "OK", "rows": [{"elements": [_leg(1000, 60)]}, {"elements": [_leg(2500, 300)]}]})
+    monkeypatch.setattr(server, "get_http_client", lambda name="default": client)
+
+    out = asyncio.run(server._google_distance_matrix_chunk(PICKUPS, *DRIVER))
+
+    assert client.calls[0][1]["destinations"] == f"{DRIVER[0]},{DRIVER[1]}"
+    assert [o["distance_km"] for o in out] == [1.0, 2.5]
+
+
+def test_osrm_table_reverse_reads_first_source_row(monkeypatch) -> None:
+    client = _Client({"code": "Ok", "distances": [[900.0, None]], "durations": [[120.0, None]]})
+    monkeypatch.setattr(server, "get_http_client", lambda name="default": client)
+
+    out = asyncio.run(server._osrm_table_chunk(PICKUPS, *DRIVER, reverse=True))
+
+    assert "sources=2&destinations=0;1" in client.calls[0][0]
+    assert out[0]["distance_km"] == 0.9 and out[0]["duration_min"] == 2
+    assert out[1] is None
+
+
+def test_matrix_to_point_reverse_caches_in_driver_to_pickup_direction(monkeypatch) -> None:
+    monkeypatch.setenv("GOOGLE_MAPS_API_KEY", "k")
+    client = _Client({"status": "OK", "rows": [{"elements": [_leg(1200, 180), _leg(3400, 420)]}]})
+    monkeypatch.setattr(server, "get_http_client", lambda name="default": client)
+
+    async def run() -> None:
+        out = await server.get_route_matrix_to_point(PICKUPS, *DRIVER, reverse=True)
+        assert [o["distance_km"] for o in out] == [1.2, 3.4]
+        hit = await server.road_route_cache.lookup("google", DRIVER[0], DRIVER[1], *PICKUPS[1])
+        assert hit["distance_km"] == 3.4
+        # İkinci çağrı tamamen cache'ten
+        again = await server.get_route_matrix_to_point(PICKUPS, *DRIVER, reverse=True)
+        assert again == out
+        assert len(client.calls) == 1
+
+    asyncio.run(run())
+
+
+def test_budget_expiry_falls_back_and_coalesces_per_cell_and_pickups(monkeypatch) -> None:
+    monkeypatch.setattr(server, "DRIVER_REQUESTS_ROUTE_BUDGET_SEC", 0.01)
+    calls = []
+
+    async def slow_matrix(origins, dest_lat, dest_lng, *, reverse=False):
+        calls.append(list(origins))
+        await asyncio.sleep(0.2)
+        return [{"distance_km": 1.0, "duration_min": 2.0}] * len(origins)
+
+    monkeypatch.setattr(server, "get_route_matrix_to_point", slow_matrix)
+
+    async def run() -> None:
+        first = await server._driver_pickup_routes(DRIVER[0], DRIVER[1], PICKUPS + [None])
+        assert all(est for _km, _min, est in first[:2])
+        assert first[2] == (None, None, False)
+        assert first[0][0] == pytest.approx(server.haversine_km(*DRIVER, *PICKUPS[0]))
+
+        # Aynı hücre + aynı pickup'lar: uçuştaki matris beklenir, yenisi açılmaz
+        await server._driver_pickup_routes(DRIVER[0] + 0.0001, DRIVER[1], PICKUPS)
+        assert len(calls) == 1
+
+        # Aynı hücrede farklı pickup kümesi (ör. başka araç filtresi): ilk matris iptal edilmez, ikisi de uçuşta
+        old = server._driver_route_tasks[(server._driver_route_cell(*DRIVER), tuple(PICKUPS))]
+        await server._driver_pickup_routes(DRIVER[0], DRIVER[1], PICKUPS[:1])
+        assert len(calls) == 2
+        await asyncio.sleep(0)
+        assert not old.cancelled()
+        assert len(server._driver_route_tasks) == 2
+
+        # Sınır dolu: yeni matris izlenmez ve bütçe sonunda iptal edilir
+        monkeypatch.setattr(server, "DRIVER_ROUTE_MAX_INFLIGHT", 2)
+        await server._driver_pickup_routes(DRIVER[0], DRIVER[1], PICKUPS[1:])
+        assert len(calls) == 3 and len(server._driver_route_tasks) == 2
+
+        await asyncio.sleep(0.25)
+        assert old.done() and not old.cancelled()
+        assert server._driver_route_tasks == {}
+
+    asyncio.run(run())
+
+
+def test_trip_estimate_is_flagged() -> None:
+    assert server._tag_trip_route({"distance_km": 12.5, "estimated_minutes": 20}) == (12.5, 20.0, False)
+    km, _mins, estimated = server._tag_trip_route(
+        {"pickup_lat": 40.75, "pickup_lng": 30.37, "dropoff_lat": 40.80, "dropoff_lng": 30.40}
+    )
+    assert estimated is True and km > 0
+    assert server._tag_trip_route({}) == (None, None, False)
+
+
+def test_driver_requests_sorts_zero_km_pickup_first(monkeypatch) -> None:
+    driver_id = "11111111-1111-1111-1111-111111111111"
+    now = datetime.utcnow().isoformat()
+
+    def tag(i: int, lat: float) -> dict:
+        return {
+            "id": f"t{i}",
+            "passenger_id": f"p{i}",
+            "status": "pending",
+            "created_at": now,
+            "pickup_location": "A",
+            "dropoff_location": "B",
+            "pickup_lat": lat,
+            "pickup_lng": DRIVER[1],
+            "dropoff_lat": 40.80,
+            "dropoff_lng": 30.40,
+            "users": {"name": "Yolcu", "city": "Sakarya"},
+        }
+
+    fake = FakeSupabase()
+    fake.tables["users"] = [{"id": driver_id, "city": "Sakarya", "latitude": DRIVER[0], "longitude": DRIVER[1]}]
+    fake.tables["blocked_users"] = []
+    fake.tables["tags"] = [tag(1, 40.80), tag(2, DRIVER[0])]
+    monkeypatch.setattr(server, "supabase", fake)
+
+    async def matrix(origins, dest_lat, dest_lng, *, reverse=False):
+        return [{"distance_km": 0.0 if la == DRIVER[0] else 4.8, "duration_min": 0.0 if la == DRIVER[0] else 9.0} for la, _lo in origins]
+
+    monkeypatch.setattr(server, "get_route_matrix_to_point", matrix)
+
+    out = asyncio.run(server.get_driver_requests(driver_id=driver_id))
+
+    assert [(r["id"], r["pickup_distance_km"]) for r in out["requests"]] == [("t2", 0.0), ("t1", 4.8)]
+    assert out["requests"][0]["pickup_eta_min"] == 0
+    assert all(r["distance_estimated"] for r in out["requests"])
@@ -0,0 +1,45 @@
+"""
+Paylaşılan durum — bellek arka ucu (Redis ile aynı API / kopya semantiği).
+`py -3 -m pytest tests/test_shared_state.py -v`
+"""
+from __future__ import annotations
+
+import asyncio
+
+from services.shared_state import MemoryStateBackend, create_state_backend
+
+
+def test_values_are_copies_and_must_be_written_back() -> None:
+    m = MemoryStateBackend().map("dispatch_queues")
+
+    async def _run() -> None:
+        await m.set("t1", [{"id": "a", "status": "waiting"}])
+        q = await m.get("t1")
+        q[0]["status"] = "sent"
+        assert (await m.get("t1"))[0]["status"] == "waiting"
+        await m.set("t1", q)
+        assert (await m.get("t1"))[0]["status"] == "sent"
+        assert await m.pop("t1") == q
+        assert await m.get("t1", []) == []
+
+    asyncio.run(_run())
+
+
+def test_ttl_and_set_if_absent() -> None:
+    m = MemoryStateBackend().map("otp")
+
+    async def _run() -> None:
+        await m.set("905551112233", {"code": "1"}, ttl_sec=0.01)
+        assert await m.contains("905551112233")
+        await asyncio.sleep(0.02)
+        assert await m.get("905551112233") is None
+        assert await m.set_if_absent("k", 1, ttl_sec=5)
+        assert not await m.set_if_absent("k", 2)
+        assert await m.items() == [("k", 1)] and await m.size() == 1
+
+    asyncio.run(_run())
+
+
+def test_without_redis_url_falls_back_to_memory(monkeypatch) -> None:
+    monkeypatch.delenv("REDIS_URL", raising=False)
+    assert create_state_backend().kind == "memory"
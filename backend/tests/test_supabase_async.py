@@ -0,0 +1,79 @@
+"""
+AsyncSupabase cephesi — sahte builder ile (ağ yok).
+`py -3 -m pytest tests/test_supabase_async.py -v`
+"""
+from __future__ import annotations
+
+import asyncio
+import threading
+
+import supabase_client as core
+
+
+class _Result:
+    def __init__(self, data):
+        self.data = data
+
+
+class _Builder:
+    def __init__(self, calls):
+        self.calls = calls
+
+    def select(self, cols):
+        self.calls.append(("select", cols))
+        return self
+
+    def eq(self, col, val):
+        self.calls.append(("eq", col, val))
+        return self
+
+    @property
+    def not_(self):
+        self.calls.append(("not_",))
+        return self
+
+    def is_(self, col, val):
+        self.calls.append(("is_", col, val))
+        return self
+
+    def execute(self):
+        self.calls.append(("thread", threading.current_thread().name))
+        return _Result([{"id": "u1"}])
+
+
+class _Client:
+    def __init__(self):
+        self.calls = []
+
+    def table(self, name):
+        self.calls.append(("table", name))
+        return _Builder(self.calls)
+
+
+def test_chain_runs_execute_off_loop_thread() -> None:
+    client = _Client()
+    db = core.AsyncSupabase(lambda: client)
+
+    async def _run():
+        return await db.table("users").select("id").not_.is_("driver_details", "null").eq("id", "u1").execute()
+
+    res = asyncio.run(_run())
+    assert res.data == [{"id": "u1"}]
+    assert client.calls[:5] == [
+        ("table", "users"),
+        ("select", "id"),
+        ("not_",),
+        ("is_", "driver_details", "null"),
+        ("eq", "id", "u1"),
+    ]
+    assert client.calls[-1][1].startswith("supabase-db")
+    assert core.get_db_stats()["queries"] >= 1
+
+
+def test_missing_client_raises() -> None:
+    db = core.AsyncSupabase(lambda: None)
+    try:
+        db.table("users")
+    except RuntimeError:
+        return
+    raise AssertionError("RuntimeError bekleniyordu")
@@ -0,0 +1,59 @@
+"""
+Tag süre dolumu süpürücüsü — yalnızca eski açık tag'ler, tek bildirim, batch sınırı.
+`py -3 -m pytest tests/test_tag_expiry.py -v`
+"""
+from __future__ import annotations
+
+import asyncio
+from datetime import datetime, timedelta
+
+from benchmarks.fake_supabase import FakeSupabase
+from services.tag_expiry import TagExpirySweeper
+from supabase_client import AsyncSupabase
+
+NOW = datetime(2026, 5, 1, 12, 0, 0)
+
+
+def _ago(minutes: int) -> str:
+    return (NOW - timedelta(minutes=minutes)).isoformat()
+
+
+def test_sweep_expires_old_open_tags_once() -> None:
+    fake = FakeSupabase()
+    fake.table("tags").insert(
+        [
+            {"id": "old-pending", "status": "pending", "created_at": _ago(30)},
+            {"id": "old-offers", "status": "offers_received", "created_at": _ago(11)},
+            {"id": "fresh", "status": "pending", "created_at": _ago(2)},
+            {"id": "old-matched", "status": "matched", "created_at": _ago(60)},
+        ]
+    ).execute()
+    seen: list = []
+
+    async def on_expired(rows):
+        seen.extend(r["id"] for r in rows)
+
+    sweeper = TagExpirySweeper(AsyncSupabase(lambda: fake), on_expired, max_age_sec=600)
+
+    async def go():
+        first = await sweeper.sweep_once(now=NOW)
+        second = await sweeper.sweep_once(now=NOW)
+        return first, second
+
+    first, second = asyncio.run(go())
+    assert sorted(r["id"] for r in first) == ["old-offers", "old-pending"]
+    assert second == [] and sorted(seen) == ["old-offers", "old-pending"]
+    status = {r["id"]: r["status"] for r in fake.table("tags").select("id, status").execute().data}
+    assert status == {"old-pending": "expired", "old-offers": "expired", "fresh": "pending", "old-matched": "matched"}
+    stats = sweeper.stats()
+    assert stats["sweeps"] == 2 and stats["expired"] == 2 and stats["errors"] == 0
+
+
+def test_batch_limit_takes_oldest_first() -> None:
+    fake = FakeSupabase()
+    fake.table("tags").insert(
+        [{"id": f"t{i}", "status": "pending", "created_at": _ago(20 + i)} for i in range(5)]
+    ).execute()
+    sweeper = TagExpirySweeper(AsyncSupabase(lambda: fake), batch_limit=2)
+    rows = asyncio.run(sweeper.sweep_once(now=NOW))
+    assert sorted(r["id"] for r in rows) == ["t3", "t4"]
@@ -0,0 +1,48 @@
+"""
+Yolculuk canlı konum süzgeci — yerel doğrulama (socket yok).
+`py -3 -m pytest tests/test_trip_location_stream.py -v`
+"""
+from __future__ import annotations
+
+import time
+
+from services.trip_location_stream import TripLocationStream, trip_room
+
+
+def test_register_maps_both_participants_and_unregister() -> None:
+    st = TripLocationStream()
+    st.register("TAG-1", "P1", "D1")
+    assert st.trip_for_user("d1")["tag_id"] == "tag-1"
+    assert st.role_of(st.get("tag-1"), "P1") == "passenger"
+    assert trip_room("TAG-1") == "trip_tag-1"
+    st.unregister("tag-1")
+    assert st.trip_for_user("p1") is None
+
+
+def test_interval_throttle_and_delta_suppression() -> None:
+    st = TripLocationStream(min_interval_sec=0.0, min_delta_m=10.0, heartbeat_sec=60.0)
+    assert st.should_emit("d1", 41.0, 29.0)
+    assert not st.should_emit("d1", 41.00001, 29.0)  # ~1 m
+    assert st.should_emit("d1", 41.0002, 29.0)  # ~22 m
+    st_fast = TripLocationStream(min_interval_sec=30.0)
+    assert st_fast.should_emit("d1", 41.0, 29.0)
+    assert not st_fast.should_emit("d1", 42.0, 29.0)
+    assert st.stats()["suppressed"] == 1 and st_fast.stats()["throttled"] == 1
+
+
+def test_heartbeat_emits_without_movement() -> None:
+    st = TripLocationStream(min_interval_sec=0.0, min_delta_m=10.0, heartbeat_sec=0.01)
+    assert st.should_emit("d1", 41.0, 29.0)
+    time.sleep(0.02)
+    assert st.should_emit("d1", 41.0, 29.0)
+
+
+def test_shared_load_forces_revalidate_and_miss_cache() -> None:
+    st = TripLocationStream(revalidate_sec=60.0, miss_ttl_sec=30.0)
+    trip = st.register("tag-2", "p2", "d2", verified=False)
+    assert st.needs_revalidate(trip)
+    assert st.stats()["shared_loads"] == 1
+    st.mark_miss("p3")
+    assert st.recently_missed("P3")
+    st.register("tag-3", "p3", "d3")
+    assert not st.recently_missed("p3")
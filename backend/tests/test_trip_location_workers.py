@@ -0,0 +1,66 @@
+"""
+Yolculuk canlı konumu — join_trip bir worker'da, konum ping'i başka worker'da (paylaşılan üyelik).
+Socket.IO emit'leri yakalanır; DB FakeSupabase (ağ yok).
+`py -3 -m pytest tests/test_trip_location_workers.py -v`
+"""
+from __future__ import annotations
+
+import asyncio
+
+import server
+from benchmarks.fake_supabase import FakeSupabase
+from services.trip_location_stream import TripLocationStream
+
+PASSENGER = "aaaaaaaa-0000-0000-0000-000000000001"
+DRIVER = "bbbbbbbb-0000-0000-0000-000000000002"
+TAG = "cccccccc-0000-0000-0000-000000000003"
+
+
+def test_ping_on_other_worker_reaches_trip_room(monkeypatch) -> None:
+    fake = FakeSupabase()
+    fake.tables["tags"] = [{"id": TAG, "passenger_id": PASSENGER, "driver_id": DRIVER, "status": "matched"}]
+    monkeypatch.setattr(server, "supabase", fake)
+    emitted = []
+
+    async def emit(event, data=None, room=None, skip_sid=None, **kwargs):
+        emitted.append((event, data, room))
+
+    async def get_session(sid, namespace=None):
+        return {"user_id": PASSENGER}
+
+    async def enter_room(sid, room, namespace=None):
+        return None
+
+    monkeypatch.setattr(server.sio, "emit", emit)
+    monkeypatch.setattr(server.sio, "get_session", get_session)
+    monkeypatch.setattr(server.sio, "enter_room", enter_room)
+
+    async def run() -> None:
+        await server.trip_members.clear()
+        # Worker A: yolcu odaya katılır
+        monkeypatch.setattr(server, "trip_location_stream", TripLocationStream(min_interval_sec=0.0))
+        await server.join_trip("sid-p", {"tag_id": TAG})
+        assert emitted[-1][0] == "trip_joined" and emitted[-1][1]["success"]
+
+        # Worker B: yerel kayıt boş; sürücü ping'i paylaşılan üyelikten yolculuğu bulur
+        monkeypatch.setattr(server, "trip_location_stream", TripLocationStream(min_interval_sec=0.0))
+        emitted.clear()
+        await server._trip_location_fanout(DRIVER, 40.75, 30.37)
+        assert [(e, r) for e, _d, r in emitted] == [("trip_location", f"trip_{TAG}")]
+        assert emitted[0][1]["role"] == "driver"
+
+        # Yolculuğu olmayan kullanıcı: no-op ve negatif cache
+        await server._trip_location_fanout("dddddddd-0000-0000-0000-000000000004", 40.0, 30.0)
+        assert len(emitted) == 1
+        assert server.trip_location_stream.recently_missed("dddddddd-0000-0000-0000-000000000004")
+
+        # Yolculuk bitti: doğrulama düşürür, paylaşılan üyelik temizlenir
+        fake.tables["tags"][0]["status"] = "completed"
+        monkeypatch.setattr(server, "trip_location_stream", TripLocationStream(min_interval_sec=0.0))
+        emitted.clear()
+        await server._trip_location_fanout(DRIVER, 40.76, 30.37)
+        assert [e for e, _d, _r in emitted] == ["trip_tracking_ended"]
+        assert await server.trip_members.get(DRIVER) is None
+        await server.trip_members.clear()
+
+    asyncio.run(run())
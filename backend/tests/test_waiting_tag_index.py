@@ -0,0 +1,43 @@
+"""
+Bekleyen tag indeksi — yarıçap / araç tipi araması, kaldırma ve worker olayları.
+`py -3 -m pytest tests/test_waiting_tag_index.py -v`
+"""
+from __future__ import annotations
+
+from services.waiting_tag_index import WaitingTagIndex
+
+
+def _tag(tid: str, lat: float, lng: float) -> dict:
+    return {"id": tid, "pickup_lat": lat, "pickup_lng": lng, "final_price": 150}
+
+
+def test_query_radius_filters_kind_and_distance() -> None:
+    idx = WaitingTagIndex(cell_deg=0.05)
+    assert not idx.is_ready(60)
+    idx.replace_all(
+        [
+            (_tag("near", 41.010, 29.000), "car"),
+            (_tag("far", 41.300, 29.000), "car"),
+            (_tag("moto", 41.011, 29.001), "motorcycle"),
+            ({"id": "nopos", "pickup_lat": None, "pickup_lng": 29.0}, "car"),
+        ]
+    )
+    assert idx.is_ready(60)
+    assert len(idx) == 3
+    hits = idx.query_radius(41.0, 29.0, 5.0, vehicle_kinds=["car"])
+    assert [row["id"] for _d, row in hits] == ["near"]
+    assert hits[0][1]["vehicle_kind"] == "car"
+    assert {row["id"] for _d, row in idx.query_radius(41.0, 29.0, 5.0)} == {"near", "moto"}
+
+
+def test_remove_and_apply_event() -> None:
+    idx = WaitingTagIndex()
+    idx.replace_all([])
+    assert idx.apply_event({"op": "upsert", "tag": _tag("T1", 41.0, 29.0), "vehicle_kind": "car"})
+    assert "t1" in idx
+    assert idx.query_radius(41.0, 29.0, 1.0, vehicle_kinds=["car"])[0][1]["id"] == "T1"
+    assert idx.apply_event({"op": "remove", "tag_id": "t1"})
+    assert not idx.remove("T1")
+    assert idx.query_radius(41.0, 29.0, 1.0) == []
+    assert not idx.apply_event("bozuk")
+    assert idx.stats()["tags"] == 0
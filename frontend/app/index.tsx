@@ -5879,11 +5879,18 @@ function PassengerDashboard({
     emitAcceptOffer: socketAcceptOffer,
     emitRejectOffer: socketRejectOffer,
     forceEndTrip: passengerForceEndTrip,
+    joinTrip: passengerJoinTrip,
+    leaveTrip: passengerLeaveTrip,
     // 🆕 Mesajlaşma
     emitSendMessage: passengerEmitSendMessage,
   } = useSocket({
     userId: user?.id || null,
     userRole: 'passenger',
+    onTripLocation: (data) => {
+      if (data.role === 'driver' && data.tag_id === String(activeTag?.id || '').toLowerCase()) {
+        setDriverLocation({ latitude: data.latitude, longitude: data.longitude });
+      }
+    },
     onCallCancelled: (data) => {
       console.log('🚫 YOLCU - ARAMA İPTAL EDİLDİ:', data);
       clearIncomingCall();
@@ -6294,7 +6301,16 @@ function PassengerDashboard({
     ).start();
   }, []);
 
-  // CANLI KONUM GÜNCELLEME - Eşleşince başla (1 saniyede bir)
+  // CANLI KONUM - trip_{tag_id} odası (socket push); yeniden register olunca tekrar katıl
+  useEffect(() => {
+    if (!socketRegistered || !activeTag?.id) return;
+    if (activeTag.status !== 'matched' && activeTag.status !== 'in_progress') return;
+    const tagId = activeTag.id;
+    passengerJoinTrip(tagId);
+    return () => passengerLeaveTrip(tagId);
+  }, [socketRegistered, activeTag?.id, activeTag?.status, passengerJoinTrip, passengerLeaveTrip]);
+
+  // CANLI KONUM GÜNCELLEME - HTTP yedeği (socket kayıtlıyken seyrek; push trip_location ile gelir)
   useEffect(() => {
     if (activeTag && (activeTag.status === 'matched' || activeTag.status === 'in_progress')) {
       console.log('🔄 Yolcu: Şoför konum takibi başlatıldı');
@@ -6313,11 +6329,11 @@ function PassengerDashboard({
       };
       
       fetchDriverLocation();
-      const interval = setInterval(fetchDriverLocation, 1000); // 1 saniyede bir güncelle - CANLI
+      const interval = setInterval(fetchDriverLocation, socketRegistered ? 10000 : 1000);
 
       return () => clearInterval(interval);
     }
-  }, [activeTag?.id, activeTag?.status, activeTag?.driver_id]);
+  }, [activeTag?.id, activeTag?.status, activeTag?.driver_id, socketRegistered]);
 
   // ❌ ESKİ POLLING KALDIRILDI - Supabase Realtime ile değiştirildi (yukarıda)
 
@@ -8721,11 +8737,18 @@ function DriverDashboard({ user, logout, setScreen, kycStatusProp, setKycStatusP
     emitSendOffer: socketSendOffer,
     emitDriverLocationUpdate,  // 🆕 YENİ: Şoför konum güncelleme (RAM)
     forceEndTrip: driverForceEndTrip,
+    joinTrip: driverJoinTrip,
+    leaveTrip: driverLeaveTrip,
     // 🆕 Mesajlaşma
     emitSendMessage: driverEmitSendMessage,
   } = useSocket({
     userId: user?.id || null,
     userRole: 'driver',
+    onTripLocation: (data) => {
+      if (data.role === 'passenger' && data.tag_id === String(activeTag?.id || '').toLowerCase()) {
+        setPassengerLocation({ latitude: data.latitude, longitude: data.longitude });
+      }
+    },
     onCallCancelled: (data) => {
       console.log('🚫 ŞOFÖR - ARAMA İPTAL EDİLDİ:', data);
       driverClearIncomingCall();
@@ -9350,7 +9373,16 @@ function DriverDashboard({ user, logout, setScreen, kycStatusProp, setKycStatusP
     return () => clearInterval(interval);
   }, [activeTag?.id, user?.id]);
 
-  // CANLI YOLCU KONUM GÜNCELLEME - Eşleşince başla
+  // CANLI YOLCU KONUMU - trip_{tag_id} odası (socket push); yeniden register olunca tekrar katıl
+  useEffect(() => {
+    if (!socketRegistered || !activeTag?.id) return;
+    if (activeTag.status !== 'matched' && activeTag.status !== 'in_progress') return;
+    const tagId = activeTag.id;
+    driverJoinTrip(tagId);
+    return () => driverLeaveTrip(tagId);
+  }, [socketRegistered, activeTag?.id, activeTag?.status, driverJoinTrip, driverLeaveTrip]);
+
+  // CANLI YOLCU KONUM GÜNCELLEME - HTTP yedeği
   useEffect(() => {
     if (activeTag && (activeTag.status === 'matched' || activeTag.status === 'in_progress')) {
       const interval = setInterval(async () => {
@@ -518,6 +518,8 @@ export default function DriverOfferScreen({
   const [mapCityGrid, setMapCityGrid] = useState<DriverMapCityGridCell[]>([]);
   const [mapDriverCity, setMapDriverCity] = useState('');
   const [mapHud, setMapHud] = useState({ seeking: 0, nearby: 0, radius: 20 });
+  /** Dokunulan işaret → yol mesafesi / süresi metni (pin listesi kuş uçuşu döner) */
+  const [markerRouteText, setMarkerRouteText] = useState<Record<string, string>>({});
   const driverPulseScale = useRef(new Animated.Value(1)).current;
   const driverPulseOpacity = useRef(new Animated.Value(0.55)).current;
   const driverPulse2Scale = useRef(new Animated.Value(1)).current;
@@ -612,6 +614,8 @@ export default function DriverOfferScreen({
       return;
     }
     let cancelled = false;
+    // Sürücü yer değiştirdi: işaret rotaları yeniden sorulur
+    setMarkerRouteText({});
     const load = async () => {
       try {
         const q = new URLSearchParams({
@@ -643,6 +647,33 @@ export default function DriverOfferScreen({
     };
   }, [driverId, driverLocation?.latitude, driverLocation?.longitude]);
 
+  // İşarete dokunma: sürücü → işaret yol rotası (sunucu cache'i + sürücü başına sınır; 429'da sessiz)
+  const loadMarkerRoute = async (key: string, targetLat: number, targetLng: number) => {
+    if (!driverId || markerRouteText[key]) return;
+    try {
+      const q = new URLSearchParams({
+        driver_id: String(driverId),
+        target_lat: String(targetLat),
+        target_lng: String(targetLng),
+      });
+      if (driverLocation) {
+        q.set('latitude', String(driverLocation.latitude));
+        q.set('longitude', String(driverLocation.longitude));
+      }
+      const res = await fetch(`${API_BASE_URL}/driver/map-marker-route?${q.toString()}`);
+      if (!res.ok) return;
+      const j = await res.json();
+      if (!j?.success) return;
+      const km = Number(j.distance_km);
+      const min = Number(j.duration_min);
+      if (!Number.isFinite(km)) return;
+      const text = Number.isFinite(min) && min > 0 ? `${km.toFixed(1)} km · ${min} dk` : `${km.toFixed(1)} km`;
+      setMarkerRouteText((prev) => ({ ...prev, [key]: text }));
+    } catch {
+      /* sessiz */
+    }
+  };
+
   // Harita sınırları: sürücü + yalnızca tarama yarıçapı içindeki pinler (şehir grid zoom’u şişirmez)
   useEffect(() => {
     if (!mapReady || !mapRef.current || !driverLocation) return;
@@ -790,12 +821,16 @@ export default function DriverOfferScreen({
 
         {mapSeekingPins.map((pin) => {
           const listed = listedTagIds.has(String(pin.tag_id));
+          const routeKey = `seek-${pin.tag_id}`;
+          const routeText = markerRouteText[routeKey];
+          const baseDesc = listed ? 'Listede — teklif verebilirsiniz' : 'Yolcu talebi';
           return (
             <Marker
-              key={`seek-${pin.tag_id}`}
+              key={routeKey}
               coordinate={{ latitude: pin.pickup_lat, longitude: pin.pickup_lng }}
               title={pin.label || 'Talep'}
-              description={listed ? 'Listede — teklif verebilirsiniz' : 'Yolcu talebi'}
+              description={routeText ? `${baseDesc} · ${routeText}` : baseDesc}
+              onPress={() => void loadMarkerRoute(routeKey, pin.pickup_lat, pin.pickup_lng)}
             >
               <View style={[styles.passengerMarkerSeeking, listed && styles.passengerMarkerSeekingListed]}>
                 <Ionicons name="navigate" size={15} color="#FFF" />
@@ -809,7 +844,12 @@ export default function DriverOfferScreen({
             key={`light-${pin.user_id}`}
             coordinate={{ latitude: pin.latitude, longitude: pin.longitude }}
             title={pin.label || 'Yakında'}
-            description="Konum paylaşan kullanıcı"
+            description={
+              markerRouteText[`light-${pin.user_id}`]
+                ? `Konum paylaşan kullanıcı · ${markerRouteText[`light-${pin.user_id}`]}`
+                : 'Konum paylaşan kullanıcı'
+            }
+            onPress={() => void loadMarkerRoute(`light-${pin.user_id}`, pin.latitude, pin.longitude)}
           >
             <View style={styles.passengerMarkerLight}>
               <View style={styles.passengerMarkerLightDot} />
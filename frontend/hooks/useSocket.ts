@@ -62,6 +62,16 @@ interface LocationData {
   target_id?: string;
 }
 
+/** Backend `trip_location` (trip_{tag_id} odası) / `trip_joined.other_location` */
+export interface TripLocationData {
+  tag_id: string;
+  user_id: string;
+  role?: 'driver' | 'passenger' | null;
+  latitude: number;
+  longitude: number;
+  updated_at?: string;
+}
+
 /** Backend `accept_ride`: `ride_accepted` (yolcu) / `ride_matched` (sürücü) */
 export interface RideMatchSocketData {
   tag_id: string;
@@ -108,6 +118,8 @@ interface UseSocketProps {
   onOfferSentAck?: (data: { success: boolean; passenger_online: boolean }) => void;
   // Konum eventleri
   onLocationUpdated?: (data: LocationData) => void;
+  /** Eşleşmiş yolculukta karşı tarafın canlı konumu (joinTrip sonrası) */
+  onTripLocation?: (data: TripLocationData) => void;
   // Yolculuk eventleri
   onTripStarted?: (data: { tag_id: string; passenger_id: string; driver_id: string }) => void;
   onTripEnded?: (data: { tag_id: string }) => void;
@@ -175,6 +187,7 @@ export default function useSocket({
   onOfferAlreadyTaken,
   onOfferSentAck,
   onLocationUpdated,
+  onTripLocation,
   onTripStarted,
   onTripEnded,
   onTripEndRequested,
@@ -220,7 +233,7 @@ export default function useSocket({
     onIncomingCall, onCallAccepted, onCallRejected, onCallEnded, onCallRinging,
     onTagCreated, onTagCancelled, onTagUpdated, onTagMatched, onRideAccepted, onRideMatched, onNewOffer,
     onOfferAccepted, onOfferRejected, onOfferAlreadyTaken, onOfferSentAck, onLocationUpdated,
-    onTripStarted, onTripEnded, onTripEndRequested, onTripEndResponse,
+    onTripLocation, onTripStarted, onTripEnded, onTripEndRequested, onTripEndResponse,
     onTripForceEnded, onShowRatingModal,
     onCallCancelled, onCallEndedNew, onNewMessage, onFirstChatMessage, onMessageSent
   });
@@ -231,7 +244,7 @@ export default function useSocket({
       onIncomingCall, onCallAccepted, onCallRejected, onCallEnded, onCallRinging,
       onTagCreated, onTagCancelled, onTagUpdated, onTagMatched, onRideAccepted, onRideMatched, onNewOffer,
       onOfferAccepted, onOfferRejected, onOfferAlreadyTaken, onOfferSentAck, onLocationUpdated,
-      onTripStarted, onTripEnded, onTripEndRequested, onTripEndResponse,
+      onTripLocation, onTripStarted, onTripEnded, onTripEndRequested, onTripEndResponse,
       onTripForceEnded, onShowRatingModal,
       onCallCancelled, onCallEndedNew, onNewMessage, onFirstChatMessage, onMessageSent
     };
@@ -284,9 +297,14 @@ export default function useSocket({
 
     // ══════════ TAG EVENTLERİ ══════════
 
-    const handleNewTag = (data: any) => {
+    // new_passenger_offer sunucuda callback ile gönderilir: ack teslim gecikmesini ölçer (offer_ack_tracker)
+    const handleNewTag = (data: any, ack?: () => void) => {
       console.log('🏷️ [useSocket] YENİ TAG:', data);
-      callbackRefs.current.onTagCreated?.(data);
+      try {
+        callbackRefs.current.onTagCreated?.(data);
+      } finally {
+        if (typeof ack === 'function') ack();
+      }
     };
 
     const handleTagCancelled = (data: any) => {
@@ -351,6 +369,18 @@ export default function useSocket({
       callbackRefs.current.onLocationUpdated?.(data);
     };
 
+    const handleTripLocation = (data: any) => {
+      callbackRefs.current.onTripLocation?.(data as TripLocationData);
+    };
+
+    const handleTripJoined = (data: any) => {
+      console.log('📍 [useSocket] trip_joined:', data?.success, data?.tag_id, data?.error);
+      // Karşı tarafın son bilinen konumu — ilk ping'i beklemeden haritayı doldur
+      if (data?.success && data.other_location) {
+        callbackRefs.current.onTripLocation?.({ tag_id: data.tag_id, ...data.other_location });
+      }
+    };
+
     // ══════════ YOLCULUK EVENTLERİ ══════════
 
     const handleTripStarted = (data: any) => {
@@ -426,6 +456,8 @@ export default function useSocket({
     socket.on('offer_already_taken', handleOfferAlreadyTaken);
     
     socket.on('location_updated', handleLocationUpdated);
+    socket.on('trip_location', handleTripLocation);
+    socket.on('trip_joined', handleTripJoined);
     
     socket.on('trip_started', handleTripStarted);
     socket.on('trip_ended', handleTripEnded);
@@ -478,6 +510,8 @@ export default function useSocket({
       socket.off('offer_sent_ack', handleOfferSentAck);
       
       socket.off('location_updated', handleLocationUpdated);
+      socket.off('trip_location', handleTripLocation);
+      socket.off('trip_joined', handleTripJoined);
       
       socket.off('trip_started', handleTripStarted);
       socket.off('trip_ended', handleTripEnded);
@@ -679,6 +713,19 @@ export default function useSocket({
 
   // ══════════ YOLCULUK FONKSİYONLARI ══════════
 
+  // Canlı konum odası (trip_{tag_id}); yeniden bağlanınca oda üyeliği düşer — çağıran isRegistered ile tekrarlar
+  const joinTrip = useCallback((tagId: string) => {
+    if (socket?.connected && tagId) {
+      socket.emit('join_trip', { tag_id: tagId });
+    }
+  }, [socket]);
+
+  const leaveTrip = useCallback((tagId: string) => {
+    if (socket?.connected && tagId) {
+      socket.emit('leave_trip', { tag_id: tagId });
+    }
+  }, [socket]);
+
   const emitTripStarted = useCallback((data: { 
     tag_id: string; 
     passenger_id: string; 
@@ -778,6 +825,8 @@ export default function useSocket({
     emitDriverLocationUpdate,
     subscribeToLocation,
     // Yolculuk
+    joinTrip,
+    leaveTrip,
     emitTripStarted,
     emitTripEnded,
     requestTripEnd,
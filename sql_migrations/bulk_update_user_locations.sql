@@ -0,0 +1,29 @@
+-- Konum ping'lerinin toplu yazımı (services/location_ingest.py) — Supabase SQL Editor'da bir kez çalıştırın
+-- p_rows: [{"id": uuid, "latitude": num, "longitude": num, "last_location_update": timestamptz}, ...]
+-- Fonksiyon yoksa backend satır satır users.update'e düşer.
+
+CREATE OR REPLACE FUNCTION bulk_update_user_locations(p_rows jsonb)
+RETURNS integer
+LANGUAGE sql
+AS $$
+  WITH src AS (
+    SELECT
+      (r->>'id')::uuid AS id,
+      (r->>'latitude')::numeric AS latitude,
+      (r->>'longitude')::numeric AS longitude,
+      (r->>'last_location_update')::timestamptz AS last_location_update
+    FROM jsonb_array_elements(p_rows) AS r
+  ), upd AS (
+    UPDATE users u
+    SET latitude = src.latitude,
+        longitude = src.longitude,
+        last_location_update = src.last_location_update
+    FROM src
+    WHERE u.id = src.id
+    RETURNING 1
+  )
+  SELECT count(*)::integer FROM upd;
+$$;
+
+REVOKE ALL ON FUNCTION bulk_update_user_locations(jsonb) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION bulk_update_user_locations(jsonb) TO service_role;
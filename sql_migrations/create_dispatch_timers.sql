@@ -0,0 +1,19 @@
+-- Kalıcı dispatch zamanlayıcıları (services/dispatch_scheduler.py) — Supabase SQL Editor'da bir kez çalıştırın
+-- Rolling batch 20 sn işleri: restart/deploy sonrası kaldığı yerden devam eder.
+-- REDIS_URL ayarlıysa journal Redis sorted set'tir; bu tablo kullanılmaz.
+
+CREATE TABLE IF NOT EXISTS dispatch_timers (
+  id text PRIMARY KEY,                 -- ör. rolling:<tag_id>
+  kind text NOT NULL,
+  due_at timestamptz NOT NULL,
+  payload jsonb NOT NULL DEFAULT '{}'::jsonb,
+  token text NOT NULL DEFAULT '',      -- planlama örneği; claim id + token ile siler (bayat kopya kaybeder)
+  created_at timestamptz NOT NULL DEFAULT now()
+);
+
+-- Tablo token kolonu olmadan oluşturulduysa
+ALTER TABLE dispatch_timers ADD COLUMN IF NOT EXISTS token text NOT NULL DEFAULT '';
+
+CREATE INDEX IF NOT EXISTS idx_dispatch_timers_due_at ON dispatch_timers(due_at);
+
+COMMENT ON TABLE dispatch_timers IS 'Dispatch timing wheel journal: süresi gelen iş DELETE ... WHERE id AND token RETURNING ile tek worker tarafından alınır';
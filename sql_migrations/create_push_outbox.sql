@@ -0,0 +1,18 @@
+-- Push outbox (services/push_outbox.py) — Supabase SQL Editor'da bir kez çalıştırın
+-- notifications_log satırı aynı zamanda gönderim kuyruğudur: pending → sending (kira) → sent | failed.
+-- Kolonlar yoksa backend eski log satırını yazar ve push'u yalnızca bellekte kuyruklar (restart'ta kaybolur).
+
+ALTER TABLE notifications_log ADD COLUMN IF NOT EXISTS status text;
+ALTER TABLE notifications_log ADD COLUMN IF NOT EXISTS data jsonb NOT NULL DEFAULT '{}'::jsonb;
+ALTER TABLE notifications_log ADD COLUMN IF NOT EXISTS push_token text;
+ALTER TABLE notifications_log ADD COLUMN IF NOT EXISTS attempts integer NOT NULL DEFAULT 0;
+ALTER TABLE notifications_log ADD COLUMN IF NOT EXISTS next_attempt_at timestamptz;
+ALTER TABLE notifications_log ADD COLUMN IF NOT EXISTS last_error text;
+ALTER TABLE notifications_log ADD COLUMN IF NOT EXISTS sent_at timestamptz;
+
+-- Yalnızca bekleyen / kiralanmış satırlar (eski log satırlarında status NULL)
+CREATE INDEX IF NOT EXISTS idx_notifications_log_outbox_due
+  ON notifications_log(next_attempt_at)
+  WHERE status IN ('pending', 'sending');
+
+COMMENT ON COLUMN notifications_log.status IS 'Push outbox: pending | sending (next_attempt_at = kira bitişi) | sent | failed | deduped (gönderilmedi, yalnızca log); NULL = eski log';
@@ -0,0 +1,7 @@
+-- Tag süre dolumu süpürücüsü (services/tag_expiry.py) — Supabase SQL Editor'da bir kez çalıştırın
+-- Süpürücü sorgusu: status IN ('pending', 'offers_received') AND created_at < now() - 10 dk ORDER BY created_at LIMIT n
+-- Kısmi indeks yalnızca açık tag'leri tutar (tamamlanmış / iptal edilmiş milyonlarca satır taranmaz).
+
+CREATE INDEX IF NOT EXISTS idx_tags_open_created_at
+  ON tags(created_at)
+  WHERE status IN ('pending', 'offers_received');